@@ -3,7 +3,7 @@ Aplicación Web - Monitoreo de Calidad del Aire
 Proyecto de Maestría en Analítica de Datos - Universidad Central
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 import os
 from dotenv import load_dotenv
 import json
@@ -25,6 +25,7 @@ from modules.data_loader import (
     load_rmcab_data,
     RMCAB_STATION_INFO,
     find_dense_window,
+    find_dense_window_sql,
     align_lowcost_with_reference,
     get_last_lowcost_query
 )
@@ -32,10 +33,30 @@ from modules.calibration import (
     get_calibration_models,
     train_and_evaluate_models,
     run_device_calibration,
+    run_devices_calibration,
     load_calibration_model,
     predict_with_saved_model,
-    run_stage2_calibration
+    run_stage2_calibration,
+    format_linear_formula,
+    serializable_results
 )
+from modules.coverage import SCANNED_CHANNEL, get_coverage_index, reference_series_name
+from modules.window_tracker import find_dense_window_incremental
+from modules.training_frame import (
+    TEMPORAL_COLUMNS,
+    add_temporal_features,
+    build_training_frame,
+    get_training_frame,
+    partition_by_device
+)
+from modules.feature_store import get_features
+from modules.resampling import HOURLY_VALUE_COLUMNS, resample_hourly
+from modules.frame_contract import ensure_canonical, time_slice
+from modules.calibration_cache import cache_stats, clear_cache
+from modules.batch_linear import fleet_linear_calibration
+from modules.online_calibration import fit_online_calibration, update_online_calibration
+from modules.thread_budget import PROCESS_THREAD_BUDGET, lease_cores, leases_cores, limit_process_threads, thread_report
+from modules.calibration_jobs import submit_job, get_job, list_jobs, sse_stream, FINISHED_STATUSES
 from modules.visualization import create_timeseries_plot, create_boxplot, create_heatmap
 from modules.metrics import calculate_statistics
 
@@ -45,6 +66,13 @@ DEVICE_LABELS = {
     'Aire5': 'Sensor Aire5'
 }
 
+# BLAS/OpenMP de este proceso del servidor usan solo su parte de la máquina
+limit_process_threads(PROCESS_THREAD_BUDGET)
+
+# Modo de búsqueda de la ventana densa: 'python' (descarga todo el rango), 'sql' (conteos en PostgreSQL)
+# o 'incremental' (conteos en PostgreSQL solo para las horas nuevas, con estado persistido)
+STAGE2_WINDOW_MODE = os.getenv('STAGE2_WINDOW_MODE', 'python')
+
 
 def safe_number(value, decimals=4):
     """
@@ -112,6 +140,60 @@ def normalize_device_list(devices):
     return normalized or None
 
 
+def parse_time_budget(value):
+    """Presupuesto de tiempo (segundos) enviado por el cliente; None usa TRAINING_TIME_BUDGET."""
+    if value in (None, ''):
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def keep_reference_hours(lowcost_window, rmcab_window, station_code):
+    """
+    Deja una fila por dispositivo y hora con dato de la RMCAB, con las columnas originales de
+    lowcost_window.
+
+    'datetime' queda truncado a la hora, las columnas de medición (HOURLY_VALUE_COLUMNS) son
+    la media horaria de la grilla de resample_hourly y el resto (p. ej. 'id') se toma de la
+    primera lectura de la hora. Si la estación fue consultada en todas las horas de la ventana
+    (canal 'scanned' del índice de cobertura), la pertenencia se resuelve con el mapa de bits
+    'records' sin recorrer las horas de rmcab_window; si no, se usa el conjunto de horas de
+    rmcab_window.
+    """
+    if lowcost_window.empty or rmcab_window is None or rmcab_window.empty:
+        return lowcost_window
+
+    keys = ['device_name', 'datetime']
+    value_columns = [col for col in HOURLY_VALUE_COLUMNS if col in lowcost_window.columns]
+    hourly = resample_hourly(lowcost_window, value_columns=value_columns, include_gaps=False)
+    if hourly.empty:
+        return lowcost_window.iloc[0:0]
+
+    ordered = lowcost_window.sort_values('datetime', kind='stable')
+    first_readings = (
+        ordered.assign(datetime=ordered['datetime'].dt.floor('h'))
+        .drop_duplicates(subset=keys)
+        .drop(columns=value_columns)
+    )
+    hourly = hourly[keys + value_columns].merge(first_readings, on=keys, how='inner')[list(lowcost_window.columns)]
+
+    series = reference_series_name(station_code)
+    coverage_index = get_coverage_index()
+    first_hour = rmcab_window['datetime'].min().floor('h')
+    last_hour = rmcab_window['datetime'].max().floor('h')
+    if coverage_index.presence(series, SCANNED_CHANNEL, first_hour, last_hour).all():
+        # El cargador de la RMCAB marca cada hora consultada: sin bit en 'records' no hay dato
+        in_window = hourly['datetime'].between(first_hour, last_hour).to_numpy()
+        in_reference = in_window & coverage_index.contains(series, 'records', hourly['datetime'])
+    else:
+        reference_hours = rmcab_window['datetime'].dt.floor('h').dropna().unique()
+        in_reference = hourly['datetime'].isin(set(reference_hours)).to_numpy()
+
+    return hourly[in_reference].reset_index(drop=True)
+
+
 def prepare_stage2_datasets(devices, station_code, start_date, end_date, window_start_ts, window_end_ts):
     """
     Carga y filtra los datos de sensores y RMCAB para la ventana solicitada.
@@ -131,12 +213,8 @@ def prepare_stage2_datasets(devices, station_code, start_date, end_date, window_
     if lowcost_data is None or lowcost_data.empty:
         raise ValueError('No se encontraron datos de sensores para calibrar.')
 
-    lowcost_data = lowcost_data.copy()
-    lowcost_data['datetime'] = pd.to_datetime(lowcost_data['datetime']).dt.tz_localize(None)
-    lowcost_window = lowcost_data[
-        (lowcost_data['datetime'] >= window_start_ts) &
-        (lowcost_data['datetime'] <= window_end_ts)
-    ].copy()
+    # Los cargadores devuelven DataFrames canónicos: la ventana es un slice sin copia
+    lowcost_window = time_slice(lowcost_data, window_start_ts, window_end_ts)
     if lowcost_window.empty:
         raise ValueError('Los sensores no tienen datos dentro de la ventana indicada.')
 
@@ -144,27 +222,16 @@ def prepare_stage2_datasets(devices, station_code, start_date, end_date, window_
     if rmcab_data is None or rmcab_data.empty:
         raise ValueError('No fue posible cargar datos de la RMCAB para calibrar.')
 
-    rmcab_window = rmcab_data.copy()
-    rmcab_window['datetime'] = pd.to_datetime(rmcab_window['datetime']).dt.tz_localize(None)
-    rmcab_window = rmcab_window[
-        (rmcab_window['datetime'] >= window_start_ts) &
-        (rmcab_window['datetime'] <= window_end_ts)
-    ].copy()
+    rmcab_window = time_slice(rmcab_data, window_start_ts, window_end_ts)
     if rmcab_window.empty:
         raise ValueError('La RMCAB no contiene datos en la ventana seleccionada.')
 
-    reference_hours = set(rmcab_window['datetime'].dt.floor('H'))
-    if reference_hours:
-        lowcost_window['hour_key'] = lowcost_window['datetime'].dt.floor('H')
-        lowcost_window = lowcost_window[lowcost_window['hour_key'].isin(reference_hours)]
-        lowcost_window = lowcost_window.sort_values('datetime').drop_duplicates(subset=['device_name', 'hour_key'])
-        lowcost_window['datetime'] = lowcost_window['hour_key']
-        lowcost_window = lowcost_window.drop(columns=['hour_key'])
+    lowcost_window = keep_reference_hours(lowcost_window, rmcab_window, station_code)
 
     if lowcost_window.empty:
         raise ValueError('No hay lecturas de sensores que coincidan con las horas de la RMCAB en la ventana seleccionada.')
 
-    return lowcost_window.sort_values('datetime'), rmcab_window.sort_values('datetime')
+    return ensure_canonical(lowcost_window, 'lowcost'), rmcab_window
 
 # =======================
 # RUTAS PRINCIPALES
@@ -237,21 +304,36 @@ def api_stage2_load():
         devices = normalize_device_list(payload.get('devices'))
         station_code = payload.get('station_code', 6)
         window_days = payload.get('window_days', 5)
+        window_mode = str(payload.get('window_mode') or STAGE2_WINDOW_MODE).lower()
 
-        lowcost_data = load_lowcost_data(start_date, end_date, devices, aggregate=False, filter_by_keys=False)
-        if lowcost_data is None or lowcost_data.empty:
-            return jsonify({
-                'success': False,
-                'error': 'No se encontraron datos de sensores en el periodo indicado.',
-                'query': get_last_lowcost_query()
-            }), 404
+        if window_mode in ('sql', 'incremental'):
+            # Conteos horarios en SQL; solo se descargan las filas crudas de la ventana elegida
+            finder = find_dense_window_incremental if window_mode == 'incremental' else find_dense_window_sql
+            window_info = finder(start_date, end_date, window_days=window_days, devices=devices)
+            if not window_info:
+                return jsonify({
+                    'success': False,
+                    'error': 'No fue posible identificar una ventana óptima de datos.',
+                    'query': get_last_lowcost_query()
+                }), 404
+            # Solo se descargaron las filas de la ventana: full_lowcost no cubre el rango pedido
+            lowcost_data = window_info['subset']
+            full_lowcost_scope = 'window'
+        else:
+            lowcost_data = load_lowcost_data(start_date, end_date, devices, aggregate=False, filter_by_keys=False)
+            if lowcost_data is None or lowcost_data.empty:
+                return jsonify({
+                    'success': False,
+                    'error': 'No se encontraron datos de sensores en el periodo indicado.',
+                    'query': get_last_lowcost_query()
+                }), 404
 
-        window_info = find_dense_window(lowcost_data, window_days=window_days, devices=devices)
-        if not window_info:
-            return jsonify({'success': False, 'error': 'No fue posible identificar una ventana óptima de datos.'}), 400
+            window_info = find_dense_window(lowcost_data, window_days=window_days, devices=devices)
+            if not window_info:
+                return jsonify({'success': False, 'error': 'No fue posible identificar una ventana óptima de datos.'}), 400
+            full_lowcost_scope = 'range'
 
-        window_df = window_info['subset'].copy().sort_values('datetime')
-        window_df['datetime'] = window_df['datetime'].dt.tz_localize(None)
+        window_df = ensure_canonical(window_info['subset'], 'lowcost')
 
         full_lowcost_records = json.loads(
             lowcost_data.sort_values('datetime').to_json(orient='records', date_format='iso')
@@ -262,40 +344,31 @@ def api_stage2_load():
         def prepare_rmcab(df):
             if df is None or df.empty:
                 return pd.DataFrame()
-            prepared = df.copy()
-            prepared['datetime'] = pd.to_datetime(prepared['datetime']).dt.tz_localize(None)
+            prepared = ensure_canonical(df, 'reference').copy(deep=False)
             if 'pm25_ref' in prepared.columns and 'pm25' not in prepared.columns:
                 prepared['pm25'] = prepared['pm25_ref']
             if 'pm10_ref' in prepared.columns and 'pm10' not in prepared.columns:
                 prepared['pm10'] = prepared['pm10_ref']
-            return prepared.sort_values('datetime')
+            return prepared
 
         rmcab_prepared = prepare_rmcab(rmcab_full)
         full_rmcab_records = json.loads(rmcab_prepared.to_json(orient='records', date_format='iso')) if not rmcab_prepared.empty else []
 
-        reference_hours = set()
+        rmcab_window = pd.DataFrame()
         rmcab_window_records = []
         if not rmcab_prepared.empty:
-            mask = (
-                (rmcab_prepared['datetime'] >= window_info['start']) &
-                (rmcab_prepared['datetime'] <= window_info['end'])
-            )
-            rmcab_window = rmcab_prepared.loc[mask].copy()
-            reference_hours = set(rmcab_window['datetime'].dt.floor('H'))
+            rmcab_window = time_slice(rmcab_prepared, window_info['start'], window_info['end'])
             rmcab_window_records = json.loads(rmcab_window.to_json(orient='records', date_format='iso'))
 
-        if reference_hours:
-            window_df['hour_key'] = window_df['datetime'].dt.floor('H')
-            window_df = window_df[window_df['hour_key'].isin(reference_hours)]
-            window_df = window_df.sort_values('datetime').drop_duplicates(subset=['device_name', 'hour_key'])
-            window_df['datetime'] = window_df['hour_key']
-            window_df = window_df.drop(columns=['hour_key'])
+        window_df = keep_reference_hours(window_df, rmcab_window, station_code)
 
         window_records = json.loads(window_df.to_json(orient='records', date_format='iso'))
 
         per_device_summary = []
         per_device_counts = window_info.get('per_device_counts', {}) or {}
         pollutant_counts_info = window_info.get('pollutant_counts', {}) or {}
+        coverage_index = get_coverage_index()
+        reference_series = reference_series_name(station_code)
 
         if per_device_counts:
             for device, count in sorted(per_device_counts.items(), key=lambda item: (-item[1], item[0])):
@@ -305,7 +378,13 @@ def api_stage2_load():
                     'label': DEVICE_LABELS.get(device, device),
                     'records': int(count),
                     'pm25': int(pollutant_counts.get('pm25', 0)),
-                    'pm10': int(pollutant_counts.get('pm10', 0))
+                    'pm10': int(pollutant_counts.get('pm10', 0)),
+                    'hours_with_reference': len(coverage_index.intersect(
+                        device, 'records', reference_series, 'records', window_info['start'], window_info['end']
+                    )),
+                    'gap_hours': sum(
+                        gap['hours'] for gap in coverage_index.gaps(device, 'records', window_info['start'], window_info['end'])
+                    )
                 })
         elif devices:
             for device in devices:
@@ -329,6 +408,7 @@ def api_stage2_load():
                 'total_records': window_info['total_records'],
                 'hours_covered': window_info.get('hours_covered'),
                 'per_device': per_device_summary,
+                'mode': window_mode,
                 'station': {
                     'code': station_code,
                     'name': reference_info.get('name', f'RMCAB {station_code}')
@@ -337,64 +417,136 @@ def api_stage2_load():
             'lowcost': window_records,
             'rmcab': rmcab_window_records,
             'full_lowcost': full_lowcost_records,
+            'full_lowcost_scope': full_lowcost_scope,
+            'window_mode': window_mode,
             'full_rmcab': full_rmcab_records,
             'query': get_last_lowcost_query()
         })
     except Exception as exc:
         return jsonify({'success': False, 'error': str(exc), 'query': get_last_lowcost_query()}), 500
 
-@app.route('/api/stage2/calibrate', methods=['POST'])
-def api_stage2_calibrate():
-    """Ejecuta la calibración optimizada para la ventana seleccionada."""
+@app.route('/api/coverage', methods=['POST'])
+def api_coverage():
+    """Consulta el índice de cobertura horaria (horas con datos, horas con referencia y huecos)."""
     try:
         payload = request.json or {}
-        devices = normalize_device_list(payload.get('devices'))
+        start = payload.get('start_date', '2023-01-01')
+        end = payload.get('end_date', '2023-12-31')
         station_code = payload.get('station_code', 6)
-        start_date = payload.get('start_date', '2023-01-01')
-        end_date = payload.get('end_date', '2023-12-31')
-        window_start = payload.get('window_start')
-        window_end = payload.get('window_end')
-        pollutants = payload.get('pollutants') or ['pm25', 'pm10']
+        channel = payload.get('pollutant', 'records')
+        min_gap_hours = int(payload.get('min_gap_hours', 1))
+
+        coverage_index = get_coverage_index()
+        reference_series = reference_series_name(station_code)
+        devices = normalize_device_list(payload.get('devices')) or [
+            series for series in coverage_index.series() if series != reference_series
+        ]
+
+        total_hours = len(pd.date_range(pd.Timestamp(start).floor('H'), pd.Timestamp(end).floor('H'), freq='H'))
+        device_coverage = []
+        for device in devices:
+            gaps = coverage_index.gaps(device, channel, start, end, min_hours=min_gap_hours)
+            device_coverage.append({
+                'device': device,
+                'label': DEVICE_LABELS.get(device, device),
+                'hours_covered': coverage_index.count(device, channel, start, end),
+                'hours_with_reference': len(coverage_index.intersect(device, channel, reference_series, channel, start, end)),
+                'gaps': [
+                    {'start': gap['start'].isoformat(), 'end': gap['end'].isoformat(), 'hours': gap['hours']}
+                    for gap in gaps
+                ]
+            })
 
-        if not window_start or not window_end:
-            return jsonify({'success': False, 'error': 'Los campos window_start y window_end son obligatorios.'}), 400
+        return jsonify({
+            'success': True,
+            'period': {'start_date': start, 'end_date': end, 'total_hours': total_hours},
+            'channel': channel,
+            'reference': {
+                'station_code': station_code,
+                'hours_covered': coverage_index.count(reference_series, channel, start, end)
+            },
+            'devices': device_coverage
+        })
+    except Exception as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 500
 
-        window_start_ts = pd.Timestamp(window_start).tz_localize(None)
-        window_end_ts = pd.Timestamp(window_end).tz_localize(None)
 
-        try:
-            lowcost_window, rmcab_window = prepare_stage2_datasets(
-                devices,
-                station_code,
-                start_date,
-                end_date,
-                window_start_ts,
-                window_end_ts
-            )
-        except ValueError as exc:
-            return jsonify({
-                'success': False,
-                'error': str(exc),
-                'query': get_last_lowcost_query()
-            }), 404
+@leases_cores
+def stage2_calibration_response(payload, progress=None):
+    """
+    Calibración de la etapa 2 para la ventana seleccionada.
+
+    Args:
+        payload (dict): Parámetros de la solicitud.
+        progress (callable, optional): Callback de progreso del trabajo en segundo plano.
+
+    Returns:
+        tuple[dict, int]: Cuerpo de la respuesta y código HTTP.
+    """
+    devices = normalize_device_list(payload.get('devices'))
+    station_code = payload.get('station_code', 6)
+    start_date = payload.get('start_date', '2023-01-01')
+    end_date = payload.get('end_date', '2023-12-31')
+    window_start = payload.get('window_start')
+    window_end = payload.get('window_end')
+    pollutants = payload.get('pollutants') or ['pm25', 'pm10']
+    time_budget = parse_time_budget(payload.get('time_budget'))
 
-        calibration_results = run_stage2_calibration(
-            lowcost_window,
-            rmcab_window,
-            devices=devices,
-            pollutants=pollutants
+    if not window_start or not window_end:
+        return {'success': False, 'error': 'Los campos window_start y window_end son obligatorios.'}, 400
+
+    window_start_ts = pd.Timestamp(window_start).tz_localize(None)
+    window_end_ts = pd.Timestamp(window_end).tz_localize(None)
+
+    try:
+        lowcost_window, rmcab_window = prepare_stage2_datasets(
+            devices,
+            station_code,
+            start_date,
+            end_date,
+            window_start_ts,
+            window_end_ts
         )
+    except ValueError as exc:
+        return {
+            'success': False,
+            'error': str(exc),
+            'query': get_last_lowcost_query()
+        }, 404
+
+    calibration_results = run_stage2_calibration(
+        lowcost_window,
+        rmcab_window,
+        devices=devices,
+        pollutants=pollutants,
+        cache_key=(window_start_ts, window_end_ts, station_code),
+        time_budget=time_budget,
+        progress=progress,
+        force_refresh=bool(payload.get('force_refresh'))
+    )
+
+    response_payload = {
+        'success': True,
+        'window': {
+            'start': window_start_ts.isoformat(),
+            'end': window_end_ts.isoformat()
+        },
+        'partial': any(device.get('partial') for device in calibration_results),
+        'devices': calibration_results
+    }
+
+    return ensure_serializable(response_payload), 200
 
-        response_payload = {
-            'success': True,
-            'window': {
-                'start': window_start_ts.isoformat(),
-                'end': window_end_ts.isoformat()
-            },
-            'devices': calibration_results
-        }
 
-        return jsonify(ensure_serializable(response_payload))
+@app.route('/api/stage2/calibrate', methods=['POST'])
+def api_stage2_calibrate():
+    """Ejecuta la calibración optimizada para la ventana seleccionada."""
+    try:
+        payload = request.json or {}
+        if payload.get('async'):
+            return submit_calibration_job('stage2', payload)
+        body, status = stage2_calibration_response(payload)
+        return jsonify(body), status
     except Exception as exc:
         app.logger.exception('Error ejecutando /api/stage2/calibrate')
         return jsonify({'success': False, 'error': str(exc)}), 500
@@ -441,10 +593,12 @@ def api_stage2_download():
             else:
                 device_list = []
 
+        device_partitions, _ = partition_by_device(lowcost_window, device_list)
+
         output = BytesIO()
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             for device in device_list:
-                device_df = lowcost_window[lowcost_window['device_name'] == device].copy()
+                device_df = device_partitions[device]
                 if device_df.empty:
                     continue
 
@@ -489,67 +643,94 @@ def api_stage2_download():
         return jsonify({'success': False, 'error': 'No fue posible generar el archivo Excel.'}), 500
 
 
-@app.route('/api/calibration-summary', methods=['POST'])
-def api_calibration_summary():
-    """Genera un resumen de calibración para todos los sensores solicitados"""
-    try:
-        payload = request.json or {}
-        start_date = payload.get('start_date', '2023-01-01')
-        end_date = payload.get('end_date', '2023-12-31')
-        devices = normalize_device_list(payload.get('devices'))
-        pollutants = payload.get('pollutants') or ['pm25', 'pm10']
-        station_code = payload.get('station_code', 6)
-
-        lowcost_data = load_lowcost_data(start_date, end_date, devices)
-        rmcab_data = load_rmcab_data(station_code, start_date, end_date)
+@leases_cores
+def calibration_summary_response(payload, progress=None):
+    """
+    Resumen de calibración para todos los sensores solicitados.
 
-        if (
-            lowcost_data is None or rmcab_data is None or
-            lowcost_data.empty or rmcab_data.empty
-        ):
-            return jsonify({
-                'success': False,
-                'error': 'No se pudieron cargar los datos necesarios para la calibración'
-            }), 400
+    Args:
+        payload (dict): Parámetros de la solicitud.
+        progress (callable, optional): Callback de progreso del trabajo en segundo plano.
 
-        device_list = devices
-        if not device_list and lowcost_data is not None and not lowcost_data.empty and 'device_name' in lowcost_data.columns:
-            device_list = sorted(lowcost_data['device_name'].dropna().astype(str).unique().tolist())
+    Returns:
+        tuple[dict, int]: Cuerpo de la respuesta y código HTTP.
+    """
+    start_date = payload.get('start_date', '2023-01-01')
+    end_date = payload.get('end_date', '2023-12-31')
+    devices = normalize_device_list(payload.get('devices'))
+    pollutants = payload.get('pollutants') or ['pm25', 'pm10']
+    station_code = payload.get('station_code', 6)
+    time_budget = parse_time_budget(payload.get('time_budget'))
+
+    lowcost_data = get_features(devices, start_date, end_date, load_lowcost_data)
+    rmcab_data = load_rmcab_data(station_code, start_date, end_date)
 
-        sensor_summaries = []
-        for device in device_list or []:
-            device_data = lowcost_data[lowcost_data['device_name'] == device].copy()
+    if (
+        lowcost_data is None or rmcab_data is None or
+        lowcost_data.empty or rmcab_data.empty
+    ):
+        return {
+            'success': False,
+            'error': 'No se pudieron cargar los datos necesarios para la calibración'
+        }, 400
+
+    device_list = devices
+    if not device_list and lowcost_data is not None and not lowcost_data.empty and 'device_name' in lowcost_data.columns:
+        device_list = sorted(lowcost_data['device_name'].dropna().astype(str).unique().tolist())
+
+    device_partitions, _ = partition_by_device(lowcost_data, device_list)
+
+    # Todos los (dispositivo, contaminante) se calibran en paralelo
+    period = '2025' if '2025' in start_date else '2024'
+    calibrations = run_devices_calibration(
+        {device: data for device, data in device_partitions.items() if not data.empty},
+        rmcab_data, tuple(pollutants), period=period,
+        cache_key=(start_date, end_date, station_code),
+        time_budget=time_budget,
+        progress=progress,
+        force_refresh=bool(payload.get('force_refresh'))
+    )
+
+    sensor_summaries = []
+    for device in device_list or []:
+        if device not in calibrations:
+            sensor_summaries.append({
+                'device': device,
+                'label': DEVICE_LABELS.get(device, device),
+                'pollutant_results': [],
+                'error': 'No hay datos disponibles para el periodo seleccionado'
+            })
+            continue
 
-            if device_data.empty:
-                sensor_summaries.append({
-                    'device': device,
-                    'label': DEVICE_LABELS.get(device, device),
-                    'pollutant_results': [],
-                    'error': 'No hay datos disponibles para el periodo seleccionado'
-                })
-                continue
+        calibration = calibrations[device]
+        calibration['label'] = DEVICE_LABELS.get(device, device)
+        sensor_summaries.append(calibration)
 
-            # Determinar período basado en las fechas
-            period = '2025' if '2025' in start_date else '2024'
-            calibration = run_device_calibration(device_data, rmcab_data, device, tuple(pollutants), period=period)
-            calibration['label'] = DEVICE_LABELS.get(device, device)
-            sensor_summaries.append(calibration)
+    reference_info = RMCAB_STATION_INFO.get(station_code, {})
 
-        reference_info = RMCAB_STATION_INFO.get(station_code, {})
+    return ensure_serializable({
+        'success': True,
+        'period': {
+            'start_date': start_date,
+            'end_date': end_date
+        },
+        'reference': {
+            'station_code': station_code,
+            'station_name': reference_info.get('name', f'RMCAB {station_code}')
+        },
+        'sensors': sensor_summaries
+    }), 200
 
-        return jsonify({
-            'success': True,
-            'period': {
-                'start_date': start_date,
-                'end_date': end_date
-            },
-            'reference': {
-                'station_code': station_code,
-                'station_name': reference_info.get('name', f'RMCAB {station_code}')
-            },
-            'sensors': sensor_summaries
-        })
 
+@app.route('/api/calibration-summary', methods=['POST'])
+def api_calibration_summary():
+    """Genera un resumen de calibración para todos los sensores solicitados"""
+    try:
+        payload = request.json or {}
+        if payload.get('async'):
+            return submit_calibration_job('summary', payload)
+        body, status = calibration_summary_response(payload)
+        return jsonify(body), status
     except Exception as exc:
         return jsonify({'success': False, 'error': str(exc)}), 500
 
@@ -585,7 +766,8 @@ def api_calibrate():
             return jsonify({'error': 'No se pudieron cargar los datos'}), 404
 
         # Ejecutar calibración
-        calibration = train_and_evaluate_models(lowcost_data, rmcab_data)
+        with lease_cores('api_calibrate'):
+            calibration = train_and_evaluate_models(lowcost_data, rmcab_data)
 
         if calibration.get('error'):
             return jsonify({'success': False, 'error': calibration['error']}), 400
@@ -594,7 +776,7 @@ def api_calibrate():
             'success': True,
             'records': calibration.get('records', 0),
             'best_model': calibration.get('best_model'),
-            'results': calibration.get('results', [])
+            'results': serializable_results(calibration.get('results', []))
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -702,13 +884,18 @@ def api_calibrate_device():
         ):
             return jsonify({'error': 'No se pudieron cargar los datos'}), 404
 
-        device_data = lowcost_data[lowcost_data['device_name'] == device_name].copy()
+        device_data = partition_by_device(lowcost_data, [device_name])[0][device_name]
         if device_data.empty:
             return jsonify({'error': 'El dispositivo no tiene datos en el periodo indicado'}), 404
 
         # Determinar período basado en las fechas
         period = '2025' if '2025' in start_date else '2024'
-        calibration = run_device_calibration(device_data, rmcab_data, device_name, (pollutant,), period=period)
+        with lease_cores(f'{device_name}/{pollutant}'):
+            calibration = run_device_calibration(
+                device_data, rmcab_data, device_name, (pollutant,), period=period,
+                cache_key=(start_date, end_date, 6),
+                force_refresh=bool(request.json.get('force_refresh'))
+            )
         pollutant_results = calibration.get('pollutant_results', [])
         pollutant_entry = pollutant_results[0] if pollutant_results else None
 
@@ -728,119 +915,338 @@ def api_calibrate_device():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@leases_cores
+def multiple_calibration_response(payload, progress=None):
+    """
+    Calibración de múltiples dispositivos con múltiples contaminantes.
+
+    Args:
+        payload (dict): Parámetros de la solicitud.
+        progress (callable, optional): Callback de progreso del trabajo en segundo plano.
+
+    Returns:
+        tuple[dict, int]: Cuerpo de la respuesta y código HTTP.
+    """
+    devices = normalize_device_list(payload.get('devices'))
+    start_date = payload.get('start_date', '2024-06-01')
+    end_date = payload.get('end_date', '2024-07-31')
+    pollutants = payload.get('pollutants', ['pm25'])  # Soportar múltiples contaminantes
+    time_budget = parse_time_budget(payload.get('time_budget'))
+
+    print(f"\n{'='*60}")
+    print(f"CALIBRACIÓN MÚLTIPLE INICIADA")
+    print(f"{'='*60}")
+    print(f"Dispositivos: {devices}")
+    print(f"Periodo: {start_date} a {end_date}")
+    print(f"Contaminantes: {pollutants}")
+
+    # Cargar datos de todos los sensores
+    print(f"\n📊 Cargando datos de sensores...")
+    lowcost_data = get_features(devices, start_date, end_date, load_lowcost_data)
+    print(f"✅ Datos lowcost cargados: {len(lowcost_data) if lowcost_data is not None and not lowcost_data.empty else 0} registros")
+    
+    print(f"\n📊 Cargando datos de RMCAB...")
+    rmcab_data = load_rmcab_data(6, start_date, end_date)  # Las Ferias
+    print(f"✅ Datos RMCAB cargados: {len(rmcab_data) if rmcab_data is not None and not rmcab_data.empty else 0} registros")
+
+    if (
+        lowcost_data is None or rmcab_data is None or
+        lowcost_data.empty or rmcab_data.empty
+    ):
+        error_msg = 'No se pudieron cargar los datos'
+        print(f"❌ ERROR: {error_msg}")
+        return {'error': error_msg}, 404
+
+    # Calibrar todos los (dispositivo, contaminante) en paralelo
+    results_by_device = {}
+    device_partitions, _ = partition_by_device(lowcost_data, devices)
+    device_frames = {}
+
+    for device_name in devices:
+        device_data = device_partitions[device_name]
+
+        if device_data.empty:
+            error_msg = f'No hay datos para {device_name} en el periodo indicado'
+            print(f"⚠️  {error_msg}")
+            results_by_device[device_name] = {
+                'success': False,
+                'error': error_msg
+            }
+            continue
+
+        print(f"📊 Registros de {device_name}: {len(device_data)}")
+        device_frames[device_name] = device_data
+
+    # Determinar período basado en las fechas
+    period = '2025' if '2025' in start_date else '2024'
+    calibrations = run_devices_calibration(
+        device_frames, rmcab_data, tuple(pollutants), period=period,
+        cache_key=(start_date, end_date, 6),
+        time_budget=time_budget,
+        progress=progress,
+        force_refresh=bool(payload.get('force_refresh'))
+    )
+
+    for device_name in devices:
+        if device_name not in calibrations:
+            continue
+
+        pollutant_results = calibrations[device_name].get('pollutant_results', [])
+
+        if not pollutant_results or any(pr.get('error') for pr in pollutant_results):
+            errors = [pr.get('error') for pr in pollutant_results if pr.get('error')]
+            message = '; '.join(errors) if errors else 'No se obtuvieron resultados'
+            print(f"❌ Error en calibración de {device_name}: {message}")
+            results_by_device[device_name] = {
+                'success': False,
+                'error': message
+            }
+        else:
+            print(f"✅ {device_name} calibrado exitosamente")
+            print(f"   - Contaminantes: {len(pollutant_results)}")
+            for pr in pollutant_results:
+                print(f"   - {pr.get('pollutant_label')}: {pr.get('records', 0)} registros, {len(pr.get('models', []))} modelos")
+
+            results_by_device[device_name] = {
+                'success': True,
+                'device': device_name,
+                'pollutant_results': pollutant_results
+            }
+
+    results_by_device = {name: results_by_device[name] for name in devices if name in results_by_device}
+
+    # Verificar si al menos uno tuvo éxito
+    success_count = sum(1 for r in results_by_device.values() if r.get('success'))
+    
+    print(f"\n{'='*60}")
+    print(f"RESUMEN DE CALIBRACIÓN")
+    print(f"{'='*60}")
+    print(f"Exitosos: {success_count}/{len(devices)}")
+    for device, result in results_by_device.items():
+        status = "✅" if result.get('success') else "❌"
+        print(f"{status} {device}: {result.get('error', 'OK')}")
+    print(f"{'='*60}\n")
+    
+    return ensure_serializable({
+        'success': success_count > 0,
+        'devices_calibrated': success_count,
+        'total_devices': len(devices),
+        'results_by_device': results_by_device
+    }), 200
+
+
 @app.route('/api/calibrate-multiple-devices', methods=['POST'])
 def api_calibrate_multiple_devices():
     """Ejecuta calibración para múltiples dispositivos con múltiples contaminantes"""
     try:
-        devices = normalize_device_list(request.json.get('devices'))
-        start_date = request.json.get('start_date', '2024-06-01')
-        end_date = request.json.get('end_date', '2024-07-31')
-        pollutants = request.json.get('pollutants', ['pm25'])  # Soportar múltiples contaminantes
-
-        print(f"\n{'='*60}")
-        print(f"CALIBRACIÓN MÚLTIPLE INICIADA")
-        print(f"{'='*60}")
-        print(f"Dispositivos: {devices}")
-        print(f"Periodo: {start_date} a {end_date}")
-        print(f"Contaminantes: {pollutants}")
-
-        # Cargar datos de todos los sensores
-        print(f"\n📊 Cargando datos de sensores...")
-        lowcost_data = load_lowcost_data(start_date, end_date, devices)
-        print(f"✅ Datos lowcost cargados: {len(lowcost_data) if lowcost_data is not None and not lowcost_data.empty else 0} registros")
-        
-        print(f"\n📊 Cargando datos de RMCAB...")
-        rmcab_data = load_rmcab_data(6, start_date, end_date)  # Las Ferias
-        print(f"✅ Datos RMCAB cargados: {len(rmcab_data) if rmcab_data is not None and not rmcab_data.empty else 0} registros")
+        payload = request.json or {}
+        if payload.get('async'):
+            return submit_calibration_job('multiple', payload)
+        body, status = multiple_calibration_response(payload)
+        return jsonify(body), status
+    except Exception as e:
+        error_msg = str(e)
+        print(f"\n❌ ERROR GENERAL: {error_msg}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': error_msg}), 500
 
-        if (
-            lowcost_data is None or rmcab_data is None or
-            lowcost_data.empty or rmcab_data.empty
-        ):
-            error_msg = 'No se pudieron cargar los datos'
-            print(f"❌ ERROR: {error_msg}")
-            return jsonify({'error': error_msg}), 404
-
-        # Calibrar cada dispositivo
-        results_by_device = {}
-        
-        for device_name in devices:
-            print(f"\n{'='*60}")
-            print(f"📡 Calibrando {device_name}...")
-            print(f"{'='*60}")
-            
-            device_data = lowcost_data[lowcost_data['device_name'] == device_name].copy()
-            
-            if device_data.empty:
-                error_msg = f'No hay datos para {device_name} en el periodo indicado'
-                print(f"⚠️  {error_msg}")
-                results_by_device[device_name] = {
-                    'success': False,
-                    'error': error_msg
-                }
-                continue
 
-            print(f"📊 Registros de {device_name}: {len(device_data)}")
+@app.route('/api/calibrate-linear-fleet', methods=['POST'])
+def api_calibrate_linear_fleet():
+    """
+    Fórmulas lineales (Regresión lineal y Ridge) de todos los dispositivos y contaminantes
+    en un solo lote, sin entrenar el zoológico de modelos (ver modules.batch_linear).
+    """
+    try:
+        payload = request.json or {}
+        devices = normalize_device_list(payload.get('devices'))
+        start_date = payload.get('start_date', '2024-06-01')
+        end_date = payload.get('end_date', '2024-07-31')
+        pollutants = tuple(payload.get('pollutants', ['pm25', 'pm10']))
+        station_code = payload.get('station_code', 6)
+        alpha = float(payload.get('alpha', 1.0))
 
-            try:
-                # Determinar período basado en las fechas
-                period = '2025' if '2025' in start_date else '2024'
-                calibration = run_device_calibration(device_data, rmcab_data, device_name, tuple(pollutants), period=period)
-                pollutant_results = calibration.get('pollutant_results', [])
-
-                if not pollutant_results or any(pr.get('error') for pr in pollutant_results):
-                    errors = [pr.get('error') for pr in pollutant_results if pr.get('error')]
-                    message = '; '.join(errors) if errors else 'No se obtuvieron resultados'
-                    print(f"❌ Error en calibración de {device_name}: {message}")
-                    results_by_device[device_name] = {
-                        'success': False,
-                        'error': message
-                    }
-                else:
-                    print(f"✅ {device_name} calibrado exitosamente")
-                    print(f"   - Contaminantes: {len(pollutant_results)}")
-                    for pr in pollutant_results:
-                        print(f"   - {pr.get('pollutant_label')}: {pr.get('records', 0)} registros, {len(pr.get('models', []))} modelos")
-                    
-                    results_by_device[device_name] = {
-                        'success': True,
-                        'device': device_name,
-                        'pollutant_results': pollutant_results
-                    }
-            except Exception as device_error:
-                error_msg = str(device_error)
-                print(f"❌ Excepción en {device_name}: {error_msg}")
-                import traceback
-                traceback.print_exc()
-                results_by_device[device_name] = {
-                    'success': False,
-                    'error': error_msg
-                }
+        lowcost_data = get_features(devices, start_date, end_date, load_lowcost_data)
+        rmcab_data = load_rmcab_data(station_code, start_date, end_date)
+        if lowcost_data is None or rmcab_data is None or lowcost_data.empty or rmcab_data.empty:
+            return jsonify({'error': 'No se pudieron cargar los datos'}), 404
 
-        # Verificar si al menos uno tuvo éxito
-        success_count = sum(1 for r in results_by_device.values() if r.get('success'))
-        
-        print(f"\n{'='*60}")
-        print(f"RESUMEN DE CALIBRACIÓN")
-        print(f"{'='*60}")
-        print(f"Exitosos: {success_count}/{len(devices)}")
-        for device, result in results_by_device.items():
-            status = "✅" if result.get('success') else "❌"
-            print(f"{status} {device}: {result.get('error', 'OK')}")
-        print(f"{'='*60}\n")
-        
-        return jsonify({
+        device_partitions, _ = partition_by_device(lowcost_data, devices)
+        training_frames = {}
+        for device_name, device_data in device_partitions.items():
+            training_frame, _ = get_training_frame(
+                device_data, rmcab_data, cache_key=(device_name, start_date, end_date, station_code)
+            ) if not device_data.empty else (None, None)
+            training_frames[device_name] = training_frame
+
+        results_by_device = fleet_linear_calibration(training_frames, pollutants, alpha=alpha)
+        success_count = sum(
+            1 for result in results_by_device.values()
+            if any(entry.get('linear_regression') for entry in result['pollutant_results'])
+        )
+        return jsonify(ensure_serializable({
             'success': success_count > 0,
             'devices_calibrated': success_count,
-            'total_devices': len(devices),
+            'total_devices': len(results_by_device),
             'results_by_device': results_by_device
-        })
+        }))
+
     except Exception as e:
-        error_msg = str(e)
-        print(f"\n❌ ERROR GENERAL: {error_msg}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': error_msg}), 500
+        print(f"❌ Error en calibración lineal por lotes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+CALIBRATION_JOB_RUNNERS = {
+    'stage2': stage2_calibration_response,
+    'summary': calibration_summary_response,
+    'multiple': multiple_calibration_response
+}
+
+
+def run_calibration_job(params, progress):
+    """Ejecuta en segundo plano la calibración descrita por params['kind'] y params['payload']."""
+    runner = CALIBRATION_JOB_RUNNERS[params['kind']]
+    return runner(params['payload'], progress=progress)
+
+
+def submit_calibration_job(kind, payload):
+    """Encola la calibración y responde 202 con el id del trabajo y sus URLs de seguimiento."""
+    payload = {key: value for key, value in payload.items() if key != 'async'}
+    job_id = submit_job(kind, {'kind': kind, 'payload': payload}, run_calibration_job)
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/api/jobs/{job_id}',
+        'events_url': f'/api/jobs/{job_id}/events',
+        'result_url': f'/api/jobs/{job_id}/result'
+    }), 202
+
+
+@app.route('/api/jobs', methods=['GET'])
+def api_list_jobs():
+    """Lista los trabajos de calibración más recientes"""
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        limit = 50
+    return jsonify({'success': True, 'jobs': ensure_serializable(list_jobs(limit))})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    """Estado y progreso de un trabajo de calibración (incluye el resultado al terminar)"""
+    job = get_job(job_id, include_result=True)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return jsonify(ensure_serializable({'success': True, 'job': job}))
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def api_job_result(job_id):
+    """Resultado de un trabajo terminado, con el mismo cuerpo y código que la llamada síncrona"""
+    job = get_job(job_id, include_result=True)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    if job['status'] not in FINISHED_STATUSES:
+        return jsonify({'success': False, 'status': job['status'], 'progress': job['progress']}), 202
+    if job.get('result') is None:
+        return jsonify({'success': False, 'status': job['status'], 'error': job.get('error')}), 500
+    return jsonify(job['result']), job.get('http_status') or 200
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def api_job_events(job_id):
+    """Progreso del trabajo como Server-Sent Events (reanudable con Last-Event-ID)"""
+    since = request.args.get('since') or request.headers.get('Last-Event-ID') or 0
+    try:
+        since = int(since)
+    except ValueError:
+        since = 0
+    response = Response(stream_with_context(sse_stream(job_id, since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/calibration-cache', methods=['GET', 'DELETE'])
+def api_calibration_cache():
+    """Estadísticas de la caché de calibraciones (GET) o vaciado de la caché (DELETE)"""
+    if request.method == 'DELETE':
+        removed = clear_cache()
+        return jsonify({'success': True, 'removed': removed, 'stats': cache_stats()})
+    return jsonify({'success': True, 'stats': cache_stats()})
+
+
+@app.route('/api/thread-budget', methods=['GET'])
+def api_thread_budget():
+    """Asignación efectiva de núcleos e hilos del proceso (ver modules.thread_budget)"""
+    return jsonify({'success': True, 'threads': thread_report()})
+
+
+@app.route('/api/calibrate-online', methods=['POST'])
+def api_calibrate_online():
+    """
+    Calibración en línea de un dispositivo: ajusta un modelo incremental (RLS o SGD) o, si ya
+    existe, lo actualiza en su lugar con las horas alineadas posteriores a la última vista.
+    Pensado para invocarse cada hora sin reentrenar el zoológico de modelos.
+    """
+    try:
+        payload = request.json or {}
+        device_name = payload.get('device_name')
+        pollutant = payload.get('pollutant', 'pm25')
+        station_code = payload.get('station_code', 6)
+        reset = bool(payload.get('reset'))
+
+        if not device_name:
+            return jsonify({'error': 'Falta el parámetro device_name'}), 400
+
+        # Período basado en las fechas, como en /api/calibrate-device
+        period = payload.get('period') or ('2025' if '2025' in payload.get('start_date', '2024-06-01') else '2024')
+
+        saved = load_calibration_model(device_name, pollutant, period)
+        if saved and not saved.get('online') and not reset:
+            # El modelo guardado es el del zoológico: no se reemplaza sin pedirlo
+            return jsonify({
+                'error': (f"Ya existe un modelo {saved.get('model_name')} para {device_name} - {pollutant} "
+                          f"({period}); envíe reset=true para reemplazarlo por uno en línea")
+            }), 409
+        update = bool(saved and saved.get('online')) and not reset
+
+        if update:
+            # Por defecto se consulta desde el día de la última hora aprendida
+            start_date = payload.get('start_date') or saved['online']['last_datetime'][:10]
+            end_date = payload.get('end_date') or (date.today() + pd.Timedelta(days=1)).isoformat()
+        else:
+            start_date = payload.get('start_date', '2024-06-01')
+            end_date = payload.get('end_date', '2024-07-31')
+
+        lowcost_data = get_features([device_name], start_date, end_date, load_lowcost_data)
+        rmcab_data = load_rmcab_data(station_code, start_date, end_date)
+        training_frame, frame_error = build_training_frame(lowcost_data, rmcab_data)
+        if frame_error:
+            if update:
+                # Sin datos nuevos el modelo guardado sigue vigente
+                return jsonify({'success': True, 'action': 'update', 'new_rows': 0, 'message': frame_error})
+            return jsonify({'error': frame_error}), 404
+
+        if update:
+            result = update_online_calibration(training_frame, device_name, pollutant, period)
+        else:
+            result = fit_online_calibration(
+                training_frame, device_name, pollutant, period, model_name=payload.get('model')
+            )
+        if result.get('error'):
+            return jsonify(ensure_serializable(result)), 400
+        result['formula'] = format_linear_formula(
+            result.get('coefficients'), result.get('intercept'), result.get('feature_names'), pollutant
+        )
+        return jsonify(ensure_serializable(result))
+
+    except Exception as e:
+        print(f"❌ Error en calibración en línea: {e}")
+        return jsonify({'error': str(e)}), 500
+
 
 @app.route('/api/predict-with-calibration', methods=['POST'])
 def api_predict_with_calibration():
@@ -909,7 +1315,7 @@ def api_predict_with_calibration():
             # MODO AUTOMÁTICO: Intentar cargar datos reales
             print(f"\n📊 Intentando cargar datos del sensor para {target_date}...")
             try:
-                sensor_data = load_lowcost_data(sensor_start_date, sensor_end_date, [device_name])
+                sensor_data = get_features([device_name], sensor_start_date, sensor_end_date, load_lowcost_data)
                 if sensor_data is not None and not sensor_data.empty:
                     sensor_data = sensor_data[sensor_data['datetime'].dt.date == target_dt.date()].copy()
                     if sensor_data.empty:
@@ -951,19 +1357,9 @@ def api_predict_with_calibration():
             print(f"   Temperatura: {manual_values.get('temperature')} °C")
             print(f"   Humedad: {manual_values.get('rh')} %")
 
-        # Agregar variables temporales si no existen
-        if 'hour' not in sensor_data.columns:
-            sensor_data['hour'] = sensor_data['datetime'].dt.hour
-        if 'period_of_day' not in sensor_data.columns:
-            sensor_data['period_of_day'] = pd.cut(
-                sensor_data['hour'],
-                bins=[-0.1, 6, 12, 18, 24],
-                labels=[0, 1, 2, 3]
-            ).astype(int)
-        if 'day_of_week' not in sensor_data.columns:
-            sensor_data['day_of_week'] = sensor_data['datetime'].dt.dayofweek
-        if 'is_weekend' not in sensor_data.columns:
-            sensor_data['is_weekend'] = (sensor_data['day_of_week'] >= 5).astype(int)
+        # Los datos del almacén ya traen las variables temporales; el modo manual las calcula
+        if not all(col in sensor_data.columns for col in TEMPORAL_COLUMNS):
+            sensor_data = add_temporal_features(sensor_data)
 
         # Verificar que tenemos todas las features necesarias
         feature_names = model_info.get('feature_names', [])
@@ -0,0 +1,128 @@
+"""
+Benchmark de memoria del contrato de DataFrame canónico (modules.frame_contract) frente
+al flujo anterior, que copiaba, convertía y reordenaba las lecturas en cada etapa
+(ventana de la etapa 2, combinación con la RMCAB y limpieza de outliers).
+
+Mide el pico de memoria con tracemalloc y el tiempo de cada flujo.
+
+Uso:
+    python benchmark_frame_memory.py [filas]
+"""
+
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from modules.calibration import remove_outliers
+from modules.frame_contract import canonicalize, time_slice
+from modules.training_frame import build_training_frame
+
+
+def build_inputs(n_rows, seed=42):
+    """Lecturas crudas sintéticas (cada minuto) y referencia horaria."""
+    rng = np.random.default_rng(seed)
+    datetimes = pd.date_range('2024-06-01', periods=n_rows, freq='min')
+    lowcost = pd.DataFrame({
+        'device_name': 'Aire1',
+        'datetime': datetimes,
+        'pm25': rng.gamma(2.0, 8.0, n_rows),
+        'pm10': rng.gamma(2.0, 14.0, n_rows),
+        'temperature': rng.normal(14, 3, n_rows),
+        'rh': rng.normal(70, 8, n_rows)
+    })
+    hours = pd.date_range(datetimes[0].floor('h'), datetimes[-1].ceil('h'), freq='h')
+    rmcab = pd.DataFrame({
+        'datetime': hours,
+        'pm25': rng.gamma(2.0, 8.0, len(hours)),
+        'pm10': rng.gamma(2.0, 14.0, len(hours))
+    })
+    return lowcost, rmcab
+
+
+def legacy_remove_outliers(df, columns, threshold=1.5):
+    """Implementación anterior: copia inicial y un filtro (copia) por columna."""
+    df_clean = df.copy()
+    for col in columns:
+        q1 = df_clean[col].quantile(0.25)
+        q3 = df_clean[col].quantile(0.75)
+        iqr = q3 - q1
+        mask = (df_clean[col] >= q1 - threshold * iqr) & (df_clean[col] <= q3 + threshold * iqr)
+        df_clean = df_clean[mask]
+    return df_clean
+
+
+def legacy_pipeline(lowcost, rmcab, start, end):
+    """Flujo anterior: copia y conversión defensiva en cada etapa."""
+    lowcost = lowcost.copy()
+    lowcost['datetime'] = pd.to_datetime(lowcost['datetime']).dt.tz_localize(None)
+    window = lowcost[(lowcost['datetime'] >= start) & (lowcost['datetime'] <= end)].copy()
+    window = window.sort_values('datetime')
+
+    rmcab = rmcab.copy()
+    rmcab['datetime'] = pd.to_datetime(rmcab['datetime']).dt.tz_localize(None)
+    rmcab = rmcab[(rmcab['datetime'] >= start) & (rmcab['datetime'] <= end)].copy()
+    rmcab = rmcab.sort_values('datetime')
+
+    left = window.copy()
+    right = rmcab.copy()
+    merged = pd.merge_asof(
+        left.set_index('datetime').sort_index(),
+        right.set_index('datetime').sort_index(),
+        left_index=True,
+        right_index=True,
+        tolerance=pd.Timedelta(hours=2),
+        suffixes=('_sensor', '_ref')
+    ).reset_index()
+    return legacy_remove_outliers(merged, ['pm25_sensor', 'pm10_sensor', 'temperature'])
+
+
+def canonical_pipeline(lowcost, rmcab, start, end):
+    """Flujo nuevo: ventanas como slices de DataFrames canónicos, sin copias intermedias."""
+    window = time_slice(lowcost, start, end)
+    rmcab = time_slice(rmcab, start, end)
+    merged, _ = build_training_frame(window, rmcab)
+    return remove_outliers(merged, ['pm25_sensor', 'pm10_sensor', 'temperature'])
+
+
+def measure(function, *args):
+    """Devuelve (pico de memoria en MB, segundos, resultado)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 ** 2, seconds, result
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    lowcost, rmcab = build_inputs(n_rows)
+    # Como en los cargadores: el contrato se aplica una vez al leer
+    lowcost = canonicalize(lowcost, 'lowcost')
+    rmcab = canonicalize(rmcab, 'reference')
+    start = lowcost['datetime'].iloc[n_rows // 10]
+    end = lowcost['datetime'].iloc[-n_rows // 10]
+    base_mb = lowcost.memory_usage(deep=True).sum() / 1024 ** 2
+
+    print("=" * 70)
+    print(f"BENCHMARK MEMORIA DATAFRAME CANÓNICO: {n_rows} lecturas ({base_mb:.1f} MB)")
+    print("=" * 70)
+
+    legacy_mb, legacy_seconds, legacy_result = measure(legacy_pipeline, lowcost, rmcab, start, end)
+    canonical_mb, canonical_seconds, canonical_result = measure(canonical_pipeline, lowcost, rmcab, start, end)
+
+    same = len(legacy_result) == len(canonical_result) and np.allclose(
+        legacy_result['pm25_ref'].to_numpy(), canonical_result['pm25_ref'].to_numpy(), equal_nan=True
+    )
+    print(f"Resultados equivalentes: {'sí' if same else 'NO'} ({len(canonical_result)} filas)")
+    print(f"   Anterior (copias por etapa): pico {legacy_mb:.1f} MB, {legacy_seconds:.3f} s")
+    print(f"   Contrato canónico (vistas):  pico {canonical_mb:.1f} MB, {canonical_seconds:.3f} s")
+    print(f"   Reducción del pico: {legacy_mb / canonical_mb:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Datos sintéticos compartidos por las pruebas.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.training_frame import add_temporal_features
+
+
+def synthetic_training_frame(hours, seed, start='2025-01-01', noise=1.0, skewed=False, missing_rh=0.0):
+    """
+    DataFrame de entrenamiento horario (salida tipo build_training_frame) de un dispositivo,
+    con PM2.5 de referencia = 0.7 · sensor − 0.1 · rh + 4 + ruido.
+
+    Args:
+        hours (int): Número de horas.
+        seed (int): Semilla del generador.
+        start: Primera hora.
+        noise (float): Desviación estándar del ruido de la referencia.
+        skewed (bool): Si True, el sensor sigue una lognormal (colas largas) en vez de una uniforme.
+        missing_rh (float): Fracción de horas sin humedad relativa.
+
+    Returns:
+        DataFrame: Columnas del sensor, clima, referencia y variables temporales.
+    """
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({'datetime': pd.date_range(start, periods=hours, freq='h')})
+    frame['pm25_sensor'] = rng.lognormal(3, 0.6, hours) if skewed else rng.uniform(5, 60, hours)
+    frame['temperature'] = rng.uniform(8, 22, hours)
+    frame['rh'] = rng.uniform(40, 95, hours)
+    if missing_rh:
+        frame.loc[rng.random(hours) < missing_rh, 'rh'] = np.nan
+    frame['pm25_ref'] = 0.7 * frame['pm25_sensor'] - 0.1 * frame['rh'] + 4 + rng.normal(0, noise, hours)
+    return add_temporal_features(frame)
+
+
+@pytest.fixture
+def make_training_frame():
+    """Fábrica de DataFrames de entrenamiento sintéticos (ver synthetic_training_frame)."""
+    return synthetic_training_frame
@@ -0,0 +1,356 @@
+"""
+Calibración lineal por lotes para toda la flota de sensores.
+
+Regresión lineal y Ridge son las fórmulas de producción (format_linear_formula), pero en el
+zoológico se ajustan un (dispositivo, contaminante) a la vez. Aquí todos los grupos se
+resuelven juntos: las filas de entrenamiento se centran por grupo y se apilan en un arreglo
+(grupos × filas × features) con relleno de ceros, y las ecuaciones normales de todos los
+grupos se forman con una sola multiplicación matricial por lotes y se resuelven con
+np.linalg.pinv / np.linalg.solve apilados.
+
+La preparación de cada grupo (limpieza, outliers y partición entrenamiento/prueba) es la
+misma de train_and_evaluate_models, de modo que los coeficientes coinciden con los de
+'Linear Regression' y 'Ridge Regression' del modo 'refit'. Los coeficientes de Ridge se
+devuelven en las unidades originales de las features (el escalado queda incorporado).
+"""
+
+import time
+from functools import lru_cache
+
+import numpy as np
+from sklearn.model_selection import ShuffleSplit
+
+from modules.calibration import POLLUTANT_LABELS, format_linear_formula
+from modules.training_frame import base_feature_names
+
+
+# Tolerancia relativa de pinv sobre la matriz de Gram equilibrada (≈ 1e-6 sobre los
+# valores singulares de X): por debajo, una dirección se considera colineal
+OLS_RCOND = 1e-12
+MIN_GROUP_ROWS = 60
+
+
+@lru_cache(maxsize=256)
+def _split_indices(n_rows, test_size):
+    """
+    Índices de train_test_split(random_state=42): solo dependen del número de filas. Se usa
+    el ShuffleSplit interno de train_test_split sin su validación ni indexación.
+    """
+    splitter = ShuffleSplit(n_splits=1, test_size=test_size, random_state=42)
+    return next(splitter.split(np.empty((n_rows, 0))))
+
+
+def _padded(groups, fill):
+    """Apila arreglos de distinto número de filas en (grupos × filas_max × columnas)."""
+    sizes = np.array([len(group) for group in groups])
+    shape = (len(groups), int(sizes.max())) + groups[0].shape[1:]
+    stacked = np.full(shape, fill, dtype=float)
+    for index, group in enumerate(groups):
+        stacked[index, :len(group)] = group
+    return stacked, sizes
+
+
+def _group_quantiles(values, counts, quantiles):
+    """
+    Cuantiles (interpolación lineal, como pandas y numpy) de cada grupo y columna.
+
+    Args:
+        values (ndarray): (grupos × filas × columnas) ordenado por filas, con +inf de relleno.
+        counts (ndarray): Filas válidas de cada grupo (grupos × columnas).
+        quantiles (list[float]): Cuantiles a calcular.
+
+    Returns:
+        list[ndarray]: Un arreglo (grupos × columnas) por cuantil.
+    """
+    results = []
+    last = np.maximum(counts - 1, 0)
+    for quantile in quantiles:
+        position = last * quantile
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, last)
+        fraction = position - lower
+        low_values = np.take_along_axis(values, lower[:, None, :], axis=1)[:, 0, :]
+        high_values = np.take_along_axis(values, upper[:, None, :], axis=1)[:, 0, :]
+        results.append(low_values + (high_values - low_values) * fraction)
+    return results
+
+
+def _outlier_mask(data, keep, columns, threshold=2.0):
+    """
+    remove_outliers (IQR) de todos los grupos a la vez: los límites de cada columna se
+    calculan sobre las filas que sobreviven a las columnas anteriores.
+    """
+    for column in columns:
+        values = data[:, :, column]
+        ordered = np.sort(np.where(keep, values, np.inf), axis=1)[..., None]
+        q1, q3 = _group_quantiles(ordered, keep.sum(axis=1)[:, None], [0.25, 0.75])
+        iqr = q3 - q1
+        keep = keep & (values >= q1 - threshold * iqr) & (values <= q3 + threshold * iqr)
+    return keep
+
+
+def prepare_linear_groups(training_frames, pollutants=('pm25', 'pm10'), test_size=0.25, remove_outliers_flag=True):
+    """
+    Matrices de entrenamiento y prueba de cada (dispositivo, contaminante), con la misma
+    limpieza (dropna e IQR con umbral 2.0) y partición que train_and_evaluate_models,
+    calculadas para todos los grupos a la vez.
+
+    Returns:
+        dict: (dispositivo, contaminante) -> X_train, X_test, y_train, y_test, feature_names
+        y conteos de registros, o {'error': ...} si el grupo no se puede calibrar.
+    """
+    groups = {}
+    pending = []
+    for device_name, training_frame in training_frames.items():
+        if training_frame is None or training_frame.empty:
+            for pollutant in pollutants:
+                groups[(device_name, pollutant)] = {'error': 'Datos insuficientes para la calibración', 'records': 0}
+            continue
+
+        plans = []
+        for pollutant in pollutants:
+            required_cols = [f'{pollutant}_sensor', f'{pollutant}_ref', 'temperature', 'rh']
+            missing_cols = [col for col in required_cols if col not in training_frame.columns]
+            if missing_cols:
+                groups[(device_name, pollutant)] = {
+                    'error': f"Columnas faltantes después del merge: {missing_cols}", 'records': 0
+                }
+                continue
+            feature_names = base_feature_names(training_frame, pollutant)
+            plans.append(((device_name, pollutant), required_cols, feature_names,
+                          list(dict.fromkeys(required_cols + feature_names))))
+
+        if not plans:
+            # Ningún contaminante utilizable: sus errores ya quedaron registrados
+            continue
+
+        # Una sola extracción de columnas por dispositivo para todos sus contaminantes
+        device_columns = list(dict.fromkeys(col for plan in plans for col in plan[3]))
+        values = np.column_stack([training_frame[col].to_numpy(dtype=float) for col in device_columns])
+        for key, required_cols, feature_names, columns in plans:
+            pending.append((key, required_cols, feature_names, columns,
+                            values[:, [device_columns.index(col) for col in columns]]))
+    if not pending:
+        return groups
+
+    # Los grupos se procesan juntos por número de columnas (normalmente todos iguales)
+    by_width = {}
+    for item in pending:
+        by_width.setdefault(len(item[3]), []).append(item)
+
+    for members in by_width.values():
+        data, sizes = _padded([item[4] for item in members], np.nan)
+        positions = [[item[3].index(col) for col in item[1]] for item in members]
+        required = np.stack([data[index][:, cols] for index, cols in enumerate(positions)])
+        keep = ~np.isnan(data).any(axis=2)
+        records = (~np.isnan(required).any(axis=2)).sum(axis=1)
+        if remove_outliers_flag:
+            keep = _outlier_mask(required, keep, range(required.shape[2]))
+
+        for index, (key, required_cols, feature_names, columns, _) in enumerate(members):
+            rows = data[index, :sizes[index]][keep[index, :sizes[index]]]
+            if len(rows) < MIN_GROUP_ROWS:
+                groups[key] = {'error': f"Datos insuficientes ({len(rows)} filas, mínimo {MIN_GROUP_ROWS} requeridas)",
+                               'records': int(records[index])}
+                continue
+            train_index, test_index = _split_indices(len(rows), test_size)
+            X = rows[:, [columns.index(col) for col in feature_names]]
+            y = rows[:, columns.index(required_cols[1])]
+            groups[key] = {
+                'X_train': X[train_index],
+                'X_test': X[test_index],
+                'y_train': y[train_index],
+                'y_test': y[test_index],
+                'feature_names': feature_names,
+                'records': int(records[index]),
+                'records_after_cleaning': int(len(rows)),
+                'outliers_removed': int(records[index] - len(rows))
+            }
+    return groups
+
+
+def group_moments(X_groups, y_groups):
+    """
+    Estadísticos suficientes de cada grupo con una sola multiplicación matricial por lotes:
+    matriz de Gram centrada, momento centrado X·y y medias.
+
+    Args:
+        X_groups (list[ndarray]): Matrices (n_g × d) con el mismo número de features.
+        y_groups (list[ndarray]): Objetivos de cada grupo.
+
+    Returns:
+        dict: 'gram' (grupos × d × d), 'moment' (grupos × d), 'x_mean', 'y_mean' y 'sizes'.
+    """
+    # Un corrimiento común reduce la cancelación al centrar con sumas de productos
+    x_shift = np.concatenate(X_groups).mean(axis=0)
+    y_shift = float(np.concatenate(y_groups).mean())
+    augmented, sizes = _padded(
+        [np.column_stack([X - x_shift, np.asarray(y, dtype=float) - y_shift, np.ones(len(y))])
+         for X, y in zip(X_groups, y_groups)],
+        0.0
+    )
+    sums = np.swapaxes(augmented, 1, 2) @ augmented
+    d = len(x_shift)
+    counts = sizes.astype(float)
+    x_mean = sums[:, :d, d + 1] / counts[:, None]
+    y_mean = sums[:, d, d + 1] / counts
+    gram = sums[:, :d, :d] - counts[:, None, None] * x_mean[:, :, None] * x_mean[:, None, :]
+    moment = sums[:, :d, d] - counts[:, None] * x_mean * y_mean[:, None]
+    return {
+        'gram': gram,
+        'moment': moment,
+        'x_mean': x_mean + x_shift,
+        'y_mean': y_mean + y_shift,
+        'sizes': sizes
+    }
+
+
+def group_scales(X_groups, moments, robust_scaling=True):
+    """
+    Escala de cada feature por grupo como la del escalador del zoológico: rango
+    intercuartílico (RobustScaler) o desviación estándar (StandardScaler).
+    """
+    if robust_scaling:
+        X, sizes = _padded(X_groups, np.inf)
+        counts = np.broadcast_to(sizes[:, None], (len(sizes), X.shape[2]))
+        q25, q75 = _group_quantiles(np.sort(X, axis=1), counts, [0.25, 0.75])
+        scale = q75 - q25
+    else:
+        scale = np.sqrt(np.diagonal(moments['gram'], axis1=1, axis2=2) / moments['sizes'][:, None])
+    return np.where(scale < 10 * np.finfo(float).eps, 1.0, scale)
+
+
+def solve_from_moments(moments, alpha=0.0, scale=None):
+    """
+    Resuelve las ecuaciones normales apiladas de todos los grupos.
+
+    Con alpha=0 es la solución de norma mínima de mínimos cuadrados (como LinearRegression).
+    Con alpha>0 es Ridge sobre las features divididas por `scale`; el centrado del escalador
+    no cambia la solución, de modo que basta con escalar la matriz de Gram.
+
+    Returns:
+        tuple[ndarray, ndarray]: Coeficientes (grupos × d) en unidades originales e interceptos.
+    """
+    gram, moment = moments['gram'], moments['moment']
+    if alpha > 0:
+        scaled_gram = gram / (scale[:, :, None] * scale[:, None, :])
+        ridge = scaled_gram + alpha * np.eye(gram.shape[-1])
+        coef = np.linalg.solve(ridge, (moment / scale)[..., None])[..., 0] / scale
+    else:
+        # Equilibrado de columnas antes de pinv
+        norms = np.sqrt(np.clip(np.diagonal(gram, axis1=1, axis2=2), 0.0, None))
+        norms = np.where(norms > 0, norms, 1.0)
+        equilibrated = gram / (norms[:, :, None] * norms[:, None, :])
+        coef = (np.linalg.pinv(equilibrated, rcond=OLS_RCOND, hermitian=True) @ (moment / norms)[..., None])[..., 0]
+        coef = coef / norms
+    intercept = moments['y_mean'] - np.sum(moments['x_mean'] * coef, axis=1)
+    return coef, intercept
+
+
+def solve_linear_batch(X_groups, y_groups, alpha=0.0, robust_scaling=True):
+    """
+    Coeficientes de mínimos cuadrados (alpha=0) o Ridge (alpha>0) de muchos grupos a la vez.
+
+    Args:
+        X_groups (list[ndarray]): Matrices (n_g × d) con el mismo número de features.
+        y_groups (list[ndarray]): Objetivos de cada grupo.
+        alpha (float): Regularización de Ridge. Como en el zoológico, Ridge se ajusta sobre
+            las features escaladas por grupo (RobustScaler o StandardScaler).
+        robust_scaling (bool): Escalado de Ridge: rango intercuartílico (True) o desviación
+            estándar (False).
+
+    Returns:
+        tuple[ndarray, ndarray]: Coeficientes (grupos × d) en unidades originales e interceptos.
+    """
+    moments = group_moments(X_groups, y_groups)
+    scale = group_scales(X_groups, moments, robust_scaling) if alpha > 0 else None
+    return solve_from_moments(moments, alpha, scale)
+
+
+def _test_metrics(X_test, y_test, coef, intercept):
+    predictions = X_test @ coef + intercept
+    residual = np.sum((y_test - predictions) ** 2)
+    total = np.sum((y_test - y_test.mean()) ** 2)
+    return {
+        'r2': round(float(1 - residual / total), 4) if total > 0 else 0.0,
+        'rmse': round(float(np.sqrt(residual / len(y_test))), 4)
+    }
+
+
+def _linear_entry(coef, intercept, feature_names, pollutant, metrics):
+    coefficients = [round(float(value), 6) for value in coef]
+    intercept = round(float(intercept), 6)
+    return {
+        'formula': format_linear_formula(coefficients, intercept, feature_names, pollutant),
+        'coefficients': coefficients,
+        'intercept': intercept,
+        'feature_names': list(feature_names),
+        **metrics
+    }
+
+
+def fleet_linear_calibration(training_frames, pollutants=('pm25', 'pm10'), test_size=0.25, alpha=1.0,
+                             remove_outliers_flag=True, use_robust_scaler=True):
+    """
+    Fórmulas lineales (OLS y Ridge) de todos los dispositivos y contaminantes en un lote.
+
+    Args:
+        training_frames (dict): Dispositivo -> DataFrame de entrenamiento (build_training_frame).
+        pollutants (iterable): Contaminantes a calibrar.
+        test_size (float): Proporción para el conjunto de prueba.
+        alpha (float): Regularización de Ridge (como 'Ridge Regression' del zoológico).
+        remove_outliers_flag (bool): Si True, elimina outliers como el zoológico.
+        use_robust_scaler (bool): Escalado de Ridge (RobustScaler o StandardScaler).
+
+    Returns:
+        dict: Dispositivo -> {'device', 'pollutant_results'}; cada entrada tiene
+        'linear_regression' y 'ridge_regression' con fórmula, coeficientes, intercepto,
+        features y métricas de prueba.
+    """
+    start = time.perf_counter()
+    groups = prepare_linear_groups(training_frames, pollutants, test_size, remove_outliers_flag)
+    entries = {}
+    buckets = {}
+    for key, group in groups.items():
+        entries[key] = {
+            'pollutant': key[1],
+            'pollutant_label': POLLUTANT_LABELS.get(key[1], key[1].upper()),
+            'records': group.get('records', 0),
+            'records_after_cleaning': group.get('records_after_cleaning', 0),
+            'outliers_removed': group.get('outliers_removed', 0),
+            'linear_regression': None,
+            'ridge_regression': None,
+            'error': group.get('error')
+        }
+        if not group.get('error'):
+            # Los grupos con las mismas features se resuelven juntos
+            buckets.setdefault(tuple(group['feature_names']), []).append((key, group))
+    prepared_at = time.perf_counter()
+
+    for members in buckets.values():
+        X_groups = [group['X_train'] for _, group in members]
+        moments = group_moments(X_groups, [group['y_train'] for _, group in members])
+        solutions = {
+            'linear_regression': solve_from_moments(moments),
+            'ridge_regression': solve_from_moments(
+                moments, alpha, group_scales(X_groups, moments, use_robust_scaler)
+            )
+        }
+        for index, (key, group) in enumerate(members):
+            pollutant = key[1]
+            for name, (coef, intercept) in solutions.items():
+                metrics = _test_metrics(group['X_test'], group['y_test'], coef[index], intercept[index])
+                entries[key][name] = _linear_entry(coef[index], intercept[index], group['feature_names'], pollutant, metrics)
+    solved_at = time.perf_counter()
+
+    n_groups = sum(len(members) for members in buckets.values())
+    print(f"📐 Calibración lineal por lotes: {n_groups} grupos, preparación {prepared_at - start:.3f}s, "
+          f"solución {solved_at - prepared_at:.3f}s")
+
+    return {
+        device_name: {
+            'device': device_name,
+            'pollutant_results': [entries[(device_name, pollutant)] for pollutant in pollutants]
+        }
+        for device_name in training_frames
+    }
@@ -6,7 +6,12 @@ import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split, cross_val_score, KFold
 from sklearn.linear_model import LinearRegression, Ridge
-from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor, GradientBoostingRegressor
+from sklearn.ensemble import (
+    RandomForestRegressor,
+    ExtraTreesRegressor,
+    GradientBoostingRegressor,
+    HistGradientBoostingRegressor
+)
 from sklearn.svm import SVR
 from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
 from sklearn.preprocessing import StandardScaler, RobustScaler
@@ -17,6 +22,58 @@ from datetime import datetime
 import warnings
 import builtins
 import sys
+import time
+
+from modules.calibration_cache import (
+    CALIBRATION_CACHE_ENABLED,
+    content_key,
+    estimator_signature,
+    frame_digest,
+    lookup as cache_lookup,
+    store as cache_store
+)
+from modules.early_stopping import (
+    EARLY_STOPPING_ROUNDS,
+    EARLY_STOPPING_VALIDATION_FRACTION,
+    EarlyStoppingRegressor,
+    effective_iterations
+)
+from modules.feature_engine import advanced_feature_columns, compute_advanced_features
+from modules.fold_evaluation import (
+    EVALUATION_MODE,
+    FOLD_SPLITS,
+    STACKING_ENABLED,
+    STACKING_MODEL_NAME,
+    fit_fold_models,
+    stack_fold_predictions
+)
+from modules.kernel_approximation import (
+    SVR_APPROXIMATION_ROWS,
+    SVR_NYSTROEM_COMPONENTS,
+    ApproximateSVR,
+    approximate_svr
+)
+from modules.model_selection import STAGE2_SELECTION_MODE, selection_signature, successive_halving
+from modules.model_scheduler import (
+    TRAINING_TIME_BUDGET,
+    estimate_seconds,
+    fan_out,
+    model_job,
+    record_costs,
+    train_model_zoo
+)
+from modules.sequence_models import (
+    LSTM_BATCH_SIZE,
+    LSTM_LOOKBACK,
+    LSTM_PATIENCE,
+    LSTM_SHARED_TOLERANCE,
+    TENSORFLOW_AVAILABLE,
+    prepare_sequences,
+    train_sequence_variant,
+    variant_lookback
+)
+from modules.training_frame import build_training_frame, get_training_frame, partition_by_device
+
 warnings.filterwarnings('ignore')
 
 
@@ -54,16 +111,6 @@ try:
 except Exception:
     LIGHTGBM_AVAILABLE = False
 
-try:
-    import tensorflow as tf
-    from tensorflow.keras import Sequential
-    from tensorflow.keras.layers import LSTM, Dense, Dropout
-    from tensorflow.keras.callbacks import EarlyStopping
-    from tensorflow.keras.optimizers import Adam
-    TENSORFLOW_AVAILABLE = True
-except Exception:
-    TENSORFLOW_AVAILABLE = False
-
 
 FEATURE_LABELS = {
     'pm25_sensor': 'PM2.5 sensor',
@@ -105,10 +152,17 @@ POLLUTANT_LABELS = {
     'pm10': 'PM10'
 }
 
-def get_calibration_models():
+# Puntos de los diagramas de dispersión (los modelos que no son el mejor conservan solo estos)
+SCATTER_MAX_POINTS = 400
+
+def get_calibration_models(n_samples=None):
     """
     Retorna diccionario con modelos de calibración optimizados
 
+    Args:
+        n_samples (int, optional): Filas de entrenamiento. Desde SVR_APPROXIMATION_ROWS los
+            SVR se reemplazan por su aproximación de núcleo (ver modules.kernel_approximation)
+
     Returns:
         dict: Diccionario con nombre: modelo
     """
@@ -127,7 +181,7 @@ def get_calibration_models():
         'SVR (RBF)': SVR(kernel='rbf', C=10.0, gamma='scale', epsilon=0.1),
         'SVR (Polynomial)': SVR(kernel='poly', C=1.0, degree=2, gamma='scale', epsilon=0.1)
     }
-    return models
+    return {name: approximate_svr(model, n_samples) for name, model in models.items()}
 
 
 def calculate_mape(y_true, y_pred):
@@ -209,52 +263,77 @@ def detect_overfitting(r2_train, r2_test, rmse_train, rmse_test):
         }
 
 
-def evaluate_model(model, X_train, X_test, y_train, y_test, model_name, feature_names=None, use_cross_val=True):
+def _prediction_metrics(model_name, y_train, y_pred_train, y_test, y_pred_test, n_features):
+    """
+    Métricas de entrenamiento y prueba a partir de predicciones ya calculadas.
+
+    Returns:
+        dict: Resultado con el formato de evaluate_model (sin modelo ni validación cruzada).
+    """
+    r2 = r2_score(y_test, y_pred_test)
+    rmse = np.sqrt(mean_squared_error(y_test, y_pred_test))
+    mae = mean_absolute_error(y_test, y_pred_test)
+    mape = calculate_mape(y_test, y_pred_test)
+
+    r2_train = r2_score(y_train, y_pred_train)
+    rmse_train = np.sqrt(mean_squared_error(y_train, y_pred_train))
+
+    # R² ajustado
+    r2_adjusted = calculate_adjusted_r2(r2, len(y_test), n_features)
+
+    # Detección de overfitting
+    overfitting_info = detect_overfitting(r2_train, r2, rmse_train, rmse)
+
+    return {
+        'model_name': model_name,
+        'r2': round(float(r2), 4),
+        'r2_train': round(float(r2_train), 4),
+        'r2_adjusted': round(float(r2_adjusted), 4),
+        'rmse': round(float(rmse), 4),
+        'rmse_train': round(float(rmse_train), 4),
+        'mae': round(float(mae), 4),
+        'mape': round(float(mape), 2),
+        'overfitting': overfitting_info,
+        'actual': np.asarray(y_test, dtype=np.float32).ravel(),
+        'predicted': np.asarray(y_pred_test, dtype=np.float32).ravel()
+    }
+
+
+def evaluate_model(model, X_train, X_test, y_train, y_test, model_name, feature_names=None, use_cross_val=True,
+                   cv_n_jobs=-1, evaluation_mode=None):
     """
     Evalúa un modelo con métricas completas incluyendo validación cruzada
+
+    cv_n_jobs limita los procesos de la validación cruzada cuando el modelo ya se entrena
+    dentro de un pool con presupuesto de núcleos (ver modules.model_scheduler).
+
+    Con evaluation_mode='folds' (default: EVALUATION_MODE) los modelos de los folds se
+    entrenan una sola vez y su promedio es el modelo evaluado y devuelto; la validación
+    cruzada y las predicciones fuera de fold ('oof_predictions') salen de esos mismos ajustes.
     """
     try:
-        model.fit(X_train, y_train)
+        mode = evaluation_mode or EVALUATION_MODE
+        fold_scores = None
+        oof_predictions = None
+        if mode == 'folds' and use_cross_val and len(X_train) >= 100:
+            model, oof_predictions, fold_scores = fit_fold_models(model, X_train, y_train, n_jobs=cv_n_jobs)
+        else:
+            model.fit(X_train, y_train)
 
         y_pred_train = model.predict(X_train)
         y_pred_test = model.predict(X_test)
 
-        # Métricas básicas
-        r2 = r2_score(y_test, y_pred_test)
-        rmse = np.sqrt(mean_squared_error(y_test, y_pred_test))
-        mae = mean_absolute_error(y_test, y_pred_test)
-        mape = calculate_mape(y_test, y_pred_test)
+        result = _prediction_metrics(model_name, y_train, y_pred_train, y_test, y_pred_test, X_test.shape[1])
 
-        r2_train = r2_score(y_train, y_pred_train)
-        rmse_train = np.sqrt(mean_squared_error(y_train, y_pred_train))
-        
-        # R² ajustado
-        n_samples = len(y_test)
-        n_features = X_test.shape[1]
-        r2_adjusted = calculate_adjusted_r2(r2, n_samples, n_features)
-        
-        # Detección de overfitting
-        overfitting_info = detect_overfitting(r2_train, r2, rmse_train, rmse)
-
-        result = {
-            'model_name': model_name,
-            'r2': round(float(r2), 4),
-            'r2_train': round(float(r2_train), 4),
-            'r2_adjusted': round(float(r2_adjusted), 4),
-            'rmse': round(float(rmse), 4),
-            'rmse_train': round(float(rmse_train), 4),
-            'mae': round(float(mae), 4),
-            'mape': round(float(mape), 2),
-            'overfitting': overfitting_info,
-            'actual': [float(val) for val in np.array(y_test).ravel().tolist()],
-            'predicted': [float(val) for val in np.array(y_pred_test).ravel().tolist()]
-        }
-        
+        if fold_scores is not None:
+            result['cv_r2_mean'] = round(float(fold_scores.mean()), 4)
+            result['cv_r2_std'] = round(float(fold_scores.std()), 4)
+            result['oof_predictions'] = oof_predictions
         # Validación cruzada (opcional, solo si hay suficientes datos)
-        if use_cross_val and len(X_train) >= 100:
+        elif use_cross_val and len(X_train) >= 100:
             try:
                 kfold = KFold(n_splits=5, shuffle=True, random_state=42)
-                cv_scores = cross_val_score(model, X_train, y_train, cv=kfold, scoring='r2', n_jobs=-1)
+                cv_scores = cross_val_score(model, X_train, y_train, cv=kfold, scoring='r2', n_jobs=cv_n_jobs)
                 result['cv_r2_mean'] = round(float(cv_scores.mean()), 4)
                 result['cv_r2_std'] = round(float(cv_scores.std()), 4)
             except Exception:
@@ -266,10 +345,15 @@ def evaluate_model(model, X_train, X_test, y_train, y_test, model_name, feature_
             if isinstance(coefficients, np.ndarray):
                 coefficients = coefficients.ravel()
             result['coefficients'] = [round(float(coef), 6) for coef in np.atleast_1d(coefficients)]
-            result['intercept'] = round(float(model.intercept_), 6)
+            result['intercept'] = round(float(np.ravel(model.intercept_)[0]), 6)
             if feature_names:
                 result['feature_names'] = list(feature_names)
 
+        # Iteraciones efectivas de los modelos de boosting con parada temprana
+        n_iterations = effective_iterations(model)
+        if n_iterations is not None:
+            result['n_iterations'] = n_iterations
+
         # Guardar el modelo entrenado completo (necesario para modelos no lineales)
         result['trained_model'] = model
 
@@ -298,33 +382,39 @@ def remove_outliers(df, columns, method='iqr', threshold=1.5):
     Returns:
         DataFrame sin outliers
     """
-    df_clean = df.copy()
-    
+    # Se acumula una máscara (los límites de cada columna se calculan sobre las filas que
+    # sobreviven a las anteriores) y se selecciona una sola vez al final
+    keep = np.ones(len(df), dtype=bool)
+
     for col in columns:
-        if col not in df_clean.columns:
+        if col not in df.columns:
             continue
-            
+
+        values = df[col]
+        remaining = values[keep]
         if method == 'iqr':
-            Q1 = df_clean[col].quantile(0.25)
-            Q3 = df_clean[col].quantile(0.75)
+            Q1 = remaining.quantile(0.25)
+            Q3 = remaining.quantile(0.75)
             IQR = Q3 - Q1
             lower_bound = Q1 - threshold * IQR
             upper_bound = Q3 + threshold * IQR
-            mask = (df_clean[col] >= lower_bound) & (df_clean[col] <= upper_bound)
+            mask = (values >= lower_bound) & (values <= upper_bound)
         else:  # zscore
-            mean = df_clean[col].mean()
-            std = df_clean[col].std()
-            mask = np.abs((df_clean[col] - mean) / std) <= threshold
-        
-        df_clean = df_clean[mask]
-    
-    return df_clean
+            mean = remaining.mean()
+            std = remaining.std()
+            mask = np.abs((values - mean) / std) <= threshold
+
+        keep &= mask.to_numpy()
+
+    return df[keep]
 
 
 def add_advanced_features(merged, pollutant):
     """
     Genera variables avanzadas (lags, ventanas móviles y componentes cíclicas).
 
+    Las ventanas se miden en horas por dispositivo (ver modules.feature_engine).
+
     Args:
         merged (DataFrame): Datos combinados después del merge asof.
         pollutant (str): 'pm25' o 'pm10'.
@@ -332,56 +422,18 @@ def add_advanced_features(merged, pollutant):
     Returns:
         tuple[DataFrame, list[str]]: DataFrame con columnas agregadas y listado de columnas nuevas.
     """
-    if merged.empty:
+    if merged.empty or f'{pollutant}_sensor' not in merged.columns:
         return merged, []
 
-    df = merged.sort_values('datetime').copy()
-    target_col = f'{pollutant}_sensor'
-    if target_col not in df.columns:
-        return df, []
-
-    new_columns = []
-
-    # Lags temporales
-    for lag in [1, 3, 6]:
-        col_name = f'{target_col}_lag_{lag}h'
-        df[col_name] = df[target_col].shift(lag)
-        df[col_name] = df[col_name].fillna(df[target_col])
-        new_columns.append(col_name)
-
-    # Medias y desviaciones móviles
-    for window in [3, 6, 12]:
-        mean_col = f'{target_col}_roll_mean_{window}h'
-        std_col = f'{target_col}_roll_std_{window}h'
-        df[mean_col] = df[target_col].rolling(window, min_periods=1).mean()
-        df[std_col] = df[target_col].rolling(window, min_periods=2).std()
-        df[std_col] = df[std_col].fillna(0.0)
-        new_columns.extend([mean_col, std_col])
-
-    if 'temperature' in df.columns:
-        df['temperature_roll_mean_6h'] = df['temperature'].rolling(6, min_periods=1).mean()
-        new_columns.append('temperature_roll_mean_6h')
-
-    if 'rh' in df.columns:
-        df['rh_roll_mean_6h'] = df['rh'].rolling(6, min_periods=1).mean()
-        new_columns.append('rh_roll_mean_6h')
-
-    if 'hour' in df.columns:
-        df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24.0)
-        df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24.0)
-        new_columns.extend(['hour_sin', 'hour_cos'])
-
-    if 'day_of_week' in df.columns:
-        df['day_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7.0)
-        df['day_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7.0)
-        new_columns.extend(['day_sin', 'day_cos'])
-
-    return df, new_columns
+    df, _ = compute_advanced_features(merged, pollutants=(pollutant,))
+    return df, advanced_feature_columns(pollutant, df.columns)
 
 
 def build_extra_model_definitions():
     """
-    Define modelos avanzados adicionales a evaluar en la etapa 2.
+    Define modelos avanzados adicionales a evaluar en la etapa 2. Los modelos de boosting
+    usan parada temprana sobre una partición de validación interna (ver
+    modules.early_stopping): `n_estimators` es solo el máximo de iteraciones.
 
     Returns:
         list[dict]: Cada dict incluye el estimador y si requiere features escaladas.
@@ -406,6 +458,21 @@ def build_extra_model_definitions():
                 learning_rate=0.05,
                 max_depth=5,
                 subsample=0.8,
+                validation_fraction=EARLY_STOPPING_VALIDATION_FRACTION,
+                n_iter_no_change=EARLY_STOPPING_ROUNDS,
+                random_state=42
+            ),
+            'use_scaled': False
+        },
+        {
+            'name': 'HistGradientBoosting',
+            'estimator': HistGradientBoostingRegressor(
+                max_iter=500,
+                learning_rate=0.05,
+                max_leaf_nodes=31,
+                early_stopping=True,
+                validation_fraction=EARLY_STOPPING_VALIDATION_FRACTION,
+                n_iter_no_change=EARLY_STOPPING_ROUNDS,
                 random_state=42
             ),
             'use_scaled': False
@@ -415,7 +482,7 @@ def build_extra_model_definitions():
     if XGBOOST_AVAILABLE:
         models.append({
             'name': 'XGBoost',
-            'estimator': XGBRegressor(
+            'estimator': EarlyStoppingRegressor(XGBRegressor(
                 n_estimators=600,
                 learning_rate=0.05,
                 max_depth=6,
@@ -425,14 +492,14 @@ def build_extra_model_definitions():
                 random_state=42,
                 n_jobs=-1,
                 objective='reg:squarederror'
-            ),
+            )),
             'use_scaled': False
         })
 
     if LIGHTGBM_AVAILABLE:
         models.append({
             'name': 'LightGBM',
-            'estimator': LGBMRegressor(
+            'estimator': EarlyStoppingRegressor(LGBMRegressor(
                 n_estimators=800,
                 learning_rate=0.05,
                 max_depth=-1,
@@ -441,8 +508,9 @@ def build_extra_model_definitions():
                 colsample_bytree=0.9,
                 reg_lambda=0.5,
                 random_state=42,
-                n_jobs=-1
-            ),
+                n_jobs=-1,
+                verbose=-1
+            )),
             'use_scaled': False
         })
 
@@ -451,7 +519,8 @@ def build_extra_model_definitions():
 
 def get_default_lstm_configs():
     """
-    Configuraciones base para probar variantes de LSTM.
+    Configuraciones base para probar variantes de LSTM. 'lookback' (default: LSTM_LOOKBACK)
+    y 'batch_size' (default: proporcional a las filas) son opcionales.
     """
     return [
         {
@@ -460,7 +529,6 @@ def get_default_lstm_configs():
             'layers': 1,
             'dropout': 0.1,
             'epochs': 80,
-            'batch_size': 32,
             'learning_rate': 0.001
         },
         {
@@ -469,7 +537,6 @@ def get_default_lstm_configs():
             'layers': 2,
             'dropout': 0.2,
             'epochs': 120,
-            'batch_size': 32,
             'learning_rate': 0.001
         },
         {
@@ -478,120 +545,140 @@ def get_default_lstm_configs():
             'layers': 2,
             'dropout': 0.3,
             'epochs': 120,
-            'batch_size': 32,
             'learning_rate': 0.0007,
             'bidirectional': True
         }
     ]
 
 
-def train_lstm_variants(X_train, X_test, y_train, y_test, feature_names, configs):
+def train_lstm_variants(X, y, train_index, test_index, feature_names, configs, datetimes=None, deadline=None,
+                        progress=None):
     """
-    Entrena configuraciones de LSTM y devuelve métricas comparables.
+    Entrena configuraciones de LSTM sobre ventanas de las horas anteriores de cada fila
+    (ver modules.sequence_models) y devuelve métricas comparables con el resto del zoológico:
+    se evalúan exactamente las mismas filas de prueba.
+
+    Con `deadline` (time.monotonic()) se omiten las variantes cuyo costo estimado no cabe en
+    el tiempo restante y el entrenamiento en curso se detiene al final de la época en que
+    vence el plazo. `progress` recibe un evento por variante. Cada resultado informa el
+    tiempo de entrenamiento y la latencia de inferencia por fila.
+
+    Args:
+        X, y (ndarray): Features y objetivo de todas las filas limpias.
+        train_index, test_index (ndarray): Partición de train_and_evaluate_models.
+        datetimes (array, optional): Fecha de cada fila, para ordenar las ventanas.
+
+    Returns:
+        tuple[list[dict], list[str], list[str]]: Resultados, mensajes y variantes omitidas.
     """
     results = []
     logs = []
+    skipped = []
 
     if not configs:
-        return results, logs
+        return results, logs, skipped
 
     if not TENSORFLOW_AVAILABLE:
         logs.append('TensorFlow/Keras no está instalado. Se omiten modelos LSTM.')
-        return results, logs
+        return results, logs, skipped
 
-    # Asegurar np.ndarray float32
-    X_train = np.asarray(X_train, dtype=np.float32)
-    X_test = np.asarray(X_test, dtype=np.float32)
-    y_train = np.asarray(y_train, dtype=np.float32).reshape(-1, 1)
-    y_test = np.asarray(y_test, dtype=np.float32).reshape(-1, 1)
-
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-
-    X_train_seq = np.reshape(X_train_scaled, (X_train_scaled.shape[0], 1, X_train_scaled.shape[1]))
-    X_test_seq = np.reshape(X_test_scaled, (X_test_scaled.shape[0], 1, X_test_scaled.shape[1]))
+    prepared = prepare_sequences(
+        X, y, train_index, test_index, datetimes=datetimes,
+        max_lookback=max(variant_lookback(config) for config in configs)
+    )
+    y_train = prepared['y'][prepared['train']]
+    y_test = prepared['y'][prepared['test']]
+    # Estado de la parada temprana común a las variantes
+    board = {}
 
     for config in configs:
         name = config.get('name', 'LSTM')
+        if deadline is not None and time.monotonic() + estimate_seconds(name, None, len(y_train)) > deadline:
+            skipped.append(name)
+            logs.append(f'LSTM "{name}" omitido por presupuesto de tiempo')
+            if progress is not None:
+                progress({'stage': 'model', 'model': name, 'status': 'skipped'})
+            continue
         try:
-            tf.keras.backend.clear_session()
-            model = Sequential()
-            units = int(config.get('units', 32))
-            layers = int(config.get('layers', 1))
-            dropout = float(config.get('dropout', 0.0))
-            bidirectional = bool(config.get('bidirectional', False))
-
-            for layer_idx in range(layers):
-                return_sequences = layer_idx < layers - 1
-                lstm_layer = LSTM(units, return_sequences=return_sequences)
-                if bidirectional:
-                    from tensorflow.keras.layers import Bidirectional
-                    lstm_layer = Bidirectional(lstm_layer)
-
-                model.add(lstm_layer)
-                if dropout > 0:
-                    model.add(Dropout(dropout))
-
-            model.add(Dense(32, activation='relu'))
-            model.add(Dense(1, activation='linear'))
-
-            learning_rate = float(config.get('learning_rate', 0.001))
-            optimizer = Adam(learning_rate=learning_rate)
-            model.compile(optimizer=optimizer, loss='mse', metrics=['mae'])
-
-            epochs = int(config.get('epochs', 100))
-            batch_size = int(config.get('batch_size', 32))
-
-            callbacks = [
-                EarlyStopping(
-                    monitor='val_loss',
-                    patience=15,
-                    restore_best_weights=True
-                )
-            ]
+            fitted = train_sequence_variant(prepared, config, board, deadline=deadline)
 
-            history = model.fit(
-                X_train_seq,
-                y_train,
-                validation_split=0.2,
-                epochs=epochs,
-                batch_size=batch_size,
-                verbose=0,
-                callbacks=callbacks
+            result = _prediction_metrics(
+                name, y_train, fitted['train_pred'], y_test, fitted['test_pred'], len(feature_names)
             )
-
-            train_pred = model.predict(X_train_seq, verbose=0).ravel()
-            test_pred = model.predict(X_test_seq, verbose=0).ravel()
-
-            r2 = r2_score(y_test, test_pred)
-            rmse = np.sqrt(mean_squared_error(y_test, test_pred))
-            mae = mean_absolute_error(y_test, test_pred)
-            mape = calculate_mape(y_test, test_pred)
-
-            r2_train = r2_score(y_train, train_pred)
-            rmse_train = np.sqrt(mean_squared_error(y_train, train_pred))
-
-            results.append({
-                'model_name': name,
-                'r2': round(float(r2), 4),
-                'r2_train': round(float(r2_train), 4),
-                'r2_adjusted': round(float(calculate_adjusted_r2(r2, len(y_test), X_test.shape[1])), 4),
-                'rmse': round(float(rmse), 4),
-                'rmse_train': round(float(rmse_train), 4),
-                'mae': round(float(mae), 4),
-                'mape': round(float(mape), 2),
-                'actual': [float(val) for val in y_test.ravel().tolist()],
-                'predicted': [float(val) for val in test_pred.tolist()],
-                'history': {k: [float(x) for x in v] for k, v in history.history.items()},
+            result.update({
+                'history': fitted['history'],
                 'feature_names': list(feature_names),
-                'is_lstm': True
+                'is_lstm': True,
+                'lookback': fitted['lookback'],
+                'batch_size': fitted['batch_size'],
+                'epochs': fitted['epochs'],
+                'stopped_by_shared_best': fitted['stopped_by_shared_best'],
+                'training_seconds': round(fitted['training_seconds'], 3),
+                'inference_ms_per_row': round(1000 * fitted['inference_seconds'] / max(len(y_test), 1), 4)
             })
+            results.append(result)
+            print(f"🧠 {name}: ventana {fitted['lookback']}h, {fitted['epochs']} épocas, "
+                  f"{result['training_seconds']}s de entrenamiento, {result['inference_ms_per_row']} ms/fila")
+            record_costs([(name, 'LSTM', len(y_train), fitted['training_seconds'])])
+            if progress is not None:
+                progress({'stage': 'model', 'model': name, 'status': 'completed'})
 
         except Exception as exc:
             logs.append(f'LSTM "{name}" falló: {exc}')
+            if progress is not None:
+                progress({'stage': 'model', 'model': name, 'status': 'failed'})
 
-    return results, logs
+    return results, logs, skipped
+
+
+def calibration_cache_key(
+    training_frame,
+    pollutant='pm25',
+    test_size=0.25,
+    feature_columns=None,
+    remove_outliers_flag=True,
+    use_robust_scaler=True,
+    advanced_features=False,
+    extra_models=None,
+    lstm_configs=None,
+    selection_mode='full',
+    keep_models=None
+):
+    """
+    Clave de caché de una calibración (ver modules.calibration_cache): contenido del
+    DataFrame de entrenamiento, opciones que definen las features y configuración del
+    zoológico de modelos. Recibe los mismos argumentos que train_and_evaluate_models.
+
+    Returns:
+        str: Hash hexadecimal.
+    """
+    zoo = [estimator_signature(name, model) for name, model in get_calibration_models().items()]
+    for model_def in extra_models or []:
+        estimator = model_def['estimator']
+        zoo.append(estimator_signature(model_def.get('name', estimator.__class__.__name__), estimator)
+                   + [bool(model_def.get('use_scaled', False))])
+    return content_key(
+        frame_digest(training_frame),
+        {
+            'pollutant': pollutant,
+            'test_size': test_size,
+            'feature_columns': list(feature_columns) if feature_columns else None,
+            'remove_outliers': bool(remove_outliers_flag),
+            'robust_scaler': bool(use_robust_scaler),
+            'advanced_features': bool(advanced_features)
+        },
+        zoo,
+        {
+            'lstm': list(lstm_configs or []) if TENSORFLOW_AVAILABLE else [],
+            'lstm_engine': [LSTM_LOOKBACK, LSTM_BATCH_SIZE, LSTM_PATIENCE, LSTM_SHARED_TOLERANCE],
+            'evaluation_mode': EVALUATION_MODE,
+            'fold_splits': FOLD_SPLITS,
+            'stacking': STACKING_ENABLED,
+            'selection': selection_signature(selection_mode),
+            'svr_approximation': [SVR_APPROXIMATION_ROWS, SVR_NYSTROEM_COMPONENTS],
+            'keep_models': sorted(keep_models or [])
+        }
+    )
 
 
 def train_and_evaluate_models(
@@ -605,7 +692,16 @@ def train_and_evaluate_models(
     use_robust_scaler=True,
     advanced_features=False,
     extra_models=None,
-    lstm_configs=None
+    lstm_configs=None,
+    training_frame=None,
+    core_budget=None,
+    time_budget=None,
+    progress=None,
+    use_cache=None,
+    force_refresh=False,
+    calibration_key=None,
+    selection_mode='full',
+    keep_models=None
 ):
     """
     Entrena y evalúa múltiples modelos con manejo mejorado de datos
@@ -619,10 +715,34 @@ def train_and_evaluate_models(
         feature_columns: Columnas de features (opcional)
         remove_outliers_flag: Si True, elimina outliers
         use_robust_scaler: Si True, usa RobustScaler en lugar de StandardScaler
+        training_frame: DataFrame ya alineado y con variables temporales (ver
+            modules.training_frame); si se entrega, se omiten la copia y el merge
+        core_budget: Núcleos para entrenar los modelos (default: núcleos reservados o MODEL_CORE_BUDGET)
+        time_budget: Segundos máximos para toda la llamada (default: TRAINING_TIME_BUDGET;
+            0 = sin límite). Al agotarse se devuelven los modelos terminados con 'partial'=True
+        progress: Callback opcional que recibe un evento por modelo (con dispositivo y contaminante)
+        use_cache: Si True, reutiliza el resultado guardado para las mismas entradas y guarda
+            los nuevos (default: CALIBRATION_CACHE_ENABLED). Los resultados parciales no se guardan
+        force_refresh: Reentrena aunque haya un resultado en caché y lo reemplaza
+        calibration_key: Clave ya consultada por el llamador (ver calibration_cache_key); solo
+            se usa para guardar el resultado
+        selection_mode: 'full' entrena todos los modelos; 'halving' descarta por successive
+            halving (modules.model_selection) los candidatos débiles antes del entrenamiento completo
+        keep_models: Nombres de modelos que, además del mejor, conservan el estimador ajustado
+            y las predicciones completas (ver compact_results)
     
     Returns:
         dict: Resumen de calibración con resultados
     """
+    if time_budget is None:
+        time_budget = TRAINING_TIME_BUDGET
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    model_progress = None
+    if progress is not None:
+        def model_progress(event):
+            progress(dict(event, device=device_name, pollutant=pollutant))
+
     summary = {
         'records': 0,
         'records_after_cleaning': 0,
@@ -631,150 +751,45 @@ def train_and_evaluate_models(
         'feature_names': [],
         'best_model': None,
         'error': None,
-        'warnings': []
+        'warnings': [],
+        'partial': False,
+        'skipped_models': [],
+        'cache': None,
+        'calibration_key': None,
+        'selection': None
     }
 
     try:
-        if lowcost_df is None or rmcab_df is None or lowcost_df.empty or rmcab_df.empty:
-            summary['error'] = 'Datos insuficientes para la calibración'
-            return summary
-
-        lowcost_df = lowcost_df.copy()
-        rmcab_df = rmcab_df.copy()
-
-        if 'datetime' not in lowcost_df.columns or 'datetime' not in rmcab_df.columns:
-            summary['error'] = "Columnas 'datetime' no presentes en los datasets"
-            return summary
-
-        # Normalizar timezones - quitar timezone info para evitar conflictos en merge
-        if lowcost_df['datetime'].dt.tz is not None:
-            lowcost_df['datetime'] = lowcost_df['datetime'].dt.tz_localize(None)
-        
-        if rmcab_df['datetime'].dt.tz is not None:
-            rmcab_df['datetime'] = rmcab_df['datetime'].dt.tz_localize(None)
+        if training_frame is None:
+            training_frame, frame_error = build_training_frame(lowcost_df, rmcab_df)
+            if frame_error:
+                summary['error'] = frame_error
+                return summary
 
-        # DEBUG: Imprimir rangos de fechas ANTES de normalizar
-        print(f"\n📅 [ANTES] Rango lowcost: {lowcost_df['datetime'].min()} a {lowcost_df['datetime'].max()}")
-        print(f"📅 [ANTES] Rango RMCAB: {rmcab_df['datetime'].min()} a {rmcab_df['datetime'].max()}")
-        
-        # Normalizar años para permitir merge entre diferentes años
-        # Si los datos están en años diferentes, normalizarlos al mismo año
-        lowcost_year = lowcost_df['datetime'].dt.year.mode()[0]
-        rmcab_year = rmcab_df['datetime'].dt.year.mode()[0]
-        
-        print(f"📅 Año predominante lowcost: {lowcost_year}")
-        print(f"📅 Año predominante RMCAB: {rmcab_year}")
-        
-        if lowcost_year != rmcab_year:
-            print(f"⚠️  AÑOS DIFERENTES detectados! Normalizando al año {lowcost_year} para merge...")
-            # Cambiar el año de RMCAB al año de lowcost manteniendo mes/día/hora
-            rmcab_df['datetime'] = rmcab_df['datetime'].apply(
-                lambda dt: dt.replace(year=lowcost_year)
+        if use_cache is None:
+            use_cache = CALIBRATION_CACHE_ENABLED
+        if use_cache:
+            summary['calibration_key'] = calibration_key or calibration_cache_key(
+                training_frame, pollutant, test_size, feature_columns, remove_outliers_flag,
+                use_robust_scaler, advanced_features, extra_models, lstm_configs, selection_mode, keep_models
             )
-            print(f"✅ Fechas RMCAB normalizadas al año {lowcost_year}")
-        
-        lowcost_df = lowcost_df.set_index('datetime')
-        rmcab_df = rmcab_df.set_index('datetime')
-
-        # DEBUG: Imprimir rangos de fechas DESPUÉS de normalizar
-        print(f"\n📅 [DESPUÉS] Rango lowcost: {lowcost_df.index.min()} a {lowcost_df.index.max()}")
-        print(f"📅 [DESPUÉS] Rango RMCAB: {rmcab_df.index.min()} a {rmcab_df.index.max()}")
-        print(f"📊 Total registros lowcost: {len(lowcost_df)}")
-        print(f"📊 Total registros RMCAB: {len(rmcab_df)}")
-        
-        # Verificar overlap de meses
-        lowcost_months = set(lowcost_df.index.month)
-        rmcab_months = set(rmcab_df.index.month)
-        common_months = lowcost_months.intersection(rmcab_months)
-        
-        if not common_months:
-            print(f"⚠️  No hay overlap de meses entre datasets")
-            print(f"   Lowcost meses: {sorted(lowcost_months)}")
-            print(f"   RMCAB meses: {sorted(rmcab_months)}")
-        else:
-            print(f"✅ Meses en común: {sorted(common_months)}")
-
-        merged = pd.merge_asof(
-            lowcost_df.sort_index(),
-            rmcab_df.sort_index(),
-            left_index=True,
-            right_index=True,
-            tolerance=pd.Timedelta('2H'),  # Tolerancia de 2 horas
-            suffixes=('_sensor', '_ref')
-        ).reset_index()
-        
-        print(f"📊 Registros después del merge: {len(merged)}")
-        
-        if len(merged) > 0:
-            print(f"📊 Columnas del merge: {merged.columns.tolist()}")
-            print(f"📊 Primeros 3 registros:")
-            print(merged[['datetime', f'{pollutant}_sensor', f'{pollutant}_ref', 'temperature', 'rh']].head(3))
-        else:
-            print("❌ El merge no produjo ningún registro!")
-            print(f"   Lowcost: {lowcost_df.index.min()} - {lowcost_df.index.max()}")
-            print(f"   RMCAB:   {rmcab_df.index.min()} - {rmcab_df.index.max()}")
+            summary['cache'] = 'refresh' if force_refresh else 'miss'
+            if calibration_key is None and not force_refresh:
+                cached = cache_lookup(summary['calibration_key'])
+                if cached is not None:
+                    print(f"♻️  Calibración en caché: {device_name or 'dataset completo'} - {pollutant}")
+                    return dict(cached, cache='hit')
+
+        # El DataFrame compartido no se modifica: cada paso deriva uno nuevo
+        merged = training_frame
 
         required_cols = [f'{pollutant}_sensor', f'{pollutant}_ref', 'temperature', 'rh']
-        
-        # Verificar qué columnas tienen datos disponibles
-        print(f"\n📊 Verificando disponibilidad de columnas:")
-        available_cols = []
-        for col in required_cols:
-            if col in merged.columns:
-                non_null_count = merged[col].notna().sum()
-                total_count = len(merged)
-                null_percentage = (1 - non_null_count / total_count) * 100
-                print(f"   {col}: {non_null_count}/{total_count} válidos ({null_percentage:.1f}% nulos)")
-                if non_null_count > 0:
-                    available_cols.append(col)
-        
-        # SIMULAR datos faltantes de temperatura y humedad si no están disponibles
-        if 'temperature' not in merged.columns or merged['temperature'].isna().all():
-            print(f"⚠️  'temperature' no disponible - SIMULANDO datos realistas")
-            # Temperatura típica de Bogotá: 8-20°C, promedio ~14°C
-            np.random.seed(42)
-            # Simular con variación diurna: más calor en tarde, más frío en madrugada
-            merged['temperature'] = 14 + 4 * np.sin((merged['datetime'].dt.hour - 6) * np.pi / 12) + np.random.normal(0, 1.5, len(merged))
-            merged['temperature'] = merged['temperature'].clip(8, 22)
-            print(f"   ✅ Temperatura simulada: {merged['temperature'].min():.1f}°C - {merged['temperature'].max():.1f}°C (promedio: {merged['temperature'].mean():.1f}°C)")
-        
-        if 'rh' not in merged.columns or merged['rh'].isna().all():
-            print(f"⚠️  'rh' (humedad relativa) no disponible - SIMULANDO datos realistas")
-            # Humedad típica de Bogotá: 60-85%, promedio ~70%
-            np.random.seed(43)
-            # Humedad más alta en madrugada, más baja en tarde
-            merged['rh'] = 70 - 10 * np.sin((merged['datetime'].dt.hour - 6) * np.pi / 12) + np.random.normal(0, 5, len(merged))
-            merged['rh'] = merged['rh'].clip(50, 90)
-            print(f"   ✅ Humedad relativa simulada: {merged['rh'].min():.1f}% - {merged['rh'].max():.1f}% (promedio: {merged['rh'].mean():.1f}%)")
-        
-        # AGREGAR VARIABLES TEMPORALES
-        print(f"\n🕐 Agregando variables temporales:")
-        
-        # Hora del día (0-23)
-        merged['hour'] = merged['datetime'].dt.hour
-        
-        # Período del día: 0=Madrugada(0-5), 1=Mañana(6-11), 2=Tarde(12-17), 3=Noche(18-23)
-        merged['period_of_day'] = pd.cut(
-            merged['hour'], 
-            bins=[-0.1, 6, 12, 18, 24], 
-            labels=[0, 1, 2, 3]
-        ).astype(int)
-        period_names = {0: 'Madrugada', 1: 'Mañana', 2: 'Tarde', 3: 'Noche'}
-        print(f"   ✅ Período del día: {merged['period_of_day'].value_counts().to_dict()}")
-        
-        # Día de la semana (0=Lunes, 6=Domingo)
-        merged['day_of_week'] = merged['datetime'].dt.dayofweek
-        
-        # Es fin de semana (Sábado=5, Domingo=6)
-        merged['is_weekend'] = (merged['day_of_week'] >= 5).astype(int)
-        weekend_count = merged['is_weekend'].sum()
-        weekday_count = len(merged) - weekend_count
-        print(f"   ✅ Entre semana: {weekday_count} registros, Fin de semana: {weekend_count} registros")
-        
-        # Actualizar required_cols para incluir nuevas features
-        required_cols = [f'{pollutant}_sensor', f'{pollutant}_ref', 'temperature', 'rh']
-        
         print(f"\n📊 Columnas requeridas para calibración: {required_cols}")
+
+        missing_cols = [col for col in required_cols if col not in merged.columns]
+        if missing_cols:
+            summary['error'] = f"Columnas faltantes después del merge: {missing_cols}"
+            return summary
         
         merged = merged.dropna(subset=required_cols)
         summary['records'] = len(merged)
@@ -799,7 +814,12 @@ def train_and_evaluate_models(
 
         advanced_cols = []
         if advanced_features:
-            merged, advanced_cols = add_advanced_features(merged, pollutant)
+            expected_cols = advanced_feature_columns(pollutant, merged.columns)
+            if all(col in merged.columns for col in expected_cols):
+                # Ya calculadas para todos los dispositivos (run_stage2_calibration)
+                advanced_cols = expected_cols
+            else:
+                merged, advanced_cols = add_advanced_features(merged, pollutant)
             if advanced_cols:
                 print(f"?? Features avanzadas agregadas: {advanced_cols}")
 
@@ -842,9 +862,11 @@ def train_and_evaluate_models(
         X = merged[features].values
         y = merged[f'{pollutant}_ref'].values
 
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=test_size, random_state=42
-        )
+        # Se parten los índices (la misma partición que partir X e y) para que las LSTM
+        # puedan armar las ventanas de historia de cada fila
+        train_index, test_index = train_test_split(np.arange(len(X)), test_size=test_size, random_state=42)
+        X_train, X_test = X[train_index], X[test_index]
+        y_train, y_test = y[train_index], y[test_index]
 
         # Usar RobustScaler para mayor robustez contra outliers
         if use_robust_scaler:
@@ -855,70 +877,87 @@ def train_and_evaluate_models(
         X_train_scaled = scaler.fit_transform(X_train)
         X_test_scaled = scaler.transform(X_test)
 
-        models = get_calibration_models()
-        results = []
+        # Zoológico de modelos: se entrena en paralelo compartiendo el presupuesto de núcleos.
+        # SVR y Ridge usan features escaladas; el resto, las originales
+        zoo_models = get_calibration_models(len(X_train))
+        jobs = [
+            model_job(model_name, model, use_scaled=('SVR' in model_name or 'Ridge' in model_name))
+            for model_name, model in zoo_models.items()
+        ]
+        approximated = [name for name, model in zoo_models.items() if isinstance(model, ApproximateSVR)]
+        if approximated:
+            print(f"⚡ {len(X_train)} filas de entrenamiento: {', '.join(approximated)} con aproximación de Nyström "
+                  f"({SVR_NYSTROEM_COMPONENTS} componentes)")
+        for model_def in extra_models or []:
+            estimator = clone(model_def['estimator'])
+            jobs.append(model_job(
+                model_def.get('name', estimator.__class__.__name__),
+                estimator,
+                use_scaled=model_def.get('use_scaled', False)
+            ))
+
+        training_data = {
+            'X_train': X_train,
+            'X_test': X_test,
+            'X_train_scaled': X_train_scaled,
+            'X_test_scaled': X_test_scaled,
+            'y_train': y_train,
+            'y_test': y_test,
+            'feature_names': features
+        }
+        if selection_mode == 'halving':
+            jobs, summary['selection'] = successive_halving(
+                jobs, training_data, core_budget=core_budget, label=device_name, deadline=deadline,
+                progress=model_progress
+            )
+            # Las LSTM se entrenan completas fuera de las rondas (ver modules.model_selection)
+            summary['selection']['not_ranked'] = [config.get('name', 'LSTM') for config in lstm_configs or []]
+
+        results, zoo_warnings, skipped_models = train_model_zoo(
+            jobs, training_data, evaluate_model, core_budget=core_budget, label=device_name, deadline=deadline,
+            progress=model_progress
+        )
+        summary['warnings'].extend(zoo_warnings)
+        summary['skipped_models'].extend(skipped_models)
 
-        for model_name, model in models.items():
-            print(f"Entrenando {model_name} ({device_name or 'dataset completo'})...")
-            
-            # Usar datos escalados para SVR, datos originales para otros
-            if 'SVR' in model_name or 'Ridge' in model_name:
-                result = evaluate_model(model, X_train_scaled, X_test_scaled, y_train, y_test, 
-                                       model_name, feature_names=features)
-            else:
-                result = evaluate_model(model, X_train, X_test, y_train, y_test, 
-                                       model_name, feature_names=features)
-
-            if result:
-                results.append(result)
-
-        # Modelos adicionales
-        if extra_models:
-            for model_def in extra_models:
-                try:
-                    estimator = clone(model_def['estimator'])
-                    model_name = model_def.get('name', estimator.__class__.__name__)
-                    use_scaled = model_def.get('use_scaled', False)
-
-                    if use_scaled:
-                        result = evaluate_model(
-                            estimator,
-                            X_train_scaled,
-                            X_test_scaled,
-                            y_train,
-                            y_test,
-                            model_name,
-                            feature_names=features
-                        )
-                    else:
-                        result = evaluate_model(
-                            estimator,
-                            X_train,
-                            X_test,
-                            y_train,
-                            y_test,
-                            model_name,
-                            feature_names=features
-                        )
-                    if result:
-                        results.append(result)
-                except Exception as exc:
-                    warning_msg = f'Modelo adicional "{model_def.get("name", "extra")}" falló: {exc}'
-                    print(warning_msg)
-                    summary['warnings'].append(warning_msg)
+        # Modelo apilado sobre las predicciones fuera de fold (solo con EVALUATION_MODE='folds')
+        if STACKING_ENABLED:
+            stacked = stack_fold_predictions(
+                results,
+                y_train,
+                scaled_names=[job['name'] for job in jobs if job['use_scaled']],
+                scaler=scaler
+            )
+            if stacked:
+                stacked_model, stacked_train, stacked_test = stacked
+                stacked_result = _prediction_metrics(
+                    STACKING_MODEL_NAME, y_train, stacked_train, y_test, stacked_test, X_test.shape[1]
+                )
+                stacked_result['trained_model'] = stacked_model
+                results.append(stacked_result)
+        for result in results:
+            result.pop('oof_predictions', None)
 
         # Modelos LSTM
         if lstm_configs:
-            lstm_results, lstm_logs = train_lstm_variants(
-                X_train,
-                X_test,
-                y_train,
-                y_test,
+            lstm_results, lstm_logs, lstm_skipped = train_lstm_variants(
+                X,
+                y,
+                train_index,
+                test_index,
                 features,
-                lstm_configs
+                lstm_configs,
+                datetimes=merged['datetime'].to_numpy() if 'datetime' in merged.columns else None,
+                deadline=deadline,
+                progress=model_progress
             )
             results.extend(lstm_results)
             summary['warnings'].extend(lstm_logs)
+            summary['skipped_models'].extend(lstm_skipped)
+
+        summary['partial'] = bool(summary['skipped_models'])
+        if summary['partial']:
+            print(f"⏱️  Resultado parcial ({device_name or 'dataset completo'}): {len(results)} modelos terminados, omitidos {summary['skipped_models']}")
 
         if not results:
             summary['error'] = 'No se pudieron entrenar modelos válidos'
@@ -929,7 +968,10 @@ def train_and_evaluate_models(
         if results:
             results[0]['is_best'] = True
             summary['best_model'] = results[0]['model_name']
-        summary['results'] = results
+        summary['results'] = compact_results(results, y_test, keep_models)
+
+        if summary['calibration_key'] and not summary['partial']:
+            cache_store(summary['calibration_key'], summary, refresh=force_refresh)
         return summary
 
     except Exception as exc:
@@ -955,135 +997,516 @@ def format_linear_formula(coefficients, intercept, feature_names, pollutant):
     return f"{target_label} = {' '.join(terms)}"
 
 
-def create_scatter_points(actual, predicted, max_points=400):
+def scatter_indices(length, max_points=SCATTER_MAX_POINTS):
+    """Índices de las filas que conserva create_scatter_points para un diagrama de dispersión."""
+    step = -(-length // max_points) if length > max_points else 1
+    return np.arange(0, length, step)
+
+
+def compact_results(results, y_test, keep_models=None):
+    """
+    Reduce la memoria de los resultados ya ordenados de train_and_evaluate_models.
+
+    El mejor modelo (y los de `keep_models`) conserva el estimador ajustado y las
+    predicciones de prueba completas, con 'actual' compartido entre ellos. El resto libera
+    'trained_model' y guarda solo los puntos de su diagrama de dispersión (scatter_indices).
+    'actual' y 'predicted' quedan como arreglos float32.
+
+    Returns:
+        list: Los mismos resultados, modificados en su lugar.
+    """
+    actual = np.asarray(y_test, dtype=np.float32).ravel()
+    keep = set(keep_models or ())
+    for result in results:
+        predicted = np.asarray(result.get('predicted', ()), dtype=np.float32).ravel()
+        if result.get('is_best') or result['model_name'] in keep:
+            result['actual'], result['predicted'] = actual, predicted
+            continue
+        index = scatter_indices(len(predicted))
+        result['actual'], result['predicted'] = actual[index], predicted[index]
+        result.pop('trained_model', None)
+    return results
+
+
+def _rounded_list(values, decimals=4):
+    return [] if values is None else np.round(np.asarray(values, dtype=float), decimals).tolist()
+
+
+def serializable_results(results):
+    """Resultados de train_and_evaluate_models aptos para JSON (sin estimadores, arreglos como listas)."""
+    serializable = []
+    for result in results:
+        entry = {key: value for key, value in result.items() if key not in ('trained_model', 'oof_predictions')}
+        for key in ('actual', 'predicted'):
+            if key in entry:
+                entry[key] = _rounded_list(entry[key])
+        serializable.append(entry)
+    return serializable
+
+
+def create_scatter_points(actual, predicted, max_points=SCATTER_MAX_POINTS):
     if actual is None or predicted is None:
         return []
 
-    actual_list = list(actual)
-    predicted_list = list(predicted)
-    length = min(len(actual_list), len(predicted_list))
+    actual = np.asarray(actual, dtype=float).ravel()
+    predicted = np.asarray(predicted, dtype=float).ravel()
+    length = min(len(actual), len(predicted))
 
     if length == 0:
         return []
 
-    points = [
+    valid = np.flatnonzero(~(np.isnan(actual[:length]) | np.isnan(predicted[:length])))
+    index = valid[scatter_indices(len(valid), max_points)]
+
+    return [
+        {'actual': actual_value, 'predicted': predicted_value}
+        for actual_value, predicted_value in zip(
+            np.round(actual[index], 4).tolist(), np.round(predicted[index], 4).tolist()
+        )
+    ]
+
+
+def _training_frame_for(lowcost_df, rmcab_df, device_name, cache_key):
+    """
+    Obtiene el DataFrame de entrenamiento de un dispositivo (una vez para todos los contaminantes).
+    Un error al prepararlo queda como el error de ese dispositivo y no interrumpe a los demás.
+
+    Returns:
+        tuple[DataFrame | None, str | None]: DataFrame de entrenamiento y mensaje de error.
+    """
+    key = (device_name,) + tuple(cache_key) if cache_key is not None else None
+    try:
+        return get_training_frame(lowcost_df, rmcab_df, cache_key=key)
+    except Exception as exc:
+        print(f"❌ Error preparando {device_name}: {exc}")
+        return None, f"Error preparando {device_name}: {exc}"
+
+
+def _remaining_budget(deadline_at):
+    """Segundos que quedan hasta un plazo absoluto (None = usar TRAINING_TIME_BUDGET)."""
+    if deadline_at is None:
+        return None
+    return max(deadline_at - time.time(), 1e-3)
+
+
+def _notify(progress, event):
+    if progress is not None:
+        try:
+            progress(event)
+        except Exception:
+            pass
+
+
+def _fanout_deadline(time_budget):
+    if time_budget is None:
+        time_budget = TRAINING_TIME_BUDGET
+    return time.time() + time_budget if time_budget else None
+
+
+def _run_pair_tasks(tasks, function, key_options=None, force_refresh=False):
+    """
+    Resuelve primero en este proceso los (dispositivo, contaminante) que ya están en la
+    caché de calibración y reparte el resto con fan_out. Cada tarea pendiente recibe su
+    clave de caché para guardar el resultado al terminar.
+
+    Yields:
+        tuple: (clave de la tarea, resultado, error) como fan_out.
+    """
+    pending = []
+    for task_key, kwargs in tasks:
+        if kwargs.get('frame_error') or not CALIBRATION_CACHE_ENABLED:
+            pending.append((task_key, kwargs))
+            continue
+        calibration_key = calibration_cache_key(
+            kwargs['training_frame'], kwargs['pollutant'], kwargs.get('test_size', 0.25), **(key_options or {})
+        )
+        cached = None if force_refresh else cache_lookup(calibration_key)
+        if cached is None:
+            pending.append((task_key, dict(kwargs, calibration_key=calibration_key, force_refresh=force_refresh)))
+            continue
+        print(f"♻️  Calibración en caché: {task_key[0]} - {task_key[1]}")
+        try:
+            yield task_key, function(**dict(kwargs, calibration=dict(cached, cache='hit'))), None
+        except Exception as exc:
+            yield task_key, None, str(exc)
+
+    yield from fan_out(pending, function)
+
+
+def _device_pollutant_entry(training_frame, frame_error, device_name, pollutant, test_size=0.25, period='2025',
+                            core_budget=None, deadline_at=None, progress=None, calibration=None,
+                            calibration_key=None, force_refresh=False):
+    """
+    Calibra un (dispositivo, contaminante) de la calibración por dispositivo y guarda el
+    mejor modelo. Es de nivel de módulo para poder ejecutarse en un proceso del fan-out.
+
+    `deadline_at` (time.time()) es el plazo común de todos los trabajos del fan-out y
+    `progress` (serializable) recibe un evento por modelo entrenado. Con `calibration`
+    (resumen tomado de la caché) no se entrena.
+
+    Returns:
+        dict: Entrada de 'pollutant_results' (con 'error' si no se pudo calibrar).
+    """
+    if frame_error:
+        calibration = {'records': 0, 'results': [], 'error': frame_error}
+    elif calibration is None:
+        calibration = train_and_evaluate_models(
+            None,
+            None,
+            pollutant=pollutant,
+            test_size=test_size,
+            device_name=device_name,
+            training_frame=training_frame,
+            core_budget=core_budget,
+            time_budget=_remaining_budget(deadline_at),
+            progress=progress,
+            force_refresh=force_refresh,
+            calibration_key=calibration_key
+        )
+
+    entry = {
+        'pollutant': pollutant,
+        'pollutant_label': POLLUTANT_LABELS.get(pollutant, pollutant.upper()),
+        'records': calibration['records'],
+        'records_after_cleaning': calibration.get('records_after_cleaning', calibration['records']),
+        'outliers_removed': calibration.get('outliers_removed', 0),
+        'models': [],
+        'linear_regression': None,
+        'scatter': None,
+        'error': calibration.get('error'),
+        'partial': calibration.get('partial', False),
+        'skipped_models': calibration.get('skipped_models', []),
+        'cache': calibration.get('cache')
+    }
+
+    if calibration.get('error'):
+        return entry
+
+    entry['models'] = [
         {
-            'actual': round(float(actual_list[i]), 4),
-            'predicted': round(float(predicted_list[i]), 4)
+            'model_name': model['model_name'],
+            'r2': model['r2'],
+            'r2_adjusted': model.get('r2_adjusted', model['r2']),
+            'rmse': model['rmse'],
+            'mae': model['mae'],
+            'mape': model['mape'],
+            'r2_train': model['r2_train'],
+            'rmse_train': model['rmse_train'],
+            'overfitting': model.get('overfitting', {'status': 'ok', 'severity': 'none'}),
+            'is_best': model.get('is_best', False)
         }
-        for i in range(length)
-        if actual_list[i] is not None and predicted_list[i] is not None
+        for model in calibration['results']
     ]
 
-    if len(points) > max_points:
-        step = max(1, len(points) // max_points)
-        points = points[::step]
+    linear_model = next(
+        (
+            m for m in calibration['results']
+            if m['model_name'] == 'Linear Regression' and m.get('coefficients')
+        ),
+        None
+    )
+
+    if linear_model:
+        entry['linear_regression'] = {
+            'formula': format_linear_formula(
+                linear_model.get('coefficients'),
+                linear_model.get('intercept'),
+                linear_model.get('feature_names'),
+                pollutant
+            ),
+            'coefficients': linear_model.get('coefficients'),
+            'intercept': linear_model.get('intercept'),
+            'feature_names': linear_model.get('feature_names', [])
+        }
 
-    return points
+    best_model = next((m for m in calibration['results'] if m.get('is_best')), None)
+    if best_model:
+        actual_values = best_model.get('actual', [])
+        predicted_values = best_model.get('predicted', [])
+        entry['scatter'] = {
+            'best_model': best_model['model_name'],
+            'model_name': best_model['model_name'],
+            'y_test': _rounded_list(actual_values),
+            'y_pred': _rounded_list(predicted_values),
+            'points': create_scatter_points(actual_values, predicted_values)
+        }
+
+    # Guardar el modelo automáticamente
+    if not calibration.get('error'):
+        print(f"\n💾 Guardando modelo para {device_name} - {pollutant}...")
+        save_result = save_calibration_models(calibration, device_name, pollutant, period)
+        if save_result.get('success'):
+            print(f"✅ Modelo guardado exitosamente")
+            entry['model_saved'] = True
+            entry['saved_model_path'] = save_result.get('metadata_path')
+        else:
+            print(f"⚠️ No se pudo guardar el modelo: {save_result.get('error')}")
+            entry['model_saved'] = False
 
+    return entry
 
-def run_device_calibration(lowcost_df, rmcab_df, device_name, pollutants=('pm25', 'pm10'), test_size=0.25, period='2025'):
-    summary = {
-        'device': device_name,
-        'pollutant_results': []
+
+def iter_device_calibrations(device_frames, rmcab_df, pollutants=('pm25', 'pm10'), test_size=0.25, period='2025',
+                             cache_key=None, time_budget=None, progress=None, force_refresh=False):
+    """
+    Calibra todos los (dispositivo, contaminante) en procesos paralelos y entrega cada
+    resultado apenas termina. Un trabajo que falla solo afecta su propia entrada.
+
+    Args:
+        device_frames (dict): Dispositivo -> lecturas del dispositivo.
+        rmcab_df (DataFrame): Datos de referencia.
+        pollutants (iterable): Contaminantes a calibrar.
+        cache_key (tuple, optional): Ventana y estación para reutilizar el DataFrame de entrenamiento.
+        time_budget (float, optional): Segundos para todo el lote (default: TRAINING_TIME_BUDGET).
+        progress (callable, optional): Callback serializable de progreso (ver modules.calibration_jobs).
+        force_refresh (bool): Reentrena aunque haya resultados en la caché de calibración.
+
+    Yields:
+        tuple[str, str, dict]: (dispositivo, contaminante, entrada de 'pollutant_results').
+    """
+    deadline_at = _fanout_deadline(time_budget)
+    tasks = []
+    for device_name, lowcost_df in device_frames.items():
+        training_frame, frame_error = _training_frame_for(lowcost_df, rmcab_df, device_name, cache_key)
+        for pollutant in pollutants:
+            tasks.append(((device_name, pollutant), {
+                'training_frame': training_frame,
+                'frame_error': frame_error,
+                'device_name': device_name,
+                'pollutant': pollutant,
+                'test_size': test_size,
+                'period': period,
+                'deadline_at': deadline_at,
+                'progress': progress
+            }))
+    _notify(progress, {'stage': 'plan', 'total': len(tasks)})
+
+    for (device_name, pollutant), entry, error in _run_pair_tasks(
+        tasks, _device_pollutant_entry, force_refresh=force_refresh
+    ):
+        if error:
+            entry = _device_pollutant_entry(None, f"Error calibrando {device_name} - {pollutant}: {error}",
+                                            device_name, pollutant)
+        _notify(progress, {
+            'stage': 'pollutant', 'device': device_name, 'pollutant': pollutant,
+            'status': 'failed' if entry.get('error') else 'completed'
+        })
+        yield device_name, pollutant, entry
+
+
+def run_devices_calibration(device_frames, rmcab_df, pollutants=('pm25', 'pm10'), test_size=0.25, period='2025',
+                            cache_key=None, time_budget=None, progress=None, force_refresh=False):
+    """
+    Calibración por dispositivo de varios sensores a la vez (ver iter_device_calibrations).
+
+    Returns:
+        dict: Dispositivo -> resumen con 'device' y 'pollutant_results' en el orden de `pollutants`.
+    """
+    entries = {}
+    for device_name, pollutant, entry in iter_device_calibrations(
+        device_frames, rmcab_df, pollutants, test_size, period, cache_key, time_budget, progress, force_refresh
+    ):
+        status = '❌' if entry.get('error') else '✅'
+        print(f"{status} Calibración terminada: {device_name} - {POLLUTANT_LABELS.get(pollutant, pollutant)}")
+        entries[(device_name, pollutant)] = entry
+
+    return {
+        device_name: {
+            'device': device_name,
+            'pollutant_results': [entries[(device_name, pollutant)] for pollutant in pollutants]
+        }
+        for device_name in device_frames
     }
 
-    for pollutant in pollutants:
+
+def run_device_calibration(lowcost_df, rmcab_df, device_name, pollutants=('pm25', 'pm10'), test_size=0.25, period='2025',
+                           cache_key=None, time_budget=None, force_refresh=False):
+    return run_devices_calibration(
+        {device_name: lowcost_df}, rmcab_df, tuple(pollutants), test_size, period, cache_key, time_budget,
+        force_refresh=force_refresh
+    )[device_name]
+
+
+def _stage2_pollutant_result(training_frame, frame_error, device_name, pollutant, test_size=0.25, core_budget=None,
+                             deadline_at=None, progress=None, calibration=None, calibration_key=None,
+                             force_refresh=False):
+    """
+    Calibra un (dispositivo, contaminante) de la etapa 2 con features avanzadas, modelos
+    adicionales y LSTM. Es de nivel de módulo para poder ejecutarse en un proceso del fan-out.
+    Con `calibration` (resumen tomado de la caché) no se entrena.
+
+    Returns:
+        dict: Resultado del contaminante (con 'error' si no se pudo calibrar).
+    """
+    if frame_error:
+        calibration = {'records': 0, 'results': [], 'error': frame_error}
+    elif calibration is None:
         calibration = train_and_evaluate_models(
-            lowcost_df,
-            rmcab_df,
+            None,
+            None,
             pollutant=pollutant,
             test_size=test_size,
-            device_name=device_name
+            device_name=device_name,
+            advanced_features=True,
+            extra_models=build_extra_model_definitions(),
+            lstm_configs=get_default_lstm_configs(),
+            training_frame=training_frame,
+            core_budget=core_budget,
+            time_budget=_remaining_budget(deadline_at),
+            progress=progress,
+            force_refresh=force_refresh,
+            calibration_key=calibration_key,
+            selection_mode=STAGE2_SELECTION_MODE
         )
 
-        entry = {
-            'pollutant': pollutant,
-            'pollutant_label': POLLUTANT_LABELS.get(pollutant, pollutant.upper()),
-            'records': calibration['records'],
-            'records_after_cleaning': calibration.get('records_after_cleaning', calibration['records']),
-            'outliers_removed': calibration.get('outliers_removed', 0),
-            'models': [],
-            'linear_regression': None,
-            'scatter': None,
-            'error': calibration.get('error')
-        }
+    pollutant_result = {
+        'records': calibration.get('records', 0),
+        'records_after_cleaning': calibration.get('records_after_cleaning', 0),
+        'outliers_removed': calibration.get('outliers_removed', 0),
+        'warnings': calibration.get('warnings', []),
+        'partial': calibration.get('partial', False),
+        'skipped_models': calibration.get('skipped_models', []),
+        'cache': calibration.get('cache'),
+        'selection': calibration.get('selection')
+    }
 
-        if calibration.get('error'):
-            summary['pollutant_results'].append(entry)
-            continue
+    if calibration.get('error'):
+        pollutant_result['error'] = calibration['error']
+        return pollutant_result
+
+    model_metrics = []
+    scatter_data = []
+    for model in calibration.get('results', []):
+        model_metrics.append({
+            'model_name': model['model_name'],
+            'r2': model.get('r2'),
+            'r2_train': model.get('r2_train'),
+            'r2_adjusted': model.get('r2_adjusted', model.get('r2')),
+            'rmse': model.get('rmse'),
+            'rmse_train': model.get('rmse_train'),
+            'mae': model.get('mae'),
+            'mape': model.get('mape'),
+            'n_iterations': model.get('n_iterations'),
+            'is_best': model.get('is_best', False)
+        })
 
-        entry['models'] = [
-            {
-                'model_name': model['model_name'],
-                'r2': model['r2'],
-                'r2_adjusted': model.get('r2_adjusted', model['r2']),
-                'rmse': model['rmse'],
-                'mae': model['mae'],
-                'mape': model['mape'],
-                'r2_train': model['r2_train'],
-                'rmse_train': model['rmse_train'],
-                'overfitting': model.get('overfitting', {'status': 'ok', 'severity': 'none'}),
-                'is_best': model.get('is_best', False)
-            }
-            for model in calibration['results']
-        ]
+        scatter_points = create_scatter_points(
+            model.get('actual'),
+            model.get('predicted')
+        )
+        scatter_data.append({
+            'model_name': model['model_name'],
+            'points': scatter_points,
+            'r2': model.get('r2'),
+            'rmse': model.get('rmse'),
+            'mae': model.get('mae'),
+            'mape': model.get('mape')
+        })
+
+    best_model_info = next(
+        (m for m in calibration.get('results', []) if m.get('is_best')),
+        calibration.get('results', [None])[0]
+    )
+
+    best_metrics = None
+    if best_model_info:
+        best_metrics = {
+            'model_name': best_model_info['model_name'],
+            'r2': best_model_info.get('r2'),
+            'rmse': best_model_info.get('rmse'),
+            'mae': best_model_info.get('mae'),
+            'mape': best_model_info.get('mape')
+        }
 
-        linear_model = next(
-            (
-                m for m in calibration['results']
-                if m['model_name'] == 'Linear Regression' and m.get('coefficients')
+    linear_model = next(
+        (
+            m for m in calibration.get('results', [])
+            if m['model_name'] == 'Linear Regression' and m.get('coefficients')
+        ),
+        None
+    )
+
+    if linear_model:
+        pollutant_result['linear_model'] = {
+            'formula': format_linear_formula(
+                linear_model.get('coefficients'),
+                linear_model.get('intercept'),
+                linear_model.get('feature_names'),
+                pollutant
             ),
-            None
-        )
+            'coefficients': linear_model.get('coefficients'),
+            'feature_names': linear_model.get('feature_names', [])
+        }
 
-        if linear_model:
-            entry['linear_regression'] = {
-                'formula': format_linear_formula(
-                    linear_model.get('coefficients'),
-                    linear_model.get('intercept'),
-                    linear_model.get('feature_names'),
-                    pollutant
-                ),
-                'coefficients': linear_model.get('coefficients'),
-                'intercept': linear_model.get('intercept'),
-                'feature_names': linear_model.get('feature_names', [])
-            }
+    pollutant_result.update({
+        'metrics': model_metrics,
+        'scatter': scatter_data,
+        'best_model': best_metrics['model_name'] if best_metrics else None,
+        'best_metrics': best_metrics,
+        'feature_names': calibration.get('feature_names', [])
+    })
 
-        best_model = next((m for m in calibration['results'] if m.get('is_best')), None)
-        if best_model:
-            actual_values = best_model.get('actual', [])
-            predicted_values = best_model.get('predicted', [])
-            entry['scatter'] = {
-                'best_model': best_model['model_name'],
-                'model_name': best_model['model_name'],
-                'y_test': actual_values,
-                'y_pred': predicted_values,
-                'points': create_scatter_points(actual_values, predicted_values)
-            }
+    return pollutant_result
 
-        # Guardar el modelo automáticamente
-        if not calibration.get('error'):
-            print(f"\n💾 Guardando modelo para {device_name} - {pollutant}...")
-            save_result = save_calibration_models(calibration, device_name, pollutant, period)
-            if save_result.get('success'):
-                print(f"✅ Modelo guardado exitosamente")
-                entry['model_saved'] = True
-                entry['saved_model_path'] = save_result.get('metadata_path')
-            else:
-                print(f"⚠️ No se pudo guardar el modelo: {save_result.get('error')}")
-                entry['model_saved'] = False
 
-        summary['pollutant_results'].append(entry)
+def iter_stage2_calibrations(lowcost_df, rmcab_df, devices, pollutants=('pm25', 'pm10'), test_size=0.25,
+                             cache_key=None, time_budget=None, progress=None, force_refresh=False):
+    """
+    Ejecuta en procesos paralelos la calibración de etapa 2 de cada (dispositivo,
+    contaminante) y entrega cada resultado apenas termina.
 
-    return summary
+    Yields:
+        tuple[str, str | None, dict]: (dispositivo, contaminante, resultado). Los dispositivos
+        sin datos se entregan con contaminante None y un resultado con 'error'.
+    """
+    deadline_at = _fanout_deadline(time_budget)
 
+    # Variables avanzadas de todos los dispositivos y contaminantes en una sola pasada
+    lowcost_df, _ = compute_advanced_features(lowcost_df, pollutants=pollutants)
+    partitions, _ = partition_by_device(lowcost_df, devices)
 
+    tasks = []
+    for device in devices:
+        device_subset = partitions[device]
+        if device_subset.empty:
+            yield device, None, {'error': f"No hay datos disponibles para {device} en la ventana seleccionada."}
+            continue
 
+        training_frame, frame_error = _training_frame_for(device_subset, rmcab_df, device, cache_key)
+        for pollutant in pollutants:
+            tasks.append(((device, pollutant), {
+                'training_frame': training_frame,
+                'frame_error': frame_error,
+                'device_name': device,
+                'pollutant': pollutant,
+                'test_size': test_size,
+                'deadline_at': deadline_at,
+                'progress': progress
+            }))
+    _notify(progress, {'stage': 'plan', 'total': len(tasks)})
+
+    key_options = {
+        'advanced_features': True,
+        'extra_models': build_extra_model_definitions(),
+        'lstm_configs': get_default_lstm_configs(),
+        'selection_mode': STAGE2_SELECTION_MODE
+    }
+    for (device, pollutant), pollutant_result, error in _run_pair_tasks(
+        tasks, _stage2_pollutant_result, key_options, force_refresh
+    ):
+        if error:
+            pollutant_result = _stage2_pollutant_result(
+                None, f"Error calibrando {device} - {pollutant}: {error}", device, pollutant
+            )
+        _notify(progress, {
+            'stage': 'pollutant', 'device': device, 'pollutant': pollutant,
+            'status': 'failed' if pollutant_result.get('error') else 'completed'
+        })
+        yield device, pollutant, pollutant_result
 
 
 def run_stage2_calibration(lowcost_df, rmcab_df, devices=None, pollutants=('pm25', 'pm10'),
-                           test_size=0.25):
+                           test_size=0.25, cache_key=None, time_budget=None, progress=None, force_refresh=False):
     """
     Calibración especializada para la etapa 2 con features avanzadas.
 
@@ -1092,6 +1515,12 @@ def run_stage2_calibration(lowcost_df, rmcab_df, devices=None, pollutants=('pm25
         rmcab_df (DataFrame): Datos de referencia RMCAB.
         devices (iterable): Dispositivos a calibrar.
         pollutants (iterable): Contaminantes a evaluar.
+        cache_key (tuple, optional): Identificador de ventana y estación para reutilizar
+            el DataFrame de entrenamiento entre llamadas.
+        time_budget (float, optional): Segundos para toda la calibración (default:
+            TRAINING_TIME_BUDGET); al agotarse se devuelven resultados parciales.
+        progress (callable, optional): Callback serializable de progreso (ver modules.calibration_jobs).
+        force_refresh (bool): Reentrena aunque haya resultados en la caché de calibración.
 
     Returns:
         list[dict]: Resultados por dispositivo.
@@ -1110,120 +1539,30 @@ def run_stage2_calibration(lowcost_df, rmcab_df, devices=None, pollutants=('pm25
     if not devices:
         return results
 
-    for device in devices:
-        device_subset = lowcost_df[lowcost_df['device_name'] == device].copy()
-        device_result = {
-            'device': device,
-            'pollutants': {}
-        }
-
-        if device_subset.empty:
-            device_result['error'] = f"No hay datos disponibles para {device} en la ventana seleccionada."
-            results.append(device_result)
+    device_results = {device: {'device': device, 'pollutants': {}} for device in devices}
+    finished = {}
+    for device, pollutant, pollutant_result in iter_stage2_calibrations(
+        lowcost_df, rmcab_df, devices, pollutants, test_size, cache_key, time_budget, progress, force_refresh
+    ):
+        if pollutant is None:
+            device_results[device]['error'] = pollutant_result['error']
             continue
+        status = '❌' if pollutant_result.get('error') else '✅'
+        print(f"{status} Calibración etapa 2 terminada: {device} - {POLLUTANT_LABELS.get(pollutant, pollutant)}")
+        finished[(device, pollutant)] = pollutant_result
 
+    for device in devices:
+        device_result = device_results[device]
         for pollutant in pollutants:
-            calibration = train_and_evaluate_models(
-                device_subset,
-                rmcab_df,
-                pollutant=pollutant,
-                test_size=test_size,
-                device_name=device,
-                advanced_features=True,
-                extra_models=build_extra_model_definitions(),
-                lstm_configs=get_default_lstm_configs()
-            )
-
-            pollutant_result = {
-                'records': calibration.get('records', 0),
-                'records_after_cleaning': calibration.get('records_after_cleaning', 0),
-                'outliers_removed': calibration.get('outliers_removed', 0),
-                'warnings': calibration.get('warnings', [])
-            }
-
-            if calibration.get('error'):
-                pollutant_result['error'] = calibration['error']
-                device_result['pollutants'][pollutant] = pollutant_result
-                continue
-
-            model_metrics = []
-            scatter_data = []
-            for model in calibration.get('results', []):
-                model_metrics.append({
-                    'model_name': model['model_name'],
-                    'r2': model.get('r2'),
-                    'r2_train': model.get('r2_train'),
-                    'r2_adjusted': model.get('r2_adjusted', model.get('r2')),
-                    'rmse': model.get('rmse'),
-                    'rmse_train': model.get('rmse_train'),
-                    'mae': model.get('mae'),
-                    'mape': model.get('mape'),
-                    'is_best': model.get('is_best', False)
-                })
-
-                scatter_points = create_scatter_points(
-                    model.get('actual'),
-                    model.get('predicted')
-                )
-                scatter_data.append({
-                    'model_name': model['model_name'],
-                    'points': scatter_points,
-                    'r2': model.get('r2'),
-                    'rmse': model.get('rmse'),
-                    'mae': model.get('mae'),
-                    'mape': model.get('mape')
-                })
-
-            best_model_info = next(
-                (m for m in calibration.get('results', []) if m.get('is_best')),
-                calibration.get('results', [None])[0]
-            )
-
-            best_metrics = None
-            if best_model_info:
-                best_metrics = {
-                    'model_name': best_model_info['model_name'],
-                    'r2': best_model_info.get('r2'),
-                    'rmse': best_model_info.get('rmse'),
-                    'mae': best_model_info.get('mae'),
-                    'mape': best_model_info.get('mape')
-                }
-
-            linear_model = next(
-                (
-                    m for m in calibration.get('results', [])
-                    if m['model_name'] == 'Linear Regression' and m.get('coefficients')
-                ),
-                None
-            )
-
-            if linear_model:
-                pollutant_result['linear_model'] = {
-                    'formula': format_linear_formula(
-                        linear_model.get('coefficients'),
-                        linear_model.get('intercept'),
-                        linear_model.get('feature_names'),
-                        pollutant
-                    ),
-                    'coefficients': linear_model.get('coefficients'),
-                    'feature_names': linear_model.get('feature_names', [])
-                }
-
-            pollutant_result.update({
-                'metrics': model_metrics,
-                'scatter': scatter_data,
-                'best_model': best_metrics['model_name'] if best_metrics else None,
-                'best_metrics': best_metrics,
-                'feature_names': calibration.get('feature_names', [])
-            })
-
-            device_result['pollutants'][pollutant] = pollutant_result
+            if (device, pollutant) in finished:
+                device_result['pollutants'][pollutant] = finished[(device, pollutant)]
 
         consolidated_warnings = []
         for pollutant_data in device_result['pollutants'].values():
             consolidated_warnings.extend(pollutant_data.get('warnings', []))
         if consolidated_warnings:
             device_result['warnings'] = list(dict.fromkeys(consolidated_warnings))
+        device_result['partial'] = any(p.get('partial') for p in device_result['pollutants'].values())
 
         results.append(device_result)
 
@@ -1282,6 +1621,29 @@ def save_calibration_models(calibration_results, device_name, pollutant, period=
         best_model_result = next((r for r in results if r.get('is_best')), results[0])
         model_name = best_model_result['model_name']
 
+        # Si ya están guardados los modelos de esta misma calibración no se reescriben
+        calibration_key = calibration_results.get('calibration_key')
+        metadata_path = os.path.join(models_dir, f'{pollutant}_model_metadata.pkl')
+        model_path = os.path.join(models_dir, f'{pollutant}_model.pkl')
+        if calibration_key and os.path.exists(metadata_path):
+            try:
+                previous = joblib.load(metadata_path)
+            except Exception:
+                previous = {}
+            if previous.get('calibration_key') == calibration_key and (
+                'model_path' not in previous or os.path.exists(model_path)
+            ):
+                print(f"♻️  Modelo sin cambios, se conserva: {metadata_path}")
+                return {
+                    'success': True,
+                    'model_name': previous.get('model_name', model_name),
+                    'metadata_path': metadata_path,
+                    'model_path': previous.get('model_path'),
+                    'device': device_name,
+                    'pollutant': pollutant,
+                    'unchanged': True
+                }
+
         # Recrear y entrenar el mejor modelo
         # (Nota: Idealmente deberíamos guardar el modelo ya entrenado desde train_and_evaluate_models)
         # Por ahora, guardamos la metadata necesaria para recrearlo
@@ -1292,6 +1654,7 @@ def save_calibration_models(calibration_results, device_name, pollutant, period=
             'period': period,
             'model_name': model_name,
             'timestamp': timestamp,
+            'calibration_key': calibration_key,
             'feature_names': calibration_results.get('feature_names', []),
             'metrics': {
                 'r2': best_model_result.get('r2'),
@@ -1308,7 +1671,6 @@ def save_calibration_models(calibration_results, device_name, pollutant, period=
 
         # Guardar el modelo completo entrenado (necesario para Random Forest, SVR, etc.)
         trained_model = best_model_result.get('trained_model')
-        model_path = os.path.join(models_dir, f'{pollutant}_model.pkl')
 
         if trained_model is not None:
             joblib.dump(trained_model, model_path)
@@ -1316,7 +1678,6 @@ def save_calibration_models(calibration_results, device_name, pollutant, period=
             print(f"✅ Modelo completo guardado: {model_path}")
 
         # Guardar metadata
-        metadata_path = os.path.join(models_dir, f'{pollutant}_model_metadata.pkl')
         joblib.dump(model_info, metadata_path)
 
         print(f"✅ Metadata guardada: {metadata_path}")
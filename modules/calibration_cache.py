@@ -0,0 +1,217 @@
+"""
+Caché direccionada por contenido de los resultados de calibración.
+
+La clave es un hash del DataFrame de entrenamiento, de las opciones que definen las
+features y de la configuración del zoológico de modelos (estimadores con sus parámetros,
+LSTM, modo de evaluación y versión de scikit-learn). El valor es el resumen completo de
+train_and_evaluate_models: métricas, predicciones para los gráficos de dispersión y
+estimadores ajustados. Repetir una calibración con las mismas entradas no reentrena.
+
+Los resúmenes se guardan con joblib en CALIBRATION_CACHE_DIR y los más recientes se
+mantienen además en memoria.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import joblib
+import pandas as pd
+import sklearn
+
+
+CALIBRATION_CACHE_DIR = os.getenv(
+    'CALIBRATION_CACHE_DIR',
+    os.path.join(os.path.dirname(__file__), '..', 'data', 'calibration_cache')
+)
+CALIBRATION_CACHE_ENABLED = os.getenv('CALIBRATION_CACHE_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
+# Entradas que se conservan en disco (se eliminan las usadas hace más tiempo) y en memoria
+CALIBRATION_CACHE_MAX_ENTRIES = int(os.getenv('CALIBRATION_CACHE_MAX_ENTRIES', 256))
+CALIBRATION_CACHE_MEMORY_ENTRIES = int(os.getenv('CALIBRATION_CACHE_MEMORY_ENTRIES', 32))
+
+# Incrementar CACHE_SCHEMA si cambia el contenido del resumen de calibración
+CACHE_SCHEMA = 1
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_counters = {'hits': 0, 'memory_hits': 0, 'misses': 0, 'stores': 0, 'refreshes': 0, 'errors': 0}
+
+
+def frame_digest(df):
+    """Hash del contenido de un DataFrame (columnas, tipos y valores, sin el índice)."""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    hasher.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def estimator_signature(name, estimator):
+    """Descripción estable de un estimador sin ajustar: clase y parámetros."""
+    params = estimator.get_params(deep=False) if hasattr(estimator, 'get_params') else {}
+    return [
+        name,
+        f'{type(estimator).__module__}.{type(estimator).__qualname__}',
+        sorted((key, repr(value)) for key, value in params.items())
+    ]
+
+
+def content_key(*parts):
+    """
+    Clave de caché de partes serializables a JSON (los valores no serializables se
+    representan con str). Incluye el esquema de la caché y la versión de scikit-learn.
+    """
+    payload = json.dumps(
+        [CACHE_SCHEMA, sklearn.__version__, list(parts)],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CALIBRATION_CACHE_DIR, f'{key}.joblib')
+
+
+def _valid_key(key):
+    return isinstance(key, str) and len(key) == 64 and all(ch in '0123456789abcdef' for ch in key)
+
+
+def _remember(key, value):
+    _memory[key] = value
+    _memory.move_to_end(key)
+    while len(_memory) > max(CALIBRATION_CACHE_MEMORY_ENTRIES, 0):
+        _memory.popitem(last=False)
+
+
+def lookup(key):
+    """
+    Resumen de calibración guardado bajo `key`.
+
+    Returns:
+        dict | None: Resumen o None si no está en la caché.
+    """
+    if not _valid_key(key):
+        return None
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            _counters['hits'] += 1
+            _counters['memory_hits'] += 1
+            return _memory[key]
+
+    path = _entry_path(key)
+    try:
+        value = joblib.load(path)
+    except FileNotFoundError:
+        value = None
+    except Exception as exc:
+        print(f"⚠️  Entrada de caché de calibración ilegible ({key[:12]}): {exc}")
+        value = None
+        with _lock:
+            _counters['errors'] += 1
+
+    with _lock:
+        if value is None:
+            _counters['misses'] += 1
+            return None
+        _counters['hits'] += 1
+        _remember(key, value)
+    try:
+        # La fecha de modificación marca el último uso para la política de eliminación
+        os.utime(path)
+    except OSError:
+        pass
+    return value
+
+
+def store(key, value, refresh=False):
+    """Guarda un resumen de calibración bajo `key` (reemplazo atómico en disco)."""
+    if not _valid_key(key):
+        return False
+    try:
+        os.makedirs(CALIBRATION_CACHE_DIR, exist_ok=True)
+        path = _entry_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        joblib.dump(value, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as exc:
+        print(f"⚠️  No se pudo guardar la calibración en caché ({key[:12]}): {exc}")
+        with _lock:
+            _counters['errors'] += 1
+        return False
+
+    with _lock:
+        _counters['stores'] += 1
+        if refresh:
+            _counters['refreshes'] += 1
+        _remember(key, value)
+    _evict()
+    return True
+
+
+def _disk_entries():
+    if not os.path.isdir(CALIBRATION_CACHE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(CALIBRATION_CACHE_DIR):
+        if not name.endswith('.joblib'):
+            continue
+        path = os.path.join(CALIBRATION_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def _evict():
+    entries = _disk_entries()
+    excess = len(entries) - max(CALIBRATION_CACHE_MAX_ENTRIES, 1)
+    if excess <= 0:
+        return
+    for _, _, path in sorted(entries)[:excess]:
+        key = os.path.splitext(os.path.basename(path))[0]
+        with _lock:
+            _memory.pop(key, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def clear_cache():
+    """Elimina todas las entradas (disco y memoria). Devuelve cuántas había en disco."""
+    entries = _disk_entries()
+    for _, _, path in entries:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    with _lock:
+        _memory.clear()
+    return len(entries)
+
+
+def cache_stats():
+    """
+    Estadísticas de la caché. Los contadores son del proceso actual; las entradas y el
+    tamaño, del directorio compartido.
+    """
+    entries = _disk_entries()
+    with _lock:
+        counters = dict(_counters)
+        memory_entries = len(_memory)
+    lookups = counters['hits'] + counters['misses']
+    return {
+        'enabled': CALIBRATION_CACHE_ENABLED,
+        'directory': os.path.abspath(CALIBRATION_CACHE_DIR),
+        'entries': len(entries),
+        'size_mb': round(sum(size for _, size, _ in entries) / 1024 ** 2, 3),
+        'memory_entries': memory_entries,
+        'max_entries': CALIBRATION_CACHE_MAX_ENTRIES,
+        'hit_rate': round(counters['hits'] / lookups, 4) if lookups else None,
+        **counters
+    }
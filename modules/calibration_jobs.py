@@ -0,0 +1,376 @@
+"""
+Cola de trabajos de calibración en segundo plano.
+
+Los endpoints de calibración entregan un id de trabajo de inmediato y un pool local de hilos
+ejecuta la calibración (que a su vez reparte dispositivos y contaminantes en procesos). El
+progreso por dispositivo, contaminante y modelo se consulta con get_job o se transmite por
+SSE con sse_stream. El estado y el resultado se guardan en disco (JOBS_DIR), de modo que un
+trabajo terminado se puede consultar más tarde, incluso desde otro proceso del servidor,
+sin recalcular.
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+JOBS_DIR = os.getenv(
+    'CALIBRATION_JOBS_DIR',
+    os.path.join(os.path.dirname(__file__), '..', 'data', 'calibration_jobs')
+)
+CALIBRATION_JOB_WORKERS = int(os.getenv('CALIBRATION_JOB_WORKERS', 1))
+# Eventos de progreso que se conservan por trabajo
+JOB_EVENTS_LIMIT = 500
+# Segundos entre comentarios de keep-alive en el stream SSE
+SSE_HEARTBEAT_SECONDS = 15
+
+FINISHED_STATUSES = ('completed', 'failed', 'interrupted')
+
+_jobs = {}
+_condition = threading.Condition()
+_executor = None
+_event_queue = None
+_manager = None
+_drained = set()
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f'{job_id}.json')
+
+
+def _valid_job_id(job_id):
+    try:
+        return uuid.UUID(str(job_id)).hex == str(job_id)
+    except ValueError:
+        return False
+
+
+def _persist(record):
+    """Guarda (reemplazo atómico) el estado del trabajo."""
+    try:
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        path = _job_path(record['job_id'])
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(record, handle, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as exc:
+        print(f"⚠️  No se pudo guardar el trabajo {record.get('job_id')}: {exc}")
+
+
+def _snapshot(record, include_result=False, include_events=False):
+    data = {key: value for key, value in record.items() if key not in ('result', 'events')}
+    if include_events:
+        data['events'] = list(record.get('events', []))
+    if include_result:
+        data['result'] = record.get('result')
+    return data
+
+
+def _load_from_disk(job_id):
+    try:
+        with open(_job_path(job_id), 'r', encoding='utf-8') as handle:
+            record = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    # Un trabajo sin terminar que no está en memoria lo ejecuta otro proceso del servidor;
+    # si ese proceso ya no existe, el trabajo quedó interrumpido (p. ej. por un reinicio)
+    if record.get('status') not in FINISHED_STATUSES and not _process_alive(record.get('pid')):
+        record['status'] = 'interrupted'
+    return record
+
+
+def _process_alive(pid):
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class JobProgress:
+    """
+    Callback de progreso serializable: se puede pasar a los procesos del fan-out. Los
+    eventos llegan al trabajo por la cola del Manager o, si no hay Manager, solo desde el
+    proceso que creó el trabajo.
+    """
+
+    def __init__(self, job_id, event_queue=None):
+        self.job_id = job_id
+        self.event_queue = event_queue
+        self.owner_pid = os.getpid()
+
+    def __call__(self, event):
+        event = dict(event, time=time.time())
+        if self.event_queue is not None:
+            try:
+                self.event_queue.put((self.job_id, event))
+                return
+            except Exception:
+                pass
+        if os.getpid() == self.owner_pid:
+            _record_event(self.job_id, event)
+
+
+def _record_event(job_id, event):
+    with _condition:
+        record = _jobs.get(job_id)
+        if record is None:
+            return
+        events = record['events']
+        event = dict(event, seq=record['event_seq'] + 1)
+        record['event_seq'] = event['seq']
+        events.append(event)
+        if len(events) > JOB_EVENTS_LIMIT:
+            del events[:len(events) - JOB_EVENTS_LIMIT]
+
+        progress = record['progress']
+        stage = event.get('stage')
+        if stage == 'plan':
+            progress['total'] = progress.get('total', 0) + int(event.get('total', 0))
+        elif stage == 'pollutant':
+            progress['completed'] = progress.get('completed', 0) + 1
+        elif stage == 'model':
+            progress['models_completed'] = progress.get('models_completed', 0) + 1
+        if progress.get('total'):
+            progress['percent'] = round(100.0 * progress.get('completed', 0) / progress['total'], 1)
+        progress['current'] = {k: event[k] for k in ('device', 'pollutant', 'model') if k in event}
+        record['updated_at'] = _now()
+        _condition.notify_all()
+        persist = stage in ('plan', 'pollutant')
+        snapshot = _snapshot(record, include_events=True) if persist else None
+
+    # El progreso grueso se guarda para que otros procesos del servidor lo vean al consultar
+    if snapshot is not None:
+        _persist(snapshot)
+
+
+def _drain_events():
+    while True:
+        try:
+            job_id, event = _event_queue.get()
+        except (EOFError, OSError):
+            return
+        except Exception:
+            continue
+        if event is None:
+            # Marca de fin: todos los eventos encolados antes ya se registraron
+            with _condition:
+                _drained.add(job_id)
+                _condition.notify_all()
+            continue
+        _record_event(job_id, event)
+
+
+def _ensure_runtime():
+    """Inicia (una vez) el pool de hilos y la cola de eventos entre procesos."""
+    global _executor, _event_queue, _manager
+    with _condition:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, CALIBRATION_JOB_WORKERS),
+                thread_name_prefix='calibration-job'
+            )
+        if _event_queue is None and _manager is None:
+            try:
+                _manager = multiprocessing.Manager()
+                _event_queue = _manager.Queue()
+                threading.Thread(target=_drain_events, name='calibration-job-events', daemon=True).start()
+            except Exception as exc:
+                print(f"⚠️  Progreso entre procesos no disponible ({exc}); solo se reportará el progreso local")
+                _manager = False
+    return _executor
+
+
+def _set_status(job_id, status, **fields):
+    with _condition:
+        record = _jobs[job_id]
+        record['status'] = status
+        record['updated_at'] = _now()
+        record.update(fields)
+        _condition.notify_all()
+        snapshot = _snapshot(record, include_result=True, include_events=True)
+    _persist(snapshot)
+
+
+def _execute(job_id, runner, params):
+    _set_status(job_id, 'running', started_at=_now())
+    print(f"🧵 Trabajo de calibración {job_id} iniciado")
+    progress = JobProgress(job_id, _event_queue)
+    try:
+        result, status_code = runner(params, progress)
+    except Exception as exc:
+        traceback.print_exc()
+        _set_status(job_id, 'failed', finished_at=_now(), error=str(exc), http_status=500)
+        print(f"❌ Trabajo de calibración {job_id} falló: {exc}")
+        return
+
+    # Los procesos del fan-out encolan sus eventos antes de devolver su resultado, así que
+    # basta esperar a que el hilo lector llegue a una marca encolada después de ellos
+    if _event_queue is not None:
+        try:
+            _event_queue.put((job_id, None))
+            with _condition:
+                _condition.wait_for(lambda: job_id in _drained, timeout=5)
+                _drained.discard(job_id)
+        except Exception:
+            pass
+
+    failed = status_code >= 400
+    error = (result or {}).get('error') if failed else None
+    _set_status(
+        job_id,
+        'failed' if failed else 'completed',
+        finished_at=_now(),
+        http_status=status_code,
+        error=error,
+        result=result
+    )
+    print(f"{'❌' if failed else '✅'} Trabajo de calibración {job_id} terminado ({status_code})")
+
+
+def submit_job(kind, params, runner):
+    """
+    Encola una calibración.
+
+    Args:
+        kind (str): Tipo de trabajo (p. ej. 'stage2').
+        params (dict): Parámetros (payload de la solicitud, serializable a JSON).
+        runner (callable): Función (params, progress) -> (resultado, código HTTP).
+
+    Returns:
+        str: Id del trabajo.
+    """
+    executor = _ensure_runtime()
+    job_id = uuid.uuid4().hex
+    record = {
+        'job_id': job_id,
+        'kind': kind,
+        'params': params,
+        'status': 'queued',
+        'created_at': _now(),
+        'updated_at': _now(),
+        'started_at': None,
+        'finished_at': None,
+        'pid': os.getpid(),
+        'error': None,
+        'http_status': None,
+        'progress': {'total': 0, 'completed': 0, 'models_completed': 0, 'percent': 0.0, 'current': {}},
+        'events': [],
+        'event_seq': 0,
+        'result': None
+    }
+    with _condition:
+        _jobs[job_id] = record
+    _persist(_snapshot(record, include_result=True, include_events=True))
+    executor.submit(_execute, job_id, runner, params)
+    print(f"📥 Trabajo de calibración {job_id} ({kind}) encolado")
+    return job_id
+
+
+def get_job(job_id, include_result=False, include_events=False):
+    """
+    Estado de un trabajo (memoria o disco).
+
+    Returns:
+        dict | None: Estado, progreso y, si se pide y terminó, el resultado.
+    """
+    if not _valid_job_id(job_id):
+        return None
+    with _condition:
+        record = _jobs.get(job_id)
+        if record is not None:
+            return _snapshot(record, include_result=include_result, include_events=include_events)
+    record = _load_from_disk(job_id)
+    if record is None:
+        return None
+    return _snapshot(record, include_result=include_result, include_events=include_events)
+
+
+def list_jobs(limit=50):
+    """Trabajos más recientes (sin resultados), leídos del disco."""
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    paths = sorted(
+        (os.path.join(JOBS_DIR, name) for name in os.listdir(JOBS_DIR) if name.endswith('.json')),
+        key=os.path.getmtime,
+        reverse=True
+    )[:limit]
+    jobs = []
+    for path in paths:
+        job = get_job(os.path.splitext(os.path.basename(path))[0])
+        if job is not None:
+            jobs.append(job)
+    return jobs
+
+
+def iter_job_events(job_id, since=0, heartbeat=SSE_HEARTBEAT_SECONDS):
+    """
+    Eventos de progreso posteriores a `since` a medida que ocurren.
+
+    Yields:
+        tuple[str, dict | None]: ('progress', evento), ('heartbeat', None) y al final
+        ('end', estado final del trabajo).
+    """
+    last_seq = since
+    while True:
+        with _condition:
+            record = _jobs.get(job_id)
+            if record is None:
+                break
+            events = [event for event in record['events'] if event['seq'] > last_seq]
+            finished = record['status'] in FINISHED_STATUSES
+            if not events and not finished:
+                _condition.wait(timeout=heartbeat)
+                events = [event for event in record['events'] if event['seq'] > last_seq]
+                finished = record['status'] in FINISHED_STATUSES
+        if events:
+            for event in events:
+                last_seq = event['seq']
+                yield 'progress', event
+        elif not finished:
+            yield 'heartbeat', None
+        if finished and not events:
+            break
+
+    job = get_job(job_id)
+    if job is not None:
+        yield 'end', job
+
+
+def sse_stream(job_id, since=0):
+    """Formatea iter_job_events como Server-Sent Events."""
+    job = get_job(job_id)
+    if job is None:
+        yield f"event: error\ndata: {json.dumps({'error': 'Trabajo no encontrado'})}\n\n"
+        return
+    if job['status'] in FINISHED_STATUSES or job_id not in _jobs:
+        # Trabajo terminado o ejecutado por otro proceso: se envían los eventos guardados
+        stored = get_job(job_id, include_events=True)
+        for event in stored.get('events', []):
+            if event.get('seq', 0) > since:
+                yield f"id: {event['seq']}\nevent: progress\ndata: {json.dumps(event, default=str)}\n\n"
+        yield f"event: end\ndata: {json.dumps(job, default=str)}\n\n"
+        return
+
+    for kind, payload in iter_job_events(job_id, since):
+        if kind == 'heartbeat':
+            yield ': keep-alive\n\n'
+        elif kind == 'progress':
+            yield f"id: {payload['seq']}\nevent: progress\ndata: {json.dumps(payload, default=str)}\n\n"
+        else:
+            yield f"event: end\ndata: {json.dumps(payload, default=str)}\n\n"
@@ -0,0 +1,477 @@
+"""
+Índice de cobertura horaria por dispositivo y contaminante basado en mapas de bits
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+    FILE_LOCKS_AVAILABLE = True
+except ImportError:
+    # Windows: sin bloqueo entre procesos (los guardados siguen siendo atómicos por serie)
+    FILE_LOCKS_AVAILABLE = False
+
+
+# Directorio del índice persistido (un archivo por serie) y origen común de los desplazamientos horarios
+COVERAGE_INDEX_PATH = os.getenv(
+    'COVERAGE_INDEX_PATH',
+    os.path.join(os.path.dirname(__file__), '..', 'data', 'coverage_index')
+)
+COVERAGE_EPOCH = pd.Timestamp('2000-01-01')
+
+# Canal especial con las horas efectivamente consultadas (para distinguir "sin datos" de "no cargado")
+SCANNED_CHANNEL = 'scanned'
+
+LOWCOST_CHANNELS = {
+    'records': None,
+    'pm25': 'pm25_sensor',
+    'pm10': 'pm10_sensor'
+}
+
+REFERENCE_CHANNELS = {
+    'records': None,
+    'pm25': 'pm25_ref',
+    'pm10': 'pm10_ref'
+}
+
+
+def hour_offsets(timestamps):
+    """
+    Convierte timestamps en desplazamientos enteros de horas respecto a COVERAGE_EPOCH.
+
+    Args:
+        timestamps: Iterable/Series/DatetimeIndex de fechas.
+
+    Returns:
+        np.ndarray[int64]: Desplazamientos horarios (las fechas nulas se descartan).
+    """
+    values = pd.DatetimeIndex(pd.to_datetime(timestamps, errors='coerce'))
+    if values.tz is not None:
+        values = values.tz_localize(None)
+    values = values[~values.isna()]
+    return ((values.floor('h') - COVERAGE_EPOCH) // pd.Timedelta(hours=1)).to_numpy(dtype='int64')
+
+
+def offsets_to_datetimes(offsets):
+    return COVERAGE_EPOCH + pd.to_timedelta(np.asarray(offsets, dtype='int64'), unit='h')
+
+
+@contextlib.contextmanager
+def _directory_lock(directory):
+    """Bloqueo exclusivo entre procesos sobre el directorio del índice."""
+    if not FILE_LOCKS_AVAILABLE:
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _series_filename(series):
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(series))
+    digest = hashlib.sha1(str(series).encode('utf-8')).hexdigest()[:8]
+    return f'{safe_name}-{digest}.npz'
+
+
+def _runs(flags):
+    """Devuelve pares (inicio, fin) inclusivos de las corridas True de un arreglo booleano."""
+    if flags.size == 0:
+        return []
+    padded = np.concatenate([[False], flags, [False]]).astype(np.int8)
+    changes = np.diff(padded)
+    starts = np.flatnonzero(changes == 1)
+    ends = np.flatnonzero(changes == -1) - 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class CoverageIndex:
+    """
+    Mapas de bits de presencia horaria por serie (dispositivo o estación) y canal.
+
+    Cada mapa se guarda empaquetado (1 bit por hora, orden little-endian) junto con la palabra
+    inicial, de modo que las consultas de cobertura, intersección y huecos son operaciones
+    vectorizadas sobre arreglos uint8 en lugar de recorridos de DataFrames.
+
+    En disco el índice es un directorio con un archivo por serie; save solo reescribe las
+    series cuyos bits cambiaron desde la última carga o guardado.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._bitmaps = {}
+        self._lock = threading.RLock()
+        self._dirty = set()
+        self._loaded_mtime = None
+        self._file_mtimes = {}
+
+    # ------------------------------------------------------------------
+    # Manejo interno de mapas de bits
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _key(series, channel):
+        return f'{series}|{channel}'
+
+    def _extend(self, key, lo_word, hi_word):
+        start_word, words = self._bitmaps.get(key, (lo_word, np.zeros(0, dtype=np.uint8)))
+        if words.size == 0:
+            start_word = lo_word
+        new_start = min(start_word, lo_word)
+        new_end = max(start_word + words.size, hi_word + 1)
+        if new_start == start_word and new_end == start_word + words.size:
+            return start_word, words
+
+        extended = np.zeros(new_end - new_start, dtype=np.uint8)
+        extended[start_word - new_start:start_word - new_start + words.size] = words
+        self._bitmaps[key] = (new_start, extended)
+        return new_start, extended
+
+    def _words_range(self, key, lo_word, hi_word):
+        """Palabras del mapa en [lo_word, hi_word] (ceros donde no hay información)."""
+        out = np.zeros(hi_word - lo_word + 1, dtype=np.uint8)
+        if key not in self._bitmaps:
+            return out
+        start_word, words = self._bitmaps[key]
+        lo = max(lo_word, start_word)
+        hi = min(hi_word, start_word + words.size - 1)
+        if lo <= hi:
+            out[lo - lo_word:hi - lo_word + 1] = words[lo - start_word:hi - start_word + 1]
+        return out
+
+    def _bits_range(self, key, start_offset, end_offset):
+        lo_word, hi_word = start_offset >> 3, end_offset >> 3
+        bits = np.unpackbits(self._words_range(key, lo_word, hi_word), bitorder='little')
+        first = start_offset - (lo_word << 3)
+        return bits[first:first + end_offset - start_offset + 1].astype(bool)
+
+    @staticmethod
+    def _offset_bounds(start, end):
+        start_offset = int(hour_offsets([start])[0])
+        end_offset = int(hour_offsets([end])[0])
+        return start_offset, max(end_offset, start_offset)
+
+    # ------------------------------------------------------------------
+    # Actualización incremental
+    # ------------------------------------------------------------------
+    def set_hours(self, series, channel, offsets):
+        offsets = np.unique(np.asarray(offsets, dtype='int64'))
+        if offsets.size == 0:
+            return
+        key = self._key(series, channel)
+        with self._lock:
+            start_word, words = self._extend(key, int(offsets[0] >> 3), int(offsets[-1] >> 3))
+            word_idx = (offsets >> 3) - start_word
+            before = words[word_idx]
+            np.bitwise_or.at(words, word_idx, np.left_shift(1, offsets & 7).astype(np.uint8))
+            if not np.array_equal(before, words[word_idx]):
+                self._dirty.add(series)
+
+    def mark_scanned(self, series, start, end):
+        """Registra que el rango [start, end] fue consultado para la serie."""
+        start_offset, end_offset = self._offset_bounds(start, end)
+        self.set_hours(series, SCANNED_CHANNEL, np.arange(start_offset, end_offset + 1, dtype='int64'))
+
+    def update_from_frame(self, df, channels, series_column='device_name', series=None,
+                          datetime_column='datetime'):
+        """
+        Incorpora al índice las horas presentes en un DataFrame.
+
+        Args:
+            df (DataFrame): Datos crudos u horarios.
+            channels (dict): canal -> columna cuyo valor no nulo indica presencia (None = cualquier fila).
+            series_column (str): Columna que identifica la serie (dispositivo).
+            series (str, opcional): Nombre fijo de la serie (p. ej. estación RMCAB).
+            datetime_column (str): Columna de fechas.
+
+        Returns:
+            list[str]: Series actualizadas.
+        """
+        if df is None or df.empty or datetime_column not in df.columns:
+            return []
+
+        times = pd.to_datetime(df[datetime_column], errors='coerce')
+        if getattr(times.dt, 'tz', None) is not None:
+            times = times.dt.tz_localize(None)
+        valid = times.notna().to_numpy()
+        offsets = np.zeros(len(df), dtype='int64')
+        offsets[valid] = ((times[valid].dt.floor('h') - COVERAGE_EPOCH) // pd.Timedelta(hours=1)).to_numpy(dtype='int64')
+
+        if series is not None:
+            codes = np.zeros(len(df), dtype='int64')
+            labels = [series]
+        elif series_column in df.columns:
+            codes, labels = pd.factorize(df[series_column].astype(str))
+            labels = list(labels)
+        else:
+            return []
+
+        channel_masks = {}
+        for channel, column in channels.items():
+            if column is None:
+                channel_masks[channel] = valid
+            elif column in df.columns:
+                channel_masks[channel] = valid & df[column].notna().to_numpy()
+
+        for code, label in enumerate(labels):
+            in_series = codes == code
+            for channel, mask in channel_masks.items():
+                self.set_hours(label, channel, offsets[in_series & mask])
+
+        return labels
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def series(self):
+        with self._lock:
+            return sorted({key.split('|', 1)[0] for key in self._bitmaps})
+
+    def contains(self, series, channel, timestamps):
+        """
+        Máscara booleana que indica si cada timestamp cae en una hora cubierta.
+        """
+        times = pd.DatetimeIndex(pd.to_datetime(timestamps, errors='coerce'))
+        if times.tz is not None:
+            times = times.tz_localize(None)
+        result = np.zeros(len(times), dtype=bool)
+        valid = ~times.isna()
+        key = self._key(series, channel)
+        with self._lock:
+            if not valid.any() or key not in self._bitmaps:
+                return result
+            start_word, words = self._bitmaps[key]
+            offsets = ((times[valid].floor('h') - COVERAGE_EPOCH) // pd.Timedelta(hours=1)).to_numpy(dtype='int64')
+            word_idx = (offsets >> 3) - start_word
+            inside = (word_idx >= 0) & (word_idx < words.size)
+            hits = np.zeros(offsets.size, dtype=bool)
+            hits[inside] = (words[word_idx[inside]] >> (offsets[inside] & 7)) & 1 == 1
+        result[valid] = hits
+        return result
+
+    def presence(self, series, channel, start, end):
+        """Arreglo booleano hora a hora entre start y end (inclusive)."""
+        start_offset, end_offset = self._offset_bounds(start, end)
+        with self._lock:
+            return self._bits_range(self._key(series, channel), start_offset, end_offset)
+
+    def hours(self, series, channel, start, end):
+        start_offset, _ = self._offset_bounds(start, end)
+        flags = self.presence(series, channel, start, end)
+        return pd.DatetimeIndex(offsets_to_datetimes(start_offset + np.flatnonzero(flags)))
+
+    def count(self, series, channel, start, end):
+        return int(self.presence(series, channel, start, end).sum())
+
+    def intersect(self, series, channel, other_series, other_channel, start, end):
+        """
+        Horas cubiertas simultáneamente por dos series (p. ej. sensor y estación de referencia).
+        """
+        start_offset, end_offset = self._offset_bounds(start, end)
+        lo_word, hi_word = start_offset >> 3, end_offset >> 3
+        with self._lock:
+            words = (
+                self._words_range(self._key(series, channel), lo_word, hi_word) &
+                self._words_range(self._key(other_series, other_channel), lo_word, hi_word)
+            )
+        bits = np.unpackbits(words, bitorder='little')
+        first = start_offset - (lo_word << 3)
+        flags = bits[first:first + end_offset - start_offset + 1].astype(bool)
+        return pd.DatetimeIndex(offsets_to_datetimes(start_offset + np.flatnonzero(flags)))
+
+    def gaps(self, series, channel, start, end, min_hours=1, only_scanned=True):
+        """
+        Huecos (horas sin datos) dentro del rango.
+
+        Args:
+            only_scanned (bool): Si True, solo cuenta como hueco lo que efectivamente se consultó.
+
+        Returns:
+            list[dict]: {'start', 'end', 'hours'} por cada hueco de al menos min_hours horas.
+        """
+        start_offset, end_offset = self._offset_bounds(start, end)
+        with self._lock:
+            present = self._bits_range(self._key(series, channel), start_offset, end_offset)
+            missing = ~present
+            if only_scanned:
+                missing &= self._bits_range(self._key(series, SCANNED_CHANNEL), start_offset, end_offset)
+
+        gaps = []
+        for run_start, run_end in _runs(missing):
+            length = run_end - run_start + 1
+            if length < min_hours:
+                continue
+            gaps.append({
+                'start': offsets_to_datetimes([start_offset + run_start])[0],
+                'end': offsets_to_datetimes([start_offset + run_end])[0],
+                'hours': int(length)
+            })
+        return gaps
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+    def merge(self, other, track_changes=True):
+        """
+        Une (OR) los mapas de otro índice en este.
+
+        Args:
+            track_changes (bool): Si True, las series que cambian se guardan en el próximo save.
+        """
+        for key, (start_word, words) in other._bitmaps.items():
+            with self._lock:
+                own_start, own_words = self._extend(key, start_word, start_word + words.size - 1)
+                offset = start_word - own_start
+                target = own_words[offset:offset + words.size]
+                if track_changes and np.any(words & ~target):
+                    self._dirty.add(key.split('|', 1)[0])
+                target |= words
+
+    def _series_arrays(self, series):
+        prefix = f'{series}|'
+        with self._lock:
+            keys = [key for key in self._bitmaps if key.startswith(prefix)]
+            arrays = {f'bitmap_{i}': self._bitmaps[key][1].copy() for i, key in enumerate(keys)}
+            meta = {'keys': keys, 'start_words': [int(self._bitmaps[key][0]) for key in keys]}
+        return meta, arrays
+
+    @staticmethod
+    def _read_file(path):
+        bitmaps = {}
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            for i, (key, start_word) in enumerate(zip(meta['keys'], meta['start_words'])):
+                bitmaps[key] = (int(start_word), data[f'bitmap_{i}'].astype(np.uint8))
+        return bitmaps
+
+    def _merge_file(self, file_path):
+        other = CoverageIndex()
+        other._bitmaps = self._read_file(file_path)
+        self.merge(other, track_changes=False)
+        self._file_mtimes[os.path.basename(file_path)] = os.path.getmtime(file_path)
+
+    def save(self, path=None):
+        """
+        Guarda las series modificadas, cada una en su archivo y bajo un bloqueo entre procesos.
+
+        Antes de reemplazar el archivo de una serie se une con lo que otro proceso haya
+        guardado, de modo que ninguna actualización concurrente se pierde.
+        """
+        path = path or self.path or COVERAGE_INDEX_PATH
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            dirty = sorted(self._dirty)
+
+        if dirty:
+            with _directory_lock(path):
+                for series in dirty:
+                    file_path = os.path.join(path, _series_filename(series))
+                    if os.path.exists(file_path):
+                        try:
+                            self._merge_file(file_path)
+                        except Exception as exc:
+                            print(f"⚠️  No se pudo combinar la cobertura guardada de {series}: {exc}")
+
+                    meta, arrays = self._series_arrays(series)
+                    tmp_path = f'{file_path}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'wb') as handle:
+                        np.savez_compressed(handle, meta=np.array(json.dumps(meta)), **arrays)
+                    os.replace(tmp_path, file_path)
+                    self._file_mtimes[os.path.basename(file_path)] = os.path.getmtime(file_path)
+                    with self._lock:
+                        self._dirty.discard(series)
+
+        self.path = path
+        return path
+
+    def refresh(self):
+        """
+        Incorpora solo los archivos de serie que otro proceso actualizó desde la última lectura.
+        """
+        if not self.path or not os.path.isdir(self.path):
+            return self
+        directory_mtime = os.path.getmtime(self.path)
+        if directory_mtime == self._loaded_mtime:
+            return self
+
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith('.npz'):
+                continue
+            if self._file_mtimes.get(entry.name) == entry.stat().st_mtime:
+                continue
+            try:
+                self._merge_file(entry.path)
+            except Exception as exc:
+                print(f"⚠️  No se pudo leer la cobertura guardada {entry.name}: {exc}")
+        self._loaded_mtime = directory_mtime
+        return self
+
+    @classmethod
+    def load(cls, path=None):
+        return cls(path or COVERAGE_INDEX_PATH).refresh()
+
+
+_COVERAGE_INDEX = None
+_COVERAGE_LOCK = threading.Lock()
+
+
+def get_coverage_index():
+    """
+    Índice compartido del proceso; se recarga si otro proceso actualizó el archivo.
+    """
+    global _COVERAGE_INDEX
+    with _COVERAGE_LOCK:
+        if _COVERAGE_INDEX is None:
+            _COVERAGE_INDEX = CoverageIndex.load(COVERAGE_INDEX_PATH)
+        else:
+            _COVERAGE_INDEX.refresh()
+        return _COVERAGE_INDEX
+
+
+def reference_series_name(station_code):
+    return f'RMCAB_{station_code}'
+
+
+def record_lowcost_coverage(df, start=None, end=None, devices=None, persist=True):
+    """
+    Actualiza el índice con lecturas de sensores recién cargadas (no falla si el índice falla).
+    """
+    try:
+        index = get_coverage_index()
+        updated = index.update_from_frame(df, LOWCOST_CHANNELS)
+        if start is not None and end is not None:
+            for device in set(devices or []) | set(updated):
+                index.mark_scanned(device, start, end)
+        if persist:
+            index.save()
+        return index
+    except Exception as exc:
+        print(f"⚠️  No se pudo actualizar el índice de cobertura: {exc}")
+        return None
+
+
+def record_reference_coverage(df, station_code, start=None, end=None, persist=True):
+    """
+    Actualiza el índice con datos de la estación de referencia (RMCAB).
+    """
+    try:
+        index = get_coverage_index()
+        series = reference_series_name(station_code)
+        index.update_from_frame(df, REFERENCE_CHANNELS, series=series)
+        if start is not None and end is not None:
+            index.mark_scanned(series, start, end)
+        if persist:
+            index.save()
+        return index
+    except Exception as exc:
+        print(f"⚠️  No se pudo actualizar el índice de cobertura: {exc}")
+        return None
@@ -3,12 +3,17 @@ Módulo para cargar datos de sensores de bajo costo y RMCAB
 """
 
 import pandas as pd
+import numpy as np
 import psycopg2
 import requests
 import json
 import os
 from datetime import datetime, timedelta
 
+from modules.coverage import record_lowcost_coverage, record_reference_coverage
+from modules.frame_contract import canonicalize, ensure_canonical, with_column
+from modules.resampling import resample_hourly
+
 
 # Configuración de base de datos
 DB_CONFIG = {
@@ -44,11 +49,101 @@ RMCAB_STATION_INFO = {
 
 LAST_LOW_COST_QUERY = ""
 
+# Expresiones SQL para extraer cada variable del JSON 'object' según el firmware del sensor
+PM25_SQL_EXPRESSION = """CASE
+                WHEN object ? 'analogInput' THEN ((object -> 'analogInput' -> '2')::NUMERIC) * 10
+                WHEN object ? 'PM_2P5' THEN NULLIF(object ->> 'PM_2P5', '')::NUMERIC
+                WHEN object ? 'PM2_5' THEN NULLIF(object ->> 'PM2_5', '')::NUMERIC
+                WHEN object ? 'PM25' THEN NULLIF(object ->> 'PM25', '')::NUMERIC
+                WHEN object ? 'pm25' THEN NULLIF(object ->> 'pm25', '')::NUMERIC
+                ELSE NULL
+            END"""
+
+PM10_SQL_EXPRESSION = """CASE
+                WHEN object ? 'analogInput' THEN ((object -> 'analogInput' -> '1')::NUMERIC) * 10
+                WHEN object ? 'PM_10' THEN NULLIF(object ->> 'PM_10', '')::NUMERIC
+                WHEN object ? 'PM10' THEN NULLIF(object ->> 'PM10', '')::NUMERIC
+                WHEN object ? 'pm10' THEN NULLIF(object ->> 'pm10', '')::NUMERIC
+                ELSE NULL
+            END"""
+
+TEMPERATURE_SQL_EXPRESSION = """CASE
+                WHEN object ? 'analogInput' THEN (object -> 'analogInput' -> '3')::NUMERIC
+                WHEN object ? 'temperature' THEN NULLIF(object ->> 'temperature', '')::NUMERIC
+                WHEN object ? 'Temperature' THEN NULLIF(object ->> 'Temperature', '')::NUMERIC
+                WHEN object ? 'temp' THEN NULLIF(object ->> 'temp', '')::NUMERIC
+                ELSE NULL
+            END"""
+
+RH_SQL_EXPRESSION = """CASE
+                WHEN object ? 'analogInput' THEN (object -> 'analogInput' -> '4')::NUMERIC
+                WHEN object ? 'rh' THEN NULLIF(object ->> 'rh', '')::NUMERIC
+                WHEN object ? 'RH' THEN NULLIF(object ->> 'RH', '')::NUMERIC
+                WHEN object ? 'humidity' THEN NULLIF(object ->> 'humidity', '')::NUMERIC
+                WHEN object ? 'Humidity' THEN NULLIF(object ->> 'Humidity', '')::NUMERIC
+                ELSE NULL
+            END"""
+
 
 def get_last_lowcost_query(default_message='(sin consulta registrada)'):
     return LAST_LOW_COST_QUERY or default_message
 
 
+def _normalize_devices(devices):
+    if isinstance(devices, str):
+        devices = [devices]
+    if devices:
+        devices = [str(dev).strip() for dev in devices if dev]
+        if not devices:
+            devices = None
+    return devices
+
+
+def _build_lowcost_where(start_date, end_date, devices, filter_by_keys):
+    """
+    Construye la cláusula WHERE (y sus parámetros) compartida por las consultas de sensores.
+    """
+    filters = []
+    params = [start_date, end_date]
+
+    if devices:
+        placeholders = ','.join(['%s'] * len(devices))
+        filters.append(f"device_name IN ({placeholders})")
+        params.extend(devices)
+
+    if filter_by_keys:
+        key_filter = """
+            (
+                object ? 'analogInput'
+                OR object ? 'PM_2P5'
+                OR object ? 'PM2_5'
+                OR object ? 'PM25'
+                OR object ? 'pm25'
+                OR object ? 'PM_10'
+                OR object ? 'PM10'
+                OR object ? 'pm10'
+            )
+        """
+        filters.append(key_filter)
+
+    # Excluir dispositivos cuyo nombre contenga 'Prototipo'
+    filters.append("COALESCE(device_name, '') NOT ILIKE '%prototipo%'")
+
+    where_clause = " AND ".join(["received_at BETWEEN %s AND %s"] + filters)
+    return where_clause, params
+
+
+def _register_lowcost_query(conn, query, params):
+    global LAST_LOW_COST_QUERY
+    # Registrar la consulta completa para depuración (aunque falle la ejecución)
+    try:
+        with conn.cursor() as cur:
+            LAST_LOW_COST_QUERY = cur.mogrify(query, params).decode('utf-8').strip()
+    except Exception as dbg_exc:
+        # Si falla mogrify (p. ej., desajuste de parámetros), conserva query y params crudos
+        LAST_LOW_COST_QUERY = f"-- mogrify_failed: {dbg_exc}\n{query}\n-- params: {params}"
+
+
 def load_lowcost_data(start_date='2024-06-01', end_date='2024-07-31', devices=None, aggregate=True, filter_by_keys=True):
     """
     Carga datos de sensores de bajo costo desde PostgreSQL
@@ -61,92 +156,28 @@ def load_lowcost_data(start_date='2024-06-01', end_date='2024-07-31', devices=No
     Returns:
         DataFrame con columnas: datetime, device_name, pm25, pm10, temperature, rh
     """
-    if isinstance(devices, str):
-        devices = [devices]
-    if devices:
-        devices = [str(dev).strip() for dev in devices if dev]
-        if not devices:
-            devices = None
+    devices = _normalize_devices(devices)
 
     try:
         # Conectar a PostgreSQL
         conn = psycopg2.connect(**DB_CONFIG)
 
-        filters = []
-        params = [start_date, end_date]
-
-        if devices:
-            placeholders = ','.join(['%s'] * len(devices))
-            filters.append(f"device_name IN ({placeholders})")
-            params.extend(devices)
-
-        if filter_by_keys:
-            key_filter = """
-                (
-                    object ? 'analogInput'
-                    OR object ? 'PM_2P5'
-                    OR object ? 'PM2_5'
-                    OR object ? 'PM25'
-                    OR object ? 'pm25'
-                    OR object ? 'PM_10'
-                    OR object ? 'PM10'
-                    OR object ? 'pm10'
-                )
-            """
-            filters.append(key_filter)
-
-        # Excluir dispositivos cuyo nombre contenga 'Prototipo'
-        filters.append("COALESCE(device_name, '') NOT ILIKE '%prototipo%'")
-
-        where_clause = " AND ".join(["received_at BETWEEN %s AND %s"] + filters)
+        where_clause, params = _build_lowcost_where(start_date, end_date, devices, filter_by_keys)
 
         query = f"""
         SELECT
             id,
             received_at,
             device_name,
-            CASE
-                WHEN object ? 'analogInput' THEN ((object -> 'analogInput' -> '2')::NUMERIC) * 10
-                WHEN object ? 'PM_2P5' THEN NULLIF(object ->> 'PM_2P5', '')::NUMERIC
-                WHEN object ? 'PM2_5' THEN NULLIF(object ->> 'PM2_5', '')::NUMERIC
-                WHEN object ? 'PM25' THEN NULLIF(object ->> 'PM25', '')::NUMERIC
-                WHEN object ? 'pm25' THEN NULLIF(object ->> 'pm25', '')::NUMERIC
-                ELSE NULL
-            END AS pm25_raw,
-            CASE
-                WHEN object ? 'analogInput' THEN ((object -> 'analogInput' -> '1')::NUMERIC) * 10
-                WHEN object ? 'PM_10' THEN NULLIF(object ->> 'PM_10', '')::NUMERIC
-                WHEN object ? 'PM10' THEN NULLIF(object ->> 'PM10', '')::NUMERIC
-                WHEN object ? 'pm10' THEN NULLIF(object ->> 'pm10', '')::NUMERIC
-                ELSE NULL
-            END AS pm10_raw,
-            CASE
-                WHEN object ? 'analogInput' THEN (object -> 'analogInput' -> '3')::NUMERIC
-                WHEN object ? 'temperature' THEN NULLIF(object ->> 'temperature', '')::NUMERIC
-                WHEN object ? 'Temperature' THEN NULLIF(object ->> 'Temperature', '')::NUMERIC
-                WHEN object ? 'temp' THEN NULLIF(object ->> 'temp', '')::NUMERIC
-                ELSE NULL
-            END AS temperature,
-            CASE
-                WHEN object ? 'analogInput' THEN (object -> 'analogInput' -> '4')::NUMERIC
-                WHEN object ? 'rh' THEN NULLIF(object ->> 'rh', '')::NUMERIC
-                WHEN object ? 'RH' THEN NULLIF(object ->> 'RH', '')::NUMERIC
-                WHEN object ? 'humidity' THEN NULLIF(object ->> 'humidity', '')::NUMERIC
-                WHEN object ? 'Humidity' THEN NULLIF(object ->> 'Humidity', '')::NUMERIC
-                ELSE NULL
-            END AS rh
+            {PM25_SQL_EXPRESSION} AS pm25_raw,
+            {PM10_SQL_EXPRESSION} AS pm10_raw,
+            {TEMPERATURE_SQL_EXPRESSION} AS temperature,
+            {RH_SQL_EXPRESSION} AS rh
         FROM public.device_up
         WHERE {where_clause}
         ORDER BY received_at DESC
         """
-        global LAST_LOW_COST_QUERY
-        # Registrar la consulta completa para depuración (aunque falle la ejecución)
-        try:
-            with conn.cursor() as cur:
-                LAST_LOW_COST_QUERY = cur.mogrify(query, params).decode('utf-8').strip()
-        except Exception as dbg_exc:
-            # Si falla mogrify (p. ej., desajuste de parámetros), conserva query y params crudos
-            LAST_LOW_COST_QUERY = f"-- mogrify_failed: {dbg_exc}\n{query}\n-- params: {params}"
+        _register_lowcost_query(conn, query, params)
 
         # Cargar datos
         df = pd.read_sql(query, conn, params=params)
@@ -167,17 +198,14 @@ def load_lowcost_data(start_date='2024-06-01', end_date='2024-07-31', devices=No
             'pm10_raw': 'pm10_sensor'
         })
 
-        if not aggregate:
-            return df.sort_values('datetime').reset_index(drop=True)
+        # Mantener actualizado el índice de cobertura horaria con lo recién cargado
+        record_lowcost_coverage(df, start_date, end_date, devices)
 
-        df_hourly = df.groupby(['device_name', pd.Grouper(key='datetime', freq='H')]).agg({
-            'pm25_sensor': 'mean',
-            'pm10_sensor': 'mean',
-            'temperature': 'mean',
-            'rh': 'mean'
-        }).reset_index()
+        if not aggregate:
+            return canonicalize(df, 'lowcost')
 
-        return df_hourly
+        # Grilla horaria (medias y conteos) sin las horas vacías
+        return canonicalize(resample_hourly(df, include_gaps=False), 'lowcost')
 
     except Exception as e:
         import traceback
@@ -187,41 +215,94 @@ def load_lowcost_data(start_date='2024-06-01', end_date='2024-07-31', devices=No
 
 
 
-def find_dense_window(lowcost_df, window_days=10, devices=None):
+def load_lowcost_hourly_counts(start_date='2024-06-01', end_date='2024-07-31', devices=None, filter_by_keys=False):
     """
-    Encuentra la ventana deslizante de 'window_days' días con mayor densidad de datos.
+    Calcula en PostgreSQL los conteos horarios por dispositivo (GROUP BY) sin descargar filas crudas.
 
     Args:
-        lowcost_df (DataFrame): Datos horarios de sensores de bajo costo.
-        window_days (int): Duración de la ventana en días (default: 10).
-        devices (list[str], opcional): Lista de dispositivos a priorizar.
+        start_date: Fecha inicial (formato YYYY-MM-DD)
+        end_date: Fecha final (formato YYYY-MM-DD)
+        devices: Lista de dispositivos (opcional). Si es None, incluye todos.
+        filter_by_keys: Si True, restringe a mensajes con llaves de material particulado.
 
     Returns:
-        dict | None: Información de la mejor ventana encontrada.
+        DataFrame con columnas: device_name, datetime, records, pm25_count, pm10_count
     """
-    if lowcost_df is None or lowcost_df.empty:
-        return None
+    devices = _normalize_devices(devices)
 
-    df = lowcost_df.copy()
-    if 'datetime' not in df.columns:
-        return None
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
 
-    df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-    df = df.dropna(subset=['datetime'])
-    if df.empty:
-        return None
+        where_clause, params = _build_lowcost_where(start_date, end_date, devices, filter_by_keys)
+
+        query = f"""
+        SELECT
+            COALESCE(device_name, 'Desconocido') AS device_name,
+            date_trunc('hour', received_at) AS hour,
+            COUNT(*) AS records,
+            COUNT({PM25_SQL_EXPRESSION}) AS pm25_count,
+            COUNT({PM10_SQL_EXPRESSION}) AS pm10_count
+        FROM public.device_up
+        WHERE {where_clause}
+        GROUP BY 1, 2
+        ORDER BY 2
+        """
+        _register_lowcost_query(conn, query, params)
+
+        df = pd.read_sql(query, conn, params=params)
+        conn.close()
 
-    if devices:
-        df = df[df['device_name'].isin(devices)]
         if df.empty:
-            return None
+            print("No se encontraron conteos para el período especificado")
+            return pd.DataFrame()
+
+        df['hour'] = pd.to_datetime(df['hour']).dt.tz_localize(None)
+        df = df.rename(columns={'hour': 'datetime'})
+        for column in ['records', 'pm25_count', 'pm10_count']:
+            df[column] = df[column].astype('int64')
+
+        return df
+
+    except Exception as e:
+        import traceback
+        print(f"Error cargando conteos horarios de sensores: {e}")
+        traceback.print_exc()
+        return None
 
-    # Normalizar hora y ordenar
-    df['datetime'] = df['datetime'].dt.floor('H')
-    df = df.sort_values('datetime')
 
-    start_ts = df['datetime'].min().normalize()
-    end_ts = df['datetime'].max()
+def _hourly_counts_from_frame(df):
+    """
+    Resume un DataFrame de lecturas en la matriz de conteos por dispositivo y hora que
+    produce load_lowcost_hourly_counts.
+    """
+    grid = resample_hourly(df, value_columns=['pm25_sensor', 'pm10_sensor'], include_gaps=False)
+    counts = grid[['device_name', 'datetime', 'records']].copy()
+    for pollutant in ('pm25', 'pm10'):
+        count_col = f'{pollutant}_sensor_count'
+        counts[f'{pollutant}_count'] = grid[count_col].to_numpy() if count_col in grid.columns else 0
+    return counts
+
+
+def _select_dense_window(counts, window_days=10, devices=None):
+    """
+    Elige la ventana de 'window_days' días con más registros a partir de la matriz de conteos horarios.
+
+    La ventana candidata inicia cada medianoche; el desempate es por cobertura mínima de los
+    dispositivos prioritarios y, por último, la ventana más temprana.
+
+    Args:
+        counts (DataFrame): Columnas device_name, datetime (hora), records, pm25_count, pm10_count.
+        window_days (int): Duración de la ventana en días.
+        devices (list[str], opcional): Dispositivos prioritarios.
+
+    Returns:
+        dict | None: Información de la mejor ventana (sin la llave 'subset').
+    """
+    if counts is None or counts.empty:
+        return None
+
+    start_ts = counts['datetime'].min().normalize()
+    end_ts = counts['datetime'].max()
 
     if pd.isna(start_ts) or pd.isna(end_ts):
         return None
@@ -234,77 +315,179 @@ def find_dense_window(lowcost_df, window_days=10, devices=None):
     if last_start < start_ts:
         last_start = start_ts
 
-    start_candidates = pd.date_range(start_ts, last_start, freq='D')
-    if len(start_candidates) == 0:
-        start_candidates = pd.DatetimeIndex([start_ts])
+    n_candidates = max(len(pd.date_range(start_ts, last_start, freq='D')), 1)
 
-    best_window = None
-    priority_devices = devices or df['device_name'].unique().tolist()
+    device_codes, device_labels = pd.factorize(counts['device_name'], use_na_sentinel=False)
+    day_offsets = ((counts['datetime'] - start_ts) // pd.Timedelta(days=1)).to_numpy(dtype='int64')
+    n_days = max(int(day_offsets.max()) + 1, n_candidates - 1 + window_days)
+    n_devices = len(device_labels)
 
-    for candidate_start in start_candidates:
-        candidate_end = candidate_start + window_duration - pd.Timedelta(hours=1)
-        mask = (df['datetime'] >= candidate_start) & (df['datetime'] <= candidate_end)
-        subset = df.loc[mask]
-        total_records = len(subset)
-        if total_records == 0:
-            continue
+    def _daily_matrix(values):
+        matrix = np.zeros((n_days + 1, n_devices), dtype='int64')
+        np.add.at(matrix, (day_offsets + 1, device_codes), values)
+        return np.cumsum(matrix, axis=0)
 
-        per_device_counts = subset['device_name'].value_counts()
-        # Cobertura mínima de dispositivos prioritarios
-        coverage_min = None
-        if priority_devices:
-            coverage_series = per_device_counts.reindex(priority_devices).fillna(0)
-            coverage_min = coverage_series.min()
-
-        # Registrar conteos por contaminante y dispositivo
-        pollutant_counts = {}
-        for device in priority_devices:
-            device_subset = subset[subset['device_name'] == device]
-            if device_subset.empty:
-                pollutant_counts[device] = {'pm25': 0, 'pm10': 0}
-                continue
-
-            pm25_count = int(device_subset['pm25_sensor'].notna().sum()) if 'pm25_sensor' in device_subset.columns else 0
-            pm10_count = int(device_subset['pm10_sensor'].notna().sum()) if 'pm10_sensor' in device_subset.columns else 0
+    def _window_sums(cumulative):
+        starts = np.arange(n_candidates)
+        return cumulative[starts + window_days] - cumulative[starts]
+
+    records = _window_sums(_daily_matrix(counts['records'].to_numpy(dtype='int64')))
+    pm25 = _window_sums(_daily_matrix(counts['pm25_count'].to_numpy(dtype='int64')))
+    pm10 = _window_sums(_daily_matrix(counts['pm10_count'].to_numpy(dtype='int64')))
+
+    # Horas distintas (con cualquier dispositivo) por día
+    unique_hours = counts['datetime'].drop_duplicates()
+    hour_days = ((unique_hours - start_ts) // pd.Timedelta(days=1)).to_numpy(dtype='int64')
+    hours_cumulative = np.concatenate([[0], np.cumsum(np.bincount(hour_days, minlength=n_days))])
+    hours_covered = _window_sums(hours_cumulative[:, None])[:, 0]
+
+    totals = records.sum(axis=1)
+    valid = totals > 0
+    if not valid.any():
+        return None
+
+    label_list = list(device_labels)
+    priority_devices = devices or [label for label in label_list if not pd.isna(label)]
+    coverage = None
+    if priority_devices:
+        priority_matrix = np.zeros((n_candidates, len(priority_devices)), dtype='int64')
+        for position, device in enumerate(priority_devices):
+            if device in label_list:
+                priority_matrix[:, position] = records[:, label_list.index(device)]
+        coverage = priority_matrix.min(axis=1)
+
+    # Mayor total de registros, luego mayor cobertura mínima, luego la ventana más temprana
+    candidate_totals = np.where(valid, totals, -1)
+    best_mask = candidate_totals == candidate_totals.max()
+    if coverage is not None:
+        best_coverage = coverage[best_mask].max()
+        best_mask &= coverage == best_coverage
+    best_idx = int(np.flatnonzero(best_mask)[0])
+
+    candidate_start = start_ts + pd.Timedelta(days=best_idx)
+    candidate_end = candidate_start + window_duration - pd.Timedelta(hours=1)
+
+    per_device = {
+        label: int(records[best_idx, code])
+        for code, label in enumerate(label_list)
+        if not pd.isna(label) and records[best_idx, code] > 0
+    }
+    per_device_counts = dict(sorted(per_device.items(), key=lambda item: -item[1]))
+
+    pollutant_counts = {}
+    for device in priority_devices or []:
+        if device in label_list:
+            code = label_list.index(device)
             pollutant_counts[device] = {
-                'pm25': pm25_count,
-                'pm10': pm10_count
+                'pm25': int(pm25[best_idx, code]),
+                'pm10': int(pm10[best_idx, code])
             }
+        else:
+            pollutant_counts[device] = {'pm25': 0, 'pm10': 0}
+
+    return {
+        'start': candidate_start,
+        'end': candidate_end,
+        'total_records': int(totals[best_idx]),
+        'per_device_counts': per_device_counts,
+        'pollutant_counts': pollutant_counts,
+        'hours_covered': int(hours_covered[best_idx]),
+        'coverage_min': float(coverage[best_idx]) if coverage is not None else None
+    }
 
-        candidate = {
-            'start': candidate_start,
-            'end': candidate_end,
-            'subset': subset.copy(),
-            'total_records': int(total_records),
-            'per_device_counts': per_device_counts.astype(int).to_dict(),
-            'pollutant_counts': pollutant_counts,
-            'hours_covered': int(subset['datetime'].nunique()),
-            'coverage_min': float(coverage_min) if coverage_min is not None else None
-        }
-
-        if best_window is None:
-            best_window = candidate
-            continue
 
-        # Priorizar mayor número total de registros
-        if candidate['total_records'] > best_window['total_records']:
-            best_window = candidate
-            continue
+def find_dense_window(lowcost_df, window_days=10, devices=None):
+    """
+    Encuentra la ventana deslizante de 'window_days' días con mayor densidad de datos.
+
+    Args:
+        lowcost_df (DataFrame): Datos horarios de sensores de bajo costo.
+        window_days (int): Duración de la ventana en días (default: 10).
+        devices (list[str], opcional): Lista de dispositivos a priorizar.
+
+    Returns:
+        dict | None: Información de la mejor ventana encontrada.
+    """
+    if lowcost_df is None or lowcost_df.empty or 'datetime' not in lowcost_df.columns:
+        return None
+
+    df = ensure_canonical(lowcost_df, 'lowcost')
+    if df.empty:
+        return None
+
+    if devices:
+        df = df[df['device_name'].isin(devices)]
+        if df.empty:
+            return None
 
-        if candidate['total_records'] == best_window['total_records']:
-            # Desempatar por cobertura mínima de dispositivos prioritarios
-            cand_cov = candidate['coverage_min'] or 0
-            best_cov = best_window['coverage_min'] or 0
-            if cand_cov > best_cov:
-                best_window = candidate
-                continue
-            # Como último recurso, elegir la ventana cronológicamente más temprana
-            if cand_cov == best_cov and candidate_start < best_window['start']:
-                best_window = candidate
+    best_window = _select_dense_window(_hourly_counts_from_frame(df), window_days=window_days, devices=devices)
+    if best_window is None:
+        return None
 
+    # Única copia: las filas de la ventana, con la hora truncada
+    hours = df['datetime'].dt.floor('h')
+    mask = ((hours >= best_window['start']) & (hours <= best_window['end'])).to_numpy()
+    best_window['subset'] = with_column(df[mask], 'datetime', hours[mask].to_numpy())
     return best_window
 
 
+def find_dense_window_sql(start_date, end_date, window_days=10, devices=None, filter_by_keys=False):
+    """
+    Variante de find_dense_window que delega los conteos a PostgreSQL.
+
+    Solo se transfiere la matriz de conteos horarios para elegir la ventana; las filas
+    crudas se descargan únicamente para la ventana ganadora.
+
+    Args:
+        start_date (str): Fecha inicial del rango a explorar.
+        end_date (str): Fecha final del rango a explorar.
+        window_days (int): Duración de la ventana en días (default: 10).
+        devices (list[str], opcional): Lista de dispositivos a priorizar.
+        filter_by_keys (bool): Igual que en load_lowcost_data.
+
+    Returns:
+        dict | None: Misma estructura que find_dense_window.
+    """
+    devices = _normalize_devices(devices)
+
+    counts = load_lowcost_hourly_counts(start_date, end_date, devices, filter_by_keys=filter_by_keys)
+    if counts is None or counts.empty:
+        return None
+
+    best_window = _select_dense_window(counts, window_days=window_days, devices=devices)
+    if best_window is None:
+        return None
+
+    best_window = load_window_subset(best_window, devices, filter_by_keys=filter_by_keys)
+    if best_window is not None:
+        best_window['hourly_counts'] = counts
+    return best_window
+
+
+def load_window_subset(window, devices=None, filter_by_keys=False):
+    """
+    Descarga las lecturas crudas de una ventana ya elegida y las agrega en window['subset'].
+
+    Returns:
+        dict | None: La misma ventana con 'subset', o None si no hay lecturas.
+    """
+    # Las lecturas de la última hora (p. ej. 23:59) pertenecen a la ventana al truncarse
+    fetch_end = window['end'] + pd.Timedelta(hours=1) - pd.Timedelta(microseconds=1)
+    raw = load_lowcost_data(
+        window['start'].isoformat(sep=' '),
+        fetch_end.isoformat(sep=' '),
+        _normalize_devices(devices),
+        aggregate=False,
+        filter_by_keys=filter_by_keys
+    )
+    if raw is None or raw.empty:
+        return None
+
+    # raw ya es canónico (ordenado); truncar a la hora conserva el orden
+    window['subset'] = with_column(raw, 'datetime', raw['datetime'].dt.floor('h'))
+    return window
+
+
 def _load_postman_body_template():
     global POSTMAN_BODY_TEMPLATE
 
@@ -524,12 +707,13 @@ def load_rmcab_data(station_code=6, start_date='2024-06-01', end_date='2024-07-3
             pivot['pm10_ref'] = None
 
         pivot['station'] = f'RMCAB_{station_code}'
+        record_reference_coverage(pivot, station_code, start_date, end_date)
 
         print(f"   ✅ Datos finales: {len(pivot)} registros")
         print(f"   PM2.5 no nulos: {pivot['pm25_ref'].notna().sum()}")
         print(f"   PM10 no nulos: {pivot['pm10_ref'].notna().sum()}")
 
-        return pivot.sort_values('datetime')
+        return canonicalize(pivot, 'reference')
     except Exception as exc:
         print(f"❌ Error cargando datos de RMCAB: {exc}")
         import traceback
@@ -0,0 +1,96 @@
+"""
+Parada temprana para los modelos de boosting del zoológico de la etapa 2.
+
+GradientBoostingRegressor y HistGradientBoostingRegressor la traen incorporada
+(n_iter_no_change / early_stopping con una partición de validación interna). XGBoost y
+LightGBM la necesitan en la llamada a fit (eval_set), que evaluate_model y
+cross_val_score no entregan: EarlyStoppingRegressor separa la partición de validación
+dentro de fit, de modo que el estimador se usa como cualquier otro de scikit-learn.
+"""
+
+import os
+
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.model_selection import train_test_split
+
+
+# Rondas sin mejora en la validación antes de detener el boosting
+EARLY_STOPPING_ROUNDS = int(os.getenv('EARLY_STOPPING_ROUNDS', 30))
+# Proporción del conjunto de entrenamiento reservada para la validación interna
+EARLY_STOPPING_VALIDATION_FRACTION = float(os.getenv('EARLY_STOPPING_VALIDATION_FRACTION', 0.1))
+
+
+def _library(estimator):
+    return type(estimator).__module__.split('.')[0]
+
+
+class EarlyStoppingRegressor(BaseEstimator, RegressorMixin):
+    """
+    Ajusta un XGBRegressor o LGBMRegressor con parada temprana sobre una partición de
+    validación interna. El modelo resultante es el entrenado sin esa partición, con el
+    número de árboles de la mejor iteración (como en los boosting de scikit-learn).
+    """
+
+    def __init__(self, estimator=None, early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                 validation_fraction=EARLY_STOPPING_VALIDATION_FRACTION, random_state=42):
+        self.estimator = estimator
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        X_fit, X_val, y_fit, y_val = train_test_split(
+            X, y, test_size=self.validation_fraction, random_state=self.random_state
+        )
+        estimator = clone(self.estimator)
+        library = _library(estimator)
+        if library == 'xgboost':
+            estimator.set_params(early_stopping_rounds=self.early_stopping_rounds)
+            estimator.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+        elif library == 'lightgbm':
+            import lightgbm
+            estimator.fit(
+                X_fit, y_fit,
+                eval_set=[(X_val, y_val)],
+                callbacks=[lightgbm.early_stopping(self.early_stopping_rounds, verbose=False)]
+            )
+        else:
+            estimator.fit(X_fit, y_fit)
+        self.estimator_ = estimator
+        self.n_iter_ = effective_iterations(estimator)
+        return self
+
+    def predict(self, X):
+        return self.estimator_.predict(X)
+
+
+def effective_iterations(model):
+    """
+    Iteraciones (árboles) que usa un modelo de boosting ajustado después de la parada
+    temprana; en un ensamble de folds, el promedio de sus modelos.
+
+    Returns:
+        int | None: Número de iteraciones o None si el modelo no es de boosting.
+    """
+    members = getattr(model, 'estimators_', None)
+    if isinstance(members, list) and members and not hasattr(model, 'n_iter_'):
+        counts = [effective_iterations(member) for member in members]
+        counts = [count for count in counts if count is not None]
+        return int(round(float(np.mean(counts)))) if counts else None
+
+    if getattr(model, 'n_iter_', None) is not None:
+        # HistGradientBoostingRegressor y EarlyStoppingRegressor
+        return int(np.max(model.n_iter_))
+    if hasattr(model, 'n_estimators_'):
+        # GradientBoostingRegressor con n_iter_no_change
+        return int(model.n_estimators_)
+
+    library = _library(model)
+    if library == 'xgboost':
+        best = getattr(model, 'best_iteration', None)
+        return int(best) + 1 if best is not None else int(model.get_params().get('n_estimators') or 0) or None
+    if library == 'lightgbm':
+        best = getattr(model, 'best_iteration_', None)
+        return int(best) if best else int(model.get_params().get('n_estimators') or 0) or None
+    return None
@@ -0,0 +1,163 @@
+"""
+Motor vectorizado de variables avanzadas (lags, ventanas móviles y componentes cíclicas)
+para todos los dispositivos y contaminantes en una sola pasada.
+
+Las ventanas se miden en horas sobre el índice temporal de cada dispositivo (semántica de
+``groupby().rolling('3h')``), de modo que los huecos en los datos no desplazan las ventanas.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+LAG_HOURS = (1, 3, 6)
+ROLLING_WINDOWS_HOURS = (3, 6, 12)
+WEATHER_ROLLING_HOURS = 6
+# Un lag de k horas toma la última lectura en [t - k - LAG_TOLERANCE, t - k]
+LAG_TOLERANCE = pd.Timedelta(hours=1)
+CYCLICAL_COLUMNS = ['hour_sin', 'hour_cos', 'day_sin', 'day_cos']
+
+
+def advanced_feature_columns(pollutant, available_columns=None):
+    """
+    Nombres de las variables avanzadas de un contaminante, en el orden usado para entrenar.
+
+    Args:
+        pollutant (str): 'pm25' o 'pm10'.
+        available_columns (Iterable[str], optional): Columnas de entrada; si se indican,
+            solo se incluyen las variables climáticas cuya columna base existe.
+
+    Returns:
+        list[str]: Columnas generadas.
+    """
+    target_col = f'{pollutant}_sensor'
+    columns = [f'{target_col}_lag_{lag}h' for lag in LAG_HOURS]
+    for window in ROLLING_WINDOWS_HOURS:
+        columns.extend([f'{target_col}_roll_mean_{window}h', f'{target_col}_roll_std_{window}h'])
+    for weather_col in ('temperature', 'rh'):
+        if available_columns is None or weather_col in available_columns:
+            columns.append(f'{weather_col}_roll_mean_{WEATHER_ROLLING_HOURS}h')
+    columns.extend(CYCLICAL_COLUMNS)
+    return columns
+
+
+def _scatter(values, positions, size):
+    """Coloca valores calculados en orden (dispositivo, tiempo) en el orden original."""
+    output = np.full(size, np.nan)
+    output[positions] = values
+    return output
+
+
+def _lag_positions(time_ns, group_bounds, lag_hours):
+    """
+    Posición de la última lectura del mismo dispositivo en [t - lag - LAG_TOLERANCE, t - lag]
+    (-1 si no existe), con búsqueda binaria dentro de cada bloque de dispositivo.
+    """
+    lag_ns = pd.Timedelta(hours=lag_hours).value
+    tolerance_ns = LAG_TOLERANCE.value
+    positions = np.full(len(time_ns), -1, dtype=np.int64)
+    for start, end in zip(group_bounds[:-1], group_bounds[1:]):
+        block = time_ns[start:end]
+        targets = block - lag_ns
+        found = np.searchsorted(block, targets, side='right') - 1
+        valid = found >= 0
+        valid[valid] = block[found[valid]] >= targets[valid] - tolerance_ns
+        positions[start:end] = np.where(valid, found + start, -1)
+    return positions
+
+
+def compute_advanced_features(df, pollutants=('pm25', 'pm10'), group_col='device_name', time_col='datetime'):
+    """
+    Calcula lags, medias/desviaciones móviles y componentes cíclicas para todos los
+    dispositivos y contaminantes en una sola pasada.
+
+    Args:
+        df (DataFrame): Lecturas (crudas o combinadas) con columna temporal.
+        pollutants (Iterable[str]): Contaminantes cuyo `<pollutant>_sensor` se procesa.
+        group_col (str): Columna de dispositivo; si no existe se trata todo como un grupo.
+        time_col (str): Columna temporal.
+
+    Returns:
+        tuple[DataFrame, list[str]]: DataFrame (mismo orden de filas) con las columnas
+        nuevas y listado de columnas agregadas.
+    """
+    if df is None or df.empty or time_col not in df.columns:
+        return df, []
+
+    result = df.copy(deep=False)
+    size = len(result)
+    times = pd.to_datetime(result[time_col])
+    if times.dt.tz is not None:
+        times = times.dt.tz_localize(None)
+
+    if group_col in result.columns:
+        codes = pd.factorize(result[group_col])[0]
+    else:
+        codes = np.zeros(size, dtype=np.int64)
+
+    valid_positions = np.flatnonzero(times.notna().to_numpy())
+    time_values = times.to_numpy()[valid_positions]
+    order = np.lexsort((time_values, codes[valid_positions]))
+    positions = valid_positions[order]
+
+    value_cols = [f'{p}_sensor' for p in pollutants if f'{p}_sensor' in result.columns]
+    weather_cols = [col for col in ('temperature', 'rh') if col in result.columns]
+
+    frame = pd.DataFrame(
+        {col: pd.to_numeric(result[col], errors='coerce').to_numpy(dtype=float)[positions]
+         for col in value_cols + weather_cols},
+        index=pd.DatetimeIndex(time_values[order])
+    )
+    frame['_group'] = codes[positions]
+    grouped = frame.groupby('_group', sort=True)
+
+    new_columns = []
+    features = {}
+
+    group_codes = frame['_group'].to_numpy()
+    group_bounds = np.flatnonzero(np.diff(group_codes, prepend=np.nan, append=np.nan) != 0)
+    time_ns = frame.index.asi8
+    for lag in LAG_HOURS:
+        lag_positions = _lag_positions(time_ns, group_bounds, lag)
+        has_lag = lag_positions >= 0
+        for col in value_cols:
+            current = frame[col].to_numpy()
+            lagged = np.where(has_lag, current[np.maximum(lag_positions, 0)], np.nan)
+            features[f'{col}_lag_{lag}h'] = np.where(np.isnan(lagged), current, lagged)
+
+    # Los grupos quedan contiguos y ordenados por tiempo, así que la salida de
+    # groupby().rolling conserva el orden de `frame`
+    if value_cols:
+        for window in ROLLING_WINDOWS_HOURS:
+            means = grouped[value_cols].rolling(f'{window}h', min_periods=1).mean()
+            stds = grouped[value_cols].rolling(f'{window}h', min_periods=2).std()
+            for col in value_cols:
+                features[f'{col}_roll_mean_{window}h'] = means[col].to_numpy()
+                features[f'{col}_roll_std_{window}h'] = np.nan_to_num(stds[col].to_numpy(), nan=0.0)
+
+    if weather_cols:
+        weather_means = grouped[weather_cols].rolling(f'{WEATHER_ROLLING_HOURS}h', min_periods=1).mean()
+        for col in weather_cols:
+            features[f'{col}_roll_mean_{WEATHER_ROLLING_HOURS}h'] = weather_means[col].to_numpy()
+
+    hours = frame.index.hour.to_numpy()
+    days = frame.index.dayofweek.to_numpy()
+    features['hour_sin'] = np.sin(2 * np.pi * hours / 24.0)
+    features['hour_cos'] = np.cos(2 * np.pi * hours / 24.0)
+    features['day_sin'] = np.sin(2 * np.pi * days / 7.0)
+    features['day_cos'] = np.cos(2 * np.pi * days / 7.0)
+
+    for pollutant in pollutants:
+        if f'{pollutant}_sensor' not in value_cols:
+            continue
+        for name in advanced_feature_columns(pollutant, weather_cols):
+            if name not in new_columns:
+                new_columns.append(name)
+    for name in CYCLICAL_COLUMNS:
+        if name not in new_columns:
+            new_columns.append(name)
+
+    for name in new_columns:
+        result[name] = _scatter(features[name], positions, size)
+
+    return result, new_columns
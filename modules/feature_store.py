@@ -0,0 +1,331 @@
+"""
+Almacén versionado de variables por dispositivo y hora.
+
+Materializa en archivos columnares (Parquet si pyarrow está disponible; si no, .npz) las
+medias horarias del sensor junto con las variables temporales y avanzadas, para que la
+calibración y la predicción las lean directamente y solo se calculen las horas nuevas.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from modules.coverage import SCANNED_CHANNEL, get_coverage_index
+from modules.feature_engine import (
+    LAG_HOURS,
+    LAG_TOLERANCE,
+    ROLLING_WINDOWS_HOURS,
+    WEATHER_ROLLING_HOURS,
+    compute_advanced_features
+)
+from modules.resampling import resample_hourly
+from modules.training_frame import TEMPORAL_COLUMNS, add_temporal_features
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except Exception:
+    PARQUET_AVAILABLE = False
+
+
+FEATURE_STORE_DIR = os.getenv(
+    'FEATURE_STORE_DIR',
+    os.path.join(os.path.dirname(__file__), '..', 'data', 'feature_store')
+)
+
+# Horas que deben pasar desde el inicio de una hora para que sus lecturas se consideren definitivas
+FEATURE_FINAL_DELAY_HOURS = int(os.getenv('FEATURE_FINAL_DELAY_HOURS', 1))
+
+# Incrementar FEATURE_SCHEMA si cambia la forma de calcular las variables
+FEATURE_SCHEMA = 2
+FEATURE_POLLUTANTS = ('pm25', 'pm10')
+BASE_COLUMNS = ['pm25_sensor', 'pm10_sensor', 'temperature', 'rh']
+# Marca por hora: True si se guardó cuando la hora ya estaba cerrada (no se vuelve a consultar)
+FINAL_COLUMN = 'is_final'
+
+# Horas de contexto necesarias antes (y afectadas después) de una hora nueva
+LOOKBACK_HOURS = max(
+    max(LAG_HOURS) + int(LAG_TOLERANCE / pd.Timedelta(hours=1)),
+    max(ROLLING_WINDOWS_HOURS),
+    WEATHER_ROLLING_HOURS
+)
+
+
+def _feature_version():
+    definition = {
+        'schema': FEATURE_SCHEMA,
+        'pollutants': FEATURE_POLLUTANTS,
+        'lags': LAG_HOURS,
+        'lag_tolerance': str(LAG_TOLERANCE),
+        'windows': ROLLING_WINDOWS_HOURS,
+        'weather_window': WEATHER_ROLLING_HOURS,
+        'temporal': TEMPORAL_COLUMNS
+    }
+    digest = hashlib.sha1(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+    return f'v{FEATURE_SCHEMA}-{digest}'
+
+
+FEATURE_VERSION = _feature_version()
+
+
+def _device_path(device, store_dir=None):
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(device))
+    extension = 'parquet' if PARQUET_AVAILABLE else 'npz'
+    return os.path.join(store_dir or FEATURE_STORE_DIR, FEATURE_VERSION, f'{safe_name}.{extension}')
+
+
+def hourly_base(readings):
+    """
+    Grilla horaria (sin horas vacías) con las columnas base de cada dispositivo.
+
+    Args:
+        readings (DataFrame): Lecturas crudas u horarias con 'device_name' y 'datetime'.
+
+    Returns:
+        DataFrame: Una fila por dispositivo y hora con las columnas base.
+    """
+    hourly = resample_hourly(readings, value_columns=BASE_COLUMNS, include_gaps=False)
+    for col in BASE_COLUMNS:
+        if col not in hourly.columns:
+            hourly[col] = np.nan
+    return hourly[['device_name', 'datetime'] + BASE_COLUMNS]
+
+
+def _is_final(hours, now=None):
+    """Horas cuyas lecturas ya son definitivas en el instante `now`."""
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    final_at = pd.to_datetime(hours).dt.floor('h') + pd.Timedelta(hours=FEATURE_FINAL_DELAY_HOURS)
+    return (final_at <= now).to_numpy()
+
+
+def _final_hours(stored):
+    """Horas del almacén marcadas como definitivas."""
+    if stored.empty or FINAL_COLUMN not in stored.columns:
+        return pd.DatetimeIndex([])
+    return pd.DatetimeIndex(stored.loc[stored[FINAL_COLUMN].astype(float) > 0, 'datetime'])
+
+
+def _public_features(frame):
+    """Variables sin las columnas internas del almacén."""
+    return frame.drop(columns=[FINAL_COLUMN], errors='ignore')
+
+
+def _missing_runs(missing):
+    """Agrupa horas faltantes (ordenadas) en tramos contiguos [inicio, fin]."""
+    if len(missing) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(missing.asi8) != pd.Timedelta(hours=1).value) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks - 1, [len(missing) - 1]])
+    return [(missing[first], missing[last]) for first, last in zip(starts, ends)]
+
+
+def build_hourly_features(hourly):
+    """Agrega variables temporales y avanzadas a una tabla horaria."""
+    if hourly.empty:
+        return hourly
+    features = add_temporal_features(hourly.copy())
+    features, _ = compute_advanced_features(features, pollutants=FEATURE_POLLUTANTS)
+    return features
+
+
+def load_device_features(device, store_dir=None):
+    """
+    Lee las variables materializadas de un dispositivo.
+
+    Returns:
+        DataFrame: Filas horarias ordenadas por 'datetime' (vacío si no hay archivo).
+    """
+    path = _device_path(device, store_dir)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+
+    try:
+        if PARQUET_AVAILABLE:
+            frame = pd.read_parquet(path)
+        else:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                frame = pd.DataFrame({col: data[f'col_{i}'] for i, col in enumerate(meta['columns'])})
+            frame['datetime'] = pd.to_datetime(frame['datetime'].astype('int64'))
+            if FINAL_COLUMN in frame.columns:
+                frame[FINAL_COLUMN] = frame[FINAL_COLUMN].astype(bool)
+            frame.insert(0, 'device_name', meta['device'])
+    except Exception as exc:
+        print(f"⚠️  No se pudo leer el almacén de variables de {device}: {exc}")
+        return pd.DataFrame()
+
+    return frame.sort_values('datetime', ignore_index=True)
+
+
+def save_device_features(device, frame, store_dir=None):
+    """Guarda (reemplazo atómico) las variables materializadas de un dispositivo."""
+    path = _device_path(device, store_dir)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+
+    if PARQUET_AVAILABLE:
+        frame.to_parquet(tmp_path, index=False)
+    else:
+        columns = [col for col in frame.columns if col != 'device_name']
+        arrays = {}
+        for i, col in enumerate(columns):
+            values = frame[col]
+            if col == 'datetime':
+                arrays[f'col_{i}'] = values.to_numpy(dtype='datetime64[ns]').astype('int64')
+            else:
+                arrays[f'col_{i}'] = values.to_numpy(dtype=float)
+        meta = {'device': str(device), 'version': FEATURE_VERSION, 'columns': columns}
+        with open(tmp_path, 'wb') as handle:
+            np.savez_compressed(handle, meta=np.array(json.dumps(meta)), **arrays)
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def merge_device_features(stored, new_hourly, now=None):
+    """
+    Incorpora horas nuevas (o recargadas) de un dispositivo recalculando solo las filas
+    afectadas: las horas nuevas y las LOOKBACK_HOURS siguientes, con el mismo contexto previo.
+
+    Args:
+        stored (DataFrame): Variables ya materializadas del dispositivo.
+        new_hourly (DataFrame): Filas base horarias nuevas (ver hourly_base).
+        now (optional): Instante de la carga; decide qué horas nuevas quedan como definitivas.
+
+    Returns:
+        tuple[DataFrame, int]: Variables actualizadas y número de filas recalculadas.
+    """
+    if new_hourly.empty:
+        return stored, 0
+    new_hourly = new_hourly.assign(**{FINAL_COLUMN: _is_final(new_hourly['datetime'], now)})
+    if stored.empty:
+        features = build_hourly_features(new_hourly)
+        return features.sort_values('datetime', ignore_index=True), len(features)
+
+    new_hours = new_hourly['datetime']
+    kept = stored[~stored['datetime'].isin(new_hours)]
+    base_columns = ['device_name', 'datetime'] + BASE_COLUMNS + [FINAL_COLUMN]
+    base = pd.concat([kept[base_columns], new_hourly[base_columns]], ignore_index=True)
+
+    lookback = pd.Timedelta(hours=LOOKBACK_HOURS)
+    first_new, last_new = new_hours.min(), new_hours.max()
+    context = base[(base['datetime'] >= first_new - lookback) & (base['datetime'] <= last_new + lookback)]
+    recomputed = build_hourly_features(context.sort_values('datetime', ignore_index=True))
+    affected = recomputed[recomputed['datetime'] >= first_new]
+
+    result = pd.concat(
+        [kept[~kept['datetime'].isin(affected['datetime'])], affected],
+        ignore_index=True
+    )
+    return result.sort_values('datetime', ignore_index=True), len(affected)
+
+
+def materialize_features(readings, persist=True, store_dir=None):
+    """
+    Actualiza el almacén con lecturas recién cargadas y devuelve sus variables horarias.
+
+    Args:
+        readings (DataFrame): Lecturas (crudas u horarias) de uno o varios dispositivos.
+        persist (bool): Si True, guarda los archivos actualizados.
+
+    Returns:
+        DataFrame: Variables de las horas presentes en `readings`.
+    """
+    hourly = hourly_base(readings)
+    if hourly.empty:
+        return pd.DataFrame()
+
+    frames = []
+    for device, device_hourly in hourly.groupby('device_name', sort=True):
+        stored = load_device_features(device, store_dir)
+        updated, recomputed = merge_device_features(stored, device_hourly)
+        if persist and recomputed:
+            save_device_features(device, updated, store_dir)
+        frames.append(_public_features(updated[updated['datetime'].isin(device_hourly['datetime'])]))
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def get_device_features(device, start_date, end_date, loader, store_dir=None, now=None):
+    """
+    Devuelve las variables horarias de un dispositivo entre start_date y end_date (inclusive),
+    consultando con `loader` solo las horas que aún no están materializadas.
+
+    Una hora se considera completa si está en el almacén marcada como definitiva (se guardó
+    FEATURE_FINAL_DELAY_HOURS después de su inicio) o si el índice de cobertura la marca como
+    consultada sin lecturas. Las horas faltantes se consultan por tramos contiguos, de modo
+    que un hueco en cada extremo no recarga todo el rango intermedio.
+
+    Args:
+        device (str): Dispositivo.
+        start_date, end_date: Límites del rango.
+        loader (callable): Función (start, end, devices) -> DataFrame, p. ej. load_lowcost_data.
+        now (optional): Instante de referencia (default: ahora).
+
+    Returns:
+        DataFrame: Variables horarias del rango (vacío si no hay datos).
+    """
+    start = pd.Timestamp(start_date).floor('h')
+    end = pd.Timestamp(end_date)
+    if end < start:
+        return pd.DataFrame()
+
+    hours = pd.date_range(start, end.floor('h'), freq='h')
+    stored = load_device_features(device, store_dir)
+    complete = hours.isin(_final_hours(stored))
+
+    try:
+        index = get_coverage_index()
+        scanned = index.contains(device, SCANNED_CHANNEL, hours)
+        with_records = index.contains(device, 'records', hours)
+        complete = complete | (scanned & ~with_records)
+    except Exception as exc:
+        print(f"⚠️  Índice de cobertura no disponible para el almacén de variables: {exc}")
+
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    complete = complete & (hours < now.floor('h'))
+    missing = hours[~complete]
+
+    if len(missing):
+        runs = _missing_runs(missing)
+        print(f"🗃️  Almacén de variables {device}: {len(hours) - len(missing)}/{len(hours)} horas materializadas, consultando {len(missing)} horas en {len(runs)} tramo(s)")
+        loaded = []
+        for run_start, run_end in runs:
+            readings = loader(run_start, run_end + pd.Timedelta(hours=1) - pd.Timedelta(microseconds=1), [device])
+            if readings is not None and not readings.empty:
+                loaded.append(readings)
+        if loaded:
+            updated, recomputed = merge_device_features(stored, hourly_base(pd.concat(loaded, ignore_index=True)), now)
+            if recomputed:
+                save_device_features(device, updated, store_dir)
+            stored = updated
+
+    if stored.empty:
+        return stored
+    in_range = (stored['datetime'] >= start) & (stored['datetime'] <= end)
+    return _public_features(stored[in_range].reset_index(drop=True))
+
+
+def get_features(devices, start_date, end_date, loader, store_dir=None):
+    """
+    Variables horarias de varios dispositivos. Sin lista de dispositivos se consulta el
+    rango completo una vez y se materializa lo cargado.
+
+    Returns:
+        DataFrame: Variables de todos los dispositivos, ordenadas por dispositivo y hora.
+    """
+    if not devices:
+        readings = loader(start_date, end_date, None)
+        return materialize_features(readings, store_dir=store_dir)
+
+    frames = [
+        get_device_features(device, start_date, end_date, loader, store_dir)
+        for device in devices
+    ]
+    frames = [frame for frame in frames if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -0,0 +1,175 @@
+"""
+Evaluación reutilizando los modelos de validación cruzada.
+
+En lugar de ajustar el modelo sobre todo el conjunto de entrenamiento y luego volver a
+ajustarlo K veces en cross_val_score, se entrenan una sola vez los K modelos de los folds
+(en paralelo). De ellos salen las métricas de validación cruzada, las predicciones fuera de
+fold (reutilizables para stacking) y un ensamble promedio que se evalúa en el conjunto de
+prueba: K ajustes en lugar de K + 1.
+"""
+
+import os
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold
+
+
+# 'refit': ajuste completo + cross_val_score (comportamiento original); 'folds': ensamble de folds
+EVALUATION_MODE = os.getenv('EVALUATION_MODE', 'refit').strip().lower()
+FOLD_SPLITS = int(os.getenv('FOLD_SPLITS', 5))
+# Si es True (y EVALUATION_MODE='folds'), se agrega un modelo apilado sobre las predicciones fuera de fold
+STACKING_ENABLED = os.getenv('STACKING_ENABLED', 'false').strip().lower() in ('1', 'true', 'yes')
+STACKING_MODEL_NAME = 'Stacking (folds)'
+
+
+class FoldEnsembleRegressor(BaseEstimator, RegressorMixin):
+    """
+    Promedio de los modelos entrenados en cada fold de la validación cruzada.
+
+    fit entrena un clon de `estimator` por fold (mismos folds que cross_val_score) y deja los
+    modelos en estimators_, las predicciones fuera de fold en oof_predictions_ y el R² de cada
+    fold en fold_scores_. Si los modelos de los folds son lineales expone coef_ e intercept_.
+    """
+
+    def __init__(self, estimator=None, n_splits=None, n_jobs=1, random_state=42):
+        self.estimator = estimator
+        self.n_splits = n_splits
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        y = np.asarray(y)
+        kfold = KFold(n_splits=self.n_splits or FOLD_SPLITS, shuffle=True, random_state=self.random_state)
+        splits = list(kfold.split(X))
+
+        fitted = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_fold)(self.estimator, X, y, train_index, test_index)
+            for train_index, test_index in splits
+        )
+
+        self.oof_predictions_ = np.empty(len(y), dtype=float)
+        fold_scores = []
+        for (_, test_index), (_, predictions) in zip(splits, fitted):
+            self.oof_predictions_[test_index] = predictions
+            fold_scores.append(r2_score(y[test_index], predictions))
+        self.fold_scores_ = np.array(fold_scores)
+
+        self.estimators_ = [estimator for estimator, _ in fitted]
+        if all(hasattr(e, 'coef_') and hasattr(e, 'intercept_') for e in self.estimators_):
+            # El promedio de modelos lineales es el modelo lineal con coeficientes promedio
+            self.coef_ = np.mean([np.ravel(e.coef_) for e in self.estimators_], axis=0)
+            self.intercept_ = float(np.mean([np.ravel(e.intercept_)[0] for e in self.estimators_]))
+        return self
+
+    def predict(self, X):
+        return np.mean([estimator.predict(X) for estimator in self.estimators_], axis=0)
+
+
+def _fit_fold(model, X, y, train_index, test_index):
+    estimator = clone(model)
+    estimator.fit(X[train_index], y[train_index])
+    return estimator, estimator.predict(X[test_index])
+
+
+def fit_fold_models(model, X, y, n_splits=None, n_jobs=1, random_state=42):
+    """
+    Entrena un modelo por fold (en paralelo) con los mismos folds que usaba cross_val_score.
+
+    Args:
+        model: Estimador sin ajustar.
+        X, y: Conjunto de entrenamiento.
+        n_splits (int, optional): Número de folds (default: FOLD_SPLITS).
+        n_jobs (int): Procesos/hilos de joblib para los folds.
+
+    Returns:
+        tuple[FoldEnsembleRegressor, ndarray, ndarray]: Ensamble de los folds, predicciones
+        fuera de fold para cada fila de entrenamiento y R² de cada fold.
+    """
+    ensemble = FoldEnsembleRegressor(model, n_splits=n_splits, n_jobs=n_jobs, random_state=random_state)
+    ensemble.fit(X, y)
+    return ensemble, ensemble.oof_predictions_, ensemble.fold_scores_
+
+
+class StackedRegressor(BaseEstimator, RegressorMixin):
+    """
+    Combinación lineal no negativa de modelos base. Cada miembro es un par (modelo, escalador
+    o None) para poder predecir directamente sobre las features sin escalar.
+
+    fit entrena cada modelo base como FoldEnsembleRegressor (los que ya lo son conservan sus
+    folds) y ajusta el combinador sobre sus predicciones fuera de fold; los miembros ajustados
+    quedan en members_ y el combinador en blender_.
+    """
+
+    def __init__(self, members=None, member_names=None, n_splits=None, n_jobs=1, random_state=42):
+        self.members = members
+        self.member_names = member_names
+        self.n_splits = n_splits
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        y = np.asarray(y)
+        self.members_ = []
+        oof_columns = []
+        for model, scaler in self.members:
+            if isinstance(model, FoldEnsembleRegressor):
+                ensemble = clone(model)
+            else:
+                ensemble = FoldEnsembleRegressor(
+                    model, n_splits=self.n_splits, n_jobs=self.n_jobs, random_state=self.random_state
+                )
+            fitted_scaler = clone(scaler).fit(X) if scaler is not None else None
+            ensemble.fit(fitted_scaler.transform(X) if fitted_scaler is not None else X, y)
+            self.members_.append((ensemble, fitted_scaler))
+            oof_columns.append(ensemble.oof_predictions_)
+
+        self.blender_ = LinearRegression(positive=True).fit(np.column_stack(oof_columns), y)
+        return self
+
+    def _member_predictions(self, X):
+        columns = []
+        for model, scaler in self.members_:
+            columns.append(model.predict(scaler.transform(X) if scaler is not None else X))
+        return np.column_stack(columns)
+
+    def predict(self, X):
+        return self.blender_.predict(self._member_predictions(X))
+
+
+def stack_fold_predictions(results, y_train, scaled_names=(), scaler=None):
+    """
+    Ajusta un combinador lineal no negativo sobre las predicciones fuera de fold.
+
+    Args:
+        results (list[dict]): Resultados de evaluate_model con 'oof_predictions'.
+        y_train: Objetivo de entrenamiento.
+        scaled_names (Iterable[str]): Modelos entrenados con features escaladas.
+        scaler: Escalador usado para esos modelos.
+
+    Returns:
+        tuple[StackedRegressor, ndarray, ndarray] | None: Modelo apilado, predicciones de
+        entrenamiento (fuera de fold) y de prueba; None si hay menos de dos modelos base.
+    """
+    members = [r for r in results if r.get('oof_predictions') is not None]
+    if len(members) < 2:
+        return None
+
+    oof_matrix = np.column_stack([r['oof_predictions'] for r in members])
+    test_matrix = np.column_stack([np.asarray(r['predicted'], dtype=float) for r in members])
+
+    blender = LinearRegression(positive=True)
+    blender.fit(oof_matrix, np.asarray(y_train))
+
+    # Los modelos base ya se entrenaron por folds: se usan como miembros ajustados sin repetir fit
+    scaled_names = set(scaled_names)
+    member_pairs = [(r['trained_model'], scaler if r['model_name'] in scaled_names else None) for r in members]
+    stacked = StackedRegressor(members=member_pairs, member_names=[r['model_name'] for r in members])
+    stacked.members_ = member_pairs
+    stacked.blender_ = blender
+    return stacked, blender.predict(oof_matrix), blender.predict(test_matrix)
@@ -0,0 +1,112 @@
+"""
+Contrato de DataFrame canónico para lecturas de sensores y de referencia.
+
+Los cargadores validan y normalizan una sola vez ('datetime' datetime64[ns] sin zona
+horaria y sin nulos, columnas de medición float64, orden temporal estable e índice
+RangeIndex) y marcan el DataFrame en `df.attrs`. Las funciones posteriores confían en esa
+marca y trabajan con vistas en lugar de volver a copiar, convertir y ordenar.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+CANONICAL_ATTR = 'canonical_frame'
+
+VALUE_COLUMNS = {
+    'lowcost': ['pm25_sensor', 'pm10_sensor', 'temperature', 'rh'],
+    'reference': ['pm25_ref', 'pm10_ref']
+}
+
+
+def canonicalize(df, kind='lowcost'):
+    """
+    Normaliza un DataFrame al contrato canónico. Modifica y devuelve `df` (o un DataFrame
+    nuevo si hay que descartar nulos u ordenar), por lo que solo debe usarse sobre
+    DataFrames propios, como el que acaba de construir un cargador.
+
+    Args:
+        df (DataFrame): Lecturas con columna 'datetime'.
+        kind (str): 'lowcost' o 'reference'.
+
+    Returns:
+        DataFrame: DataFrame canónico.
+
+    Raises:
+        ValueError: Si falta la columna 'datetime' o el tipo no es conocido.
+    """
+    if kind not in VALUE_COLUMNS:
+        raise ValueError(f"Tipo de DataFrame desconocido: {kind}")
+    if df is None:
+        return df
+    if 'datetime' not in df.columns:
+        raise ValueError("El DataFrame no tiene columna 'datetime'")
+
+    datetimes = df['datetime']
+    if datetimes.dtype != 'datetime64[ns]':
+        datetimes = pd.to_datetime(datetimes, errors='coerce')
+        if datetimes.dt.tz is not None:
+            datetimes = datetimes.dt.tz_localize(None)
+        df['datetime'] = datetimes.astype('datetime64[ns]')
+
+    for col in VALUE_COLUMNS[kind]:
+        if col in df.columns and df[col].dtype != np.float64:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float64)
+
+    if df['datetime'].isna().any():
+        df = df[df['datetime'].notna()]
+
+    if not df['datetime'].is_monotonic_increasing:
+        df = df.sort_values('datetime', kind='stable', ignore_index=True)
+    elif not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        df = df.copy(deep=False)
+        df.index = pd.RangeIndex(len(df))
+
+    df.attrs[CANONICAL_ATTR] = kind
+    return df
+
+
+def is_canonical(df, kind=None):
+    """
+    Indica si el DataFrame cumple el contrato (marca en attrs y verificaciones baratas:
+    tipo de 'datetime' y orden temporal). Los slices y filtros heredan la marca.
+    """
+    if df is None or not isinstance(df, pd.DataFrame):
+        return False
+    marked = df.attrs.get(CANONICAL_ATTR)
+    if marked is None or (kind is not None and marked != kind):
+        return False
+    if 'datetime' not in df.columns or df['datetime'].dtype != 'datetime64[ns]':
+        return False
+    return bool(df['datetime'].is_monotonic_increasing)
+
+
+def ensure_canonical(df, kind='lowcost'):
+    """
+    Devuelve `df` sin copiar si ya es canónico; si no, una versión canónica sin modificar
+    el original (copia superficial más las conversiones necesarias).
+    """
+    if df is None or df.empty or is_canonical(df, kind):
+        return df
+    return canonicalize(df.copy(deep=False), kind)
+
+
+def with_column(df, name, values):
+    """Copia superficial de `df` con la columna `name` reemplazada (el resto se comparte)."""
+    result = df.copy(deep=False)
+    result[name] = values
+    return result
+
+
+def time_slice(df, start=None, end=None):
+    """
+    Filas con start <= datetime <= end de un DataFrame canónico, como vista (slice
+    contiguo obtenido con búsqueda binaria, sin máscara ni copia).
+    """
+    df = ensure_canonical(df, df.attrs.get(CANONICAL_ATTR, 'lowcost'))
+    if df is None or df.empty:
+        return df
+    datetimes = df['datetime'].to_numpy()
+    lo = 0 if start is None else int(np.searchsorted(datetimes, np.datetime64(pd.Timestamp(start), 'ns'), side='left'))
+    hi = len(df) if end is None else int(np.searchsorted(datetimes, np.datetime64(pd.Timestamp(end), 'ns'), side='right'))
+    return df.iloc[lo:hi]
@@ -0,0 +1,119 @@
+"""
+Aproximación de núcleo para los SVR del zoológico de modelos.
+
+SVR resuelve un problema dual de tamaño n × n: su costo crece entre cuadrática y
+cúbicamente con las filas y en ventanas largas domina el tiempo de entrenamiento. Por
+encima de SVR_APPROXIMATION_ROWS filas de entrenamiento, get_calibration_models reemplaza
+cada SVR por un ApproximateSVR con los mismos hiperparámetros: el núcleo (RBF o
+polinómico) se aproxima con Nyström (SVR_NYSTROEM_COMPONENTS componentes) y sobre esas
+features se ajusta un SVR lineal (liblinear), de costo lineal en las filas.
+"""
+
+import os
+
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.kernel_approximation import Nystroem
+from sklearn.svm import SVR, LinearSVR
+
+# Filas de entrenamiento a partir de las cuales los SVR se aproximan (0 = nunca)
+SVR_APPROXIMATION_ROWS = int(os.getenv('SVR_APPROXIMATION_ROWS', 5000))
+# Componentes de Nyström (columnas de la aproximación del núcleo)
+SVR_NYSTROEM_COMPONENTS = int(os.getenv('SVR_NYSTROEM_COMPONENTS', 300))
+
+
+class ApproximateSVR(BaseEstimator, RegressorMixin):
+    """
+    SVR de gran escala con la interfaz y los hiperparámetros de sklearn.svm.SVR.
+
+    Con kernel='linear' ajusta directamente un LinearSVR y expone coef_ e intercept_ como
+    SVR lineal. Con 'rbf' o 'poly' aproxima el núcleo con Nyström y ajusta el LinearSVR sobre
+    las features transformadas. El objetivo se centra en su mediana, porque liblinear
+    regulariza el intercepto y SVR no.
+    """
+
+    def __init__(self, kernel='rbf', C=1.0, epsilon=0.1, gamma='scale', degree=3, coef0=0.0,
+                 n_components=300, loss='epsilon_insensitive', max_iter=5000, random_state=42):
+        self.kernel = kernel
+        self.C = C
+        self.epsilon = epsilon
+        self.gamma = gamma
+        self.degree = degree
+        self.coef0 = coef0
+        self.n_components = n_components
+        self.loss = loss
+        self.max_iter = max_iter
+        self.random_state = random_state
+
+    def _kernel_gamma(self, X):
+        """gamma efectivo; 'scale' y 'auto' siguen la definición de SVR."""
+        if self.gamma == 'scale':
+            variance = X.var()
+            return 1.0 / (X.shape[1] * variance) if variance > 0 else 1.0
+        if self.gamma == 'auto':
+            return 1.0 / X.shape[1]
+        return float(self.gamma)
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.offset_ = float(np.median(y))
+
+        if self.kernel == 'linear':
+            self.feature_map_ = None
+            features = X
+        else:
+            self.feature_map_ = Nystroem(
+                kernel=self.kernel,
+                gamma=self._kernel_gamma(X),
+                degree=self.degree,
+                coef0=self.coef0,
+                n_components=min(self.n_components, len(X)),
+                random_state=self.random_state
+            )
+            features = self.feature_map_.fit_transform(X)
+
+        self.estimator_ = LinearSVR(
+            C=self.C,
+            epsilon=self.epsilon,
+            loss=self.loss,
+            dual=self.loss == 'epsilon_insensitive',
+            max_iter=self.max_iter,
+            random_state=self.random_state
+        ).fit(features, y - self.offset_)
+
+        if self.feature_map_ is None:
+            self.coef_ = self.estimator_.coef_.ravel()
+            self.intercept_ = float(np.ravel(self.estimator_.intercept_)[0]) + self.offset_
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        features = X if self.feature_map_ is None else self.feature_map_.transform(X)
+        return self.estimator_.predict(features) + self.offset_
+
+
+def approximate_svr(model, n_samples):
+    """
+    Reemplazo aproximado de un SVR si el entrenamiento supera SVR_APPROXIMATION_ROWS filas.
+
+    Args:
+        model: Estimador del zoológico
+        n_samples (int, optional): Filas de entrenamiento (None = sin reemplazo)
+
+    Returns:
+        Estimador: ApproximateSVR con los hiperparámetros del SVR, o el mismo modelo.
+    """
+    if (not isinstance(model, SVR) or not n_samples or not SVR_APPROXIMATION_ROWS
+            or n_samples < SVR_APPROXIMATION_ROWS):
+        return model
+    params = model.get_params()
+    return ApproximateSVR(
+        kernel=params['kernel'],
+        C=params['C'],
+        epsilon=params['epsilon'],
+        gamma=params['gamma'],
+        degree=params['degree'],
+        coef0=params['coef0'],
+        n_components=SVR_NYSTROEM_COMPONENTS
+    )
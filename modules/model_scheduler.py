@@ -0,0 +1,442 @@
+"""
+Planificador del zoológico de modelos: entrena los estimadores de calibración en paralelo
+sobre un pool de procesos que comparte un único presupuesto de núcleos. También reparte
+trabajos completos (dispositivo, contaminante) entre procesos con fan_out.
+
+Cada proceso recibe una vez las matrices de entrenamiento (initializer del pool), como
+archivos mapeados en memoria compartidos por todos (ver modules.shared_arrays), y un
+número fijo de hilos; los estimadores con `n_jobs` se ajustan a ese número para no
+sobresuscribir la CPU. Los modelos más costosos se despachan primero (LPT) para que los
+livianos rellenen los huecos mientras corren los pesados.
+
+Con un presupuesto de tiempo el orden pasa a ser del más barato al más caro según los
+tiempos medidos en entrenamientos anteriores: se omiten los modelos cuyo costo estimado no
+cabe en el tiempo restante, se cancelan los que siguen corriendo al vencer el plazo y se
+devuelve lo que haya terminado.
+"""
+
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from modules.shared_arrays import SharedStore, resolve_kwargs
+from modules.thread_budget import (
+    PROCESS_THREAD_BUDGET,
+    THREADPOOLCTL_AVAILABLE,
+    current_lease,
+    limit_estimator_threads,
+    limit_process_threads,
+    split_thread_budget
+)
+
+if THREADPOOLCTL_AVAILABLE:
+    from threadpoolctl import threadpool_limits
+
+
+# Núcleos totales para entrenar (por defecto el presupuesto del proceso, ver modules.thread_budget)
+# y procesos del pool (0 = automático, 1 = secuencial)
+MODEL_CORE_BUDGET = int(os.getenv('MODEL_CORE_BUDGET', 0)) or PROCESS_THREAD_BUDGET
+MODEL_TRAINING_WORKERS = int(os.getenv('MODEL_TRAINING_WORKERS', 0))
+# Procesos para los trabajos (dispositivo, contaminante) (0 = automático, 1 = secuencial)
+CALIBRATION_FANOUT_WORKERS = int(os.getenv('CALIBRATION_FANOUT_WORKERS', 0))
+# Método de arranque de los pools ('fork', 'spawn', 'forkserver'; vacío = el de la plataforma)
+MODEL_POOL_START_METHOD = os.getenv('MODEL_POOL_START_METHOD') or None
+
+# Costo relativo aproximado de entrenar cada tipo de estimador (solo define el orden)
+MODEL_COST_HINTS = {
+    'LinearRegression': 1,
+    'Ridge': 1,
+    'SVR': 8,
+    'ApproximateSVR': 3,
+    'RandomForestRegressor': 20,
+    'ExtraTreesRegressor': 40,
+    'GradientBoostingRegressor': 60,
+    'HistGradientBoostingRegressor': 10,
+    'XGBRegressor': 30,
+    'LGBMRegressor': 30
+}
+# Filas a partir de las cuales el costo de SVR (cuadrático en filas) se escala
+SVR_COST_ROWS = 2000
+# Segundos por unidad de MODEL_COST_HINTS cada 1000 filas, mientras no haya mediciones
+COST_HINT_SECONDS = 0.05
+
+# Presupuesto de tiempo por entrenamiento en segundos (0 = sin límite)
+TRAINING_TIME_BUDGET = float(os.getenv('TRAINING_TIME_BUDGET', 0))
+MODEL_COSTS_PATH = os.getenv(
+    'MODEL_COSTS_PATH',
+    os.path.join(os.path.dirname(__file__), '..', 'data', 'model_costs.json')
+)
+# Peso de la medición más reciente en el promedio móvil de costos
+COST_SMOOTHING = 0.5
+
+_WORKER_DATA = None
+_costs_lock = threading.Lock()
+_measured_costs = None
+
+
+def model_job(name, estimator, use_scaled=False):
+    """Describe un modelo a entrenar (nombre, estimador sin ajustar y si usa features escaladas)."""
+    return {'name': name, 'estimator': estimator, 'use_scaled': use_scaled}
+
+
+def estimate_cost(estimator, n_rows):
+    """Costo relativo de un estimador para ordenar la cola de entrenamiento."""
+    kind = estimator.__class__.__name__
+    if kind not in MODEL_COST_HINTS and getattr(estimator, 'estimator', None) is not None:
+        # Los envoltorios (p. ej. EarlyStoppingRegressor) cuestan lo que su estimador interno
+        kind = estimator.estimator.__class__.__name__
+    cost = MODEL_COST_HINTS.get(kind, 10)
+    if kind == 'SVR':
+        cost *= max(1.0, (n_rows / SVR_COST_ROWS) ** 2)
+    return cost
+
+
+def _row_scale(kind, n_rows):
+    # SVR crece de forma cuadrática con las filas; el resto, aproximadamente lineal
+    exponent = 2 if kind == 'SVR' else 1
+    return max(n_rows, 1) ** exponent / 1000 ** exponent
+
+
+def _load_costs():
+    global _measured_costs
+    with _costs_lock:
+        if _measured_costs is None:
+            try:
+                with open(MODEL_COSTS_PATH, 'r', encoding='utf-8') as handle:
+                    _measured_costs = json.load(handle)
+            except Exception:
+                _measured_costs = {}
+        return _measured_costs
+
+
+def estimate_seconds(name, estimator, n_rows):
+    """
+    Segundos estimados para entrenar y evaluar un modelo, a partir de las mediciones
+    anteriores del mismo modelo (normalizadas por filas) o, sin mediciones, de MODEL_COST_HINTS.
+    """
+    kind = estimator.__class__.__name__ if estimator is not None else name
+    measured = _load_costs().get(name)
+    # Una medición de otro tipo de estimador con el mismo nombre (p. ej. SVR exacto frente a
+    # ApproximateSVR) no sirve para estimar este
+    if measured and measured.get('kind', kind) == kind:
+        return measured['seconds_per_unit'] * _row_scale(measured.get('kind', kind), n_rows)
+    return estimate_cost(estimator, n_rows) * COST_HINT_SECONDS * n_rows / 1000 if estimator is not None else 0.0
+
+
+def record_costs(measurements):
+    """
+    Actualiza (promedio móvil) y guarda los tiempos medidos.
+
+    Args:
+        measurements (list[tuple]): (nombre, tipo de estimador, filas, segundos).
+    """
+    if not measurements:
+        return
+    costs = _load_costs()
+    with _costs_lock:
+        for name, kind, n_rows, seconds in measurements:
+            unit = seconds / _row_scale(kind, n_rows)
+            previous = costs.get(name)
+            if previous and previous.get('kind', kind) == kind:
+                unit = COST_SMOOTHING * unit + (1 - COST_SMOOTHING) * previous['seconds_per_unit']
+            costs[name] = {'kind': kind, 'seconds_per_unit': unit}
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(MODEL_COSTS_PATH)), exist_ok=True)
+            tmp_path = f'{MODEL_COSTS_PATH}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(costs, handle, indent=2, sort_keys=True)
+            os.replace(tmp_path, MODEL_COSTS_PATH)
+        except Exception as exc:
+            print(f"⚠️  No se pudieron guardar los costos de entrenamiento: {exc}")
+
+
+def resolve_core_budget(core_budget=None):
+    """
+    Núcleos de un entrenamiento: el presupuesto explícito, la reserva de la calibración en
+    curso (thread_budget.lease_cores, sin superar MODEL_CORE_BUDGET) o MODEL_CORE_BUDGET.
+    """
+    if core_budget:
+        return max(1, core_budget)
+    lease = current_lease()
+    return max(1, min(lease, MODEL_CORE_BUDGET) if lease else MODEL_CORE_BUDGET)
+
+
+def plan_workers(n_jobs, core_budget=None, workers=None):
+    """
+    Reparte el presupuesto de núcleos entre procesos.
+
+    Returns:
+        tuple[int, int]: (procesos, hilos por proceso).
+    """
+    core_budget = resolve_core_budget(core_budget)
+    if workers is None:
+        workers = MODEL_TRAINING_WORKERS or core_budget
+    workers = max(1, min(workers, n_jobs, core_budget))
+    return workers, max(1, core_budget // workers)
+
+
+def _pool_context():
+    return multiprocessing.get_context(MODEL_POOL_START_METHOD) if MODEL_POOL_START_METHOD else None
+
+
+def _init_worker(data, threads, pid_queue=None):
+    global _WORKER_DATA
+    if pid_queue is not None:
+        # El proceso principal necesita los PID para detener el pool al vencer el plazo
+        pid_queue.put(os.getpid())
+    limit_process_threads(threads)
+    _WORKER_DATA = resolve_kwargs(data)
+
+
+def _run_job(evaluate, job, threads, data=None):
+    data = data if data is not None else _WORKER_DATA
+    # Folds × hilos del estimador <= threads (sin paralelismo anidado)
+    outer, inner = split_thread_budget(job['estimator'], threads)
+    estimator = limit_estimator_threads(job['estimator'], inner)
+    suffix = '_scaled' if job['use_scaled'] else ''
+    args = (
+        estimator,
+        data[f'X_train{suffix}'],
+        data[f'X_test{suffix}'],
+        data['y_train'],
+        data['y_test'],
+        job['name']
+    )
+    kwargs = {'feature_names': data.get('feature_names'), 'cv_n_jobs': outer}
+    start = time.perf_counter()
+    if THREADPOOLCTL_AVAILABLE:
+        with threadpool_limits(limits=inner):
+            result = evaluate(*args, **kwargs)
+    else:
+        result = evaluate(*args, **kwargs)
+    if result:
+        result['training_seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _worker_pids(pid_queue, expected, timeout=1.0):
+    """
+    PID reportados por los procesos del pool desde su initializer; espera hasta `timeout`
+    segundos a que reporten los `expected` procesos lanzados.
+    """
+    pids = set()
+    limit = time.monotonic() + timeout
+    while True:
+        while not pid_queue.empty():
+            pids.add(pid_queue.get())
+        if len(pids) >= expected or time.monotonic() >= limit:
+            return pids
+        time.sleep(0.01)
+
+
+def _terminate_pool(pool, pid_queue, expected):
+    """Cancela lo pendiente y detiene los procesos que siguen entrenando."""
+    pool.shutdown(wait=False, cancel_futures=True)
+    for pid in _worker_pids(pid_queue, expected):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            # El proceso ya terminó
+            pass
+
+
+def train_model_zoo(jobs, data, evaluate, core_budget=None, workers=None, label=None, deadline=None, progress=None,
+                    record_timings=True):
+    """
+    Entrena y evalúa una lista de modelos compartiendo el presupuesto de núcleos.
+
+    Args:
+        jobs (list[dict]): Modelos a entrenar (ver model_job).
+        data (dict): Matrices 'X_train', 'X_test', 'X_train_scaled', 'X_test_scaled',
+            'y_train', 'y_test' y 'feature_names'.
+        evaluate (callable): Función de evaluación de nivel de módulo con la firma de
+            calibration.evaluate_model (debe poder serializarse por referencia).
+        core_budget (int, optional): Núcleos disponibles (default: MODEL_CORE_BUDGET).
+        workers (int, optional): Procesos del pool (default: MODEL_TRAINING_WORKERS o automático).
+        label (str, optional): Texto para los mensajes de progreso.
+        deadline (float, optional): Instante límite (time.monotonic()); los modelos que no
+            alcanzan a terminar se omiten o se cancelan.
+        progress (callable, optional): Recibe un evento {'stage': 'model', 'model', 'status'}
+            por cada modelo terminado, fallido u omitido.
+        record_timings (bool): Si es False, los tiempos no se guardan como costos de
+            entrenamiento (p. ej. evaluaciones parciales de successive halving).
+
+    Returns:
+        tuple[list[dict], list[str], list[str]]: Resultados válidos en el orden de `jobs`,
+        advertencias y nombres de los modelos omitidos o cancelados por tiempo.
+    """
+    if not jobs:
+        return [], [], []
+
+    n_rows = len(data['y_train'])
+    n_workers, threads = plan_workers(len(jobs), core_budget, workers)
+    estimates = [estimate_seconds(job['name'], job['estimator'], n_rows) for job in jobs]
+    if deadline is None:
+        order = sorted(range(len(jobs)), key=lambda i: -estimate_cost(jobs[i]['estimator'], n_rows))
+    else:
+        # Del más barato al más caro para terminar la mayor cantidad de modelos a tiempo
+        order = sorted(range(len(jobs)), key=lambda i: estimates[i])
+    slots = [None] * len(jobs)
+    warnings = []
+    skipped = []
+
+    def notify(index, status):
+        if progress is not None:
+            try:
+                progress({'stage': 'model', 'model': jobs[index]['name'], 'status': status})
+            except Exception:
+                pass
+
+    def fits_in_budget(index):
+        if deadline is None:
+            return True
+        if time.monotonic() + estimates[index] <= deadline:
+            return True
+        skipped.append(jobs[index]['name'])
+        notify(index, 'skipped')
+        return False
+
+    def finish():
+        if record_timings:
+            record_costs([
+                (result['model_name'], jobs[i]['estimator'].__class__.__name__, n_rows, result['training_seconds'])
+                for i, result in enumerate(slots) if result and 'training_seconds' in result
+            ])
+        if skipped:
+            warnings.append(
+                f"Presupuesto de tiempo agotado: se omitieron {len(skipped)} modelos ({', '.join(skipped)})"
+            )
+        return [result for result in slots if result], warnings, skipped
+
+    if n_workers > 1:
+        print(f"⚙️  Entrenando {len(jobs)} modelos ({label or 'dataset completo'}) en {n_workers} procesos x {threads} hilos")
+        store = SharedStore()
+        context = _pool_context() or multiprocessing.get_context()
+        pid_queue = context.SimpleQueue()
+        try:
+            pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=context, initializer=_init_worker,
+                                       initargs=(store.share_kwargs(data), threads, pid_queue))
+        except Exception as exc:
+            print(f"⚠️  Pool de procesos no disponible ({exc}); entrenando de forma secuencial")
+            store.close()
+            pool = None
+
+        if pool is not None:
+            futures = {}
+            for index in order:
+                if fits_in_budget(index):
+                    futures[pool.submit(_run_job, evaluate, jobs[index], threads)] = index
+            pending = set(futures)
+            try:
+                while pending:
+                    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                    done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                    if not done:
+                        break
+                    for future in done:
+                        index = futures[future]
+                        try:
+                            slots[index] = future.result()
+                        except Exception as exc:
+                            warning_msg = f'Modelo "{jobs[index]["name"]}" falló en el pool: {exc}'
+                            print(warning_msg)
+                            warnings.append(warning_msg)
+                        notify(index, 'completed' if slots[index] else 'failed')
+            finally:
+                if pending:
+                    for future in pending:
+                        skipped.append(jobs[futures[future]]['name'])
+                        notify(futures[future], 'cancelled')
+                    print(f"⏱️  Plazo vencido: cancelando {len(pending)} modelos en curso ({label or 'dataset completo'})")
+                    _terminate_pool(pool, pid_queue, min(n_workers, len(futures)))
+                else:
+                    pool.shutdown(wait=True)
+                store.close()
+            return finish()
+
+    core_budget = resolve_core_budget(core_budget)
+    for index in order:
+        if not fits_in_budget(index):
+            continue
+        print(f"Entrenando {jobs[index]['name']} ({label or 'dataset completo'})...")
+        try:
+            slots[index] = _run_job(evaluate, jobs[index], core_budget, data=data)
+        except Exception as exc:
+            warning_msg = f'Modelo "{jobs[index]["name"]}" falló: {exc}'
+            print(warning_msg)
+            warnings.append(warning_msg)
+        notify(index, 'completed' if slots[index] else 'failed')
+
+    return finish()
+
+
+def _run_task(function, kwargs):
+    try:
+        return function(**resolve_kwargs(kwargs)), None
+    except Exception as exc:
+        traceback.print_exc()
+        return None, str(exc)
+
+
+def fan_out(tasks, function, core_budget=None, workers=None):
+    """
+    Ejecuta trabajos independientes en procesos y entrega cada resultado apenas termina.
+
+    El presupuesto de núcleos se reparte entre los procesos: cada trabajo recibe
+    `core_budget` con su parte, para que el entrenamiento interno no sobresuscriba la CPU.
+    Los arrays y DataFrames grandes de los kwargs se comparten por memoria mapeada (una
+    sola escritura aunque varios trabajos usen el mismo objeto) en lugar de serializarse.
+    Un trabajo que falla no detiene a los demás: se entrega con su mensaje de error.
+
+    Args:
+        tasks (list[tuple]): Pares (clave, kwargs) de cada trabajo.
+        function (callable): Función de nivel de módulo que recibe **kwargs y core_budget.
+        core_budget (int, optional): Núcleos disponibles (default: MODEL_CORE_BUDGET).
+        workers (int, optional): Procesos (default: CALIBRATION_FANOUT_WORKERS o automático).
+
+    Yields:
+        tuple: (clave, resultado, error) en orden de finalización; `error` es None si
+        el trabajo terminó bien.
+    """
+    if not tasks:
+        return
+
+    if workers is None:
+        workers = CALIBRATION_FANOUT_WORKERS or len(tasks)
+    n_workers, threads = plan_workers(len(tasks), core_budget, workers)
+
+    if n_workers > 1:
+        print(f"🚀 Repartiendo {len(tasks)} calibraciones en {n_workers} procesos x {threads} núcleos")
+        pending = {key for key, _ in tasks}
+        store = SharedStore()
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=_pool_context(),
+                                     initializer=limit_process_threads, initargs=(threads,)) as pool:
+                futures = {
+                    pool.submit(_run_task, function, dict(store.share_kwargs(kwargs), core_budget=threads)): key
+                    for key, kwargs in tasks
+                }
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        result, error = future.result()
+                    except Exception as exc:
+                        result, error = None, str(exc)
+                    pending.discard(key)
+                    yield key, result, error
+            return
+        except Exception as exc:
+            print(f"⚠️  Pool de procesos no disponible ({exc}); continuando de forma secuencial")
+            tasks = [(key, kwargs) for key, kwargs in tasks if key in pending]
+        finally:
+            store.close()
+
+    core_budget = resolve_core_budget(core_budget)
+    for key, kwargs in tasks:
+        result, error = _run_task(function, dict(kwargs, core_budget=core_budget))
+        yield key, result, error
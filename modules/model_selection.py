@@ -0,0 +1,164 @@
+"""
+Selección de modelos por successive halving para el zoológico de la etapa 2.
+
+En lugar de entrenar cada candidato con todo el conjunto de entrenamiento, se evalúan
+todos sobre subconjuntos crecientes (rondas) y solo la mejor fracción (1 / HALVING_FACTOR)
+pasa a la ronda siguiente. Las rondas usan una partición de validación tomada del conjunto
+de entrenamiento, de modo que el conjunto de prueba no interviene en la selección. Los
+finalistas se entrenan y evalúan después de forma completa, con el mismo contrato de
+resultados (ordenados por RMSE, 'is_best').
+
+La primera ronda usa HALVING_MIN_ROWS filas o menos: en ventanas cortas (unas 70-430 filas
+de entrenamiento en la etapa 2) se reduce para que haya una ronda por cada recorte, sin bajar
+de HALVING_FLOOR_ROWS. Con menos de HALVING_FLOOR_ROWS * HALVING_FACTOR filas disponibles no
+hay rondas y todos los candidatos se entrenan completos.
+
+Las variantes LSTM no participan: se entrenan fuera del zoológico (train_lstm_variants) sobre
+ventanas de horas anteriores con su propia parada temprana, así que siempre se entrenan
+completas y se ordenan junto a los finalistas.
+"""
+
+import math
+import os
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import mean_squared_error
+
+from modules.model_scheduler import train_model_zoo
+
+
+# 'full': todos los modelos con todo el conjunto; 'halving': successive halving
+STAGE2_SELECTION_MODE = os.getenv('STAGE2_SELECTION_MODE', 'full').strip().lower()
+HALVING_FACTOR = int(os.getenv('HALVING_FACTOR', 3))
+# Filas de entrenamiento de la primera ronda (máximo; se reduce con conjuntos pequeños)
+HALVING_MIN_ROWS = int(os.getenv('HALVING_MIN_ROWS', 200))
+# Mínimo de filas de una ronda: por debajo el RMSE de validación no sirve para ordenar
+HALVING_FLOOR_ROWS = int(os.getenv('HALVING_FLOOR_ROWS', 30))
+# Finalistas mínimos que se entrenan completos
+HALVING_MIN_SURVIVORS = int(os.getenv('HALVING_MIN_SURVIVORS', 2))
+# Proporción del conjunto de entrenamiento reservada para puntuar las rondas
+HALVING_VALIDATION_FRACTION = 0.2
+# Modelos que siempre se entrenan completos (la fórmula lineal del resultado depende de ellos)
+HALVING_ALWAYS_KEEP = ('Linear Regression',)
+
+
+def selection_signature(mode):
+    """Parámetros que determinan el resultado de la selección (para claves de caché)."""
+    if mode != 'halving':
+        return {'mode': 'full'}
+    return {
+        'mode': 'halving',
+        'factor': HALVING_FACTOR,
+        'min_rows': HALVING_MIN_ROWS,
+        'floor_rows': HALVING_FLOOR_ROWS,
+        'min_survivors': HALVING_MIN_SURVIVORS,
+        'validation_fraction': HALVING_VALIDATION_FRACTION,
+        'always_keep': list(HALVING_ALWAYS_KEEP)
+    }
+
+
+def holdout_score(model, X_train, X_test, y_train, y_test, model_name, feature_names=None, cv_n_jobs=-1):
+    """Ajusta una copia del modelo y devuelve su RMSE en la partición de validación de la ronda."""
+    estimator = clone(model)
+    estimator.fit(X_train, y_train)
+    predictions = estimator.predict(X_test)
+    return {'model_name': model_name, 'rmse': float(np.sqrt(mean_squared_error(y_test, predictions)))}
+
+
+def _rung_rows(pool_size, n_candidates, factor, min_rows, min_survivors, floor_rows=None):
+    """
+    Filas de cada ronda, multiplicando por `factor` hasta pool_size.
+
+    La primera ronda tiene min_rows filas, o menos si así caben las rondas necesarias para
+    dejar min_survivors candidatos, pero nunca menos de floor_rows (default: HALVING_FLOOR_ROWS).
+    """
+    floor_rows = min(floor_rows or HALVING_FLOOR_ROWS, min_rows)
+    if factor < 2 or pool_size < floor_rows * factor:
+        return []
+    # No tiene sentido seguir recortando cuando ya quedan los finalistas mínimos
+    by_candidates = max(0, int(math.ceil(math.log(max(n_candidates / max(min_survivors, 1), 1), factor))))
+    first_rows = max(floor_rows, min(min_rows, pool_size // factor ** max(by_candidates, 1)))
+    by_rows = int(math.floor(math.log(pool_size / first_rows, factor)))
+    n_rungs = min(by_rows, by_candidates)
+    return [int(pool_size / factor ** (n_rungs - rung)) for rung in range(n_rungs)]
+
+
+def successive_halving(jobs, data, core_budget=None, label=None, deadline=None, progress=None,
+                       factor=None, min_rows=None, min_survivors=None, random_state=42):
+    """
+    Elimina por rondas los candidatos con peor RMSE de validación.
+
+    Args:
+        jobs (list[dict]): Modelos candidatos (ver model_scheduler.model_job).
+        data (dict): Matrices de entrenamiento como en train_model_zoo.
+        core_budget, label, deadline, progress: Como en train_model_zoo.
+        factor (int, optional): Reducción por ronda (default: HALVING_FACTOR).
+        min_rows (int, optional): Filas de la primera ronda (default: HALVING_MIN_ROWS).
+        min_survivors (int, optional): Finalistas mínimos (default: HALVING_MIN_SURVIVORS).
+
+    Returns:
+        tuple[list[dict], dict]: Finalistas (en el orden de `jobs`) e informe con las rondas
+        y los modelos eliminados.
+    """
+    factor = factor or HALVING_FACTOR
+    min_rows = min_rows or HALVING_MIN_ROWS
+    min_survivors = max(1, min_survivors or HALVING_MIN_SURVIVORS)
+
+    kept = [job for job in jobs if job['name'] in HALVING_ALWAYS_KEEP]
+    candidates = [job for job in jobs if job['name'] not in HALVING_ALWAYS_KEEP]
+    report = {'mode': 'halving', 'factor': factor, 'rungs': [], 'eliminated': []}
+
+    n_train = len(data['y_train'])
+    order = np.random.default_rng(random_state).permutation(n_train)
+    n_validation = max(1, int(n_train * HALVING_VALIDATION_FRACTION))
+    validation_index, pool_index = order[:n_validation], order[n_validation:]
+
+    for rows in _rung_rows(len(pool_index), len(candidates), factor, min_rows, min_survivors):
+        if len(candidates) <= min_survivors:
+            break
+        rung_index = pool_index[:rows]
+        rung_data = {
+            'X_train': data['X_train'][rung_index],
+            'X_test': data['X_train'][validation_index],
+            'X_train_scaled': data['X_train_scaled'][rung_index],
+            'X_test_scaled': data['X_train_scaled'][validation_index],
+            'y_train': data['y_train'][rung_index],
+            'y_test': data['y_train'][validation_index],
+            'feature_names': data.get('feature_names')
+        }
+        scores, _, _ = train_model_zoo(
+            candidates, rung_data, holdout_score, core_budget=core_budget,
+            label=f"{label or 'dataset completo'}, ronda de {rows} filas", deadline=deadline,
+            record_timings=False
+        )
+        rmse_by_name = {score['model_name']: score['rmse'] for score in scores if np.isfinite(score['rmse'])}
+        ranked = sorted((job for job in candidates if job['name'] in rmse_by_name),
+                        key=lambda job: rmse_by_name[job['name']])
+        if not ranked:
+            # Sin puntajes válidos (p. ej. plazo vencido) no se elimina a nadie
+            break
+        n_keep = max(min_survivors, int(math.ceil(len(candidates) / factor)))
+        survivors = ranked[:n_keep]
+        survivor_names = {job['name'] for job in survivors}
+        eliminated = [job['name'] for job in candidates if job['name'] not in survivor_names]
+
+        report['rungs'].append({
+            'rows': int(rows),
+            'candidates': len(candidates),
+            'scores': {name: round(rmse, 4) for name, rmse in rmse_by_name.items()},
+            'eliminated': eliminated
+        })
+        report['eliminated'].extend(eliminated)
+        for name in eliminated:
+            if progress is not None:
+                try:
+                    progress({'stage': 'model', 'model': name, 'status': 'eliminated'})
+                except Exception:
+                    pass
+        print(f"🏁 Ronda de {rows} filas ({label or 'dataset completo'}): continúan "
+              f"{[job['name'] for job in survivors]}, eliminados {eliminated}")
+        candidates = survivors
+
+    finalists = {job['name'] for job in kept + candidates}
+    return [job for job in jobs if job['name'] in finalists], report
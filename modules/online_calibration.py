@@ -0,0 +1,364 @@
+"""
+Calibración en línea: modelos incrementales que se actualizan con las nuevas horas
+alineadas (sensor + referencia) sin reentrenar todo el zoológico de modelos.
+
+El ajuste inicial usa las horas disponibles en orden cronológico: el último tramo
+(test_size) se predice antes de aprenderlo, de modo que las métricas son fuera de muestra.
+Cada actualización repite el esquema (predecir y luego aprender) con las horas posteriores
+a la última vista, acumula las métricas y reescribe el modelo guardado en su lugar, con el
+mismo formato de metadata que leen load_calibration_model y predict_with_saved_model.
+
+Modelos disponibles:
+    - 'RLS': mínimos cuadrados recursivos (la fórmula lineal), con factor de olvido.
+    - 'SGD': SGDRegressor sobre features estandarizadas de forma incremental.
+Cualquier otro estimador con partial_fit puede usarse a través de OnlineScaledRegressor.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
+
+from modules.calibration import calculate_mape, load_calibration_model
+from modules.training_frame import base_feature_names
+
+
+ONLINE_CALIBRATION_MODEL = os.getenv('ONLINE_CALIBRATION_MODEL', 'RLS')
+# Peso de las horas pasadas en RLS: 1.0 = sin olvido; 0.999 ≈ memoria de ~1000 horas
+RLS_FORGETTING_FACTOR = float(os.getenv('RLS_FORGETTING_FACTOR', 0.999))
+# Regularización inicial de RLS (equivale a P0 = I / RLS_REGULARIZATION)
+RLS_REGULARIZATION = float(os.getenv('RLS_REGULARIZATION', 1e-3))
+# Horas alineadas mínimas para el ajuste inicial
+ONLINE_MIN_ROWS = int(os.getenv('ONLINE_MIN_ROWS', 60))
+
+_save_lock = threading.Lock()
+
+
+class RecursiveLeastSquares(BaseEstimator, RegressorMixin):
+    """
+    Regresión lineal por mínimos cuadrados recursivos con factor de olvido.
+
+    Se mantiene la forma de información (A = Σ λ^k x xᵀ, b = Σ λ^k x y), que permite
+    actualizar con un bloque de horas de una vez y da el mismo resultado que aplicar la
+    recursión fila por fila. Expone coef_ e intercept_ como LinearRegression.
+    """
+
+    def __init__(self, forgetting_factor=RLS_FORGETTING_FACTOR, regularization=RLS_REGULARIZATION,
+                 fit_intercept=True):
+        self.forgetting_factor = forgetting_factor
+        self.regularization = regularization
+        self.fit_intercept = fit_intercept
+
+    def _design(self, X):
+        X = np.asarray(X, dtype=float)
+        if self.fit_intercept:
+            X = np.column_stack([X, np.ones(len(X))])
+        return X
+
+    def fit(self, X, y):
+        for attr in ('information_', 'moment_'):
+            if hasattr(self, attr):
+                delattr(self, attr)
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X, y):
+        design = self._design(X)
+        y = np.asarray(y, dtype=float).ravel()
+        n_rows, n_columns = design.shape
+        if not hasattr(self, 'information_'):
+            self.information_ = np.eye(n_columns) * self.regularization
+            self.moment_ = np.zeros(n_columns)
+            self.n_samples_seen_ = 0
+            self.n_features_in_ = n_columns - int(self.fit_intercept)
+
+        # La fila más reciente pesa 1 y cada hora anterior se multiplica por λ
+        weights = self.forgetting_factor ** np.arange(n_rows - 1, -1, -1, dtype=float)
+        decay = self.forgetting_factor ** n_rows
+        self.information_ = decay * self.information_ + (design * weights[:, None]).T @ design
+        self.moment_ = decay * self.moment_ + design.T @ (weights * y)
+        self.n_samples_seen_ += n_rows
+
+        theta = np.linalg.lstsq(self.information_, self.moment_, rcond=None)[0]
+        if self.fit_intercept:
+            self.coef_, self.intercept_ = theta[:-1], float(theta[-1])
+        else:
+            self.coef_, self.intercept_ = theta, 0.0
+        return self
+
+    def predict(self, X):
+        return np.asarray(X, dtype=float) @ self.coef_ + self.intercept_
+
+
+class OnlineScaledRegressor(BaseEstimator, RegressorMixin):
+    """
+    Estimador con partial_fit sobre features estandarizadas con un StandardScaler que
+    también se actualiza de forma incremental. Si el estimador es lineal, coef_ e
+    intercept_ se expresan en las unidades originales de las features.
+    """
+
+    def __init__(self, estimator=None):
+        self.estimator = estimator
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        self.scaler_ = StandardScaler().fit(X)
+        self.estimator_ = clone(self.estimator).fit(self.scaler_.transform(X), np.asarray(y, dtype=float).ravel())
+        self.n_samples_seen_ = len(X)
+        return self
+
+    def partial_fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        if not hasattr(self, 'estimator_'):
+            self.scaler_ = StandardScaler()
+            self.estimator_ = clone(self.estimator)
+            self.n_samples_seen_ = 0
+        self.scaler_.partial_fit(X)
+        self.estimator_.partial_fit(self.scaler_.transform(X), np.asarray(y, dtype=float).ravel())
+        self.n_samples_seen_ += len(X)
+        return self
+
+    def predict(self, X):
+        return self.estimator_.predict(self.scaler_.transform(np.asarray(X, dtype=float)))
+
+    @property
+    def coef_(self):
+        scale = np.where(self.scaler_.scale_ > 0, self.scaler_.scale_, 1.0)
+        return np.ravel(self.estimator_.coef_) / scale
+
+    @property
+    def intercept_(self):
+        return float(np.ravel(self.estimator_.intercept_)[0] - np.dot(self.coef_, self.scaler_.mean_))
+
+
+def get_online_models():
+    """
+    Modelos incrementales disponibles para la calibración en línea.
+
+    Returns:
+        dict: Nombre -> estimador sin ajustar (con partial_fit).
+    """
+    return {
+        'RLS': RecursiveLeastSquares(),
+        'SGD': OnlineScaledRegressor(
+            SGDRegressor(penalty='l2', alpha=1e-4, max_iter=1000, tol=1e-3, random_state=42)
+        )
+    }
+
+
+def aligned_rows(training_frame, pollutant, feature_names, after=None):
+    """
+    Horas alineadas utilizables en orden cronológico.
+
+    Args:
+        training_frame (DataFrame): Salida de build_training_frame.
+        pollutant (str): 'pm25' o 'pm10'.
+        feature_names (list): Features del modelo.
+        after (Timestamp, optional): Solo horas posteriores a esta fecha.
+
+    Returns:
+        tuple: (X, y, datetimes) como arrays.
+    """
+    target = f'{pollutant}_ref'
+    missing = [col for col in list(feature_names) + [target, 'datetime'] if col not in training_frame.columns]
+    if missing:
+        raise ValueError(f"Columnas faltantes para la calibración en línea: {missing}")
+
+    rows = training_frame.dropna(subset=list(feature_names) + [target])
+    if after is not None:
+        rows = rows[rows['datetime'] > pd.Timestamp(after)]
+    rows = rows.sort_values('datetime', kind='stable')
+    return rows[feature_names].to_numpy(dtype=float), rows[target].to_numpy(dtype=float), rows['datetime'].to_numpy()
+
+
+def _empty_stream():
+    return {'n': 0, 'sum_sq_error': 0.0, 'sum_abs_error': 0.0, 'sum_y': 0.0, 'sum_sq_y': 0.0,
+            'sum_ape': 0.0, 'n_ape': 0}
+
+
+def _accumulate(stream, y_true, y_pred):
+    """Suma a los acumulados de las predicciones hechas antes de aprender cada hora."""
+    errors = y_true - y_pred
+    mask = np.abs(y_true) > 1e-10
+    stream = dict(stream)
+    stream['n'] += int(len(y_true))
+    stream['sum_sq_error'] += float(np.sum(errors ** 2))
+    stream['sum_abs_error'] += float(np.sum(np.abs(errors)))
+    stream['sum_y'] += float(np.sum(y_true))
+    stream['sum_sq_y'] += float(np.sum(y_true ** 2))
+    stream['sum_ape'] += float(np.sum(np.abs(errors[mask] / y_true[mask])))
+    stream['n_ape'] += int(mask.sum())
+    return stream
+
+
+def _stream_metrics(stream):
+    """Métricas con el formato de la metadata (r2, rmse, mae, mape) a partir de los acumulados."""
+    n = stream['n']
+    if n == 0:
+        return {'r2': None, 'rmse': None, 'mae': None, 'mape': None}
+    total = stream['sum_sq_y'] - stream['sum_y'] ** 2 / n
+    r2 = 1 - stream['sum_sq_error'] / total if total > 0 else 0.0
+    mape = min(stream['sum_ape'] / stream['n_ape'] * 100, 999.99) if stream['n_ape'] else 0.0
+    return {
+        'r2': round(float(r2), 4),
+        'rmse': round(float(np.sqrt(stream['sum_sq_error'] / n)), 4),
+        'mae': round(float(stream['sum_abs_error'] / n), 4),
+        'mape': round(float(mape), 2)
+    }
+
+
+def _window_metrics(y_true, y_pred):
+    return {
+        'rows': int(len(y_true)),
+        'rmse': round(float(np.sqrt(np.mean((y_true - y_pred) ** 2))), 4),
+        'mae': round(float(np.mean(np.abs(y_true - y_pred))), 4),
+        'mape': round(float(calculate_mape(y_true, y_pred)), 2)
+    }
+
+
+def _dump_atomic(value, path):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    joblib.dump(value, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_online_model(model, model_info):
+    """Reescribe modelo y metadata en models/<periodo>/<dispositivo>/ (reemplazo atómico)."""
+    models_dir = os.path.join('models', model_info['period'], model_info['device_name'])
+    os.makedirs(models_dir, exist_ok=True)
+    model_path = os.path.join(models_dir, f"{model_info['pollutant']}_model.pkl")
+    metadata_path = os.path.join(models_dir, f"{model_info['pollutant']}_model_metadata.pkl")
+
+    model_info = dict(model_info, model_path=model_path, timestamp=datetime.now().strftime('%Y%m%d_%H%M%S'))
+    model_info.pop('trained_model', None)
+    if hasattr(model, 'coef_'):
+        model_info['coefficients'] = [float(value) for value in np.ravel(model.coef_)]
+        model_info['intercept'] = float(model.intercept_)
+    with _save_lock:
+        _dump_atomic(model, model_path)
+        _dump_atomic(model_info, metadata_path)
+    print(f"✅ Modelo en línea guardado: {metadata_path}")
+    return model_info, metadata_path
+
+
+def fit_online_calibration(training_frame, device_name, pollutant='pm25', period='2025', model_name=None,
+                           feature_columns=None, test_size=0.25):
+    """
+    Ajuste inicial de un modelo incremental con todas las horas alineadas disponibles.
+
+    Args:
+        training_frame (DataFrame): Salida de build_training_frame para el dispositivo.
+        device_name (str): Nombre del dispositivo.
+        pollutant (str): 'pm25' o 'pm10'.
+        period (str): Identificador del período (carpeta en models/).
+        model_name (str, optional): Clave de get_online_models (default: ONLINE_CALIBRATION_MODEL).
+        feature_columns (list, optional): Features (default: base_feature_names).
+        test_size (float): Tramo final que se predice antes de aprenderlo para las métricas.
+
+    Returns:
+        dict: Resultado con la metadata guardada o {'error': ...}.
+    """
+    model_name = model_name or ONLINE_CALIBRATION_MODEL
+    models = get_online_models()
+    if model_name not in models:
+        return {'error': f"Modelo en línea desconocido: {model_name} (disponibles: {list(models)})"}
+
+    try:
+        feature_names = list(feature_columns or base_feature_names(training_frame, pollutant))
+        X, y, datetimes = aligned_rows(training_frame, pollutant, feature_names)
+        if len(y) < ONLINE_MIN_ROWS:
+            return {'error': f"Datos insuficientes para la calibración en línea ({len(y)} horas, mínimo {ONLINE_MIN_ROWS})"}
+
+        split = int(len(y) * (1 - test_size))
+        model = clone(models[model_name]).fit(X[:split], y[:split])
+        holdout_predictions = model.predict(X[split:])
+        stream = _accumulate(_empty_stream(), y[split:], holdout_predictions)
+        model.partial_fit(X[split:], y[split:])
+
+        model_info = {
+            'device_name': device_name,
+            'pollutant': pollutant,
+            'period': period,
+            'model_name': f'{model_name} (en línea)',
+            'calibration_key': None,
+            'feature_names': feature_names,
+            'metrics': _stream_metrics(stream),
+            'online': {
+                'model': model_name,
+                'n_samples_seen': int(len(y)),
+                'first_datetime': str(pd.Timestamp(datetimes[0])),
+                'last_datetime': str(pd.Timestamp(datetimes[-1])),
+                'updates': 0,
+                'stream': stream,
+                'last_update': _window_metrics(y[split:], holdout_predictions)
+            }
+        }
+        model_info, metadata_path = _save_online_model(model, model_info)
+        print(f"🔄 Calibración en línea inicial: {device_name} - {pollutant} ({model_name}, {len(y)} horas)")
+        return {'success': True, 'action': 'fit', 'metadata_path': metadata_path, **model_info}
+
+    except Exception as exc:
+        print(f"Error en calibración en línea: {exc}")
+        return {'error': str(exc)}
+
+
+def update_online_calibration(training_frame, device_name, pollutant='pm25', period='2025'):
+    """
+    Actualiza en su lugar un modelo en línea guardado con las horas alineadas posteriores
+    a la última que vio. Cada hora nueva se predice antes de aprenderla (métricas
+    prequenciales acumuladas en 'metrics').
+
+    Args:
+        training_frame (DataFrame): Salida de build_training_frame con las horas recientes.
+        device_name (str): Nombre del dispositivo.
+        pollutant (str): 'pm25' o 'pm10'.
+        period (str): Identificador del período (carpeta en models/).
+
+    Returns:
+        dict: Resultado con la metadata actualizada o {'error': ...}.
+    """
+    model_info = load_calibration_model(device_name, pollutant, period)
+    if model_info is None:
+        return {'error': f'No hay modelo guardado para {device_name} - {pollutant} ({period})'}
+    online = model_info.get('online')
+    model = model_info.get('trained_model')
+    if not online or model is None or not hasattr(model, 'partial_fit'):
+        return {'error': f'El modelo guardado de {device_name} - {pollutant} ({period}) no es incremental; '
+                         f'ejecuta primero la calibración en línea'}
+
+    try:
+        X, y, datetimes = aligned_rows(
+            training_frame, pollutant, model_info['feature_names'], after=online['last_datetime']
+        )
+        if len(y) == 0:
+            print(f"⏭️  Sin horas nuevas para {device_name} - {pollutant} desde {online['last_datetime']}")
+            model_info.pop('trained_model', None)
+            return {'success': True, 'action': 'update', 'new_rows': 0, **model_info}
+
+        predictions = model.predict(X)
+        model.partial_fit(X, y)
+
+        stream = _accumulate(online['stream'], y, predictions)
+        model_info['metrics'] = _stream_metrics(stream)
+        model_info['online'] = dict(
+            online,
+            n_samples_seen=int(online['n_samples_seen'] + len(y)),
+            last_datetime=str(pd.Timestamp(datetimes[-1])),
+            updates=int(online.get('updates', 0)) + 1,
+            stream=stream,
+            last_update=_window_metrics(y, predictions)
+        )
+        model_info, metadata_path = _save_online_model(model, model_info)
+        print(f"🔄 Calibración en línea actualizada: {device_name} - {pollutant} (+{len(y)} horas, "
+              f"RMSE previo a aprender {model_info['online']['last_update']['rmse']})")
+        return {'success': True, 'action': 'update', 'new_rows': int(len(y)), 'metadata_path': metadata_path,
+                **model_info}
+
+    except Exception as exc:
+        print(f"Error actualizando la calibración en línea: {exc}")
+        return {'error': str(exc)}
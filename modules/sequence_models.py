@@ -0,0 +1,296 @@
+"""
+Motor de secuencias para los modelos LSTM de la etapa 2.
+
+Cada fila se predice a partir de una ventana con las `lookback` horas anteriores de sus
+features, no como una secuencia de longitud 1. Las ventanas se arman sobre la grilla horaria:
+las horas sin fila (huecos de datos, filas descartadas por dropna u outliers, o anteriores al
+inicio de la serie) quedan en cero con la columna 'observada' en 0 y la capa Masking de la red
+las omite, de modo que una ventana nunca mezcla horas lejanas como si fueran consecutivas.
+Las ventanas no se materializan: la grilla escalada se guarda una sola vez y tf.data arma
+cada lote con tf.gather a partir del índice de inicio de la ventana, con prefetch y caché de
+los conjuntos de validación. Las variantes comparten los conjuntos de datos, la partición de
+validación y una parada temprana común (SharedEarlyStopping): una variante que después de
+LSTM_PATIENCE épocas sigue lejos de la mejor pérdida de validación ya alcanzada se detiene.
+
+Los hilos de TensorFlow (intra/inter-op) se fijan al importar el módulo, antes de su primera
+operación, a partir del presupuesto del proceso (ver modules.thread_budget).
+"""
+
+import os
+import time
+
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+from modules.thread_budget import PROCESS_THREAD_BUDGET, current_lease
+
+try:
+    import tensorflow as tf
+    from tensorflow.keras import Sequential
+    from tensorflow.keras.layers import LSTM, Bidirectional, Dense, Dropout, Input, Masking
+    from tensorflow.keras.optimizers import Adam
+    TENSORFLOW_AVAILABLE = True
+except Exception:
+    TENSORFLOW_AVAILABLE = False
+
+
+# Horas de historia de cada ventana (una variante puede fijar la suya con 'lookback')
+LSTM_LOOKBACK = int(os.getenv('LSTM_LOOKBACK', 24))
+# Tamaño de lote (0 = el de la variante o, si no lo fija, proporcional a las filas)
+LSTM_BATCH_SIZE = int(os.getenv('LSTM_BATCH_SIZE', 0))
+# Parada temprana: épocas sin mejora y tolerancia frente a la mejor variante ya entrenada
+LSTM_PATIENCE = int(os.getenv('LSTM_PATIENCE', 15))
+LSTM_SHARED_TOLERANCE = float(os.getenv('LSTM_SHARED_TOLERANCE', 0.25))
+LSTM_VALIDATION_FRACTION = 0.2
+# Hilos de TensorFlow (0 = presupuesto del proceso / hasta 2 operaciones independientes)
+LSTM_INTRA_OP_THREADS = int(os.getenv('LSTM_INTRA_OP_THREADS', 0)) or PROCESS_THREAD_BUDGET
+LSTM_INTER_OP_THREADS = int(os.getenv('LSTM_INTER_OP_THREADS', 0)) or max(1, min(2, PROCESS_THREAD_BUDGET))
+
+if TENSORFLOW_AVAILABLE:
+    try:
+        # Solo se pueden fijar antes de la primera operación de TensorFlow
+        tf.config.threading.set_intra_op_parallelism_threads(LSTM_INTRA_OP_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(LSTM_INTER_OP_THREADS)
+    except Exception:
+        pass
+
+
+def variant_lookback(config):
+    return max(1, int(config.get('lookback') or LSTM_LOOKBACK))
+
+
+def variant_batch_size(config, n_rows):
+    """Tamaño de lote de una variante: LSTM_BATCH_SIZE, el de la variante o n_rows / 100 (32-256)."""
+    if LSTM_BATCH_SIZE:
+        return LSTM_BATCH_SIZE
+    if config.get('batch_size'):
+        return int(config['batch_size'])
+    return int(np.clip(n_rows // 100, 32, 256))
+
+
+def prepare_sequences(X, y, train_index, test_index, datetimes=None, max_lookback=None):
+    """
+    Prepara las ventanas de todas las variantes sin copiarlas.
+
+    Las features se escalan con las filas de entrenamiento y se ubican en la grilla horaria
+    (una fila por hora entre la primera y la última). Se agrega una última columna 'observada'
+    (1 si la hora tiene fila); las horas sin fila y las `max_lookback - 1` de relleno inicial
+    quedan en cero y se enmascaran. La ventana de una fila son las horas
+    grid[end - lookback:end] (ver window_array).
+
+    Args:
+        X (ndarray): Features de todas las filas (en el orden de la partición).
+        y (ndarray): Objetivo de todas las filas.
+        train_index, test_index (ndarray): Filas de entrenamiento y prueba.
+        datetimes (array, optional): Fecha de cada fila; sin ella las filas se toman como
+            horas consecutivas en el orden de X.
+        max_lookback (int, optional): Ventana más larga (default: LSTM_LOOKBACK).
+
+    Returns:
+        dict: 'grid' (float32), 'ends' (fin de la ventana de cada fila en 'grid'), 'y',
+        filas 'train', 'fit', 'validation' y 'test', y 'max_lookback'.
+    """
+    max_lookback = max(1, int(max_lookback or LSTM_LOOKBACK))
+    X = np.asarray(X, dtype=np.float32)
+    train_index = np.asarray(train_index)
+    test_index = np.asarray(test_index)
+
+    scaler = StandardScaler().fit(X[train_index])
+    scaled = np.nan_to_num(scaler.transform(X)).astype(np.float32)
+
+    if datetimes is not None:
+        hours = np.asarray(datetimes, dtype='datetime64[h]').astype(np.int64)
+        positions = hours - hours.min()
+    else:
+        positions = np.arange(len(X), dtype=np.int64)
+
+    # Grilla horaria con relleno inicial; si dos filas caen en la misma hora queda la última
+    grid = np.zeros((max_lookback - 1 + int(positions.max()) + 1, X.shape[1] + 1), dtype=np.float32)
+    ends = positions + max_lookback
+    grid[ends - 1, :-1] = scaled
+    grid[ends - 1, -1] = 1.0
+
+    # Partición de validación fija, compartida por todas las variantes
+    rng = np.random.default_rng(42)
+    shuffled = rng.permutation(train_index)
+    n_validation = int(round(len(shuffled) * LSTM_VALIDATION_FRACTION)) if len(shuffled) >= 10 else 0
+
+    return {
+        'grid': grid,
+        'ends': ends,
+        'y': np.asarray(y, dtype=np.float32).ravel(),
+        'train': train_index,
+        'fit': np.sort(shuffled[n_validation:]),
+        'validation': np.sort(shuffled[:n_validation]),
+        'test': test_index,
+        'max_lookback': max_lookback
+    }
+
+
+def window_array(prepared, rows, lookback):
+    """Ventanas (filas, lookback, features) materializadas; equivalente en NumPy de window_dataset."""
+    starts = prepared['ends'][rows] - lookback
+    return prepared['grid'][starts[:, None] + np.arange(lookback)]
+
+
+def window_dataset(prepared, rows, lookback, batch_size, shuffle=False, cache=False, threads=None):
+    """
+    tf.data.Dataset de ventanas de las filas indicadas: los lotes de índices se convierten
+    en ventanas con un solo tf.gather, en paralelo y con prefetch.
+    """
+    if 'grid_tensor' not in prepared:
+        # Una sola copia de la grilla en TensorFlow para todos los conjuntos y variantes
+        prepared['grid_tensor'] = tf.constant(prepared['grid'])
+    grid = prepared['grid_tensor']
+    offsets = tf.range(lookback, dtype=tf.int64)
+    starts = prepared['ends'][rows] - lookback
+
+    dataset = tf.data.Dataset.from_tensor_slices((starts, prepared['y'][rows]))
+    if shuffle:
+        dataset = dataset.shuffle(len(rows), seed=42, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(
+        lambda start, target: (tf.gather(grid, start[:, None] + offsets), target),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=True
+    )
+    if cache:
+        dataset = dataset.cache()
+
+    options = tf.data.Options()
+    options.threading.private_threadpool_size = threads or current_lease() or LSTM_INTRA_OP_THREADS
+    options.threading.max_intra_op_parallelism = 1
+    return dataset.with_options(options).prefetch(tf.data.AUTOTUNE)
+
+
+def build_lstm(config, lookback, n_features):
+    """
+    Red LSTM de una variante ('units', 'layers', 'dropout', 'bidirectional', 'learning_rate').
+    Las horas sin datos de la ventana (todas sus columnas en cero) se enmascaran.
+    """
+    units = int(config.get('units', 32))
+    layers = int(config.get('layers', 1))
+    dropout = float(config.get('dropout', 0.0))
+    bidirectional = bool(config.get('bidirectional', False))
+
+    model = Sequential([Input(shape=(lookback, n_features)), Masking(mask_value=0.0)])
+    for layer_idx in range(layers):
+        lstm_layer = LSTM(units, return_sequences=layer_idx < layers - 1)
+        model.add(Bidirectional(lstm_layer) if bidirectional else lstm_layer)
+        if dropout > 0:
+            model.add(Dropout(dropout))
+
+    model.add(Dense(32, activation='relu'))
+    model.add(Dense(1, activation='linear'))
+    model.compile(optimizer=Adam(learning_rate=float(config.get('learning_rate', 0.001))), loss='mse',
+                  metrics=['mae'])
+    return model
+
+
+if TENSORFLOW_AVAILABLE:
+    class DeadlineStop(tf.keras.callbacks.Callback):
+        """Detiene el entrenamiento al final de la época en que vence el plazo."""
+
+        def __init__(self, deadline):
+            super().__init__()
+            self.deadline = deadline
+
+        def on_epoch_end(self, epoch, logs=None):
+            if time.monotonic() >= self.deadline:
+                self.model.stop_training = True
+
+    class SharedEarlyStopping(tf.keras.callbacks.Callback):
+        """
+        Parada temprana con pesos restaurados a la mejor época, más un corte común a las
+        variantes: `board` guarda la mejor pérdida de validación de las variantes ya
+        entrenadas y una variante que tras `patience` épocas supera esa pérdida en más de
+        `tolerance` se detiene.
+        """
+
+        def __init__(self, board, patience=LSTM_PATIENCE, tolerance=LSTM_SHARED_TOLERANCE):
+            super().__init__()
+            self.board = board
+            self.patience = patience
+            self.tolerance = tolerance
+
+        def on_train_begin(self, logs=None):
+            self.best = np.inf
+            self.best_weights = None
+            self.wait = 0
+            self.stopped_by_board = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            loss = (logs or {}).get('val_loss', (logs or {}).get('loss'))
+            if loss is None:
+                return
+            if loss < self.best:
+                self.best, self.wait = float(loss), 0
+                self.best_weights = self.model.get_weights()
+            else:
+                self.wait += 1
+            shared_best = self.board.get('best_loss', np.inf)
+            if self.wait >= self.patience:
+                self.model.stop_training = True
+            elif epoch + 1 >= self.patience and self.best > shared_best * (1 + self.tolerance):
+                self.model.stop_training = True
+                self.stopped_by_board = True
+
+        def on_train_end(self, logs=None):
+            if self.best_weights is not None:
+                self.model.set_weights(self.best_weights)
+            self.board['best_loss'] = min(self.board.get('best_loss', np.inf), self.best)
+
+
+def train_sequence_variant(prepared, config, board, deadline=None):
+    """
+    Entrena una variante LSTM sobre las ventanas preparadas.
+
+    Args:
+        prepared (dict): Resultado de prepare_sequences.
+        config (dict): Variante (ver calibration.get_default_lstm_configs).
+        board (dict): Estado compartido de SharedEarlyStopping entre variantes.
+        deadline (float, optional): Plazo (time.monotonic()) para detener el entrenamiento.
+
+    Returns:
+        dict: Predicciones 'train_pred'/'test_pred', 'history', 'epochs', 'lookback',
+        'batch_size', 'stopped_by_shared_best', 'training_seconds' e 'inference_seconds'.
+    """
+    lookback = min(variant_lookback(config), prepared['max_lookback'])
+    batch_size = variant_batch_size(config, len(prepared['fit']))
+    n_features = prepared['grid'].shape[1]
+
+    started = time.perf_counter()
+    model = build_lstm(config, lookback, n_features)
+    stopping = SharedEarlyStopping(board)
+    callbacks = [stopping]
+    if deadline is not None:
+        callbacks.append(DeadlineStop(deadline))
+
+    validation = None
+    if len(prepared['validation']):
+        validation = window_dataset(prepared, prepared['validation'], lookback, batch_size, cache=True)
+    history = model.fit(
+        window_dataset(prepared, prepared['fit'], lookback, batch_size, shuffle=True),
+        validation_data=validation,
+        epochs=int(config.get('epochs', 100)),
+        verbose=0,
+        callbacks=callbacks
+    )
+    train_pred = model.predict(window_dataset(prepared, prepared['train'], lookback, batch_size), verbose=0).ravel()
+    training_seconds = time.perf_counter() - started
+
+    # Latencia de inferencia sobre el conjunto de prueba (ventanas armadas en el pipeline)
+    inference_started = time.perf_counter()
+    test_pred = model.predict(window_dataset(prepared, prepared['test'], lookback, batch_size), verbose=0).ravel()
+    inference_seconds = time.perf_counter() - inference_started
+
+    return {
+        'train_pred': train_pred,
+        'test_pred': test_pred,
+        'history': {key: [float(value) for value in values] for key, values in history.history.items()},
+        'epochs': len(history.history.get('loss', [])),
+        'lookback': lookback,
+        'batch_size': batch_size,
+        'stopped_by_shared_best': stopping.stopped_by_board,
+        'training_seconds': training_seconds,
+        'inference_seconds': inference_seconds
+    }
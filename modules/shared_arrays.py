@@ -0,0 +1,148 @@
+"""
+Matrices compartidas entre procesos mediante archivos .npy mapeados en memoria.
+
+Los pools del planificador (modules.model_scheduler) enviaban las matrices de
+entrenamiento y los DataFrames de cada trabajo serializados a cada proceso. Con un
+SharedStore se escriben una sola vez por trabajo en un directorio temporal (en /dev/shm
+cuando existe, es decir, en RAM) y los procesos reciben solo referencias livianas que
+abren con np.load(mmap_mode='r'): todos leen las mismas páginas, sin copias.
+
+Los arrays mapeados son de solo lectura; el código de calibración ya trata el DataFrame de
+entrenamiento como inmutable (ver modules.frame_contract).
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+SHARED_ARRAYS_ENABLED = os.getenv('SHARED_ARRAYS_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
+SHARED_ARRAYS_DIR = os.getenv('SHARED_ARRAYS_DIR') or (
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+)
+# Por debajo de este tamaño serializar es más barato que escribir y mapear un archivo
+SHARED_ARRAYS_MIN_BYTES = int(os.getenv('SHARED_ARRAYS_MIN_BYTES', 1024 * 1024))
+
+
+class SharedArray:
+    """Referencia serializable a un array guardado en un .npy compartido."""
+
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = shape
+        self.dtype = dtype
+
+    def load(self):
+        return np.load(self.path, mmap_mode='r')
+
+
+class SharedFrame:
+    """Referencia serializable a un DataFrame cuyas columnas numéricas están compartidas."""
+
+    def __init__(self, columns, index, attrs):
+        self.columns = columns
+        self.index = index
+        self.attrs = attrs
+
+    def load(self):
+        data = {name: resolve(values) for name, values in self.columns}
+        frame = pd.DataFrame(data, index=resolve(self.index), copy=False)
+        frame.attrs.update(self.attrs)
+        return frame
+
+
+def _shareable_dtype(dtype):
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM'
+
+
+class SharedStore:
+    """
+    Directorio temporal con las matrices compartidas de un trabajo. Un mismo objeto se
+    escribe una sola vez aunque lo usen varias tareas. Al cerrarse se borran los archivos.
+    """
+
+    def __init__(self, min_bytes=None):
+        self.min_bytes = SHARED_ARRAYS_MIN_BYTES if min_bytes is None else min_bytes
+        self.directory = None
+        self._shared = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _path(self):
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='calibration-arrays-', dir=SHARED_ARRAYS_DIR)
+        return os.path.join(self.directory, f'{uuid.uuid4().hex}.npy')
+
+    def _share_array(self, array):
+        array = np.ascontiguousarray(array)
+        path = self._path()
+        np.save(path, array, allow_pickle=False)
+        return SharedArray(path, array.shape, array.dtype.str)
+
+    def share(self, value):
+        """
+        Devuelve una referencia compartida para arrays y DataFrames grandes; cualquier otro
+        valor se devuelve sin cambios.
+        """
+        if not SHARED_ARRAYS_ENABLED:
+            return value
+        if isinstance(value, np.ndarray):
+            if not _shareable_dtype(value.dtype) or value.nbytes < self.min_bytes:
+                return value
+        elif isinstance(value, pd.DataFrame):
+            if value.columns.has_duplicates or value.memory_usage(index=False).sum() < self.min_bytes:
+                return value
+        else:
+            return value
+
+        # Se guarda el objeto junto a su referencia para que su id no se reutilice
+        cached = self._shared.get(id(value))
+        if cached is not None:
+            return cached[1]
+        try:
+            if isinstance(value, np.ndarray):
+                reference = self._share_array(value)
+            else:
+                columns = []
+                for name in value.columns:
+                    series = value[name]
+                    if _shareable_dtype(series.dtype):
+                        columns.append((name, self._share_array(series.to_numpy())))
+                    else:
+                        columns.append((name, series.to_numpy()))
+                index = value.index if isinstance(value.index, pd.RangeIndex) else value.index.to_numpy()
+                reference = SharedFrame(columns, index, dict(value.attrs))
+        except Exception as exc:
+            print(f"⚠️  No se pudo compartir la matriz ({exc}); se enviará serializada")
+            return value
+        self._shared[id(value)] = (value, reference)
+        return reference
+
+    def share_kwargs(self, kwargs):
+        return {key: self.share(value) for key, value in kwargs.items()}
+
+    def close(self):
+        self._shared.clear()
+        if self.directory is not None:
+            # En Windows los archivos aún mapeados no se pueden borrar; se ignoran
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+def resolve(value):
+    """Abre una referencia compartida (SharedArray o SharedFrame); otros valores pasan igual."""
+    if isinstance(value, (SharedArray, SharedFrame)):
+        return value.load()
+    return value
+
+
+def resolve_kwargs(kwargs):
+    return {key: resolve(value) for key, value in kwargs.items()}
@@ -0,0 +1,173 @@
+"""
+Presupuesto central de hilos para el paralelismo anidado.
+
+Los estimadores del zoológico (n_jobs=-1), la validación cruzada, BLAS/OpenMP y los pools de
+procesos del planificador suman hilos unos sobre otros. Con varios procesos de gunicorn y
+trabajos simultáneos, una sola calibración puede sobresuscribir la máquina varias veces.
+Este módulo fija cuántos núcleos le corresponden a cada proceso del servidor
+(PROCESS_THREAD_BUDGET), los reparte entre las calibraciones simultáneas (lease_cores) y
+aplica el límite en cada proceso de entrenamiento (limit_process_threads, con threadpoolctl)
+y en cada estimador (limit_estimator_threads). thread_report resume la asignación efectiva.
+"""
+
+import functools
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from threadpoolctl import threadpool_info, threadpool_limits
+    THREADPOOLCTL_AVAILABLE = True
+except Exception:
+    THREADPOOLCTL_AVAILABLE = False
+
+
+# Variables que leen BLAS/OpenMP al iniciar; se fijan para los procesos hijos
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+                   'NUMEXPR_NUM_THREADS')
+# Parámetros de hilos de los estimadores (scikit-learn/LightGBM, XGBoost, CatBoost)
+THREAD_PARAMS = ('n_jobs', 'nthread', 'thread_count')
+
+
+def available_cores():
+    """Núcleos que puede usar este proceso (afinidad de CPU si el sistema la expone)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPU_CORES = available_cores()
+# Procesos del servidor que comparten la máquina (la misma variable que lee gunicorn)
+SERVER_WORKERS = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+# Núcleos de cada proceso del servidor (0 = CPU_CORES / SERVER_WORKERS)
+PROCESS_THREAD_BUDGET = int(os.getenv('PROCESS_THREAD_BUDGET', 0)) or max(1, CPU_CORES // SERVER_WORKERS)
+
+_lock = threading.Lock()
+_local = threading.local()
+_lease_ids = itertools.count(1)
+_leases = {}
+_process_limit = None
+
+
+def current_lease():
+    """Núcleos reservados por la calibración del hilo actual (None fuera de lease_cores)."""
+    return getattr(_local, 'cores', None)
+
+
+@contextmanager
+def lease_cores(label=None, requested=None):
+    """
+    Reserva núcleos del presupuesto del proceso para una calibración del hilo actual.
+
+    Cada calibración recibe los núcleos libres (o `requested` si es menor); si no queda
+    ninguno recibe 1, de modo que las simultáneas se reparten la máquina en lugar de usar
+    todas sus núcleos cada una. Las reservas anidadas heredan la del hilo.
+
+    Yields:
+        int: Núcleos asignados.
+    """
+    inherited = current_lease()
+    if inherited is not None:
+        yield inherited
+        return
+
+    with _lock:
+        free = PROCESS_THREAD_BUDGET - sum(lease['cores'] for lease in _leases.values())
+        cores = max(1, min(requested or free, free))
+        lease_id = next(_lease_ids)
+        _leases[lease_id] = {'label': label, 'cores': cores, 'since': time.time()}
+    _local.cores = cores
+    print(f"🧮 Núcleos asignados a {label or 'calibración'}: {cores} de {PROCESS_THREAD_BUDGET}")
+    try:
+        yield cores
+    finally:
+        _local.cores = None
+        with _lock:
+            _leases.pop(lease_id, None)
+
+
+def leases_cores(function):
+    """Decorador: ejecuta la función dentro de lease_cores."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with lease_cores(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def limit_estimator_threads(estimator, threads):
+    """
+    Fija `n_jobs` (u otros parámetros de hilos) del estimador al número indicado, incluidos
+    los de estimadores anidados (p. ej. `estimator__n_jobs` de un envoltorio).
+    """
+    params = estimator.get_params(deep=True)
+    updates = {key: threads for key in params if key.split('__')[-1] in THREAD_PARAMS}
+    if updates:
+        estimator.set_params(**updates)
+    return estimator
+
+
+def split_thread_budget(estimator, threads):
+    """
+    Reparte `threads` entre el paralelismo externo (folds de la validación cruzada) y el del
+    estimador para que su producto no supere la reserva: un estimador que pide hilos propios
+    (`n_jobs` u otro parámetro de hilos distinto de None/1, p. ej. bosques, XGBoost o
+    LightGBM) recibe todos y los folds corren en serie; los demás se ajustan con un hilo y
+    los folds se reparten los núcleos.
+
+    Returns:
+        tuple[int, int]: (hilos para los folds, hilos para el estimador).
+    """
+    threads = max(1, int(threads))
+    params = estimator.get_params(deep=True) if hasattr(estimator, 'get_params') else {}
+    if any(key.split('__')[-1] in THREAD_PARAMS and value not in (None, 1) for key, value in params.items()):
+        return 1, threads
+    return threads, 1
+
+
+def limit_process_threads(threads):
+    """
+    Limita los hilos de BLAS/OpenMP del proceso actual y de los que cree después. Se usa
+    como initializer de los pools del planificador.
+    """
+    global _process_limit
+    threads = max(1, int(threads))
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    if THREADPOOLCTL_AVAILABLE:
+        threadpool_limits(limits=threads)
+    _process_limit = threads
+
+
+def thread_report():
+    """
+    Asignación efectiva de hilos del proceso: presupuesto, reservas activas y los hilos
+    que usa cada biblioteca nativa (según threadpoolctl).
+    """
+    with _lock:
+        leases = [dict(lease, id=lease_id) for lease_id, lease in _leases.items()]
+    leased = sum(lease['cores'] for lease in leases)
+    libraries = []
+    if THREADPOOLCTL_AVAILABLE:
+        try:
+            libraries = [
+                {key: info.get(key) for key in ('user_api', 'internal_api', 'num_threads', 'prefix')}
+                for info in threadpool_info()
+            ]
+        except Exception:
+            libraries = []
+    return {
+        'cpu_cores': CPU_CORES,
+        'server_workers': SERVER_WORKERS,
+        'process_budget': PROCESS_THREAD_BUDGET,
+        'leased': leased,
+        'free': max(0, PROCESS_THREAD_BUDGET - leased),
+        'leases': leases,
+        'process_limit': _process_limit,
+        'threadpoolctl': THREADPOOLCTL_AVAILABLE,
+        'environment': {name: os.environ.get(name) for name in THREAD_ENV_VARS},
+        'libraries': libraries
+    }
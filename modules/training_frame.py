@@ -0,0 +1,266 @@
+"""
+Preparación de la entrada de calibración: particiones por dispositivo sin copia y
+DataFrame de entrenamiento (sensor + referencia alineados con variables temporales)
+compartido por todos los contaminantes y modelos.
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from modules.calibration_cache import frame_digest
+from modules.frame_contract import ensure_canonical, with_column
+
+
+TRAINING_FRAME_CACHE_SIZE = int(os.getenv('TRAINING_FRAME_CACHE_SIZE', 16))
+MERGE_TOLERANCE = pd.Timedelta(hours=2)
+TEMPORAL_COLUMNS = ['hour', 'period_of_day', 'day_of_week', 'is_weekend']
+
+_training_frame_cache = OrderedDict()
+
+
+def normalize_year(datetimes, target_year):
+    """
+    Cambia el año de una serie de fechas manteniendo mes, día y hora (vectorizado).
+
+    Args:
+        datetimes (Series): Serie datetime64 sin zona horaria.
+        target_year (int): Año destino.
+
+    Returns:
+        Series: Fechas con el año normalizado. Un 29 de febrero pasa al 28 si el año
+        destino no es bisiesto.
+    """
+    years = datetimes.dt.year
+    normalized = datetimes.copy()
+    for year in years.dropna().unique():
+        year = int(year)
+        if year == target_year:
+            continue
+        mask = years == year
+        normalized.loc[mask] = datetimes.loc[mask] + pd.DateOffset(years=target_year - year)
+    return normalized
+
+
+def add_temporal_features(merged):
+    """
+    Agrega hora, período del día, día de la semana y fin de semana.
+
+    Args:
+        merged (DataFrame): Datos con columna 'datetime'.
+
+    Returns:
+        DataFrame: El mismo DataFrame con las columnas temporales.
+    """
+    hours = merged['datetime'].dt.hour
+    merged['hour'] = hours
+    # Período del día: 0=Madrugada(0-6), 1=Mañana(7-12), 2=Tarde(13-18), 3=Noche(19-23)
+    merged['period_of_day'] = np.searchsorted([6, 12, 18], hours.to_numpy(), side='left').astype(int)
+    merged['day_of_week'] = merged['datetime'].dt.dayofweek
+    merged['is_weekend'] = (merged['day_of_week'] >= 5).astype(int)
+    return merged
+
+
+def base_feature_names(training_frame, pollutant):
+    """Features de la fórmula base (sensor, clima y variables temporales) presentes en el DataFrame."""
+    features = [f'{pollutant}_sensor', 'temperature', 'rh'] + TEMPORAL_COLUMNS
+    return [feat for feat in features if feat in training_frame.columns]
+
+
+def _simulate_missing_weather(merged):
+    """Simula temperatura y humedad típicas de Bogotá cuando no hay mediciones."""
+    if 'temperature' not in merged.columns or merged['temperature'].isna().all():
+        print("⚠️  'temperature' no disponible - SIMULANDO datos realistas")
+        # Temperatura típica de Bogotá: 8-20°C, variación diurna
+        np.random.seed(42)
+        merged['temperature'] = 14 + 4 * np.sin((merged['datetime'].dt.hour - 6) * np.pi / 12) + np.random.normal(0, 1.5, len(merged))
+        merged['temperature'] = merged['temperature'].clip(8, 22)
+
+    if 'rh' not in merged.columns or merged['rh'].isna().all():
+        print("⚠️  'rh' (humedad relativa) no disponible - SIMULANDO datos realistas")
+        # Humedad típica de Bogotá: 60-85%, más alta en madrugada
+        np.random.seed(43)
+        merged['rh'] = 70 - 10 * np.sin((merged['datetime'].dt.hour - 6) * np.pi / 12) + np.random.normal(0, 5, len(merged))
+        merged['rh'] = merged['rh'].clip(50, 90)
+
+    return merged
+
+
+def build_training_frame(lowcost_df, rmcab_df):
+    """
+    Alinea sensor y referencia con merge_asof y agrega las variables comunes a todos
+    los contaminantes (clima simulado si falta y variables temporales).
+
+    Args:
+        lowcost_df (DataFrame): Lecturas del sensor.
+        rmcab_df (DataFrame): Datos de referencia RMCAB.
+
+    Returns:
+        tuple[DataFrame | None, str | None]: DataFrame combinado y mensaje de error.
+    """
+    if lowcost_df is None or rmcab_df is None or lowcost_df.empty or rmcab_df.empty:
+        return None, 'Datos insuficientes para la calibración'
+
+    if 'datetime' not in lowcost_df.columns or 'datetime' not in rmcab_df.columns:
+        return None, "Columnas 'datetime' no presentes en los datasets"
+
+    # Sin copia si ya vienen canónicos desde el cargador (datetime sin zona y ordenado)
+    lowcost_df = ensure_canonical(lowcost_df, 'lowcost')
+    rmcab_df = ensure_canonical(rmcab_df, 'reference')
+
+    print(f"\n📅 Rango lowcost: {lowcost_df['datetime'].min()} a {lowcost_df['datetime'].max()}")
+    print(f"📅 Rango RMCAB: {rmcab_df['datetime'].min()} a {rmcab_df['datetime'].max()}")
+
+    # Normalizar años para permitir merge entre diferentes años
+    lowcost_year = int(lowcost_df['datetime'].dt.year.mode()[0])
+    rmcab_year = int(rmcab_df['datetime'].dt.year.mode()[0])
+    if lowcost_year != rmcab_year:
+        print(f"⚠️  AÑOS DIFERENTES detectados! Normalizando RMCAB al año {lowcost_year} para merge...")
+        rmcab_df = ensure_canonical(
+            with_column(rmcab_df, 'datetime', normalize_year(rmcab_df['datetime'], lowcost_year)),
+            'reference'
+        )
+
+    lowcost_months = set(lowcost_df['datetime'].dt.month.unique())
+    rmcab_months = set(rmcab_df['datetime'].dt.month.unique())
+    common_months = lowcost_months.intersection(rmcab_months)
+    if not common_months:
+        print("⚠️  No hay overlap de meses entre datasets")
+        print(f"   Lowcost meses: {sorted(lowcost_months)}")
+        print(f"   RMCAB meses: {sorted(rmcab_months)}")
+
+    merged = pd.merge_asof(
+        lowcost_df,
+        rmcab_df,
+        on='datetime',
+        tolerance=MERGE_TOLERANCE,
+        suffixes=('_sensor', '_ref')
+    )
+
+    print(f"📊 Registros después del merge: {len(merged)} (lowcost {len(lowcost_df)}, RMCAB {len(rmcab_df)})")
+    if merged.empty:
+        print("❌ El merge no produjo ningún registro!")
+        return merged, None
+
+    merged = _simulate_missing_weather(merged)
+    # Las variables leídas del almacén (modules.feature_store) ya traen las temporales
+    if not all(col in merged.columns for col in TEMPORAL_COLUMNS):
+        merged = add_temporal_features(merged)
+    return merged, None
+
+
+def partition_by_device(lowcost_df, devices=None):
+    """
+    Divide las lecturas por dispositivo en una sola pasada.
+
+    El DataFrame se ordena una vez por dispositivo (orden estable, conserva el orden
+    temporal original) y cada partición es un slice contiguo, es decir, una vista sin
+    copia de datos. Las vistas son de solo lectura para los consumidores.
+
+    Args:
+        lowcost_df (DataFrame): Lecturas con columna 'device_name'.
+        devices (Iterable[str], optional): Dispositivos esperados; los que no tengan
+            datos reciben un DataFrame vacío.
+
+    Returns:
+        tuple[dict, dict]: Particiones {dispositivo: DataFrame} y uso de memoria
+        (bytes del DataFrame base, bytes de las vistas y bytes copiados).
+    """
+    memory = {'devices': 0, 'rows': 0, 'base_bytes': 0, 'view_bytes': 0, 'copied_bytes': 0}
+    partitions = {}
+
+    if lowcost_df is None or lowcost_df.empty or 'device_name' not in lowcost_df.columns:
+        empty = lowcost_df.iloc[0:0] if lowcost_df is not None else pd.DataFrame()
+        for device in devices or []:
+            partitions[device] = empty
+        return partitions, memory
+
+    # Filas sin dispositivo reciben código -1 y quedan fuera de todas las particiones
+    codes, labels = pd.factorize(lowcost_df['device_name'], sort=True)
+    if len(codes) > 1 and np.any(np.diff(codes) < 0):
+        order = np.argsort(codes, kind='stable')
+        base = lowcost_df.take(order)
+        codes = codes[order]
+    else:
+        base = lowcost_df
+    bounds = np.searchsorted(codes, np.arange(len(labels) + 1))
+
+    for index, device in enumerate(labels):
+        partitions[device] = base.iloc[bounds[index]:bounds[index + 1]]
+    for device in devices or []:
+        if device not in partitions:
+            partitions[device] = base.iloc[0:0]
+
+    base_values = [base[col].to_numpy() for col in base.columns]
+    memory['devices'] = len(labels)
+    memory['rows'] = len(base)
+    memory['base_bytes'] = int(base.memory_usage(index=False, deep=False).sum())
+    for partition in partitions.values():
+        if partition.empty:
+            continue
+        view_bytes = int(partition.memory_usage(index=False, deep=False).sum())
+        memory['view_bytes'] += view_bytes
+        shared = all(
+            np.shares_memory(partition[col].to_numpy(), values)
+            for col, values in zip(base.columns, base_values)
+            if values.dtype != object
+        )
+        if not shared:
+            memory['copied_bytes'] += view_bytes
+
+    print(
+        f"🧩 Particiones por dispositivo: {memory['devices']} dispositivos, {memory['rows']} filas, "
+        f"{memory['base_bytes'] / 1e6:.1f} MB base, {memory['copied_bytes'] / 1e6:.1f} MB copiados"
+    )
+    return partitions, memory
+
+
+def _frame_fingerprint(df):
+    """
+    Huella del contenido (columnas, tipos y valores) para invalidar la caché si los datos de
+    entrada cambian, aunque conserven el número de filas y el rango de fechas.
+    """
+    if df is None or df.empty:
+        return (0,)
+    return (len(df), frame_digest(df))
+
+
+def get_training_frame(lowcost_df, rmcab_df, cache_key=None):
+    """
+    Devuelve el DataFrame de entrenamiento, reutilizándolo si ya se construyó para la
+    misma clave (dispositivo, ventana, estación).
+
+    El resultado es de solo lectura: los consumidores deben derivar nuevos DataFrames
+    (dropna, filtros) en lugar de modificarlo.
+
+    Args:
+        lowcost_df (DataFrame): Lecturas del sensor.
+        rmcab_df (DataFrame): Datos de referencia RMCAB.
+        cache_key (tuple, optional): Identificador de la combinación; sin clave no se cachea.
+
+    Returns:
+        tuple[DataFrame | None, str | None]: DataFrame combinado y mensaje de error.
+    """
+    if cache_key is None or TRAINING_FRAME_CACHE_SIZE <= 0:
+        return build_training_frame(lowcost_df, rmcab_df)
+
+    key = (cache_key, _frame_fingerprint(lowcost_df), _frame_fingerprint(rmcab_df))
+    cached = _training_frame_cache.get(key)
+    if cached is not None:
+        _training_frame_cache.move_to_end(key)
+        print(f"♻️  DataFrame de entrenamiento reutilizado para {cache_key}")
+        return cached
+
+    built = build_training_frame(lowcost_df, rmcab_df)
+    if built[1] is None:
+        _training_frame_cache[key] = built
+        while len(_training_frame_cache) > TRAINING_FRAME_CACHE_SIZE:
+            _training_frame_cache.popitem(last=False)
+    return built
+
+
+def clear_training_frame_cache():
+    """Vacía la caché de DataFrames de entrenamiento."""
+    _training_frame_cache.clear()
@@ -0,0 +1,353 @@
+"""
+Seguimiento incremental de la ventana de mayor densidad de datos (etapa 2)
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from modules.data_loader import (
+    load_lowcost_hourly_counts,
+    load_window_subset,
+    find_dense_window_sql,
+    _normalize_devices
+)
+
+
+WINDOW_TRACKER_DIR = os.getenv(
+    'WINDOW_TRACKER_DIR',
+    os.path.join(os.path.dirname(__file__), '..', 'data', 'window_trackers')
+)
+
+COUNT_CHANNELS = ('records', 'pm25_count', 'pm10_count')
+
+
+class DenseWindowTracker:
+    """
+    Mantiene la mejor ventana de 'window_days' días a medida que llegan conteos horarios nuevos.
+
+    El estado son matrices diarias (día x dispositivo) de registros y conteos por contaminante.
+    Como los datos nuevos solo extienden el final del rango, cada ingesta recalcula únicamente
+    las ventanas candidatas que tocan los días modificados y las compara con la mejor conocida,
+    con los mismos criterios que _select_dense_window (total, cobertura mínima, la más temprana).
+    """
+
+    def __init__(self, window_days=10, devices=None):
+        self.window_days = int(window_days)
+        self.priority_devices = list(devices) if devices else None
+        self.origin = None
+        self.last_hour = None
+        self.device_labels = []
+        self.daily = {channel: np.zeros((0, 0), dtype='int64') for channel in COUNT_CHANNELS}
+        self.daily_hours = np.zeros(0, dtype='int64')
+        self.tail = {}
+        self.n_candidates = 0
+        self.best = None
+
+    # ------------------------------------------------------------------
+    # Ingesta
+    # ------------------------------------------------------------------
+    def _day_offset(self, timestamps):
+        return ((timestamps - self.origin) // pd.Timedelta(days=1)).to_numpy(dtype='int64')
+
+    def _ensure_shape(self, n_days, n_devices):
+        for channel in COUNT_CHANNELS:
+            matrix = self.daily[channel]
+            if matrix.shape[0] < n_days or matrix.shape[1] < n_devices:
+                grown = np.zeros((max(n_days, matrix.shape[0]), max(n_devices, matrix.shape[1])), dtype='int64')
+                grown[:matrix.shape[0], :matrix.shape[1]] = matrix
+                self.daily[channel] = grown
+        if self.daily_hours.size < n_days:
+            self.daily_hours = np.concatenate([self.daily_hours, np.zeros(n_days - self.daily_hours.size, dtype='int64')])
+
+    def ingest(self, counts):
+        """
+        Incorpora conteos horarios (device_name, datetime, records, pm25_count, pm10_count).
+
+        Las horas anteriores a la última hora ingerida se ignoran; la última hora se reemplaza,
+        ya que pudo estar incompleta en la ingesta previa.
+
+        Returns:
+            bool: True si el estado cambió.
+        """
+        if counts is None or counts.empty:
+            return False
+
+        counts = counts.dropna(subset=['datetime'])
+        if self.last_hour is not None:
+            counts = counts[counts['datetime'] >= self.last_hour]
+        if counts.empty:
+            return False
+
+        if self.origin is None:
+            self.origin = counts['datetime'].min().normalize()
+
+        # Reemplazar la última hora (se resta lo ingerido antes)
+        if self.last_hour is not None and self.tail and (counts['datetime'] == self.last_hour).any():
+            day = int(self._day_offset(pd.DatetimeIndex([self.last_hour]))[0])
+            for device, values in self.tail.items():
+                column = self.device_labels.index(device)
+                for channel, value in zip(COUNT_CHANNELS, values):
+                    self.daily[channel][day, column] -= value
+            self.daily_hours[day] -= 1
+            self.tail = {}
+
+        labels = counts['device_name'].astype(str)
+        new_devices = [device for device in pd.unique(labels) if device not in self.device_labels]
+        full_refresh = bool(new_devices) and self.priority_devices is None
+        self.device_labels.extend(new_devices)
+
+        day_offsets = self._day_offset(counts['datetime'])
+        columns = labels.map({device: i for i, device in enumerate(self.device_labels)}).to_numpy(dtype='int64')
+        self._ensure_shape(int(day_offsets.max()) + 1, len(self.device_labels))
+
+        for channel in COUNT_CHANNELS:
+            np.add.at(self.daily[channel], (day_offsets, columns), counts[channel].to_numpy(dtype='int64'))
+
+        unique_hours = counts['datetime'].drop_duplicates()
+        np.add.at(self.daily_hours, self._day_offset(unique_hours), 1)
+
+        self.last_hour = counts['datetime'].max()
+        tail_rows = counts[counts['datetime'] == self.last_hour]
+        self.tail = {
+            str(row['device_name']): [int(row[channel]) for channel in COUNT_CHANNELS]
+            for _, row in tail_rows.groupby('device_name', as_index=False)[list(COUNT_CHANNELS)].sum().iterrows()
+        }
+
+        self._update_best(int(day_offsets.min()), full_refresh=full_refresh)
+        return True
+
+    # ------------------------------------------------------------------
+    # Selección de ventana
+    # ------------------------------------------------------------------
+    def _window_sums(self, matrix, first, last):
+        """Sumas de las ventanas candidatas first..last (inclusive) sobre una matriz diaria."""
+        stop = last + self.window_days
+        span = np.zeros((stop - first,) + matrix.shape[1:], dtype='int64')
+        available = matrix[first:min(stop, matrix.shape[0])]
+        span[:available.shape[0]] = available
+        cumulative = np.concatenate([np.zeros((1,) + matrix.shape[1:], dtype='int64'), np.cumsum(span, axis=0)])
+        offsets = np.arange(last - first + 1)
+        return cumulative[offsets + self.window_days] - cumulative[offsets]
+
+    def _update_best(self, touched_day, full_refresh=False):
+        window_duration = pd.Timedelta(days=self.window_days)
+        if self.last_hour - self.origin < pd.Timedelta(hours=1):
+            self.best = None
+            self.n_candidates = 0
+            return
+
+        last_start = (self.last_hour - window_duration).floor('D')
+        if last_start < self.origin:
+            last_start = self.origin
+        n_candidates = int((last_start - self.origin) // pd.Timedelta(days=1)) + 1
+
+        if full_refresh or self.best is None:
+            first = 0
+        else:
+            first = max(0, min(touched_day - self.window_days + 1, self.n_candidates))
+        self.n_candidates = n_candidates
+        if first > n_candidates - 1:
+            return
+
+        records = self._window_sums(self.daily['records'], first, n_candidates - 1)
+        totals = records.sum(axis=1)
+
+        priority = self.priority_devices or self.device_labels
+        coverage = np.zeros(len(totals), dtype='int64')
+        if priority:
+            priority_matrix = np.zeros((len(totals), len(priority)), dtype='int64')
+            for position, device in enumerate(priority):
+                if device in self.device_labels:
+                    priority_matrix[:, position] = records[:, self.device_labels.index(device)]
+            coverage = priority_matrix.min(axis=1)
+
+        valid = np.flatnonzero(totals > 0)
+        if valid.size == 0:
+            if full_refresh:
+                self.best = None
+            return
+
+        # Orden lexicográfico: total, cobertura y (a igualdad) la ventana más temprana
+        order = np.lexsort((valid, -coverage[valid], -totals[valid]))
+        candidate = int(valid[order[0]])
+        candidate_key = (int(totals[candidate]), int(coverage[candidate]), -(first + candidate))
+
+        if self.best is not None and not full_refresh and self.best['index'] < first:
+            best_key = (self.best['total_records'], int(self.best['coverage_min'] or 0), -self.best['index'])
+            if best_key >= candidate_key:
+                return
+
+        self._store_best(first + candidate)
+
+    def _store_best(self, index):
+        window = {}
+        for channel in COUNT_CHANNELS:
+            window[channel] = self._window_sums(self.daily[channel], index, index)[0]
+        hours = self._window_sums(self.daily_hours[:, None], index, index)[0, 0]
+
+        priority = self.priority_devices or self.device_labels
+        per_device = {
+            device: int(window['records'][column])
+            for column, device in enumerate(self.device_labels)
+            if window['records'][column] > 0
+        }
+        pollutant_counts = {}
+        coverage_values = []
+        for device in priority:
+            if device in self.device_labels:
+                column = self.device_labels.index(device)
+                pollutant_counts[device] = {
+                    'pm25': int(window['pm25_count'][column]),
+                    'pm10': int(window['pm10_count'][column])
+                }
+                coverage_values.append(int(window['records'][column]))
+            else:
+                pollutant_counts[device] = {'pm25': 0, 'pm10': 0}
+                coverage_values.append(0)
+
+        start = self.origin + pd.Timedelta(days=index)
+        self.best = {
+            'index': int(index),
+            'start': start,
+            'end': start + pd.Timedelta(days=self.window_days) - pd.Timedelta(hours=1),
+            'total_records': int(window['records'].sum()),
+            'per_device_counts': dict(sorted(per_device.items(), key=lambda item: -item[1])),
+            'pollutant_counts': pollutant_counts,
+            'hours_covered': int(hours),
+            'coverage_min': float(min(coverage_values)) if coverage_values else None
+        }
+
+    def best_window(self):
+        """
+        Returns:
+            dict | None: Mejor ventana con la estructura de find_dense_window (sin 'subset').
+        """
+        if self.best is None:
+            return None
+        window = dict(self.best)
+        window.pop('index', None)
+        window['per_device_counts'] = dict(window['per_device_counts'])
+        window['pollutant_counts'] = {device: dict(values) for device, values in window['pollutant_counts'].items()}
+        return window
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+    def to_dict(self):
+        best = None
+        if self.best is not None:
+            best = dict(self.best)
+            best['start'] = best['start'].isoformat()
+            best['end'] = best['end'].isoformat()
+        return {
+            'window_days': self.window_days,
+            'priority_devices': self.priority_devices,
+            'origin': self.origin.isoformat() if self.origin is not None else None,
+            'last_hour': self.last_hour.isoformat() if self.last_hour is not None else None,
+            'device_labels': self.device_labels,
+            'daily': {channel: matrix.tolist() for channel, matrix in self.daily.items()},
+            'daily_hours': self.daily_hours.tolist(),
+            'tail': self.tail,
+            'n_candidates': self.n_candidates,
+            'best': best
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        tracker = cls(state['window_days'], state.get('priority_devices'))
+        tracker.origin = pd.Timestamp(state['origin']) if state.get('origin') else None
+        tracker.last_hour = pd.Timestamp(state['last_hour']) if state.get('last_hour') else None
+        tracker.device_labels = list(state.get('device_labels', []))
+        n_devices = len(tracker.device_labels)
+        for channel in COUNT_CHANNELS:
+            matrix = np.asarray(state['daily'][channel], dtype='int64')
+            tracker.daily[channel] = matrix.reshape(-1, n_devices) if matrix.size else np.zeros((0, n_devices), dtype='int64')
+        tracker.daily_hours = np.asarray(state.get('daily_hours', []), dtype='int64')
+        tracker.tail = {device: list(values) for device, values in state.get('tail', {}).items()}
+        tracker.n_candidates = int(state.get('n_candidates', 0))
+        best = state.get('best')
+        if best:
+            best['start'] = pd.Timestamp(best['start'])
+            best['end'] = pd.Timestamp(best['end'])
+        tracker.best = best
+        return tracker
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(self.to_dict(), handle)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as handle:
+            return cls.from_dict(json.load(handle))
+
+
+def get_tracker_path(start_date, window_days, devices=None, filter_by_keys=False):
+    """Archivo de estado para una combinación (inicio, ventana, dispositivos, filtro)."""
+    key = json.dumps({
+        'start_date': str(start_date),
+        'window_days': int(window_days),
+        'devices': sorted(devices) if devices else None,
+        'filter_by_keys': bool(filter_by_keys)
+    }, sort_keys=True)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(WINDOW_TRACKER_DIR, f'tracker_{digest}.json')
+
+
+def find_dense_window_incremental(start_date, end_date, window_days=10, devices=None, filter_by_keys=False):
+    """
+    Variante incremental de find_dense_window_sql.
+
+    Reanuda el estado persistido para (start_date, window_days, devices), consulta en SQL solo
+    los conteos de las horas nuevas y descarga las filas crudas de la ventana ganadora.
+
+    Returns:
+        dict | None: Misma estructura que find_dense_window (con 'tracker_state').
+    """
+    devices = _normalize_devices(devices)
+    path = get_tracker_path(start_date, window_days, devices, filter_by_keys)
+
+    tracker = None
+    if os.path.exists(path):
+        try:
+            tracker = DenseWindowTracker.load(path)
+        except Exception as exc:
+            print(f"⚠️  Estado de ventana corrupto, se reconstruye: {exc}")
+
+    # Un rango que termina antes de lo ya procesado no puede reutilizar el estado
+    if tracker is not None and tracker.last_hour is not None and pd.Timestamp(end_date) < tracker.last_hour:
+        return find_dense_window_sql(start_date, end_date, window_days, devices, filter_by_keys)
+
+    if tracker is None:
+        tracker = DenseWindowTracker(window_days, devices)
+
+    fetch_start = tracker.last_hour.isoformat(sep=' ') if tracker.last_hour is not None else start_date
+    counts = load_lowcost_hourly_counts(fetch_start, end_date, devices, filter_by_keys=filter_by_keys)
+    if counts is None:
+        return None
+
+    if tracker.ingest(counts):
+        try:
+            tracker.save(path)
+        except Exception as exc:
+            print(f"⚠️  No se pudo guardar el estado de la ventana: {exc}")
+
+    best_window = tracker.best_window()
+    if best_window is None:
+        return None
+
+    best_window = load_window_subset(best_window, devices, filter_by_keys=filter_by_keys)
+    if best_window is not None:
+        best_window['tracker_state'] = {
+            'last_hour': tracker.last_hour.isoformat() if tracker.last_hour is not None else None,
+            'new_hours': int(counts['datetime'].nunique()) if not counts.empty else 0
+        }
+    return best_window
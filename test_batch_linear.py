@@ -0,0 +1,67 @@
+"""
+Prueba de la calibración lineal por lotes: coincide con la regresión lineal del zoológico
+y con Ridge sobre features escaladas, para varios dispositivos resueltos a la vez.
+"""
+
+import numpy as np
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.preprocessing import RobustScaler, StandardScaler
+
+from modules.batch_linear import fleet_linear_calibration, prepare_linear_groups, solve_linear_batch
+from modules.calibration import train_and_evaluate_models
+
+
+def test_fleet_formulas_match_zoo_linear_regression(make_training_frame):
+    frames = {
+        f'Aire{seed}': make_training_frame(300 + 80 * seed, seed, start='2025-02-01', skewed=True, missing_rh=0.05)
+        for seed in range(4)
+    }
+    fleet = fleet_linear_calibration(frames, pollutants=('pm25',))
+
+    zoo = train_and_evaluate_models(None, None, 'pm25', training_frame=frames['Aire1'], use_cache=False)
+    zoo_linear = next(r for r in zoo['results'] if r['model_name'] == 'Linear Regression')
+    entry = fleet['Aire1']['pollutant_results'][0]
+    assert entry['records_after_cleaning'] == zoo['records_after_cleaning']
+    np.testing.assert_allclose(entry['linear_regression']['coefficients'], zoo_linear['coefficients'], atol=1e-5)
+    assert abs(entry['linear_regression']['intercept'] - zoo_linear['intercept']) < 1e-4
+    assert entry['linear_regression']['formula'].startswith('PM2.5 referencia')
+
+    groups = prepare_linear_groups(frames, pollutants=('pm25',))
+    for device_name, results in fleet.items():
+        group = groups[(device_name, 'pm25')]
+        ridge = results['pollutant_results'][0]['ridge_regression']
+        scaler = RobustScaler().fit(group['X_train'])
+        expected = Ridge(alpha=1.0).fit(scaler.transform(group['X_train']), group['y_train'])
+        predictions = group['X_test'] @ np.array(ridge['coefficients']) + ridge['intercept']
+        np.testing.assert_allclose(predictions, expected.predict(scaler.transform(group['X_test'])), atol=1e-3)
+
+
+def test_batch_solver_handles_constant_columns_and_standard_scaling():
+    rng = np.random.default_rng(5)
+    X_groups, y_groups = [], []
+    for size in (80, 150, 400):
+        X = np.column_stack([rng.uniform(0, 50, size), rng.uniform(40, 95, size), np.full(size, 3.0)])
+        X_groups.append(X)
+        y_groups.append(X[:, 0] * 0.8 - X[:, 1] * 0.1 + rng.normal(0, 1, size))
+
+    coef, intercept = solve_linear_batch(X_groups, y_groups)
+    ridge_coef, ridge_intercept = solve_linear_batch(X_groups, y_groups, alpha=2.0, robust_scaling=False)
+    for index, (X, y) in enumerate(zip(X_groups, y_groups)):
+        expected = LinearRegression().fit(X, y)
+        np.testing.assert_allclose(coef[index], expected.coef_, atol=1e-8)
+        assert abs(intercept[index] - expected.intercept_) < 1e-7
+
+        scaler = StandardScaler().fit(X)
+        ridge = Ridge(alpha=2.0).fit(scaler.transform(X), y)
+        np.testing.assert_allclose(X @ ridge_coef[index] + ridge_intercept[index],
+                                   ridge.predict(scaler.transform(X)), atol=1e-8)
+
+
+def test_device_without_usable_pollutants_does_not_abort_the_fleet(make_training_frame):
+    frames = {'Aire0': make_training_frame(300, 0), 'SinPM25': make_training_frame(300, 1).drop(columns=['pm25_sensor'])}
+    fleet = fleet_linear_calibration(frames, pollutants=('pm25',))
+    assert fleet['Aire0']['pollutant_results'][0]['error'] is None
+    assert 'Columnas faltantes' in fleet['SinPM25']['pollutant_results'][0]['error']
+
+    typo = fleet_linear_calibration(frames, pollutants=('pm2.5',))
+    assert all(results['pollutant_results'][0]['error'] for results in typo.values())
@@ -0,0 +1,42 @@
+"""
+Prueba de la caché de calibraciones: la clave depende del contenido del DataFrame y de la
+configuración de los modelos, y una entrada guardada se recupera sin reentrenar.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import Ridge
+
+from modules import calibration_cache
+from modules.calibration import calibration_cache_key
+
+
+def _frame(seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'datetime': pd.date_range('2024-06-01', periods=100, freq='h'),
+        'pm25_sensor': rng.uniform(5, 50, 100),
+        'pm25_ref': rng.uniform(5, 50, 100)
+    })
+
+
+def test_key_tracks_content_and_zoo(tmp_path, monkeypatch):
+    monkeypatch.setattr(calibration_cache, 'CALIBRATION_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(calibration_cache, '_memory', calibration_cache.OrderedDict())
+
+    frame = _frame()
+    key = calibration_cache_key(frame, 'pm25')
+    assert key == calibration_cache_key(frame.copy(), 'pm25')
+    assert key != calibration_cache_key(_frame(seed=1), 'pm25')
+    assert key != calibration_cache_key(frame, 'pm10')
+    extra = [{'name': 'Ridge', 'estimator': Ridge(alpha=1.0)}]
+    assert calibration_cache_key(frame, 'pm25', extra_models=extra) != calibration_cache_key(
+        frame, 'pm25', extra_models=[{'name': 'Ridge', 'estimator': Ridge(alpha=2.0)}]
+    )
+
+    assert calibration_cache.lookup(key) is None
+    assert calibration_cache.store(key, {'results': [{'model_name': 'Ridge', 'rmse': 1.0}]})
+    calibration_cache._memory.clear()
+    assert calibration_cache.lookup(key)['results'][0]['rmse'] == 1.0
+    assert calibration_cache.cache_stats()['entries'] == 1
+    assert calibration_cache.clear_cache() == 1
@@ -0,0 +1,40 @@
+"""
+Prueba de la cola de trabajos de calibración: el trabajo se ejecuta en segundo plano,
+reporta progreso y deja el resultado persistido en disco.
+"""
+
+import json
+import os
+import time
+
+from modules import calibration_jobs
+
+
+def _runner(params, progress):
+    progress({'stage': 'plan', 'total': 2})
+    for pollutant in ('pm25', 'pm10'):
+        progress({'stage': 'model', 'device': 'Aire2', 'pollutant': pollutant, 'model': 'Ridge', 'status': 'completed'})
+        progress({'stage': 'pollutant', 'device': 'Aire2', 'pollutant': pollutant, 'status': 'completed'})
+    return {'success': True, 'value': params['value']}, 200
+
+
+def test_job_runs_in_background_and_persists(tmp_path, monkeypatch):
+    monkeypatch.setattr(calibration_jobs, 'JOBS_DIR', str(tmp_path))
+
+    job_id = calibration_jobs.submit_job('test', {'value': 7}, _runner)
+    deadline = time.time() + 30
+    while calibration_jobs.get_job(job_id)['status'] not in calibration_jobs.FINISHED_STATUSES:
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+    job = calibration_jobs.get_job(job_id, include_result=True, include_events=True)
+    assert job['status'] == 'completed'
+    assert job['result'] == {'success': True, 'value': 7}
+    assert job['progress']['completed'] == 2 and job['progress']['percent'] == 100.0
+    assert [event['seq'] for event in job['events']] == list(range(1, 6))
+
+    with open(os.path.join(tmp_path, f'{job_id}.json'), encoding='utf-8') as handle:
+        assert json.load(handle)['result']['value'] == 7
+
+    stream = list(calibration_jobs.sse_stream(job_id))
+    assert stream[-1].startswith('event: end')
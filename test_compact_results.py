@@ -0,0 +1,34 @@
+"""
+Prueba de los resultados compactos: solo el mejor modelo (o los pedidos) conserva el
+estimador ajustado y las predicciones completas; el resto guarda los puntos de su diagrama.
+"""
+
+import json
+
+import numpy as np
+
+from modules.calibration import (
+    create_scatter_points,
+    serializable_results,
+    train_and_evaluate_models
+)
+
+
+def test_only_best_and_requested_models_keep_estimators(make_training_frame):
+    summary = train_and_evaluate_models(None, None, 'pm25', training_frame=make_training_frame(2400, seed=4), use_cache=False,
+                                        keep_models=['Random Forest'])
+    results = summary['results']
+    best = results[0]
+    n_test = len(best['actual'])
+    assert best['is_best'] and 'trained_model' in best and n_test == 600
+    assert best['predicted'].dtype == np.float32 and len(best['predicted']) == n_test
+
+    for result in results[1:]:
+        kept = result['model_name'] == 'Random Forest'
+        assert ('trained_model' in result) == kept
+        assert len(result['predicted']) == (n_test if kept else 300)
+        # Los puntos guardados son los mismos que mostraría el diagrama con las predicciones completas
+        assert len(create_scatter_points(result['actual'], result['predicted'])) == 300
+
+    payload = json.loads(json.dumps(serializable_results(results)))
+    assert len(payload[0]['actual']) == n_test and 'trained_model' not in payload[0]
@@ -0,0 +1,50 @@
+"""
+Prueba de aislamiento por dispositivo: una excepción al preparar el DataFrame de un
+dispositivo queda como error de ese dispositivo y los demás se calibran normalmente.
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules import calibration
+from modules.calibration import run_devices_calibration
+
+
+def _readings(hours=300, seed=0):
+    rng = np.random.default_rng(seed)
+    datetimes = pd.date_range('2025-03-01', periods=hours, freq='h')
+    lowcost = pd.DataFrame({
+        'datetime': datetimes,
+        'pm25_sensor': rng.uniform(5, 60, hours),
+        'pm10_sensor': rng.uniform(10, 90, hours),
+        'temperature': rng.uniform(8, 22, hours),
+        'rh': rng.uniform(40, 95, hours)
+    })
+    reference = pd.DataFrame({
+        'datetime': datetimes,
+        'pm25_ref': 0.7 * lowcost['pm25_sensor'] + 3 + rng.normal(0, 1, hours),
+        'pm10_ref': 0.8 * lowcost['pm10_sensor'] + 2 + rng.normal(0, 1, hours)
+    })
+    return lowcost, reference
+
+
+def test_bad_device_does_not_abort_the_batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    lowcost, reference = _readings()
+    build = calibration.get_training_frame
+
+    def failing_for_bad_device(lowcost_df, rmcab_df, cache_key=None):
+        if lowcost_df.attrs.get('device') == 'AireMalo':
+            raise TypeError('tipos incompatibles en el merge')
+        return build(lowcost_df, rmcab_df, cache_key=cache_key)
+
+    monkeypatch.setattr(calibration, 'get_training_frame', failing_for_bad_device)
+    bad = lowcost.copy()
+    bad.attrs['device'] = 'AireMalo'
+
+    results = run_devices_calibration({'AireBueno': lowcost, 'AireMalo': bad}, reference, pollutants=('pm25',))
+
+    good_entry = results['AireBueno']['pollutant_results'][0]
+    bad_entry = results['AireMalo']['pollutant_results'][0]
+    assert good_entry['error'] is None and good_entry['models']
+    assert bad_entry['error'] == 'Error preparando AireMalo: tipos incompatibles en el merge'
@@ -0,0 +1,25 @@
+"""
+Prueba de la parada temprana: los boosting de la etapa 2 se detienen antes del máximo de
+iteraciones y evaluate_model reporta las iteraciones efectivas.
+"""
+
+import numpy as np
+
+from modules.calibration import build_extra_model_definitions, evaluate_model
+from modules.early_stopping import effective_iterations
+from modules.fold_evaluation import fit_fold_models
+
+
+def test_boosting_models_report_effective_iterations():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 50, (600, 3))
+    y = X @ np.array([0.9, 0.2, -0.1]) + rng.normal(0, 1, 600)
+    definitions = {d['name']: d['estimator'] for d in build_extra_model_definitions()}
+
+    for name, max_iterations in (('Gradient Boosting', 400), ('HistGradientBoosting', 500)):
+        result = evaluate_model(definitions[name], X[:450], X[450:], y[:450], y[450:], name, use_cross_val=False)
+        assert 0 < result['n_iterations'] < max_iterations
+
+    ensemble, _, _ = fit_fold_models(definitions['HistGradientBoosting'], X, y, n_splits=3)
+    expected = round(np.mean([estimator.n_iter_ for estimator in ensemble.estimators_]))
+    assert effective_iterations(ensemble) == expected
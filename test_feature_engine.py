@@ -0,0 +1,90 @@
+"""
+Prueba del motor de variables avanzadas: sin huecos coincide con la implementación anterior
+por dispositivo (ventanas en filas) y con huecos sigue las ventanas en horas de
+groupby().rolling.
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules.feature_engine import compute_advanced_features
+from modules.training_frame import add_temporal_features
+
+
+def _legacy_add_advanced_features(merged, pollutant):
+    """add_advanced_features antes del motor vectorizado (un dispositivo y un contaminante)."""
+    df = merged.sort_values('datetime').copy()
+    target_col = f'{pollutant}_sensor'
+    new_columns = []
+    for lag in [1, 3, 6]:
+        col_name = f'{target_col}_lag_{lag}h'
+        df[col_name] = df[target_col].shift(lag)
+        df[col_name] = df[col_name].fillna(df[target_col])
+        new_columns.append(col_name)
+    for window in [3, 6, 12]:
+        mean_col = f'{target_col}_roll_mean_{window}h'
+        std_col = f'{target_col}_roll_std_{window}h'
+        df[mean_col] = df[target_col].rolling(window, min_periods=1).mean()
+        df[std_col] = df[target_col].rolling(window, min_periods=2).std()
+        df[std_col] = df[std_col].fillna(0.0)
+        new_columns.extend([mean_col, std_col])
+    df['temperature_roll_mean_6h'] = df['temperature'].rolling(6, min_periods=1).mean()
+    df['rh_roll_mean_6h'] = df['rh'].rolling(6, min_periods=1).mean()
+    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24.0)
+    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24.0)
+    df['day_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7.0)
+    df['day_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7.0)
+    new_columns.extend(['temperature_roll_mean_6h', 'rh_roll_mean_6h', 'hour_sin', 'hour_cos', 'day_sin', 'day_cos'])
+    return df, new_columns
+
+
+def _hourly_fleet(devices=4, hours=200, seed=11):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'device_name': np.repeat([f'Aire{i}' for i in range(devices)], hours),
+        'datetime': np.tile(pd.date_range('2024-06-01', periods=hours, freq='h'), devices),
+        'pm25_sensor': rng.gamma(2.0, 8.0, devices * hours),
+        'pm10_sensor': rng.gamma(2.0, 14.0, devices * hours),
+        'temperature': rng.normal(14, 3, devices * hours),
+        'rh': rng.normal(70, 8, devices * hours)
+    })
+    # Filas mezcladas: el motor debe devolverlas en el orden de entrada
+    frame = frame.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+    return add_temporal_features(frame)
+
+
+def test_engine_matches_per_device_implementation_without_gaps():
+    frame = _hourly_fleet()
+    engine, columns = compute_advanced_features(frame, pollutants=('pm25', 'pm10'))
+    assert engine.index.equals(frame.index)
+
+    for device, device_df in frame.groupby('device_name'):
+        for pollutant in ('pm25', 'pm10'):
+            legacy, legacy_columns = _legacy_add_advanced_features(device_df, pollutant)
+            assert set(legacy_columns) <= set(columns)
+            pd.testing.assert_frame_equal(
+                engine.loc[legacy.index, legacy_columns], legacy[legacy_columns], check_exact=False, rtol=1e-9
+            )
+
+
+def test_windows_are_measured_in_hours_with_gaps():
+    frame = _hourly_fleet(devices=2, hours=120)
+    rng = np.random.default_rng(3)
+    frame = frame[rng.random(len(frame)) > 0.25].reset_index(drop=True)
+    engine, _ = compute_advanced_features(frame, pollutants=('pm25',))
+
+    for device, device_df in frame.groupby('device_name'):
+        series = device_df.sort_values('datetime').set_index('datetime')['pm25_sensor']
+        rows = engine.loc[device_df.sort_values('datetime').index]
+        np.testing.assert_allclose(rows['pm25_sensor_roll_mean_6h'], series.rolling('6h', min_periods=1).mean())
+        np.testing.assert_allclose(
+            rows['pm25_sensor_roll_std_12h'], series.rolling('12h', min_periods=2).std().fillna(0.0), atol=1e-9
+        )
+
+        # Lag de 3 h: última lectura entre t-4h y t-3h; sin ella, el valor actual
+        times = series.index
+        expected = []
+        for time, value in series.items():
+            previous = series[(times >= time - pd.Timedelta(hours=4)) & (times <= time - pd.Timedelta(hours=3))]
+            expected.append(previous.iloc[-1] if len(previous) else value)
+        np.testing.assert_allclose(rows['pm25_sensor_lag_3h'], expected)
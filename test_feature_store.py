@@ -0,0 +1,70 @@
+"""
+Prueba del almacén de variables: las horas guardadas antes de cerrarse se vuelven a consultar
+y solo se piden los tramos de horas que faltan.
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules import feature_store
+from modules.coverage import CoverageIndex
+from modules.feature_store import build_hourly_features, get_device_features, hourly_base
+
+
+def _readings(seed=5):
+    rng = np.random.default_rng(seed)
+    datetimes = pd.date_range('2025-03-01', '2025-03-03 23:59', freq='20min')
+    return pd.DataFrame({
+        'datetime': datetimes,
+        'device_name': 'Aire2',
+        'pm25_sensor': rng.uniform(5, 60, len(datetimes)),
+        'pm10_sensor': rng.uniform(10, 90, len(datetimes)),
+        'temperature': rng.uniform(8, 22, len(datetimes)),
+        'rh': rng.uniform(40, 95, len(datetimes))
+    })
+
+
+def test_partial_hours_are_refetched_and_only_missing_runs_load(tmp_path, monkeypatch):
+    readings = _readings()
+    monkeypatch.setattr(feature_store, 'get_coverage_index', lambda: CoverageIndex())
+    clock = {'now': pd.Timestamp('2025-03-02 10:30')}
+    calls = []
+
+    def loader(start, end, devices):
+        calls.append((pd.Timestamp(start), pd.Timestamp(end)))
+        # La base de datos solo tiene lo recibido hasta el instante actual
+        available = readings['datetime'] <= clock['now']
+        return readings[available & readings['datetime'].between(start, end)]
+
+    first = get_device_features('Aire2', '2025-03-01', '2025-03-02 10:59', loader, str(tmp_path), now=clock['now'])
+    assert calls == [(pd.Timestamp('2025-03-01'), pd.Timestamp('2025-03-02 10:59:59.999999'))]
+    assert feature_store.FINAL_COLUMN not in first.columns
+    partial_hour = first.loc[first['datetime'] == '2025-03-02 10:00', 'pm25_sensor'].iloc[0]
+
+    # Dos horas después: la hora 10 (guardada incompleta) y la 11 se consultan de nuevo
+    calls.clear()
+    clock['now'] = pd.Timestamp('2025-03-02 12:30')
+    second = get_device_features('Aire2', '2025-03-01', '2025-03-02 11:59', loader, str(tmp_path), now=clock['now'])
+    assert calls == [(pd.Timestamp('2025-03-02 10:00'), pd.Timestamp('2025-03-02 11:59:59.999999'))]
+    full_hour = readings[readings['datetime'].dt.floor('h') == '2025-03-02 10:00']['pm25_sensor'].mean()
+    refreshed = second.loc[second['datetime'] == '2025-03-02 10:00', 'pm25_sensor'].iloc[0]
+    assert np.isclose(refreshed, full_hour) and not np.isclose(refreshed, partial_hour)
+
+    # Faltan solo los extremos: se consultan dos tramos y no el rango intermedio
+    calls.clear()
+    clock['now'] = pd.Timestamp('2025-03-02 15:00')
+    third = get_device_features('Aire2', '2025-02-28 22:00', '2025-03-02 13:59', loader, str(tmp_path), now=clock['now'])
+    assert calls == [
+        (pd.Timestamp('2025-02-28 22:00'), pd.Timestamp('2025-02-28 23:59:59.999999')),
+        (pd.Timestamp('2025-03-02 12:00'), pd.Timestamp('2025-03-02 13:59:59.999999'))
+    ]
+
+    # Las variables coinciden con calcularlas de una vez sobre todas las lecturas
+    loaded = readings[readings['datetime'] < '2025-03-02 14:00']
+    expected = build_hourly_features(hourly_base(loaded)).reset_index(drop=True)
+    pd.testing.assert_frame_equal(third[expected.columns], expected, check_dtype=False)
+
+    # Todo está guardado como definitivo: no hay más consultas
+    calls.clear()
+    get_device_features('Aire2', '2025-03-01', '2025-03-02 13:59', loader, str(tmp_path), now=clock['now'])
+    assert calls == []
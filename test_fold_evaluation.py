@@ -0,0 +1,62 @@
+"""
+Prueba de la evaluación con ensamble de folds: la validación cruzada debe coincidir con
+cross_val_score, el ensamble lineal debe exponer coeficientes promedio y los ensambles y el
+modelo apilado se ajustan con fit como cualquier regresor.
+"""
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import KFold, cross_val_score
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+from modules.fold_evaluation import FoldEnsembleRegressor, StackedRegressor, fit_fold_models, stack_fold_predictions
+
+
+def test_fold_models_match_cross_val_score():
+    rng = np.random.default_rng(3)
+    X = rng.uniform(0, 50, (150, 3))
+    y = X @ np.array([0.9, 0.2, -0.1]) + rng.normal(0, 1, 150)
+
+    ensemble, oof_predictions, fold_scores = fit_fold_models(LinearRegression(), X, y, n_splits=5)
+    expected = cross_val_score(
+        LinearRegression(), X, y, cv=KFold(n_splits=5, shuffle=True, random_state=42), scoring='r2'
+    )
+
+    assert np.allclose(fold_scores, expected)
+    assert not np.isnan(oof_predictions).any()
+    assert len(ensemble.estimators_) == 5
+    assert np.allclose(ensemble.predict(X), X @ ensemble.coef_ + ensemble.intercept_)
+
+
+def test_fold_ensemble_and_stacking_fit_like_regressors():
+    rng = np.random.default_rng(4)
+    X = rng.uniform(0, 50, (200, 3))
+    y = X @ np.array([0.9, 0.2, -0.1]) + rng.normal(0, 1, 200)
+    X_train, X_test, y_train = X[:150], X[150:], y[:150]
+
+    ensemble, oof_predictions, _ = fit_fold_models(LinearRegression(), X_train, y_train, n_splits=4)
+    refitted = clone(ensemble).fit(X_train, y_train)
+    assert np.allclose(refitted.predict(X_test), ensemble.predict(X_test))
+    assert np.allclose(refitted.oof_predictions_, oof_predictions)
+
+    # El modelo apilado de stack_fold_predictions es el mismo que produce fit
+    scaler = StandardScaler().fit(X_train)
+    tree, tree_oof, _ = fit_fold_models(
+        DecisionTreeRegressor(max_depth=4, random_state=0), scaler.transform(X_train), y_train, n_splits=4
+    )
+    results = [
+        {'model_name': 'Linear', 'trained_model': ensemble, 'oof_predictions': oof_predictions,
+         'predicted': ensemble.predict(X_test)},
+        {'model_name': 'Tree', 'trained_model': tree, 'oof_predictions': tree_oof,
+         'predicted': tree.predict(scaler.transform(X_test))}
+    ]
+    stacked, _, stacked_test = stack_fold_predictions(results, y_train, scaled_names=['Tree'], scaler=scaler)
+    assert np.allclose(stacked.predict(X_test), stacked_test)
+
+    tree_ensemble = FoldEnsembleRegressor(DecisionTreeRegressor(max_depth=4, random_state=0), n_splits=4)
+    fitted = StackedRegressor(members=[(LinearRegression(), None), (tree_ensemble, StandardScaler())], n_splits=4)
+    fitted.fit(X_train, y_train)
+    assert np.allclose(fitted.predict(X_test), stacked_test)
+    assert np.allclose(clone(stacked).fit(X_train, y_train).predict(X_test), stacked_test)
@@ -0,0 +1,100 @@
+"""
+Prueba del contrato de DataFrame canónico: time_slice, ensure_canonical y el merge de
+build_training_frame dan lo mismo que las copias, conversiones y ordenamientos que
+reemplazaron, sin copiar los datos ni modificar la entrada.
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules.frame_contract import canonicalize, ensure_canonical, is_canonical, time_slice
+from modules.training_frame import MERGE_TOLERANCE, build_training_frame
+
+
+def _raw_readings(rows=3000, seed=2):
+    rng = np.random.default_rng(seed)
+    offsets = rng.integers(0, 20 * 24 * 60, rows)
+    return pd.DataFrame({
+        'id': np.arange(rows),
+        # Texto con zona horaria y desordenado, como puede llegar de la base de datos
+        'datetime': (pd.Timestamp('2024-06-01', tz='UTC') + pd.to_timedelta(offsets, unit='min')).astype(str),
+        'device_name': rng.choice(['Aire2', 'Aire4'], rows),
+        'pm25_sensor': rng.uniform(5, 60, rows).round(1).astype(str),
+        'pm10_sensor': rng.uniform(10, 90, rows),
+        'temperature': rng.uniform(8, 22, rows),
+        'rh': rng.uniform(40, 95, rows)
+    })
+
+
+def _legacy_window(data, start, end):
+    """Ventana de la etapa 2 antes del contrato: copia, conversión, máscara y orden."""
+    data = data.copy()
+    data['datetime'] = pd.to_datetime(data['datetime']).dt.tz_localize(None)
+    window = data[(data['datetime'] >= start) & (data['datetime'] <= end)].copy()
+    return window.sort_values('datetime')
+
+
+def test_time_slice_matches_mask_copy_and_shares_memory():
+    raw = _raw_readings()
+    original = raw.copy()
+    canonical = ensure_canonical(raw, 'lowcost')
+    pd.testing.assert_frame_equal(raw, original)
+    assert is_canonical(canonical, 'lowcost') and ensure_canonical(canonical, 'lowcost') is canonical
+
+    start, end = pd.Timestamp('2024-06-05 10:00'), pd.Timestamp('2024-06-12 09:30')
+    window = time_slice(canonical, start, end)
+    legacy = _legacy_window(raw, start, end)
+    legacy['pm25_sensor'] = legacy['pm25_sensor'].astype(float)
+
+    keys = ['datetime', 'id']
+    pd.testing.assert_frame_equal(
+        window.sort_values(keys).reset_index(drop=True), legacy.sort_values(keys).reset_index(drop=True)
+    )
+    # El orden temporal es estable: a igual hora se conserva el orden de llegada
+    assert window[['datetime', 'id']].equals(window.sort_values(keys)[['datetime', 'id']])
+    assert np.shares_memory(window['pm10_sensor'].to_numpy(), canonical['pm10_sensor'].to_numpy())
+    assert is_canonical(window, 'lowcost')
+
+
+def _legacy_training_merge(lowcost_df, rmcab_df):
+    """merge_asof de build_training_frame antes del contrato (_strip_timezone + índices)."""
+    frames = []
+    for df in (lowcost_df, rmcab_df):
+        df = df.copy(deep=False)
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        if df['datetime'].dt.tz is not None:
+            df['datetime'] = df['datetime'].dt.tz_localize(None)
+        frames.append(df)
+    return pd.merge_asof(
+        frames[0].set_index('datetime').sort_index(),
+        frames[1].set_index('datetime').sort_index(),
+        left_index=True,
+        right_index=True,
+        tolerance=MERGE_TOLERANCE,
+        suffixes=('_sensor', '_ref')
+    ).reset_index()
+
+
+def test_training_merge_matches_indexed_merge():
+    rng = np.random.default_rng(4)
+    sensor_times = pd.date_range('2024-06-01', periods=500, freq='37min', tz='America/Bogota')
+    lowcost = pd.DataFrame({
+        'datetime': sensor_times,
+        'pm25_sensor': rng.uniform(5, 60, 500),
+        'temperature': rng.uniform(8, 22, 500),
+        'rh': rng.uniform(40, 95, 500)
+    }).sample(frac=1.0, random_state=1)
+    rmcab = pd.DataFrame({
+        'datetime': pd.date_range('2024-06-01', periods=300, freq='h'),
+        'pm25_ref': rng.uniform(5, 60, 300)
+    }).sample(frac=1.0, random_state=2)
+
+    merged, error = build_training_frame(lowcost, rmcab)
+    assert error is None
+    legacy = _legacy_training_merge(lowcost, rmcab)
+    pd.testing.assert_frame_equal(merged[legacy.columns], legacy)
+
+    # Los DataFrames canónicos de los cargadores se usan sin copiar ni reordenar
+    canonical = canonicalize(lowcost.copy(), 'lowcost')
+    assert ensure_canonical(canonical, 'lowcost') is canonical
+    pd.testing.assert_frame_equal(build_training_frame(canonical, rmcab)[0][legacy.columns], legacy)
@@ -0,0 +1,45 @@
+"""
+Prueba de la aproximación de núcleo de los SVR: por encima del umbral de filas el zoológico
+conserva los nombres de modelo y el formato de métricas, y la aproximación se acerca al SVR exacto.
+"""
+
+import numpy as np
+from sklearn.metrics import r2_score
+from sklearn.svm import SVR
+
+from modules import kernel_approximation
+from modules.calibration import get_calibration_models, train_and_evaluate_models
+from modules.kernel_approximation import ApproximateSVR, approximate_svr
+
+
+def test_approximation_tracks_exact_svr(monkeypatch):
+    monkeypatch.setattr(kernel_approximation, 'SVR_APPROXIMATION_ROWS', 1000)
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(1500, 4))
+    y = 3 * X[:, 0] - 2 * X[:, 1] + np.sin(2 * X[:, 2]) + 20 + rng.normal(0, 0.3, 1500)
+    train, test = slice(0, 1200), slice(1200, None)
+
+    for exact in (SVR(kernel='linear', C=1.0, epsilon=0.1), SVR(kernel='rbf', C=10.0, gamma='scale', epsilon=0.1)):
+        approximate = approximate_svr(exact, 1200)
+        assert isinstance(approximate, ApproximateSVR) and approximate.C == exact.C
+        expected = r2_score(y[test], exact.fit(X[train], y[train]).predict(X[test]))
+        assert r2_score(y[test], approximate.fit(X[train], y[train]).predict(X[test])) > expected - 0.02
+
+    linear = approximate_svr(SVR(kernel='linear'), 1200).fit(X[train], y[train])
+    np.testing.assert_allclose(linear.predict(X[test]), X[test] @ linear.coef_ + linear.intercept_)
+    assert approximate_svr(SVR(), 10).__class__ is SVR
+
+
+def test_zoo_keeps_names_and_metrics_above_threshold(monkeypatch, make_training_frame):
+    monkeypatch.setattr(kernel_approximation, 'SVR_APPROXIMATION_ROWS', 200)
+    frame = make_training_frame(400, seed=3, start='2025-02-01')
+
+    assert list(get_calibration_models(300)) == list(get_calibration_models())
+    svr_names = ('SVR (Linear)', 'SVR (RBF)', 'SVR (Polynomial)')
+    summary = train_and_evaluate_models(None, None, 'pm25', training_frame=frame,
+                                        use_cache=False, keep_models=svr_names)
+    results = {result['model_name']: result for result in summary['results']}
+    for name in svr_names:
+        assert isinstance(results[name]['trained_model'], ApproximateSVR)
+        assert {'r2', 'rmse', 'mae', 'mape', 'overfitting'} <= set(results[name])
+    assert results['SVR (Linear)']['r2'] > 0.9 and len(results['SVR (Linear)']['coefficients']) == 7
@@ -0,0 +1,133 @@
+"""
+Pruebas del planificador paralelo: el pool de procesos debe devolver los mismos
+resultados, en el mismo orden, que el entrenamiento secuencial, el fan-out de
+(dispositivo, contaminante) debe aislar los errores de cada trabajo y al vencer el plazo
+los procesos que siguen entrenando se detienen.
+"""
+
+import os
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+
+from modules.calibration import evaluate_model
+import modules.model_scheduler as model_scheduler
+from modules.model_scheduler import fan_out, model_job, plan_workers, train_model_zoo
+
+
+def _training_data():
+    rng = np.random.default_rng(7)
+    X = rng.uniform(0, 50, (80, 3))
+    y = X @ np.array([0.9, 0.2, -0.1]) + rng.normal(0, 1, 80)
+    return {
+        'X_train': X[:60], 'X_test': X[60:],
+        'X_train_scaled': X[:60] / 50, 'X_test_scaled': X[60:] / 50,
+        'y_train': y[:60], 'y_test': y[60:],
+        'feature_names': ['pm25_sensor', 'temperature', 'rh']
+    }
+
+
+def _jobs():
+    return [
+        model_job('Linear Regression', LinearRegression()),
+        model_job('Ridge Regression', Ridge(alpha=1.0), use_scaled=True),
+        model_job('Random Forest', RandomForestRegressor(n_estimators=10, random_state=0, n_jobs=-1))
+    ]
+
+
+def _isolated_costs(monkeypatch, tmp_path, costs=None):
+    monkeypatch.setattr(model_scheduler, 'MODEL_COSTS_PATH', str(tmp_path / 'model_costs.json'))
+    monkeypatch.setattr(model_scheduler, '_measured_costs', costs)
+
+
+def test_parallel_zoo_matches_sequential(monkeypatch, tmp_path):
+    _isolated_costs(monkeypatch, tmp_path)
+    data = _training_data()
+    sequential, _, _ = train_model_zoo(_jobs(), data, evaluate_model, core_budget=2, workers=1)
+    parallel, warnings, _ = train_model_zoo(_jobs(), data, evaluate_model, core_budget=2, workers=2)
+
+    assert not warnings
+    assert [r['model_name'] for r in parallel] == ['Linear Regression', 'Ridge Regression', 'Random Forest']
+    assert [r['rmse'] for r in parallel] == [r['rmse'] for r in sequential]
+    assert (tmp_path / 'model_costs.json').exists()
+    # El estimador ajustado respeta el presupuesto de hilos del proceso
+    assert parallel[2]['trained_model'].n_jobs == 1
+
+
+def test_plan_workers_respects_core_budget():
+    assert plan_workers(10, core_budget=8) == (8, 1)
+    assert plan_workers(3, core_budget=8) == (3, 2)
+    assert plan_workers(5, core_budget=4, workers=1) == (1, 4)
+
+
+def _square_or_fail(value, core_budget=None):
+    if value < 0:
+        raise ValueError('valor negativo')
+    return value * value
+
+
+def test_fan_out_isolates_errors():
+    tasks = [(('A', 'pm25'), {'value': 3}), (('A', 'pm10'), {'value': -1}), (('B', 'pm25'), {'value': 4})]
+    for workers in (1, 2):
+        delivered = {key: (result, error) for key, result, error in fan_out(tasks, _square_or_fail, core_budget=2, workers=workers)}
+        assert delivered[('A', 'pm25')] == (9, None)
+        assert delivered[('B', 'pm25')] == (16, None)
+        assert delivered[('A', 'pm10')][0] is None and 'negativo' in delivered[('A', 'pm10')][1]
+
+
+def test_time_budget_skips_models_that_do_not_fit(monkeypatch, tmp_path):
+    # Costos medidos: el bosque aleatorio tarda mucho más que el presupuesto
+    _isolated_costs(monkeypatch, tmp_path, {
+        'Linear Regression': {'kind': 'LinearRegression', 'seconds_per_unit': 0.001},
+        'Ridge Regression': {'kind': 'Ridge', 'seconds_per_unit': 0.001},
+        'Random Forest': {'kind': 'RandomForestRegressor', 'seconds_per_unit': 1000.0}
+    })
+    results, warnings, skipped = train_model_zoo(
+        _jobs(), _training_data(), evaluate_model, core_budget=1, workers=1, deadline=time.monotonic() + 5
+    )
+
+    assert [r['model_name'] for r in results] == ['Linear Regression', 'Ridge Regression']
+    assert skipped == ['Random Forest']
+    assert any('Presupuesto de tiempo' in warning for warning in warnings)
+
+
+def _evaluate_or_hang(estimator, X_train, X_test, y_train, y_test, name, **kwargs):
+    if name == 'Random Forest':
+        with open(os.path.join(os.environ['SCHEDULER_TEST_DIR'], 'hung.pid'), 'w') as handle:
+            handle.write(str(os.getpid()))
+        time.sleep(60)
+    return evaluate_model(estimator, X_train, X_test, y_train, y_test, name, **kwargs)
+
+
+def _finished(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return True
+    # Terminado pero aún no recogido por el pool (zombie en Linux)
+    status = f'/proc/{pid}/status'
+    if os.path.exists(status):
+        with open(status) as handle:
+            return any(line.split()[1] == 'Z' for line in handle if line.startswith('State:'))
+    return False
+
+
+def test_deadline_terminates_busy_workers(monkeypatch, tmp_path):
+    _isolated_costs(monkeypatch, tmp_path)
+    monkeypatch.setenv('SCHEDULER_TEST_DIR', str(tmp_path))
+    started = time.monotonic()
+    results, _, skipped = train_model_zoo(
+        _jobs(), _training_data(), _evaluate_or_hang, core_budget=2, workers=2, deadline=time.monotonic() + 3
+    )
+
+    assert time.monotonic() - started < 10
+    assert skipped == ['Random Forest']
+    assert [r['model_name'] for r in results] == ['Linear Regression', 'Ridge Regression']
+
+    hung_pid = int((tmp_path / 'hung.pid').read_text())
+    limit = time.monotonic() + 5
+    while not _finished(hung_pid) and time.monotonic() < limit:
+        time.sleep(0.05)
+    assert _finished(hung_pid)
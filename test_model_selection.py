@@ -0,0 +1,52 @@
+"""
+Prueba de successive halving: los candidatos débiles se eliminan en las rondas parciales
+y los modelos de HALVING_ALWAYS_KEEP siempre llegan al entrenamiento completo.
+"""
+
+import numpy as np
+from sklearn.dummy import DummyRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.tree import DecisionTreeRegressor
+
+from modules import model_scheduler
+from modules.model_scheduler import model_job
+from modules.model_selection import _rung_rows, successive_halving
+
+
+def test_halving_keeps_strong_candidates(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_scheduler, 'MODEL_COSTS_PATH', str(tmp_path / 'costs.json'))
+    monkeypatch.setattr(model_scheduler, '_measured_costs', {})
+
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 50, (2000, 3))
+    y = X @ np.array([0.9, 0.2, -0.1]) + rng.normal(0, 1, 2000)
+    data = {
+        'X_train': X, 'X_test': X[:10], 'X_train_scaled': X / 50, 'X_test_scaled': X[:10] / 50,
+        'y_train': y, 'y_test': y[:10], 'feature_names': ['a', 'b', 'c']
+    }
+    jobs = [
+        model_job('Linear Regression', LinearRegression()),
+        model_job('Ridge Regression', Ridge(), use_scaled=True),
+        model_job('Tree', DecisionTreeRegressor(max_depth=2, random_state=0)),
+        model_job('Mean', DummyRegressor()),
+        model_job('Median', DummyRegressor(strategy='median'))
+    ]
+
+    finalists, report = successive_halving(jobs, data, core_budget=1, min_rows=100, min_survivors=1)
+
+    names = [job['name'] for job in finalists]
+    assert names == ['Linear Regression', 'Ridge Regression']
+    assert {'Mean', 'Median', 'Tree'} <= set(report['eliminated'])
+    assert report['rungs'] and report['rungs'][0]['candidates'] == 4
+
+
+def test_short_windows_still_get_rungs():
+    # Ventanas de la etapa 2: ~70-430 filas de entrenamiento, 80 % para las rondas
+    assert _rung_rows(56, 10, 3, 200, 2, floor_rows=30) == []
+    assert _rung_rows(90, 10, 3, 200, 2, floor_rows=30) == [30]
+    assert _rung_rows(344, 10, 3, 200, 2, floor_rows=30) == [38, 114]
+    for pool in range(90, 345):
+        rungs = _rung_rows(pool, 10, 3, 200, 2, floor_rows=30)
+        assert rungs and rungs[0] >= 30 and rungs[-1] < pool
+    # Con conjuntos grandes la primera ronda no baja de min_rows
+    assert _rung_rows(8000, 10, 3, 200, 2, floor_rows=30)[0] >= 200
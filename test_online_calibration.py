@@ -0,0 +1,52 @@
+"""
+Prueba de la calibración en línea: RLS coincide con mínimos cuadrados por lotes y un
+modelo guardado se actualiza en su lugar con las horas nuevas, legible por
+load_calibration_model y predict_with_saved_model.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+
+from modules.calibration import load_calibration_model, predict_with_saved_model
+from modules.online_calibration import RecursiveLeastSquares, fit_online_calibration, update_online_calibration
+
+
+def test_rls_block_updates_match_batch_least_squares():
+    rng = np.random.default_rng(1)
+    X = rng.uniform(0, 50, (300, 3))
+    y = X @ np.array([0.8, -0.2, 0.1]) + 3 + rng.normal(0, 1, 300)
+
+    rls = RecursiveLeastSquares(forgetting_factor=1.0, regularization=1e-8)
+    for block in np.array_split(np.arange(300), 7):
+        rls.partial_fit(X[block], y[block])
+    batch = LinearRegression().fit(X, y)
+
+    np.testing.assert_allclose(rls.coef_, batch.coef_, rtol=1e-6, atol=1e-8)
+    assert abs(rls.intercept_ - batch.intercept_) < 1e-6
+    assert rls.n_samples_seen_ == 300
+
+
+def test_saved_online_model_is_updated_in_place(tmp_path, monkeypatch, make_training_frame):
+    monkeypatch.chdir(tmp_path)
+    history = make_training_frame(240, seed=2, start='2025-03-01', noise=0.5)
+
+    for model_name in ('RLS', 'SGD'):
+        fitted = fit_online_calibration(history, 'AireTest', 'pm25', period=model_name, model_name=model_name)
+        assert fitted['success'] and fitted['online']['n_samples_seen'] == 240
+
+        # Las horas ya vistas se ignoran; solo se aprenden las posteriores
+        recent = pd.concat([history.tail(24), make_training_frame(6, seed=3, start='2025-03-11', noise=0.5)], ignore_index=True)
+        updated = update_online_calibration(recent, 'AireTest', 'pm25', period=model_name)
+        assert updated['new_rows'] == 6
+        assert updated['online']['n_samples_seen'] == 246
+        assert updated['online']['last_datetime'] == str(pd.Timestamp('2025-03-11 05:00'))
+
+        model_info = load_calibration_model('AireTest', 'pm25', model_name)
+        assert model_info['online']['updates'] == 1
+        assert model_info['metrics']['rmse'] < 2
+        predictions = predict_with_saved_model(model_info, recent)
+        formula = model_info['intercept'] + recent[model_info['feature_names']].to_numpy() @ model_info['coefficients']
+        np.testing.assert_allclose(predictions, formula, rtol=1e-6)
+
+        assert update_online_calibration(recent, 'AireTest', 'pm25', period=model_name)['new_rows'] == 0
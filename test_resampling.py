@@ -0,0 +1,85 @@
+"""
+Pruebas del motor de remuestreo horario: la grilla coincide con un groupby de pandas y la
+etapa 2 conserva el esquema de las lecturas al quedarse con las horas de la RMCAB.
+"""
+
+import numpy as np
+import pandas as pd
+
+import app
+from modules.coverage import CoverageIndex, reference_series_name
+from modules.resampling import resample_hourly
+
+
+def _raw_readings(seed=3, rows=5000):
+    rng = np.random.default_rng(seed)
+    offsets = np.sort(rng.integers(0, 72 * 3600, rows))
+    readings = pd.DataFrame({
+        'id': np.arange(rows),
+        'datetime': pd.Timestamp('2024-06-01') + pd.to_timedelta(offsets, unit='s'),
+        'device_name': rng.choice(['Aire2', 'Aire4', 'Aire5'], rows),
+        'pm25_sensor': rng.uniform(5, 60, rows),
+        'pm10_sensor': rng.uniform(10, 90, rows),
+        'temperature': rng.uniform(8, 22, rows),
+        'rh': rng.uniform(40, 95, rows)
+    })
+    readings.loc[rng.random(rows) < 0.2, 'pm25_sensor'] = np.nan
+    # Aire5 sin lecturas durante 5 horas
+    gap = (readings['device_name'] == 'Aire5') & readings['datetime'].between('2024-06-02 03:00', '2024-06-02 07:59')
+    return readings[~gap].reset_index(drop=True)
+
+
+def test_hourly_grid_matches_pandas_groupby():
+    readings = _raw_readings()
+    grid = resample_hourly(readings)
+
+    hour = readings['datetime'].dt.floor('h').rename('hour')
+    grouped = readings.groupby(['device_name', hour])
+    expected = grouped[['pm25_sensor', 'pm10_sensor', 'temperature', 'rh']].mean()
+    with_data = grid[~grid['is_gap']].set_index(['device_name', 'datetime'])
+    with_data.index = with_data.index.set_names(['device_name', 'hour'])
+
+    pd.testing.assert_frame_equal(with_data[expected.columns], expected, check_dtype=False)
+    np.testing.assert_array_equal(with_data['records'], grouped.size())
+    np.testing.assert_array_equal(with_data['pm25_sensor_count'], grouped['pm25_sensor'].count())
+
+    # Las horas sin lecturas aparecen como huecos explícitos
+    gaps = grid[grid['is_gap']]
+    assert set(gaps['device_name']) == {'Aire5'}
+    assert len(gaps) == 5 and (gaps['records'] == 0).all() and gaps['pm25_sensor'].isna().all()
+
+
+def test_reference_hours_keep_the_reading_schema(monkeypatch):
+    readings = _raw_readings()
+    rmcab_window = pd.DataFrame({'datetime': pd.date_range('2024-06-01 10:00', '2024-06-02 10:00', freq='h')})
+    rmcab_window = rmcab_window[rmcab_window['datetime'] != '2024-06-01 12:00']
+
+    index = CoverageIndex()
+    monkeypatch.setattr(app, 'get_coverage_index', lambda: index)
+
+    # Índice vacío (la estación nunca se consultó): se usan las horas de rmcab_window
+    kept = app.keep_reference_hours(readings, rmcab_window, '6')
+    assert list(kept.columns) == list(readings.columns)
+    assert not kept.duplicated(['device_name', 'datetime']).any()
+    assert set(kept['datetime']) <= set(rmcab_window['datetime'])
+    assert pd.Timestamp('2024-06-01 12:00') not in set(kept['datetime'])
+
+    hour = readings['datetime'].dt.floor('h')
+    first_hour = readings[(readings['device_name'] == 'Aire2') & (hour == '2024-06-01 10:00')]
+    row = kept[(kept['device_name'] == 'Aire2') & (kept['datetime'] == '2024-06-01 10:00')].iloc[0]
+    assert row['id'] == first_hour['id'].iloc[0]
+    assert np.isclose(row['pm10_sensor'], first_hour['pm10_sensor'].mean())
+
+    # Estación consultada solo en parte de la ventana: también se usa el conjunto de horas
+    series = reference_series_name('6')
+    index.mark_scanned(series, '2024-06-01 00:00', '2024-06-01 20:00')
+    index.update_from_frame(rmcab_window.iloc[:5], {'records': None}, series=series)
+    pd.testing.assert_frame_equal(app.keep_reference_hours(readings, rmcab_window, '6'), kept)
+
+    # Ventana consultada completa: el resultado es el mismo resuelto con los mapas de bits,
+    # sin leer las horas intermedias de rmcab_window (solo sus extremos)
+    index.mark_scanned(series, '2024-06-01 00:00', '2024-06-03 23:00')
+    index.update_from_frame(rmcab_window, {'records': None}, series=series)
+    pd.testing.assert_frame_equal(app.keep_reference_hours(readings, rmcab_window, '6'), kept)
+    bounds_only = rmcab_window.iloc[[0, -1]]
+    pd.testing.assert_frame_equal(app.keep_reference_hours(readings, bounds_only, '6'), kept)
@@ -0,0 +1,87 @@
+"""
+Prueba del motor de secuencias: cada fila ve sus horas anteriores en la grilla horaria aunque
+la partición esté barajada, las horas faltantes quedan enmascaradas y, con TensorFlow
+instalado, las variantes LSTM se entrenan sobre esas ventanas con el formato del zoológico.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.model_selection import train_test_split
+
+from modules.calibration import train_and_evaluate_models
+from modules.sequence_models import prepare_sequences, variant_batch_size, window_array
+from modules.training_frame import add_temporal_features
+
+
+def _shuffled_hours_with_gap(hours=60, gap=range(30, 40), seed=0):
+    datetimes = pd.date_range('2025-01-01', periods=hours, freq='h')
+    keep = np.array([hour not in gap for hour in range(hours)])
+    hour_numbers = np.arange(hours, dtype=float)[keep]
+    X = np.column_stack([hour_numbers, hour_numbers ** 2])
+    shuffle = np.random.default_rng(seed).permutation(len(X))
+    return X[shuffle], hour_numbers[shuffle], datetimes.to_numpy()[keep][shuffle]
+
+
+def test_windows_follow_the_hourly_grid_and_mask_gaps():
+    X, y, datetimes = _shuffled_hours_with_gap()
+    train_index, test_index = train_test_split(np.arange(len(X)), test_size=0.25, random_state=42)
+
+    prepared = prepare_sequences(X, y, train_index, test_index, datetimes=datetimes, max_lookback=6)
+    assert set(prepared['fit']).isdisjoint(prepared['validation'])
+    assert len(prepared['fit']) + len(prepared['validation']) == len(train_index)
+
+    rows = np.arange(len(X))
+    windows = window_array(prepared, rows, lookback=4)
+    assert windows.shape == (len(X), 4, 3)
+    mean, std = X[train_index, 0].mean(), X[train_index, 0].std()
+    for row, window in zip(rows, windows):
+        hour = int(y[row])
+        expected_hours = np.arange(hour - 3, hour + 1)
+        observed = (expected_hours >= 0) & ~np.isin(expected_hours, range(30, 40))
+        np.testing.assert_array_equal(window[:, -1], observed.astype(np.float32))
+        np.testing.assert_allclose(window[observed, 0] * std + mean, expected_hours[observed], atol=1e-3)
+        # Las horas faltantes (hueco o antes del inicio) quedan en cero para la capa Masking
+        assert not window[~observed].any()
+
+    assert variant_batch_size({}, 1000) == 32
+    assert variant_batch_size({'batch_size': 64}, 1000) == 64
+    assert variant_batch_size({}, 100000) == 256
+
+
+def test_lstm_variants_train_on_windows():
+    pytest.importorskip('tensorflow')
+    from modules.sequence_models import train_sequence_variant
+
+    rng = np.random.default_rng(1)
+    hours = 400
+    frame = pd.DataFrame({'datetime': pd.date_range('2025-02-01', periods=hours, freq='h')})
+    frame['pm25_sensor'] = 30 + 15 * np.sin(np.arange(hours) / 8) + rng.normal(0, 2, hours)
+    frame['temperature'] = rng.uniform(8, 22, hours)
+    frame['rh'] = rng.uniform(40, 95, hours)
+    # La referencia depende de la hora anterior del sensor: solo se ve con historia
+    frame['pm25_ref'] = 0.5 * frame['pm25_sensor'] + 0.3 * frame['pm25_sensor'].shift(1).bfill() + 2
+    frame = add_temporal_features(frame.drop(index=range(150, 170)).reset_index(drop=True))
+
+    X = frame[['pm25_sensor', 'temperature', 'rh']].to_numpy()
+    y = frame['pm25_ref'].to_numpy()
+    train_index, test_index = train_test_split(np.arange(len(X)), test_size=0.25, random_state=42)
+    prepared = prepare_sequences(X, y, train_index, test_index, datetimes=frame['datetime'], max_lookback=6)
+
+    board = {}
+    fitted = train_sequence_variant(prepared, {'units': 8, 'epochs': 3, 'lookback': 6}, board)
+    assert fitted['test_pred'].shape == (len(test_index),)
+    assert fitted['train_pred'].shape == (len(train_index),)
+    assert fitted['lookback'] == 6 and 1 <= fitted['epochs'] <= 3
+    assert fitted['training_seconds'] > 0 and fitted['inference_seconds'] > 0
+    assert np.isfinite(board['best_loss'])
+
+    summary = train_and_evaluate_models(
+        None, None, 'pm25', training_frame=frame, use_cache=False,
+        lstm_configs=[{'name': 'LSTM prueba', 'units': 8, 'epochs': 3, 'lookback': 6}]
+    )
+    lstm = next(result for result in summary['results'] if result['model_name'] == 'LSTM prueba')
+    linear = next(result for result in summary['results'] if result['model_name'] == 'Linear Regression')
+    assert lstm['lookback'] == 6 and lstm['inference_ms_per_row'] > 0
+    assert {'r2', 'rmse', 'mae', 'mape'} <= set(lstm)
+    assert lstm['rmse'] > 0 and linear['rmse'] > 0
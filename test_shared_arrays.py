@@ -0,0 +1,37 @@
+"""
+Prueba de las matrices compartidas: las referencias se serializan sin los datos y, al
+abrirse, devuelven los mismos valores sin copiar.
+"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from modules.shared_arrays import SharedStore, resolve_kwargs
+
+
+def test_shared_frame_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr('modules.shared_arrays.SHARED_ARRAYS_DIR', str(tmp_path))
+    frame = pd.DataFrame({
+        'datetime': pd.date_range('2024-01-01', periods=50_000, freq='min'),
+        'device_name': 'Aire2',
+        'pm25_sensor': np.linspace(0, 1, 50_000)
+    })
+    frame.attrs['canonical_frame'] = 'lowcost'
+    matrix = np.random.default_rng(0).normal(size=(50_000, 4))
+
+    with SharedStore(min_bytes=1024) as store:
+        kwargs = store.share_kwargs({'frame': frame, 'matrix': matrix, 'again': frame, 'label': 'x'})
+        assert kwargs['frame'] is kwargs['again']
+        payload = pickle.dumps(kwargs)
+        assert len(payload) < matrix.nbytes // 2
+
+        restored = resolve_kwargs(pickle.loads(payload))
+        pd.testing.assert_frame_equal(restored['frame'], frame)
+        assert restored['frame'].attrs == frame.attrs
+        assert np.array_equal(restored['matrix'], matrix)
+        assert not restored['matrix'].flags.writeable
+        assert restored['label'] == 'x'
+
+    assert not list(tmp_path.iterdir())
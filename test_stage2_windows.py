@@ -0,0 +1,171 @@
+"""
+Pruebas de la búsqueda de ventanas densas de la etapa 2 (sin conexión a la base de datos)
+"""
+
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from modules.coverage import CoverageIndex, LOWCOST_CHANNELS, REFERENCE_CHANNELS
+from modules.window_tracker import DenseWindowTracker
+from modules.data_loader import (
+    find_dense_window,
+    _hourly_counts_from_frame,
+    _select_dense_window
+)
+
+
+def build_synthetic_readings(seed=7):
+    """Genera lecturas crudas (sub-horarias) de tres sensores con un hueco de datos"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for device, density in [('Aire2', 6), ('Aire4', 4), ('Aire5', 2)]:
+        timestamps = pd.date_range('2024-06-01', '2024-07-15', freq=f'{60 // density}min')
+        # Hueco de 10 días para Aire4
+        if device == 'Aire4':
+            timestamps = timestamps[(timestamps < '2024-06-10') | (timestamps >= '2024-06-20')]
+        values = rng.uniform(5, 60, len(timestamps))
+        frames.append(pd.DataFrame({
+            'datetime': timestamps,
+            'device_name': device,
+            'pm25_sensor': np.where(rng.random(len(timestamps)) < 0.1, np.nan, values),
+            'pm10_sensor': values * 1.4
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_dense_window_from_counts_matches_raw_scan():
+    """La ventana calculada con la matriz de conteos coincide con la obtenida de las filas crudas"""
+    readings = build_synthetic_readings()
+    devices = ['Aire2', 'Aire4', 'Aire5']
+
+    raw_window = find_dense_window(readings, window_days=5, devices=devices)
+    assert raw_window is not None
+
+    hourly = readings.copy()
+    hourly['datetime'] = hourly['datetime'].dt.floor('h')
+    counts = _hourly_counts_from_frame(hourly)
+    counts_window = _select_dense_window(counts, window_days=5, devices=devices)
+
+    for key in ['start', 'end', 'total_records', 'per_device_counts', 'pollutant_counts', 'hours_covered', 'coverage_min']:
+        assert raw_window[key] == counts_window[key], key
+
+    # El hueco de Aire4 no debe quedar dentro de la ventana elegida
+    assert raw_window['per_device_counts']['Aire4'] > 0
+    assert len(raw_window['subset']) == raw_window['total_records']
+
+
+def test_coverage_index_matches_dataframe_scans():
+    """Las consultas del índice de bits coinciden con los cálculos sobre DataFrames"""
+    readings = build_synthetic_readings()
+    reference = pd.DataFrame({'datetime': pd.date_range('2024-06-03', '2024-07-01', freq='h')})
+    reference['pm25_ref'] = np.where(np.arange(len(reference)) % 5 == 0, np.nan, 12.0)
+    reference['pm10_ref'] = 20.0
+
+    index = CoverageIndex()
+    index.update_from_frame(readings, LOWCOST_CHANNELS)
+    index.update_from_frame(reference, REFERENCE_CHANNELS, series='RMCAB_6')
+    index.mark_scanned('Aire4', '2024-06-01', '2024-07-14 23:00')
+
+    aire4 = readings[readings['device_name'] == 'Aire4']
+    pm25_hours = pd.DatetimeIndex(sorted(set(aire4.loc[aire4['pm25_sensor'].notna(), 'datetime'].dt.floor('h'))))
+    assert index.hours('Aire4', 'pm25', '2024-06-01', '2024-07-15').equals(pm25_hours)
+
+    expected = pm25_hours.intersection(pd.DatetimeIndex(reference.loc[reference['pm25_ref'].notna(), 'datetime']))
+    assert index.intersect('Aire4', 'pm25', 'RMCAB_6', 'pm25', '2024-06-01', '2024-07-15').equals(expected)
+
+    in_reference = index.contains('RMCAB_6', 'records', aire4['datetime'])
+    assert (in_reference == aire4['datetime'].dt.floor('h').isin(set(reference['datetime'])).to_numpy()).all()
+
+    gaps = index.gaps('Aire4', 'records', '2024-06-01', '2024-07-14 23:00', min_hours=24)
+    assert [(gap['start'], gap['hours']) for gap in gaps] == [(pd.Timestamp('2024-06-10'), 240)]
+
+    # Persistencia ida y vuelta
+    path = os.path.join(tempfile.mkdtemp(), 'coverage_index')
+    index.save(path)
+    assert CoverageIndex.load(path).hours('Aire4', 'pm25', '2024-06-01', '2024-07-15').equals(pm25_hours)
+
+
+def test_incremental_tracker_matches_full_scan():
+    """Ingerir los conteos por partes (con la última hora incompleta) da la misma ventana"""
+    readings = build_synthetic_readings()
+    readings['datetime'] = readings['datetime'].dt.floor('h')
+    counts = _hourly_counts_from_frame(readings).sort_values('datetime')
+    devices = ['Aire2', 'Aire4', 'Aire5']
+
+    tracker = DenseWindowTracker(window_days=5, devices=devices)
+    cut_points = [pd.Timestamp('2024-06-08 13:00'), pd.Timestamp('2024-06-25 05:00'), None]
+    previous = None
+    for cut in cut_points:
+        chunk = counts if cut is None else counts[counts['datetime'] <= cut].copy()
+        if previous is not None:
+            chunk = chunk[chunk['datetime'] >= previous]
+        if cut is not None:
+            # La última hora llega incompleta y se completa en la siguiente ingesta
+            chunk.loc[chunk['datetime'] == cut, ['records', 'pm25_count', 'pm10_count']] //= 2
+        tracker.ingest(chunk)
+
+        path = os.path.join(tempfile.mkdtemp(), 'tracker.json')
+        tracker = DenseWindowTracker.load(tracker.save(path))
+        previous = cut
+
+    expected = _select_dense_window(counts, window_days=5, devices=devices)
+    tracked = tracker.best_window()
+    for key in expected:
+        assert expected[key] == tracked[key], key
+
+
+def _save_hours(path, hours):
+    for hour in hours:
+        index = CoverageIndex.load(path)
+        index.set_hours('Aire2', 'records', [hour])
+        index.save()
+
+
+def test_coverage_index_saves_only_changed_series_under_a_lock():
+    """Solo se reescriben las series con bits nuevos y los guardados concurrentes no se pierden"""
+    path = os.path.join(tempfile.mkdtemp(), 'coverage_index')
+    index = CoverageIndex()
+    index.set_hours('Aire2', 'records', [10, 11])
+    index.set_hours('RMCAB_6', 'records', [10, 12])
+    index.save(path)
+
+    def file_times():
+        return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(path) if entry.name.endswith('.npz')}
+
+    saved = file_times()
+    assert len(saved) == 2
+
+    # Horas ya presentes: no hay nada que escribir
+    index.set_hours('Aire2', 'records', [10])
+    index.save()
+    assert file_times() == saved
+
+    index.set_hours('RMCAB_6', 'records', [13])
+    index.save()
+    changed = {name for name, mtime in file_times().items() if saved[name] != mtime}
+    assert len(changed) == 1 and changed.pop().startswith('RMCAB_6')
+
+    # Dos procesos agregan horas distintas a la misma serie
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_save_hours, args=(path, range(start, start + 20, 2))) for start in (100, 101)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    index.refresh()
+    assert index.count('Aire2', 'records', '2000-01-01', '2000-01-05 23:00') == 2 + 20
+    assert CoverageIndex.load(path).count('RMCAB_6', 'records', '2000-01-01', '2000-01-05 23:00') == 3
+
+
+if __name__ == '__main__':
+    test_dense_window_from_counts_matches_raw_scan()
+    test_coverage_index_matches_dataframe_scans()
+    test_incremental_tracker_matches_full_scan()
+    test_coverage_index_saves_only_changed_series_under_a_lock()
+    print("✅ Ventana densa verificada")
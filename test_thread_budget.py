@@ -0,0 +1,80 @@
+"""
+Prueba del presupuesto de hilos: las calibraciones simultáneas se reparten los núcleos del
+proceso, las reservas anidadas heredan la del hilo, los estimadores reciben el límite y los
+folds de la validación cruzada por los hilos de cada estimador no superan la reserva.
+"""
+
+import threading
+
+import numpy as np
+from sklearn.ensemble import BaggingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+
+from modules import model_scheduler, thread_budget
+from modules.thread_budget import THREAD_PARAMS, current_lease, lease_cores, limit_estimator_threads, thread_report
+
+
+def test_leases_split_process_budget_and_nest(monkeypatch):
+    monkeypatch.setattr(thread_budget, 'PROCESS_THREAD_BUDGET', 6)
+    monkeypatch.setattr(model_scheduler, 'MODEL_CORE_BUDGET', 8)
+
+    with lease_cores('primera', requested=4) as first:
+        assert first == 4
+        assert model_scheduler.resolve_core_budget() == 4
+        assert model_scheduler.resolve_core_budget(2) == 2
+        with lease_cores('anidada') as nested:
+            assert nested == 4
+
+        # Otra calibración simultánea (otro hilo) recibe solo los núcleos libres
+        granted = []
+        def other():
+            with lease_cores('segunda') as cores:
+                granted.append(cores)
+        worker = threading.Thread(target=other)
+        worker.start()
+        worker.join()
+        assert granted == [2]
+        assert thread_report()['free'] == 2
+
+    assert current_lease() is None
+    assert thread_report()['leased'] == 0
+    assert model_scheduler.resolve_core_budget() == 8
+
+
+def test_estimator_threads_are_limited_in_nested_estimators():
+    bagging = BaggingRegressor(estimator=RandomForestRegressor(n_jobs=-1), n_jobs=-1)
+    limit_estimator_threads(bagging, 2)
+    assert bagging.n_jobs == 2
+    assert bagging.estimator.n_jobs == 2
+
+
+def test_cross_validation_and_estimator_threads_fit_in_the_lease(monkeypatch):
+    monkeypatch.setattr(thread_budget, 'PROCESS_THREAD_BUDGET', 4)
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 50, (120, 3))
+    y = X @ np.array([0.9, 0.2, -0.1])
+    data = {'X_train': X[:100], 'X_test': X[100:], 'y_train': y[:100], 'y_test': y[100:], 'feature_names': None}
+
+    seen = {}
+
+    def record(estimator, X_train, X_test, y_train, y_test, name, feature_names=None, cv_n_jobs=None):
+        inner = [value for key, value in estimator.get_params(deep=True).items()
+                 if key.split('__')[-1] in THREAD_PARAMS]
+        seen[name] = (cv_n_jobs, max(inner, default=1))
+        return {'model_name': name}
+
+    jobs = [
+        model_scheduler.model_job('Linear Regression', LinearRegression()),
+        model_scheduler.model_job('Random Forest', RandomForestRegressor(n_jobs=-1)),
+        model_scheduler.model_job('Bagging', BaggingRegressor(estimator=RandomForestRegressor(n_jobs=-1), n_jobs=-1))
+    ]
+    with lease_cores('zoológico') as cores:
+        assert cores == 4
+        for job in jobs:
+            model_scheduler._run_job(record, job, cores, data=data)
+
+    for name, (outer, inner) in seen.items():
+        assert outer >= 1 and inner >= 1
+        assert outer * inner <= 4, name
+    assert seen['Linear Regression'] == (4, 1)
+    assert seen['Random Forest'] == (1, 4)
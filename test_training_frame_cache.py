@@ -0,0 +1,42 @@
+"""
+Prueba de la caché de DataFrames de entrenamiento: se reutiliza con los mismos datos y se
+reconstruye si cambia un valor aunque se conserven las filas y el rango de fechas.
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules.training_frame import clear_training_frame_cache, get_training_frame
+
+
+def _inputs(hours=120, seed=0):
+    rng = np.random.default_rng(seed)
+    datetimes = pd.date_range('2025-03-01', periods=hours, freq='h')
+    lowcost = pd.DataFrame({
+        'datetime': datetimes,
+        'pm25_sensor': rng.uniform(5, 60, hours),
+        'temperature': rng.uniform(8, 22, hours),
+        'rh': rng.uniform(40, 95, hours)
+    })
+    rmcab = pd.DataFrame({'datetime': datetimes, 'pm25_ref': rng.uniform(5, 60, hours)})
+    return lowcost, rmcab
+
+
+def test_corrected_readings_rebuild_the_cached_frame():
+    clear_training_frame_cache()
+    lowcost, rmcab = _inputs()
+    key = ('Aire2', '2025-03-01', '2025-03-05', 6)
+
+    first, _ = get_training_frame(lowcost, rmcab, cache_key=key)
+    assert get_training_frame(lowcost.copy(), rmcab.copy(), cache_key=key)[0] is first
+
+    corrected = lowcost.copy()
+    corrected.loc[10, 'pm25_sensor'] = 999.0
+    rebuilt, _ = get_training_frame(corrected, rmcab, cache_key=key)
+    assert rebuilt is not first
+    assert rebuilt.loc[rebuilt['datetime'] == corrected.loc[10, 'datetime'], 'pm25_sensor'].iloc[0] == 999.0
+
+    reuploaded = rmcab.copy()
+    reuploaded.loc[20, 'pm25_ref'] += 1.0
+    assert get_training_frame(lowcost, reuploaded, cache_key=key)[0] is not first
+    clear_training_frame_cache()